@@ -7,6 +7,8 @@
 # Update  30/09/25
 # Enhanced by: Query Processor con supporto multiriga, template, directory reports e MULTITASKING
 #
+import hashlib
+import json
 import logging
 import pandas as pd
 import warnings
@@ -50,6 +52,13 @@ class MultitaskingQueryProcessor:
             config.get('execution', {}).get('reports_query_directory', 'reports/queries'))
         self.reports_directory = Path(config.get('execution', {}).get('reports_directory', 'reports'))
 
+        # Change detection lato sorgente (change_probe per query)
+        self.change_probe_state_file = Path(
+            config.get('execution', {}).get('change_probe_state_file', 'state/change_probes.json'))
+        self.ignore_change_probes = config.get('execution', {}).get('ignore_change_probes', False)
+        self.probe_lock = threading.Lock()
+        self.probe_state = self._load_probe_state()
+
         # Crea tutte le directory necessarie
         self._setup_directories()
 
@@ -141,6 +150,51 @@ class MultitaskingQueryProcessor:
             self._thread_safe_log('ERROR', f"ERRORE: Risoluzione SQL [{query_name}] ({query_type}): {e}")
             raise
 
+    def _load_probe_state(self) -> Dict[str, Any]:
+        """Carica gli ultimi valori dei change_probe salvati su file"""
+        if not self.change_probe_state_file.exists():
+            return {}
+
+        try:
+            with open(self.change_probe_state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            self.logger.warning(f"PROBE: Stato change_probe non leggibile ({self.change_probe_state_file}): {e}")
+            return {}
+
+    def _save_probe_state(self, query_name: str, probe_value: str, sql_hash: str):
+        """Registra il valore del change_probe dopo un trasferimento riuscito (thread-safe)"""
+        with self.probe_lock:
+            self.probe_state[query_name] = {
+                'probe_value': probe_value,
+                'sql_hash': sql_hash,
+                'updated_at': time.strftime('%Y-%m-%d %H:%M:%S')
+            }
+            try:
+                self.change_probe_state_file.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = self.change_probe_state_file.with_suffix('.tmp')
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.probe_state, f, indent=2, ensure_ascii=False)
+                tmp_path.replace(self.change_probe_state_file)
+            except OSError as e:
+                self._thread_safe_log('WARNING', f"PROBE: Impossibile salvare stato change_probe: {e}")
+
+    def _evaluate_change_probe(self, query_config: Dict[str, Any]) -> str:
+        """Esegue la change_probe SQL sul database sorgente e ne restituisce il valore scalare"""
+        probe_sql = query_config['change_probe']
+        if isinstance(probe_sql, list):
+            probe_sql = ' '.join(line.strip() for line in probe_sql)
+
+        with self.db_manager.get_connection(query_config['source_database']) as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(probe_sql)
+                row = cursor.fetchone()
+            finally:
+                cursor.close()
+
+        return str(row[0]) if row else ''
+
     def _get_sql_source_type(self, query_config: Dict[str, Any]) -> str:
         """Determina il tipo di sorgente SQL per il reporting"""
         if 'sql' in query_config:
@@ -186,6 +240,33 @@ class MultitaskingQueryProcessor:
             if not sql_query.strip():
                 raise ValueError(f"Query SQL vuota per [{query_name}]")
 
+            # Change detection: se il probe non è cambiato salta estrazione e scrittura
+            probe_value = None
+            sql_hash = hashlib.sha256(sql_query.encode('utf-8')).hexdigest()
+            if query_config.get('change_probe'):
+                probe_value = self._evaluate_change_probe(query_config)
+                last_state = self.probe_state.get(query_name, {})
+
+                if (not self.ignore_change_probes
+                        and last_state.get('probe_value') == probe_value
+                        and last_state.get('sql_hash') == sql_hash):
+                    self._thread_safe_log('INFO',
+                                          f"THREAD-{thread_id}: SKIP Query [{query_name}] ({query_type}) invariata "
+                                          f"(probe={probe_value}, ultimo trasferimento {last_state.get('updated_at')})")
+                    return {
+                        'success': True,
+                        'skipped_unchanged': True,
+                        'query_name': query_name,
+                        'rows': 0,
+                        'source': source_db,
+                        'destination': dest_db,
+                        'table': f"{dest_schema}.{dest_table}",
+                        'sql_type': self._get_sql_source_type(query_config),
+                        'query_type': query_type,
+                        'thread_id': thread_id,
+                        'execution_time': time.time() - start_time
+                    }
+
             self._thread_safe_log('INFO',
                                   f"THREAD-{thread_id}: AVVIO Query {query_name} ({query_type}) da [{source_db}]")
 
@@ -196,6 +277,8 @@ class MultitaskingQueryProcessor:
             if df.empty:
                 self._thread_safe_log('WARNING',
                                       f"THREAD-{thread_id}: Query [{query_name}] ({query_type}) ha restituito 0 righe")
+                if probe_value is not None:
+                    self._save_probe_state(query_name, probe_value, sql_hash)
                 return {
                     'success': True,
                     'query_name': query_name,
@@ -215,6 +298,9 @@ class MultitaskingQueryProcessor:
             # Scrive risultati nel database destinazione
             self._write_to_destination(df, dest_db, dest_table, dest_schema, query_name, query_type, thread_id)
 
+            if probe_value is not None:
+                self._save_probe_state(query_name, probe_value, sql_hash)
+
             full_table_name = f"{dest_schema}.{dest_table}"
             execution_time = time.time() - start_time
 
@@ -396,7 +482,7 @@ class MultitaskingQueryProcessor:
                 'written_tables': [],
                 'errors': ['Nessuna query abilitata'],
                 'stats': {'standard_queries': 0, 'report_queries': 0, 'total_rows_processed': 0,
-                          'total_execution_time': 0}
+                          'total_execution_time': 0, 'skipped_unchanged': 0, 'skip_rate': 0.0}
             }
 
         results = {
@@ -408,7 +494,9 @@ class MultitaskingQueryProcessor:
                 'report_queries': 0,
                 'total_rows_processed': 0,
                 'total_execution_time': 0,
-                'concurrent_executions': 0
+                'concurrent_executions': 0,
+                'skipped_unchanged': 0,
+                'skip_rate': 0.0
             }
         }
 
@@ -440,6 +528,7 @@ class MultitaskingQueryProcessor:
 
                         # Aggiorna risultati
                         results['executed_queries'][query_name] = {
+                            'skipped_unchanged': result.get('skipped_unchanged', False),
                             'rows': result['rows'],
                             'source': result['source'],
                             'destination': result['destination'],
@@ -466,8 +555,13 @@ class MultitaskingQueryProcessor:
                         results['stats']['total_rows_processed'] += result['rows']
                         results['stats']['total_execution_time'] += result['execution_time']
 
-                        self._thread_safe_log('INFO',
-                                              f"COMPLETED: {completed_count}/{len(enabled_queries)} - {query_name} ({result['rows']} righe in {result['execution_time']:.2f}s)")
+                        if result.get('skipped_unchanged'):
+                            results['stats']['skipped_unchanged'] += 1
+                            self._thread_safe_log('INFO',
+                                                  f"COMPLETED: {completed_count}/{len(enabled_queries)} - {query_name} (invariata, saltata)")
+                        else:
+                            self._thread_safe_log('INFO',
+                                                  f"COMPLETED: {completed_count}/{len(enabled_queries)} - {query_name} ({result['rows']} righe in {result['execution_time']:.2f}s)")
 
                     else:
                         error_msg = f"Query [{result['query_name']}]: {result.get('error', result.get('reason', 'Unknown error'))}"
@@ -484,12 +578,14 @@ class MultitaskingQueryProcessor:
         total_pipeline_time = time.time() - start_time
         results['stats']['total_pipeline_time'] = total_pipeline_time
         results['stats']['concurrent_executions'] = len(enabled_queries)
+        results['stats']['skip_rate'] = results['stats']['skipped_unchanged'] / len(enabled_queries)
 
         # Log finale delle statistiche
         stats = results['stats']
         self._thread_safe_log('INFO', f"PIPELINE MULTITASKING COMPLETATA: {stats['standard_queries']} query standard, "
                                       f"{stats['report_queries']} query reports, "
-                                      f"{stats['total_rows_processed']} righe totali processate")
+                                      f"{stats['total_rows_processed']} righe totali processate, "
+                                      f"{stats['skipped_unchanged']} invariate saltate ({stats['skip_rate']:.0%})")
         self._thread_safe_log('INFO', f"PERFORMANCE: Pipeline totale {total_pipeline_time:.2f}s, "
                                       f"tempo query cumulativo {stats['total_execution_time']:.2f}s, "
                                       f"speedup: {stats['total_execution_time'] / total_pipeline_time:.1f}x")
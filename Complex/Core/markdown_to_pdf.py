@@ -17,24 +17,67 @@ import requests
 from pathlib import Path
 from datetime import datetime
 import base64
+import hashlib
+import json
+import re
 import tempfile
 import webbrowser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Asset remoti (scaricati una sola volta e messi in cache locale come data-URI)
+TIM_LOGO_URL = "https://upload.wikimedia.org/wikipedia/commons/thumb/3/3a/TIM_logo_2016.svg/200px-TIM_logo_2016.svg.png"
+INTER_FONT_CSS_URL = "https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap"
+DEFAULT_CACHE_DIR = Path.home() / '.cache' / 'tim_markdown_to_pdf'
+BATCH_MANIFEST = '.md2pdf_manifest.json'
+
+FONT_MIME_TYPES = {
+    '.ttf': 'font/ttf',
+    '.woff': 'font/woff',
+    '.woff2': 'font/woff2',
+    '.otf': 'font/otf'
+}
+
+PDF_OPTIONS = {
+    'page-size': 'A4',
+    'margin-top': '15mm',
+    'margin-right': '15mm',
+    'margin-bottom': '15mm',
+    'margin-left': '15mm',
+    'encoding': "UTF-8",
+    'no-outline': None,
+    'enable-local-file-access': None,
+    'print-media-type': None,
+    'disable-smart-shrinking': None,
+    'zoom': '0.8'
+}
 
 
 class MarkdownToPdfConverter:
     """Convertitore Markdown a PDF con styling professionale TIM"""
 
-    def __init__(self):
+    def __init__(self, cache_dir=None):
         self.tim_blue = "#0066CC"
         self.tim_light_blue = "#E6F2FF"
         self.tim_dark_blue = "#003366"
+        self.cache_dir = Path(cache_dir) if cache_dir else DEFAULT_CACHE_DIR
+        self._tim_logo_data = None
+        self.font_css = self.load_font_css()
         self.setup_css_styles()
 
+        # Converter Markdown riutilizzato tra le conversioni (reset() prima di ogni uso)
+        self.md = markdown.Markdown(extensions=[
+            'extra',  # Tabelle e funzionalità extra
+            'codehilite',  # Syntax highlighting
+            'toc',  # Table of contents
+            'fenced_code',  # Code blocks
+            'tables'  # Supporto tabelle
+        ])
+
     def setup_css_styles(self):
         """Definisce gli stili CSS professionali per TIM"""
         self.css_styles = f"""
         <style>
-        @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap');
+        {self.font_css}
 
         * {{
             box-sizing: border-box;
@@ -235,13 +278,58 @@ class MarkdownToPdfConverter:
         </style>
         """
 
+    def load_font_css(self):
+        """Restituisce le @font-face Inter con i font inline (data-URI), scaricandole solo al primo uso"""
+        font_cache = self.cache_dir / 'inter_fonts.css'
+        if font_cache.exists():
+            return font_cache.read_text(encoding='utf-8')
+
+        try:
+            response = requests.get(INTER_FONT_CSS_URL, timeout=10)
+            response.raise_for_status()
+            font_css = response.text
+
+            # Sostituisce ogni url(...) del foglio Google Fonts con il font inline
+            for font_url in set(re.findall(r'url\((https://[^)]+)\)', font_css)):
+                font_response = requests.get(font_url, timeout=10)
+                font_response.raise_for_status()
+                mime = FONT_MIME_TYPES.get(Path(font_url).suffix.lower(), 'font/ttf')
+                font_base64 = base64.b64encode(font_response.content).decode('utf-8')
+                font_css = font_css.replace(font_url, f"data:{mime};base64,{font_base64}")
+
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            font_cache.write_text(font_css, encoding='utf-8')
+            return font_css
+
+        except Exception as e:
+            print(f"⚠️  Font Inter non disponibili in cache ({e}), uso import remoto")
+            return f"@import url('{INTER_FONT_CSS_URL}');"
+
+    def get_tim_logo(self):
+        """Restituisce il logo TIM come data-URI usando cache in memoria e su disco"""
+        if self._tim_logo_data:
+            return self._tim_logo_data
+
+        logo_cache = self.cache_dir / 'tim_logo.png'
+        if logo_cache.exists():
+            logo_base64 = base64.b64encode(logo_cache.read_bytes()).decode('utf-8')
+            self._tim_logo_data = f"data:image/png;base64,{logo_base64}"
+            return self._tim_logo_data
+
+        self._tim_logo_data = self.download_tim_logo()
+        if self._tim_logo_data:
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                logo_cache.write_bytes(base64.b64decode(self._tim_logo_data.split(',', 1)[1]))
+            except OSError as e:
+                print(f"⚠️  Impossibile salvare il logo TIM in cache: {e}")
+
+        return self._tim_logo_data
+
     def download_tim_logo(self):
         """Scarica il logo TIM e lo converte in base64"""
         try:
-            # URL logo TIM (Wikipedia)
-            logo_url = "https://upload.wikimedia.org/wikipedia/commons/thumb/3/3a/TIM_logo_2016.svg/200px-TIM_logo_2016.svg.png"
-
-            response = requests.get(logo_url, timeout=10)
+            response = requests.get(TIM_LOGO_URL, timeout=10)
             if response.status_code == 200:
                 logo_base64 = base64.b64encode(response.content).decode('utf-8')
                 return f"data:image/png;base64,{logo_base64}"
@@ -255,8 +343,8 @@ class MarkdownToPdfConverter:
     def process_markdown_content(self, markdown_content):
         """Processa il contenuto Markdown e aggiunge header/footer TIM"""
 
-        # Scarica logo TIM
-        tim_logo_data = self.download_tim_logo()
+        # Logo TIM (cache locale, download solo al primo utilizzo)
+        tim_logo_data = self.get_tim_logo()
 
         # Header TIM
         tim_header = f"""
@@ -283,15 +371,7 @@ class MarkdownToPdfConverter:
         """
 
         # Converte Markdown in HTML
-        md = markdown.Markdown(extensions=[
-            'extra',  # Tabelle e funzionalità extra
-            'codehilite',  # Syntax highlighting
-            'toc',  # Table of contents
-            'fenced_code',  # Code blocks
-            'tables'  # Supporto tabelle
-        ])
-
-        html_content = md.convert(markdown_content)
+        html_content = self.md.reset().convert(markdown_content)
 
         # Processa emoji e simboli speciali
         html_content = self.process_emoji(html_content)
@@ -381,24 +461,9 @@ class MarkdownToPdfConverter:
             temp_html_path = temp_html.name
 
         try:
-            # Opzioni PDF
-            options = {
-                'page-size': 'A4',
-                'margin-top': '15mm',
-                'margin-right': '15mm',
-                'margin-bottom': '15mm',
-                'margin-left': '15mm',
-                'encoding': "UTF-8",
-                'no-outline': None,
-                'enable-local-file-access': None,
-                'print-media-type': None,
-                'disable-smart-shrinking': None,
-                'zoom': '0.8'
-            }
-
             # Converte in PDF
             print("🔄 Generazione PDF in corso...")
-            pdfkit.from_file(temp_html_path, output_file, options=options)
+            pdfkit.from_file(temp_html_path, output_file, options=PDF_OPTIONS)
 
             print(f"✅ PDF generato con successo: {output_file}")
 
@@ -427,6 +492,76 @@ class MarkdownToPdfConverter:
             except:
                 pass
 
+    def content_hash(self, markdown_content):
+        """Hash del contenuto Markdown e degli stili: se invariato il PDF non va rigenerato"""
+        digest = hashlib.sha256()
+        digest.update(markdown_content.encode('utf-8'))
+        digest.update(self.css_styles.encode('utf-8'))
+        digest.update(json.dumps(PDF_OPTIONS, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def convert_batch(self, input_dir, output_dir=None, workers=None, force=False):
+        """Converte tutti i file Markdown di una directory con un pool di processi,
+        saltando quelli il cui contenuto non è cambiato dall'ultima esecuzione"""
+        input_path = Path(input_dir)
+        if not input_path.is_dir():
+            raise NotADirectoryError(f"Directory Markdown non trovata: {input_dir}")
+
+        output_path = Path(output_dir) if output_dir else input_path
+        output_path.mkdir(parents=True, exist_ok=True)
+
+        manifest_path = output_path / BATCH_MANIFEST
+        manifest = {}
+        if manifest_path.exists() and not force:
+            try:
+                manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+            except (OSError, json.JSONDecodeError):
+                manifest = {}
+
+        # Scalda la cache degli asset prima di avviare i worker (leggeranno da disco)
+        self.get_tim_logo()
+
+        jobs = []
+        skipped = []
+        for markdown_file in sorted(input_path.rglob('*.md')):
+            relative = markdown_file.relative_to(input_path)
+            output_file = output_path / relative.parent / (markdown_file.stem + "_TIM.pdf")
+            file_hash = self.content_hash(markdown_file.read_text(encoding='utf-8'))
+
+            if manifest.get(str(relative)) == file_hash and output_file.exists():
+                skipped.append(str(relative))
+                continue
+
+            output_file.parent.mkdir(parents=True, exist_ok=True)
+            jobs.append((str(markdown_file), str(output_file), str(relative), file_hash))
+
+        print(f"📚 Batch: {len(jobs)} file da convertire, {len(skipped)} invariati saltati")
+
+        converted = []
+        errors = []
+        if jobs:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                     initargs=(str(self.cache_dir),)) as executor:
+                future_to_job = {executor.submit(_convert_batch_file, job[0], job[1]): job for job in jobs}
+
+                for future in as_completed(future_to_job):
+                    markdown_file, output_file, relative, file_hash = future_to_job[future]
+                    try:
+                        future.result()
+                        manifest[relative] = file_hash
+                        converted.append(output_file)
+                    except Exception as e:
+                        errors.append(f"{relative}: {e}")
+                        print(f"❌ {relative}: {e}")
+
+            manifest_path.write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding='utf-8')
+
+        return {
+            'converted': converted,
+            'skipped': skipped,
+            'errors': errors
+        }
+
     def create_sample_markdown(self):
         """Crea un file Markdown di esempio"""
         sample_content = """# 🔄 COMPLEX - Sistema Esempio
@@ -489,6 +624,21 @@ config = {
         return 'sample_documentation.md'
 
 
+# Converter per-processo usato dai worker del batch (inizializzato una volta per processo)
+_batch_converter = None
+
+
+def _init_batch_worker(cache_dir):
+    """Inizializza il converter del worker riutilizzando la cache asset condivisa"""
+    global _batch_converter
+    _batch_converter = MarkdownToPdfConverter(cache_dir=cache_dir)
+
+
+def _convert_batch_file(markdown_file, output_file):
+    """Converte un singolo file nel processo worker"""
+    return _batch_converter.convert_to_pdf(markdown_file, output_file)
+
+
 def check_dependencies():
     """Verifica dipendenze necessarie"""
     missing_deps = []
@@ -539,6 +689,7 @@ Esempi d'uso:
   python markdown_to_pdf.py doc.md -o report.pdf     # Output personalizzato
   python markdown_to_pdf.py doc.md --open            # Apri PDF dopo conversione
   python markdown_to_pdf.py --sample                 # Crea file esempio
+  python markdown_to_pdf.py --batch docs -o pdf      # Converte tutti i .md di docs/ in pdf/
         """
     )
 
@@ -546,6 +697,9 @@ Esempi d'uso:
     parser.add_argument('-o', '--output', help='File PDF output')
     parser.add_argument('--open', action='store_true', help='Apri PDF dopo conversione')
     parser.add_argument('--sample', action='store_true', help='Crea file Markdown esempio')
+    parser.add_argument('--batch', metavar='DIR', help='Converte tutti i file Markdown della directory')
+    parser.add_argument('--workers', type=int, help='Processi paralleli in modalità batch (default: CPU)')
+    parser.add_argument('--force', action='store_true', help='Rigenera anche i PDF con contenuto invariato')
 
     args = parser.parse_args()
 
@@ -567,6 +721,19 @@ Esempi d'uso:
         converter.convert_to_pdf(sample_file, open_pdf=True)
         return
 
+    # Modalità batch
+    if args.batch:
+        try:
+            results = converter.convert_batch(args.batch, args.output, args.workers, args.force)
+            print(f"\n✅ Batch completato: {len(results['converted'])} convertiti, "
+                  f"{len(results['skipped'])} invariati, {len(results['errors'])} errori")
+            if results['errors']:
+                sys.exit(1)
+        except Exception as e:
+            print(f"\n❌ ERRORE: {e}")
+            sys.exit(1)
+        return
+
     # Verifica input
     if not args.input_file:
         parser.print_help()
@@ -176,6 +176,10 @@ def validate_enhanced_config(config: Dict[str, Any]) -> bool:
             if not isinstance(template_params, dict):
                 raise ValueError(f"{query_id}: template_params deve essere un oggetto JSON")
 
+        # Validazione change_probe opzionale (stringa o array multiriga)
+        if 'change_probe' in query and not isinstance(query['change_probe'], (str, list)):
+            raise ValueError(f"{query_id}: change_probe deve essere una stringa SQL o un array di stringhe")
+
     return True
 
 
@@ -215,10 +219,18 @@ def print_enhanced_results_summary(results: Dict[str, Any]):
     if results['executed_queries']:
         print(f"QUERY ESEGUITE: {len(results['executed_queries'])}")
         for query_name, info in results['executed_queries'].items():
+            if info.get('skipped_unchanged'):
+                print(f"   = {query_name}: invariata (skipped_unchanged)")
+                continue
             print(f"   ✓ {query_name}: {info['rows']:,} righe")
             print(f"     {info['source']} → {info['destination']}.{info['table']}")
             print(f"     Tipo: {info['sql_type']}")
 
+    stats = results.get('stats', {})
+    if stats.get('skipped_unchanged'):
+        print(f"\nQUERY INVARIATE SALTATE: {stats['skipped_unchanged']} "
+              f"(skip rate {stats.get('skip_rate', 0):.0%})")
+
     if results['written_tables']:
         print(f"\nTABELLE SCRITTE: {len(results['written_tables'])}")
         for table in results['written_tables']:
@@ -483,6 +495,7 @@ def main():
         print(f"  • Output reports: {directories['reports']}/")
         print(f"  • Template con parametri: Usare {{param_name}} nelle query")
         print(f"  • Query multiriga: Array di stringhe nel config.json")
+        print(f"  • Change detection: 'change_probe' per saltare query con sorgente invariata")
         print(f"  • Log dettagliati: Controllare {log_filepath}")
         print(f"  • Cleanup automatico: Log più vecchi di 3 giorni eliminati all'avvio")
 
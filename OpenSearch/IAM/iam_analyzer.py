@@ -19,13 +19,39 @@ UTILIZZO:
     analyzer.analisi_sla_by_operazione()
     analyzer.analisi_durate_operazioni()
     analyzer.analisi_trend_temporale()
+    analyzer.analisi_sla_composite(sla_hours=72)
+
+    # Tutte le analisi in un solo _msearch, con cache per generazione dell'indice
+    analyzer.esegui_tutte_analisi()
+
+    # Trend temporale dall'indice rollup giornaliero (iam-richieste-daily)
+    IAMAnalyzer(use_rollup=True).analisi_trend_temporale()
+
+    # SLA e p50/p95/p99 dagli sketch t-digest per operazione × giorno (iam-kpi-sketches)
+    IAMAnalyzer(use_sketch=True).analisi_sla_da_sketch(giorni=30)
 ================================================================================
 """
 
 from opensearchpy import OpenSearch
-from datetime import datetime, timedelta
-from typing import Dict, List, Tuple
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Tuple, Optional
 import json
+import sys
+import time
+
+from iam_partitions import IAMPartitionManager
+from iam_rollup import ROLLUP_INDEX
+from iam_sketch import SKETCH_INDEX, IAMKpiSketches
+from iam_tracing import span, registra
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from opensearch_pool import get_client
+
+# Campi data che cambiano a ogni scrittura (chiave di cache persistente, vedi index_generation):
+# richieste = campi del watermark del sync + aggregati padre/figli; rollup e sketch = updated_at
+GENERATION_FIELDS_RICHIESTE = ('data_storicizzazione', 'data_chiusura', 'data_creazione', 'albero.aggiornato')
+GENERATION_FIELDS_DERIVATI = ('updated_at',)
 
 
 class Colors:
@@ -43,25 +69,20 @@ class Colors:
 class IAMAnalyzer:
     """Analizzatore di richieste IAM"""
 
-    def __init__(self, host='localhost', port=9200,
-                 use_ssl=False):
-        """Inizializza la connessione (NO SECURITY)"""
-        self.client = OpenSearch(
-            hosts=[{'host': host, 'port': port}],
-            use_ssl=use_ssl,
-            verify_certs=False,
-            ssl_show_warn=False,
-            timeout=30,
-            max_retries=3
-        )
+    def __init__(self, host=None, port=None,
+                 use_ssl=None, cache_file='iam_analysis_cache.json', use_rollup=False,
+                 use_sketch=False, sketch_days=30, client: Optional[OpenSearch] = None):
+        """Usa il client condiviso di opensearch_pool (NO SECURITY); use_rollup legge i trend dal rollup
+        giornaliero, use_sketch la SLA per operazione dagli sketch degli ultimi sketch_days giorni"""
+        self.client = client or get_client(host=host, port=port, use_ssl=use_ssl)
         self.index_name = 'iam-richieste'
-
-        try:
-            info = self.client.info()
-            print(f"✓ Connesso a OpenSearch {info['version']['number']} (NO SECURITY)\n")
-        except Exception as e:
-            print(f"✗ Errore connessione: {e}")
-            raise
+        self.cache_file = cache_file
+        self.rollup_index = ROLLUP_INDEX
+        self.use_rollup = use_rollup
+        self.sketch_index = SKETCH_INDEX
+        self.use_sketch = use_sketch
+        self.sketch_days = sketch_days
+        self.partitions = IAMPartitionManager(self.client, self.index_name)
 
     def _print_section(self, title: str):
         """Stampa titolo sezione"""
@@ -72,30 +93,32 @@ class IAMAnalyzer:
     def _print_success(self, msg: str):
         print(f"{Colors.GREEN}✓{Colors.RESET} {msg}")
 
-    def analisi_sla_by_operazione(self) -> Dict:
-        """Analizza SLA per tipo di operazione"""
-        self._print_section("1. SLA COMPLIANCE PER OPERAZIONE")
-
-        response = self.client.search(
-            index=self.index_name,
-            body={
-                'size': 0,
-                'aggs': {
-                    'by_operazione': {
-                        'terms': {'field': 'fk_nome_operazione', 'size': 50},
-                        'aggs': {
-                            'total_count': {'value_count': {'field': 'id_richiesta'}},
-                            'sla_passed': {'filter': {'term': {'sla_rispettato': True}}},
-                            'sla_failed': {'filter': {'term': {'sla_rispettato': False}}},
-                            'avg_durata': {'avg': {'field': 'durata_ore'}},
-                            'max_durata': {'max': {'field': 'durata_ore'}},
-                            'min_durata': {'min': {'field': 'durata_ore'}},
-                            'p95_durata': {'percentiles': {'field': 'durata_ore', 'percents': [95]}}
-                        }
+    def _body_sla_by_operazione(self) -> Dict:
+        """Richiesta _search per analisi_sla_by_operazione"""
+        return {
+            'size': 0,
+            'aggs': {
+                'by_operazione': {
+                    'terms': {'field': 'fk_nome_operazione', 'size': 50},
+                    'aggs': {
+                        'total_count': {'value_count': {'field': 'id_richiesta'}},
+                        'sla_passed': {'filter': {'term': {'sla_rispettato': True}}},
+                        'sla_failed': {'filter': {'term': {'sla_rispettato': False}}},
+                        'avg_durata': {'avg': {'field': 'durata_ore'}},
+                        'max_durata': {'max': {'field': 'durata_ore'}},
+                        'min_durata': {'min': {'field': 'durata_ore'}},
+                        'p95_durata': {'percentiles': {'field': 'durata_ore', 'percents': [95]}}
                     }
                 }
             }
-        )
+        }
+
+    def analisi_sla_by_operazione(self, response: Optional[Dict] = None) -> Dict:
+        """Analizza SLA per tipo di operazione"""
+        self._print_section("1. SLA COMPLIANCE PER OPERAZIONE")
+
+        if response is None:
+            response = self.client.search(index=self.index_name, body=self._body_sla_by_operazione())
 
         results = {}
         for bucket in response['aggregations']['by_operazione']['buckets']:
@@ -127,23 +150,73 @@ class IAMAnalyzer:
 
         return results
 
-    def analisi_stato_distribution(self) -> Dict:
-        """Distribuzione richieste per stato"""
-        self._print_section("2. DISTRIBUZIONE RICHIESTE PER STATO")
+    def analisi_sla_da_sketch(self, giorni: Optional[int] = None) -> Dict:
+        """
+        SLA per operazione unendo gli sketch giornalieri (iam_sketch.py) invece di
+        aggregare percentiles sui documenti raw: SLA esatta come in KPIEngine (richieste
+        nello stato del KPI entro la durata della famiglia), p50/p95/p99 stimati dal t-digest.
+        """
+        giorni = giorni or self.sketch_days
+        self._print_section(f"1. SLA COMPLIANCE PER OPERAZIONE (sketch, ultimi {giorni} giorni)")
 
-        response = self.client.search(
-            index=self.index_name,
-            body={
-                'size': 0,
-                'aggs': {
-                    'by_stato': {
-                        'terms': {'field': 'stato', 'size': 20}
-                    }
+        sketches = IAMKpiSketches(client=self.client, source_index=self.index_name,
+                                  sketch_index=self.sketch_index)
+        stime = sketches.percentili(giorni=giorni)
+
+        results = {}
+        for op_name, stima in sorted(stime.items(), key=lambda item: -item[1]['total'])[:50]:
+            sla_pct = stima['sla_percentage']
+            if sla_pct is None:
+                status = f"{Colors.YELLOW}-{Colors.RESET}"
+            else:
+                status = f"{Colors.GREEN}✓{Colors.RESET}" if sla_pct >= 80 else f"{Colors.RED}✗{Colors.RESET}"
+
+            completed = stima['completed']
+            sla_label = (f"{stima['sla_passed']:3d}/{stima['sla_total']:3d} {stima['sla_status']} "
+                         f"({sla_pct:5.1f}% entro {stima['sla_duration']:g}h)"
+                         if sla_pct is not None else "n/d (famiglia senza durata KPI)")
+            print(f"{status} {op_name}")
+            print(f"   Totale: {stima['total']:4d} | SLA: {sla_label}")
+            if completed:
+                print(f"   Durata: media {stima['avg_hours']:6.1f}h | max {stima['max_hours']:6.1f}h | "
+                      f"p50 {stima['p50_hours']:6.1f}h | p95 {stima['p95_hours']:6.1f}h | p99 {stima['p99_hours']:6.1f}h")
+
+            results[op_name] = {
+                'total': stima['total'],
+                'sla_total': stima['sla_total'],
+                'sla_passed': stima['sla_passed'],
+                'sla_failed': stima['sla_failed'],
+                'sla_percentage': sla_pct,
+                'avg_hours': stima['avg_hours'],
+                'max_hours': stima['max_hours'],
+                'p50_hours': stima['p50_hours'],
+                'p95_hours': stima['p95_hours'],
+                'p99_hours': stima['p99_hours']
+            }
+
+        return results
+
+    def _body_stato_distribution(self) -> Dict:
+        """Richiesta _search per analisi_stato_distribution"""
+        return {
+            'size': 0,
+            'track_total_hits': True,
+            'aggs': {
+                'by_stato': {
+                    'terms': {'field': 'stato', 'size': 20}
                 }
             }
-        )
+        }
 
-        total_docs = self.client.count(index=self.index_name)['count']
+    def analisi_stato_distribution(self, response: Optional[Dict] = None) -> Dict:
+        """Distribuzione richieste per stato"""
+        self._print_section("2. DISTRIBUZIONE RICHIESTE PER STATO")
+
+        if response is None:
+            response = self.client.search(index=self.index_name, body=self._body_stato_distribution())
+
+        # Totale documenti dalla stessa risposta (track_total_hits), senza una count separata
+        total_docs = response['hits']['total']['value']
         results = {}
 
         for bucket in response['aggregations']['by_stato']['buckets']:
@@ -161,27 +234,29 @@ class IAMAnalyzer:
 
         return results
 
-    def analisi_operazioni_lente(self, threshold_hours=24) -> List[Dict]:
-        """Identifica operazioni lente"""
-        self._print_section(f"3. OPERAZIONI LENTE (>{threshold_hours}h)")
-
-        response = self.client.search(
-            index=self.index_name,
-            body={
-                'query': {'range': {'durata_ore': {'gte': threshold_hours}}},
-                'size': 0,
-                'aggs': {
-                    'lente_ops': {
-                        'terms': {'field': 'fk_nome_operazione', 'size': 30},
-                        'aggs': {
-                            'count': {'value_count': {'field': 'id_richiesta'}},
-                            'avg_durata': {'avg': {'field': 'durata_ore'}},
-                            'max_durata': {'max': {'field': 'durata_ore'}}
-                        }
+    def _body_operazioni_lente(self, threshold_hours=24) -> Dict:
+        """Richiesta _search per analisi_operazioni_lente"""
+        return {
+            'query': {'range': {'durata_ore': {'gte': threshold_hours}}},
+            'size': 0,
+            'aggs': {
+                'lente_ops': {
+                    'terms': {'field': 'fk_nome_operazione', 'size': 30},
+                    'aggs': {
+                        'count': {'value_count': {'field': 'id_richiesta'}},
+                        'avg_durata': {'avg': {'field': 'durata_ore'}},
+                        'max_durata': {'max': {'field': 'durata_ore'}}
                     }
                 }
             }
-        )
+        }
+
+    def analisi_operazioni_lente(self, threshold_hours=24, response: Optional[Dict] = None) -> List[Dict]:
+        """Identifica operazioni lente"""
+        self._print_section(f"3. OPERAZIONI LENTE (>{threshold_hours}h)")
+
+        if response is None:
+            response = self.client.search(index=self.index_name, body=self._body_operazioni_lente(threshold_hours))
 
         results = []
         total_slow = response['hits']['total']['value']
@@ -205,27 +280,29 @@ class IAMAnalyzer:
 
         return results
 
-    def analisi_utenti_top(self, limit=10) -> List[Dict]:
-        """Top utenti per richieste"""
-        self._print_section(f"4. TOP {limit} UTENTI PER RICHIESTE")
-
-        response = self.client.search(
-            index=self.index_name,
-            body={
-                'size': 0,
-                'aggs': {
-                    'top_users': {
-                        'terms': {'field': 'fk_utente_richiedente', 'size': limit},
-                        'aggs': {
-                            'user_name': {'terms': {'field': 'nome_utente.keyword', 'size': 1}},
-                            'count': {'value_count': {'field': 'id_richiesta'}},
-                            'avg_durata': {'avg': {'field': 'durata_ore'}},
-                            'sla_rispettate': {'filter': {'term': {'sla_rispettato': True}}}
-                        }
+    def _body_utenti_top(self, limit=10) -> Dict:
+        """Richiesta _search per analisi_utenti_top"""
+        return {
+            'size': 0,
+            'aggs': {
+                'top_users': {
+                    'terms': {'field': 'fk_utente_richiedente', 'size': limit},
+                    'aggs': {
+                        'user_name': {'terms': {'field': 'nome_utenza', 'size': 1}},
+                        'count': {'value_count': {'field': 'id_richiesta'}},
+                        'avg_durata': {'avg': {'field': 'durata_ore'}},
+                        'sla_rispettate': {'filter': {'term': {'sla_rispettato': True}}}
                     }
                 }
             }
-        )
+        }
+
+    def analisi_utenti_top(self, limit=10, response: Optional[Dict] = None) -> List[Dict]:
+        """Top utenti per richieste"""
+        self._print_section(f"4. TOP {limit} UTENTI PER RICHIESTE")
+
+        if response is None:
+            response = self.client.search(index=self.index_name, body=self._body_utenti_top(limit))
 
         results = []
         for i, bucket in enumerate(response['aggregations']['top_users']['buckets'], 1):
@@ -250,28 +327,78 @@ class IAMAnalyzer:
 
         return results
 
-    def analisi_trend_temporale(self, interval='1d') -> Dict:
-        """Trend richieste nel tempo"""
-        self._print_section(f"5. TREND TEMPORALE (intervallo: {interval})")
+    # Analisi che con use_rollup=True interrogano l'indice rollup invece del raw
+    ROLLUP_ANALYSES = ('trend_temporale',)
+
+    def _analysis_index(self, name: str, raw_index: Optional[str] = None) -> str:
+        """Indice su cui eseguire un'analisi (raw_index: partizioni della finestra, vedi _raw_index)"""
+        if self.use_rollup and name in self.ROLLUP_ANALYSES:
+            return self.rollup_index
+        return raw_index or self.index_name
 
-        response = self.client.search(
-            index=self.index_name,
-            body={
+    def _raw_index(self, giorni: Optional[int]) -> str:
+        """Partizioni mensili degli ultimi N giorni (alias di lettura senza finestra)"""
+        if not giorni:
+            return self.index_name
+        try:
+            return self.partitions.indices_for_range(date.today() - timedelta(days=giorni))
+        except Exception as e:
+            print(f"⚠ Partizioni non risolte ({e}): analisi sull'alias '{self.index_name}'")
+            return self.index_name
+
+    def _con_finestra(self, name: str, body: Dict, giorni: Optional[int]) -> Dict:
+        """Body dell'analisi limitato alle richieste create negli ultimi N giorni"""
+        if not giorni:
+            return body
+        field = 'day' if self.use_rollup and name in self.ROLLUP_ANALYSES else 'data_creazione'
+        filtri = [{'range': {field: {'gte': f"now-{giorni}d/d"}}}]
+        if 'query' in body:
+            filtri.append(body['query'])
+        return {**body, 'query': {'bool': {'filter': filtri}}}
+
+    def _body_trend_temporale(self, interval='1d') -> Dict:
+        """Richiesta _search per analisi_trend_temporale"""
+        if self.use_rollup:
+            # Un documento rollup per giorno/operazione/tipo/stato: si sommano i contatori
+            return {
                 'size': 0,
                 'aggs': {
                     'timeline': {
                         'date_histogram': {
-                            'field': 'data_creazione',
+                            'field': 'day',
                             'fixed_interval': interval
                         },
                         'aggs': {
-                            'count': {'value_count': {'field': 'id_richiesta'}},
-                            'sla_ok': {'filter': {'term': {'sla_rispettato': True}}}
+                            'count': {'sum': {'field': 'count'}},
+                            'sla_ok': {'sum': {'field': 'sla_ok'}}
                         }
                     }
                 }
             }
-        )
+
+        return {
+            'size': 0,
+            'aggs': {
+                'timeline': {
+                    'date_histogram': {
+                        'field': 'data_creazione',
+                        'fixed_interval': interval
+                    },
+                    'aggs': {
+                        'count': {'value_count': {'field': 'id_richiesta'}},
+                        'sla_ok': {'filter': {'term': {'sla_rispettato': True}}}
+                    }
+                }
+            }
+        }
+
+    def analisi_trend_temporale(self, interval='1d', response: Optional[Dict] = None) -> Dict:
+        """Trend richieste nel tempo"""
+        self._print_section(f"5. TREND TEMPORALE (intervallo: {interval})")
+
+        if response is None:
+            response = self.client.search(index=self._analysis_index('trend_temporale'),
+                                          body=self._body_trend_temporale(interval))
 
         results = {}
         print("Data          | Richieste | SLA OK | Trend")
@@ -279,8 +406,9 @@ class IAMAnalyzer:
 
         for bucket in response['aggregations']['timeline']['buckets'][-30:]:  # Ultimi 30 intervalli
             timestamp = bucket['key_as_string'][:10]
-            count = bucket['count']['value']
-            sla_ok = bucket['sla_ok']['doc_count']
+            count = int(bucket['count']['value'] or 0)
+            # filter sul raw (doc_count) o sum sul rollup (value)
+            sla_ok = int(bucket['sla_ok'].get('doc_count', bucket['sla_ok'].get('value') or 0))
             sla_pct = (sla_ok / count * 100) if count > 0 else 0
 
             bar = '█' * max(1, int(count / 5))
@@ -294,26 +422,28 @@ class IAMAnalyzer:
 
         return results
 
-    def analisi_priorita(self) -> Dict:
-        """Analisi per priorità"""
-        self._print_section("6. ANALISI PER PRIORITÀ")
-
-        response = self.client.search(
-            index=self.index_name,
-            body={
-                'size': 0,
-                'aggs': {
-                    'by_priorita': {
-                        'terms': {'field': 'priorita'},
-                        'aggs': {
-                            'count': {'value_count': {'field': 'id_richiesta'}},
-                            'avg_durata': {'avg': {'field': 'durata_ore'}},
-                            'sla_ok': {'filter': {'term': {'sla_rispettato': True}}}
-                        }
+    def _body_priorita(self) -> Dict:
+        """Richiesta _search per analisi_priorita"""
+        return {
+            'size': 0,
+            'aggs': {
+                'by_priorita': {
+                    'terms': {'field': 'priorita'},
+                    'aggs': {
+                        'count': {'value_count': {'field': 'id_richiesta'}},
+                        'avg_durata': {'avg': {'field': 'durata_ore'}},
+                        'sla_ok': {'filter': {'term': {'sla_rispettato': True}}}
                     }
                 }
             }
-        )
+        }
+
+    def analisi_priorita(self, response: Optional[Dict] = None) -> Dict:
+        """Analisi per priorità"""
+        self._print_section("6. ANALISI PER PRIORITÀ")
+
+        if response is None:
+            response = self.client.search(index=self.index_name, body=self._body_priorita())
 
         results = {}
         for bucket in response['aggregations']['by_priorita']['buckets']:
@@ -333,26 +463,28 @@ class IAMAnalyzer:
 
         return results
 
-    def analisi_area_responsabile(self) -> Dict:
-        """Analisi per area responsabile"""
-        self._print_section("7. ANALISI PER AREA RESPONSABILE")
-
-        response = self.client.search(
-            index=self.index_name,
-            body={
-                'size': 0,
-                'aggs': {
-                    'by_area': {
-                        'terms': {'field': 'area_responsabile', 'size': 20},
-                        'aggs': {
-                            'count': {'value_count': {'field': 'id_richiesta'}},
-                            'avg_durata': {'avg': {'field': 'durata_ore'}},
-                            'sla_ok': {'filter': {'term': {'sla_rispettato': True}}}
-                        }
+    def _body_area_responsabile(self) -> Dict:
+        """Richiesta _search per analisi_area_responsabile"""
+        return {
+            'size': 0,
+            'aggs': {
+                'by_area': {
+                    'terms': {'field': 'area_responsabile', 'size': 20},
+                    'aggs': {
+                        'count': {'value_count': {'field': 'id_richiesta'}},
+                        'avg_durata': {'avg': {'field': 'durata_ore'}},
+                        'sla_ok': {'filter': {'term': {'sla_rispettato': True}}}
                     }
                 }
             }
-        )
+        }
+
+    def analisi_area_responsabile(self, response: Optional[Dict] = None) -> Dict:
+        """Analisi per area responsabile"""
+        self._print_section("7. ANALISI PER AREA RESPONSABILE")
+
+        if response is None:
+            response = self.client.search(index=self.index_name, body=self._body_area_responsabile())
 
         results = {}
         for bucket in response['aggregations']['by_area']['buckets']:
@@ -372,24 +504,230 @@ class IAMAnalyzer:
 
         return results
 
-    def esegui_tutte_analisi(self) -> Dict:
-        """Esegue tutte le analisi e ritorna i risultati"""
-        all_results = {
-            'sla_by_operazione': self.analisi_sla_by_operazione(),
-            'stato_distribution': self.analisi_stato_distribution(),
-            'operazioni_lente': self.analisi_operazioni_lente(),
-            'utenti_top': self.analisi_utenti_top(),
-            'trend_temporale': self.analisi_trend_temporale(),
-            'priorita': self.analisi_priorita(),
-            'area_responsabile': self.analisi_area_responsabile(),
-            'timestamp': datetime.now().isoformat()
+    def _body_sla_composite(self, sla_hours=72) -> Dict:
+        """Richiesta _search per analisi_sla_composite: solo le radici degli alberi (albero.livello = 0)"""
+        return {
+            'size': 0,
+            'query': {'bool': {'filter': [{'term': {'albero.livello': 0}}]}},
+            'aggs': {
+                'by_operazione': {
+                    'terms': {'field': 'fk_nome_operazione', 'size': 50},
+                    'aggs': {
+                        'completi': {'filter': {'term': {'albero.completo': True}}},
+                        'entro_sla': {'filter': {'range': {'albero.durata_ore': {'lte': sla_hours}}}},
+                        'avg_durata': {'avg': {'field': 'albero.durata_ore'}},
+                        'max_durata': {'max': {'field': 'albero.durata_ore'}},
+                        'p95_durata': {'percentiles': {'field': 'albero.durata_ore', 'percents': [95]}},
+                        'avg_discendenti': {'avg': {'field': 'albero.discendenti'}},
+                        'stato_peggiore': {'terms': {'field': 'albero.stato_peggiore', 'size': 10}}
+                    }
+                }
+            }
         }
 
+    def analisi_sla_composite(self, sla_hours=72, response: Optional[Dict] = None) -> Dict:
+        """SLA end-to-end delle richieste composite (aggregati padre/figli di iam_tree.py)"""
+        self._print_section(f"8. SLA RICHIESTE COMPOSITE (end-to-end entro {sla_hours}h)")
+
+        if response is None:
+            response = self.client.search(index=self.index_name, body=self._body_sla_composite(sla_hours))
+
+        results = {}
+        for bucket in response['aggregations']['by_operazione']['buckets']:
+            op_name = bucket['key']
+            total = bucket['doc_count']
+            completi = bucket['completi']['doc_count']
+            entro_sla = bucket['entro_sla']['doc_count']
+            sla_pct = (entro_sla / completi * 100) if completi > 0 else 0
+            avg_dur = bucket['avg_durata']['value'] or 0
+            p95 = bucket['p95_durata']['values'].get('95.0') or 0
+            stati = {b['key']: b['doc_count'] for b in bucket['stato_peggiore']['buckets']}
+
+            status = f"{Colors.GREEN}✓{Colors.RESET}" if sla_pct >= 80 else f"{Colors.RED}✗{Colors.RESET}"
+            print(f"{status} {op_name}")
+            print(f"   Alberi: {total:4d} (completi {completi}) | SLA: {entro_sla:3d}/{completi:3d} ({sla_pct:5.1f}%) | "
+                  f"figli medi {bucket['avg_discendenti']['value'] or 0:.1f}")
+            print(f"   Durata end-to-end: media {avg_dur:6.1f}h | p95 {p95:6.1f}h | stato peggiore: {stati}")
+
+            results[op_name] = {
+                'trees': total,
+                'completed': completi,
+                'sla_passed': entro_sla,
+                'sla_percentage': round(sla_pct, 2),
+                'avg_hours': round(avg_dur, 2),
+                'max_hours': round(bucket['max_durata']['value'] or 0, 2),
+                'p95_hours': round(p95, 2),
+                'avg_descendants': round(bucket['avg_discendenti']['value'] or 0, 2),
+                'worst_states': stati
+            }
+
+        return results
+
+    def index_generation(self) -> Optional[str]:
+        """
+        Generazione dell'indice, usata come chiave della cache delle analisi: per ogni indice
+        letto numero di documenti e massimo dei campi data che cambiano a ogni scrittura
+        (GENERATION_FIELDS_*). Valori persistiti nei documenti: a differenza dei contatori di
+        indexing non ripartono da zero dopo un riavvio dei nodi o lo spostamento di uno shard.
+        """
+        try:
+            indices = ([(self.index_name, GENERATION_FIELDS_RICHIESTE)]
+                       + ([(self.rollup_index, GENERATION_FIELDS_DERIVATI)] if self.use_rollup else [])
+                       + ([(self.sketch_index, GENERATION_FIELDS_DERIVATI)] if self.use_sketch else []))
+            msearch_body = []
+            for index, fields in indices:
+                msearch_body.extend([{'index': index}, {
+                    'size': 0,
+                    'track_total_hits': True,
+                    'aggs': {f"max_{i}": {'max': {'field': field}} for i, field in enumerate(fields)}
+                }])
+            responses = self.client.msearch(body=msearch_body)['responses']
+
+            parts = []
+            for (index, _), response in zip(indices, responses):
+                if 'error' in response:
+                    raise RuntimeError(f"{index}: {response['error']}")
+                values = [response['hits']['total']['value']]
+                values += [agg['value'] for _, agg in sorted(response.get('aggregations', {}).items())]
+                parts.append(':'.join('-' if value is None else str(int(value)) for value in values))
+            return '|'.join(parts)
+        except Exception as e:
+            print(f"⚠ Generazione indice non disponibile ({e}), cache disabilitata")
+            return None
+
+    def _load_cache(self, generation: str, giorni: Optional[int] = None) -> Optional[Dict]:
+        """Risultati in cache se calcolati sulla stessa generazione dell'indice"""
+        try:
+            if self.cache_file and Path(self.cache_file).exists():
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    cached = json.load(f)
+                if (cached.get('index') == self.index_name and cached.get('generation') == generation
+                        and cached.get('use_rollup', False) == self.use_rollup
+                        and cached.get('use_sketch', False) == self.use_sketch
+                        and cached.get('giorni') == giorni):
+                    return cached['results']
+        except Exception as e:
+            print(f"⚠ Cache analisi non leggibile: {e}")
+        return None
+
+    def _save_cache(self, generation: str, results: Dict, giorni: Optional[int] = None):
+        """Salva i risultati con la generazione dell'indice su cui sono stati calcolati"""
+        try:
+            with open(self.cache_file, 'w', encoding='utf-8') as f:
+                json.dump({'index': self.index_name, 'generation': generation,
+                           'use_rollup': self.use_rollup, 'use_sketch': self.use_sketch,
+                           'giorni': giorni, 'results': results},
+                          f, indent=2, ensure_ascii=False)
+        except Exception as e:
+            print(f"⚠ Cache analisi non salvata: {e}")
+
+    def _sketch_disponibili(self) -> bool:
+        """True se l'indice degli sketch KPI esiste e contiene almeno un documento"""
+        try:
+            return self.client.count(index=self.sketch_index)['count'] > 0
+        except Exception:
+            return False
+
+    def _search_analisi(self, index: str, body: Dict) -> Dict:
+        """Ricerca di una sola analisi; un errore diventa la voce 'error' come nelle risposte _msearch"""
+        try:
+            return self.client.search(index=index, body=body)
+        except Exception as e:
+            return {'error': str(e)}
+
+    def esegui_tutte_analisi(self, use_cache: bool = True, giorni: Optional[int] = None) -> Dict:
+        """
+        Esegue tutte le analisi con un unico _msearch e ritorna i risultati.
+        Con giorni solo le richieste create negli ultimi N giorni, interrogando le sole
+        partizioni mensili coinvolte (SLA da sketch sugli stessi giorni).
+        Se l'indice non è cambiato dall'ultima esecuzione restituisce i risultati in cache.
+        """
+        if self.use_sketch and not self._sketch_disponibili():
+            # Prima del primo sync completo (o con update_sketches=False) l'indice non esiste
+            print(f"{Colors.YELLOW}⚠ Indice sketch '{self.sketch_index}' assente o vuoto: "
+                  f"SLA per operazione dai documenti raw{Colors.RESET}")
+            self.use_sketch = False
+
+        generation = self.index_generation() if use_cache and self.cache_file else None
+        if generation:
+            cached = self._load_cache(generation, giorni)
+            if cached is not None:
+                self._print_section("✓ ANALISI DA CACHE (indice invariato)")
+                print(f"Generazione indice: {generation}")
+                print(f"Timestamp calcolo: {cached.get('timestamp')}")
+                return cached
+
+        analisi = [
+            ('sla_by_operazione', self._body_sla_by_operazione(), self.analisi_sla_by_operazione),
+            ('stato_distribution', self._body_stato_distribution(), self.analisi_stato_distribution),
+            ('operazioni_lente', self._body_operazioni_lente(), self.analisi_operazioni_lente),
+            ('utenti_top', self._body_utenti_top(), self.analisi_utenti_top),
+            ('trend_temporale', self._body_trend_temporale(), self.analisi_trend_temporale),
+            ('priorita', self._body_priorita(), self.analisi_priorita),
+            ('area_responsabile', self._body_area_responsabile(), self.analisi_area_responsabile),
+            ('sla_composite', self._body_sla_composite(), self.analisi_sla_composite)
+        ]
+
+        all_results = {}
+        has_errors = False
+        if self.use_sketch:
+            # SLA e percentili dagli sketch: niente percentiles sui documenti raw nel _msearch
+            analisi = [a for a in analisi if a[0] != 'sla_by_operazione']
+            try:
+                with span('analisi.sla_by_operazione', source='sketch'):
+                    all_results['sla_by_operazione'] = self.analisi_sla_da_sketch(giorni)
+            except Exception as e:
+                has_errors = True
+                print(f"{Colors.RED}✗ Analisi 'sla_by_operazione' da sketch fallita: {e}{Colors.RESET}")
+                all_results['sla_by_operazione'] = {'error': str(e)}
+
+        # Indici risolti una volta (la finestra legge l'elenco delle partizioni)
+        analisi = [(name, self._con_finestra(name, body, giorni), analyze) for name, body, analyze in analisi]
+        raw_index = self._raw_index(giorni)
+        indici = {name: self._analysis_index(name, raw_index) for name, _, _ in analisi}
+
+        # Un solo round-trip per tutte le aggregazioni
+        msearch_body = []
+        for name, body, _ in analisi:
+            msearch_body.extend([{'index': indici[name]}, body])
+        try:
+            with span('analisi.msearch', searches=len(analisi)):
+                responses = self.client.msearch(body=msearch_body)['responses']
+        except Exception as e:
+            # Errore di trasporto sull'intero _msearch: una ricerca per analisi, errori isolati
+            print(f"⚠ _msearch non riuscito ({e}): analisi eseguite singolarmente")
+            responses = [self._search_analisi(indici[name], body) for name, body, _ in analisi]
+
+        for (name, _, analyze), response in zip(analisi, responses):
+            if 'error' in response:
+                has_errors = True
+                print(f"{Colors.RED}✗ Analisi '{name}' fallita: {response['error']}{Colors.RESET}")
+                all_results[name] = {'error': str(response['error'])}
+                registra(f"analisi.{name}", 0.0, status='error')
+                continue
+            t0 = time.perf_counter()
+            try:
+                all_results[name] = analyze(response=response)
+            except Exception as e:
+                has_errors = True
+                print(f"{Colors.RED}✗ Analisi '{name}' fallita: {e}{Colors.RESET}")
+                all_results[name] = {'error': str(e)}
+                registra(f"analisi.{name}", 0.0, status='error')
+                continue
+            # Latenza lato server ('took') + elaborazione della risposta in Python
+            python_ms = (time.perf_counter() - t0) * 1000
+            registra(f"analisi.{name}", response.get('took', 0) + python_ms, took_ms=response.get('took'),
+                     python_ms=round(python_ms, 3), index=indici[name])
+
+        all_results['timestamp'] = datetime.now().isoformat()
+
         self._print_section("✓ ANALISI COMPLETATA")
         print(f"Timestamp: {all_results['timestamp']}")
 
-        return all_results
+        if generation and not has_errors:
+            self._save_cache(generation, all_results, giorni)
 
+        return all_results
 
 if __name__ == '__main__':
     print("="*80)
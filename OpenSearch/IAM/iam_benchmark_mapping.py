@@ -0,0 +1,181 @@
+"""
+================================================================================
+FILE: iam_benchmark_mapping.py
+================================================================================
+Benchmark mapping iam-richieste: schema v1 vs profilo ottimizzato (iam_schema.py)
+
+Carica le stesse richieste sintetiche in due indici:
+- v1: mapping precedente (dynamic, nessun index sort, ordinali lazy)
+- v2: richieste_mappings()/richieste_settings() (index sort su data_creazione,
+      eager_global_ordinals, doc_values/norms disattivati dove inutili)
+
+poi riesegue le aggregazioni di IAMAnalyzer su entrambi e riporta la latenza
+(prima esecuzione dopo il refresh e p50/p95 successive) e la dimensione su disco.
+
+UTILIZZO:
+    python iam_benchmark_mapping.py
+    python iam_benchmark_mapping.py --docs 2000000 --runs 30 --shards 2
+================================================================================
+"""
+
+import argparse
+import random
+import statistics
+from datetime import datetime, timedelta
+
+from opensearchpy import OpenSearch, helpers
+
+from iam_analyzer import IAMAnalyzer
+from iam_schema import richieste_mappings, richieste_settings
+
+INDEX_V1 = 'iam-bench-mapping-v1'
+INDEX_V2 = 'iam-bench-mapping-v2'
+
+# Mapping usato finora per iam-richieste (nomi minuscoli letti da IAMAnalyzer)
+MAPPINGS_V1 = {'properties': {
+    'id_richiesta': {'type': 'keyword'},
+    'fk_id_oggetto': {'type': 'integer'},
+    'nome_utenza': {'type': 'text', 'fields': {'keyword': {'type': 'keyword'}}},
+    'fk_tipo_richiesta': {'type': 'keyword'},
+    'fk_tipo_utenza': {'type': 'keyword'},
+    'fk_nome_operazione': {'type': 'keyword'},
+    'id_richiesta_parent': {'type': 'integer'},
+    'data_creazione': {'type': 'date'},
+    'data_chiusura': {'type': 'date'},
+    'fk_utente': {'type': 'keyword'},
+    'fk_utente_richiedente': {'type': 'keyword'},
+    'stato': {'type': 'keyword'},
+    'nota': {'type': 'text'},
+    'flag_transazione': {'type': 'keyword'},
+    'data_storicizzazione': {'type': 'date'},
+    'priorita_secondaria': {'type': 'integer'},
+    'tipo_op_secondaria': {'type': 'integer'},
+    'comunicazione_uf': {'type': 'text'},
+    'durata_ore': {'type': 'float'},
+    'data_inserimento_es': {'type': 'date'}
+}}
+
+OPERAZIONI = [f"{base}_{sistema}" for base in ('RESET_PASSWORD', 'CREAZIONE_ACCOUNT', 'BLOCCO', 'PROROGA',
+                                               'MODIFICA_PARAMETRI', 'RIATTIVAZIONE', 'CANCELLAZIONE')
+              for sistema in ('AD', 'LDAP', 'SAP', 'RACF', 'ORACLE', 'UNIX')]
+STATI = ['EVASA'] * 6 + ['NON EVASA', 'ANNULLATA', 'IN LAVORAZIONE']
+TIPI_UTENZA = ['INTERNA', 'ESTERNA', 'TECNICA', 'AMMINISTRATIVA']
+
+
+def documenti(n_docs: int, days: int, seed: int):
+    """Richieste sintetiche degli ultimi N giorni, identiche per entrambi gli indici"""
+    rng = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    for i in range(n_docs):
+        creazione = now - timedelta(seconds=rng.randint(0, days * 86400))
+        chiusura = creazione + timedelta(hours=rng.expovariate(1 / 18)) if rng.random() < 0.85 else None
+        yield str(i), {
+            'id_richiesta': str(i),
+            'fk_id_oggetto': i % 5000,
+            'nome_utenza': f"U{i % 50000:06d}",
+            'fk_tipo_richiesta': 'STD',
+            'fk_tipo_utenza': rng.choice(TIPI_UTENZA),
+            'fk_nome_operazione': rng.choice(OPERAZIONI),
+            'data_creazione': creazione.isoformat(),
+            'data_chiusura': chiusura.isoformat() if chiusura else None,
+            'fk_utente': f"OP{i % 300:03d}",
+            'fk_utente_richiedente': f"R{i % 8000:05d}",
+            'stato': rng.choice(STATI),
+            'nota': 'Richiesta gestita manualmente dal presidio' if rng.random() < 0.1 else None,
+            'flag_transazione': 'N',
+            'priorita_secondaria': rng.randint(0, 3),
+            'tipo_op_secondaria': 0,
+            'durata_ore': round((chiusura - creazione).total_seconds() / 3600, 2) if chiusura else None
+        }
+
+
+def carica(client: OpenSearch, args):
+    """Ricrea i due indici e li popola con lo stesso flusso di documenti"""
+    for index in (INDEX_V1, INDEX_V2):
+        if client.indices.exists(index=index):
+            client.indices.delete(index=index)
+
+    client.indices.create(index=INDEX_V1, body={
+        'settings': {'number_of_shards': args.shards, 'number_of_replicas': 0, 'index': {'refresh_interval': '-1'}},
+        'mappings': MAPPINGS_V1
+    })
+    client.indices.create(index=INDEX_V2, body={
+        'settings': richieste_settings(shards=args.shards, refresh_interval='-1'),
+        'mappings': richieste_mappings()
+    })
+
+    def azioni():
+        for doc_id, doc in documenti(args.docs, args.days, args.seed):
+            yield {'_index': INDEX_V1, '_id': doc_id, '_source': doc}
+            yield {'_index': INDEX_V2, '_id': doc_id, '_source': doc}
+
+    helpers.bulk(client, azioni(), chunk_size=5000, max_chunk_bytes=10 * 1024 * 1024, request_timeout=300)
+
+    for index in (INDEX_V1, INDEX_V2):
+        client.indices.put_settings(index=index, body={'index': {'refresh_interval': '5s'}})
+    client.indices.refresh(index=f"{INDEX_V1},{INDEX_V2}")
+    if args.merge:
+        client.indices.forcemerge(index=f"{INDEX_V1},{INDEX_V2}", max_num_segments=1, request_timeout=3600)
+
+
+def dimensione_mb(client: OpenSearch, index: str) -> float:
+    """Dimensione su disco (primari) in MB"""
+    stats = client.indices.stats(index=index, metric='store')['indices'][index]
+    return stats['primaries']['store']['size_in_bytes'] / 1024 / 1024
+
+
+def misura(client: OpenSearch, index: str, body: dict, runs: int) -> dict:
+    """Latenza server ('took', ms): prima esecuzione e p50/p95 delle successive, request cache disabilitata"""
+    timings = [client.search(index=index, body=body, request_cache=False)['took'] for _ in range(runs + 1)]
+    prima, resto = timings[0], sorted(timings[1:])
+    return {'prima': prima, 'p50': statistics.median(resto),
+            'p95': resto[min(len(resto) - 1, int(len(resto) * 0.95))]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark mapping iam-richieste v1 vs profilo ottimizzato')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9200)
+    parser.add_argument('--docs', type=int, default=1_000_000)
+    parser.add_argument('--days', type=int, default=365, help='Giorni di storia sintetica')
+    parser.add_argument('--shards', type=int, default=2, help='Shard di entrambi gli indici')
+    parser.add_argument('--runs', type=int, default=20, help='Ripetizioni per aggregazione')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-merge', dest='merge', action='store_false', help='Non eseguire il force-merge')
+    parser.add_argument('--keep', action='store_true', help='Non eliminare gli indici di benchmark')
+    args = parser.parse_args()
+
+    client = OpenSearch(hosts=[{'host': args.host, 'port': args.port}], use_ssl=False,
+                        verify_certs=False, ssl_show_warn=False, timeout=300)
+    analyzer = IAMAnalyzer(host=args.host, port=args.port, cache_file=None)
+
+    print(f"⏳ Caricamento {args.docs:,} richieste in '{INDEX_V1}' e '{INDEX_V2}'...")
+    carica(client, args)
+
+    analisi = [
+        ('sla_by_operazione', analyzer._body_sla_by_operazione()),
+        ('stato_distribution', analyzer._body_stato_distribution()),
+        ('operazioni_lente', analyzer._body_operazioni_lente()),
+        ('utenti_top', analyzer._body_utenti_top()),
+        ('trend_temporale', analyzer._body_trend_temporale()),
+        ('priorita', analyzer._body_priorita()),
+        ('area_responsabile', analyzer._body_area_responsabile())
+    ]
+
+    print(f"\n{'Analisi':20s} | {'v1 prima':>8s} | {'v1 p50/p95':>15s} | {'v2 prima':>8s} | {'v2 p50/p95':>15s}")
+    print('-' * 80)
+    for name, body in analisi:
+        v1 = misura(client, INDEX_V1, body, args.runs)
+        v2 = misura(client, INDEX_V2, body, args.runs)
+        print(f"{name:20s} | {v1['prima']:6d}ms | {v1['p50']:5.1f} / {v1['p95']:5d} ms | "
+              f"{v2['prima']:6d}ms | {v2['p50']:5.1f} / {v2['p95']:5d} ms")
+
+    size_v1, size_v2 = dimensione_mb(client, INDEX_V1), dimensione_mb(client, INDEX_V2)
+    print(f"\nDisco: v1 {size_v1:,.1f} MB | v2 {size_v2:,.1f} MB ({(size_v2 - size_v1) / size_v1 * 100:+.1f}%)")
+
+    if not args.keep:
+        client.indices.delete(index=f"{INDEX_V1},{INDEX_V2}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+================================================================================
+FILE: iam_benchmark_operation_family.py
+================================================================================
+Benchmark KPI query: wildcard su fk_nome_operazione vs term su operation_prefix
+
+Crea un indice temporaneo con molte operazioni distinte (come in Griffon),
+classificate con le regole di iam_kpi_config.json, e confronta la latenza
+delle due forme di query per ogni prefisso KPI.
+
+UTILIZZO:
+    python iam_benchmark_operation_family.py
+    python iam_benchmark_operation_family.py --operations 5000 --docs 500000 --runs 30
+================================================================================
+"""
+
+import argparse
+import random
+import statistics
+from datetime import datetime, timedelta
+
+from opensearchpy import OpenSearch, helpers
+
+from iam_operation_rules import OperationClassifier, PREFIX_FIELD
+
+BENCH_INDEX = 'iam-bench-operation-family'
+
+
+def genera_operazioni(classifier: OperationClassifier, n_operations: int) -> list:
+    """Genera nomi operazione distinti: metà sotto i prefissi KPI, metà fuori perimetro"""
+    prefixes = sorted(classifier.prefixes) or ['RESET_PASSWORD']
+    operazioni = set()
+    while len(operazioni) < n_operations:
+        if random.random() < 0.5:
+            base = random.choice(prefixes)
+        else:
+            base = random.choice(['ABILITAZIONE', 'PROFILAZIONE', 'VERIFICA', 'ASSEGNAZIONE', 'AUDIT'])
+        operazioni.add(f"{base}_{random.choice(['AD', 'LDAP', 'SAP', 'RACF', 'ORACLE', 'UNIX'])}_{len(operazioni)}")
+    return list(operazioni)
+
+
+def carica_dati(client: OpenSearch, classifier: OperationClassifier, n_operations: int, n_docs: int):
+    """Crea e popola l'indice di benchmark"""
+    if client.indices.exists(index=BENCH_INDEX):
+        client.indices.delete(index=BENCH_INDEX)
+
+    client.indices.create(index=BENCH_INDEX, body={
+        'settings': {'number_of_shards': 2, 'number_of_replicas': 0, 'index': {'refresh_interval': '-1'}},
+        'mappings': {'properties': {
+            'fk_nome_operazione': {'type': 'keyword'},
+            'stato': {'type': 'keyword'},
+            'data_creazione': {'type': 'date'},
+            'durata_ore': {'type': 'float'},
+            'operation_family': {'type': 'keyword'},
+            'operation_prefix': {'type': 'keyword'}
+        }}
+    })
+
+    operazioni = genera_operazioni(classifier, n_operations)
+    now = datetime.now()
+
+    def documenti():
+        for i in range(n_docs):
+            doc = {
+                'fk_nome_operazione': random.choice(operazioni),
+                'stato': random.choice(['EVASA', 'EVASA', 'EVASA', 'NON EVASA', 'ANNULLATA']),
+                'data_creazione': (now - timedelta(minutes=random.randint(0, 90 * 24 * 60))).isoformat(),
+                'durata_ore': round(random.expovariate(1 / 12), 2)
+            }
+            yield {'_index': BENCH_INDEX, '_id': str(i), '_source': classifier.annotate(doc)}
+
+    helpers.bulk(client, documenti(), chunk_size=5000, max_chunk_bytes=10 * 1024 * 1024)
+    client.indices.put_settings(index=BENCH_INDEX, body={'index': {'refresh_interval': '1s'}})
+    client.indices.refresh(index=BENCH_INDEX)
+    client.indices.forcemerge(index=BENCH_INDEX, max_num_segments=1, request_timeout=600)
+
+
+def misura(client: OpenSearch, query: dict, runs: int) -> dict:
+    """Latenza server ('took', ms) di un count KPI, cache disabilitata"""
+    body = {'size': 0, 'track_total_hits': True, 'query': query}
+    timings = sorted(
+        client.search(index=BENCH_INDEX, body=body, request_cache=False)['took']
+        for _ in range(runs)
+    )
+    return {
+        'p50': statistics.median(timings),
+        'p95': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'hits': client.count(index=BENCH_INDEX, body={'query': query})['count']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark wildcard vs operation_prefix per i KPI IAM')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9200)
+    parser.add_argument('--config', default='iam_kpi_config.json')
+    parser.add_argument('--operations', type=int, default=3000, help='Operazioni distinte')
+    parser.add_argument('--docs', type=int, default=200000, help='Documenti da indicizzare')
+    parser.add_argument('--runs', type=int, default=20, help='Ripetizioni per query')
+    parser.add_argument('--keep', action='store_true', help="Non eliminare l'indice di benchmark")
+    args = parser.parse_args()
+
+    client = OpenSearch(hosts=[{'host': args.host, 'port': args.port}], use_ssl=False,
+                        verify_certs=False, ssl_show_warn=False, timeout=120)
+    classifier = OperationClassifier.from_config_file(args.config)
+
+    print(f"⏳ Caricamento {args.docs:,} documenti con {args.operations:,} operazioni distinte...")
+    carica_dati(client, classifier, args.operations, args.docs)
+
+    print(f"\n{'Prefisso':25s} | {'wildcard p50/p95':>18s} | {'term p50/p95':>14s} | {'hits':>8s}")
+    print('-' * 75)
+
+    totale_wildcard = totale_term = 0.0
+    for prefix in sorted(classifier.prefixes):
+        wildcard = misura(client, {'bool': {'filter': [
+            {'wildcard': {'fk_nome_operazione': f"{prefix}*"}}, {'term': {'stato': 'EVASA'}}
+        ]}}, args.runs)
+        term = misura(client, {'bool': {'filter': [
+            {'term': {PREFIX_FIELD: prefix}}, {'term': {'stato': 'EVASA'}}
+        ]}}, args.runs)
+
+        totale_wildcard += wildcard['p50']
+        totale_term += term['p50']
+        check = '' if wildcard['hits'] == term['hits'] else ' ✗ mismatch'
+        print(f"{prefix:25s} | {wildcard['p50']:7.1f} / {wildcard['p95']:7.1f} ms | "
+              f"{term['p50']:5.1f} / {term['p95']:5.1f} ms | {term['hits']:8d}{check}")
+
+    print('-' * 75)
+    speedup = totale_wildcard / totale_term if totale_term else float('inf')
+    print(f"Totale p50: wildcard {totale_wildcard:.1f} ms, term {totale_term:.1f} ms ({speedup:.1f}x)")
+
+    if not args.keep:
+        client.indices.delete(index=BENCH_INDEX)
+
+
+if __name__ == '__main__':
+    main()
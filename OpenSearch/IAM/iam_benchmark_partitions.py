@@ -0,0 +1,141 @@
+"""
+================================================================================
+FILE: iam_benchmark_partitions.py
+================================================================================
+Benchmark layout indice: monolitico vs partizioni mensili
+
+Carica mese dopo mese la stessa storia sintetica in:
+- un indice monolitico (2 shard, come il vecchio iam-richieste)
+- partizioni mensili gestite da IAMPartitionManager (template + alias)
+
+e a ogni crescita della storia misura la latenza della query "ultimi 30 giorni"
+su monolitico, alias di lettura e sole partizioni selezionate per intervallo.
+
+UTILIZZO:
+    python iam_benchmark_partitions.py
+    python iam_benchmark_partitions.py --months 24 --docs-per-month 100000 --runs 20
+================================================================================
+"""
+
+import argparse
+import random
+import statistics
+from datetime import date, datetime, timedelta
+
+from opensearchpy import OpenSearch, helpers
+
+from iam_partitions import IAMPartitionManager, add_months
+
+MONO_INDEX = 'iam-bench-mono'
+PART_BASE = 'iam-bench-part'
+
+MAPPINGS = {'properties': {
+    'fk_nome_operazione': {'type': 'keyword'},
+    'stato': {'type': 'keyword'},
+    'data_creazione': {'type': 'date'},
+    'durata_ore': {'type': 'float'}
+}}
+
+OPERAZIONI = ['RESET_PASSWORD_AD', 'CREAZIONE_ACCOUNT_LDAP', 'BLOCCO_INATTIVITA', 'MODIFICA_PARAMETRI_SAP',
+              'RIATTIVAZIONE_RACF', 'CANCELLAZIONE_ACCOUNT_AD', 'PROROGA_UTENZA', 'VARIAZIONE_ANAGRAFICA']
+
+
+def query_ultimi_30_giorni(now: datetime) -> dict:
+    """Query di riferimento: ultimi 30 giorni, volumi e durata media per operazione"""
+    return {
+        'size': 0,
+        'query': {'range': {'data_creazione': {'gte': (now - timedelta(days=30)).isoformat()}}},
+        'aggs': {
+            'per_operazione': {
+                'terms': {'field': 'fk_nome_operazione', 'size': 20},
+                'aggs': {'durata_media': {'avg': {'field': 'durata_ore'}}}
+            }
+        }
+    }
+
+
+def documenti_mese(month: date, n_docs: int, partitions: IAMPartitionManager):
+    """Documenti sintetici di un mese, per indice monolitico e partizione"""
+    next_month = add_months(month, 1)
+    span = int((datetime.combine(next_month, datetime.min.time()) -
+                datetime.combine(month, datetime.min.time())).total_seconds())
+
+    for i in range(n_docs):
+        created = datetime.combine(month, datetime.min.time()) + timedelta(seconds=random.randint(0, span - 1))
+        doc = {
+            'fk_nome_operazione': random.choice(OPERAZIONI),
+            'stato': random.choice(['EVASA', 'EVASA', 'EVASA', 'NON EVASA', 'ANNULLATA']),
+            'data_creazione': created.isoformat(),
+            'durata_ore': round(random.expovariate(1 / 12), 2)
+        }
+        doc_id = f"{month:%Y%m}-{i}"
+        yield {'_index': MONO_INDEX, '_id': doc_id, '_source': doc}
+        yield {'_index': partitions.partition_for(doc), '_id': doc_id, '_source': doc}
+
+
+def misura(client: OpenSearch, index: str, body: dict, runs: int) -> dict:
+    """Latenza server ('took', ms), request cache disabilitata"""
+    timings = sorted(client.search(index=index, body=body, request_cache=False)['took'] for _ in range(runs))
+    return {'p50': statistics.median(timings), 'p95': timings[min(len(timings) - 1, int(len(timings) * 0.95))]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark indice monolitico vs partizioni mensili')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9200)
+    parser.add_argument('--months', type=int, default=24, help='Mesi di storia da generare')
+    parser.add_argument('--docs-per-month', type=int, default=50000)
+    parser.add_argument('--step', type=int, default=3, help='Misura ogni N mesi aggiunti')
+    parser.add_argument('--runs', type=int, default=20, help='Ripetizioni per query')
+    parser.add_argument('--keep', action='store_true', help='Non eliminare gli indici di benchmark')
+    args = parser.parse_args()
+
+    client = OpenSearch(hosts=[{'host': args.host, 'port': args.port}], use_ssl=False,
+                        verify_certs=False, ssl_show_warn=False, timeout=300)
+    partitions = IAMPartitionManager(client, PART_BASE)
+
+    for name in [MONO_INDEX] + list(partitions.list_partitions()):
+        if client.indices.exists(index=name):
+            client.indices.delete(index=name)
+
+    client.indices.create(index=MONO_INDEX, body={
+        'settings': {'number_of_shards': 2, 'number_of_replicas': 0},
+        'mappings': MAPPINGS
+    })
+    partitions.put_template(MAPPINGS, {'number_of_shards': 1, 'number_of_replicas': 0})
+
+    now = datetime.now()
+    body = query_ultimi_30_giorni(now)
+    current = date(now.year, now.month, 1)
+
+    print(f"\n{'Mesi':>5s} | {'Docs':>10s} | {'monolitico p50/p95':>19s} | "
+          f"{'alias p50/p95':>15s} | {'pruning p50/p95':>17s} | partizioni")
+    print('-' * 100)
+
+    # La storia cresce all'indietro: il mese corrente è sempre presente
+    for loaded in range(1, args.months + 1):
+        month = add_months(current, -(loaded - 1))
+        helpers.bulk(client, documenti_mese(month, args.docs_per_month, partitions),
+                     chunk_size=5000, max_chunk_bytes=10 * 1024 * 1024)
+
+        if loaded % args.step and loaded != args.months:
+            continue
+
+        client.indices.refresh(index=f"{MONO_INDEX},{partitions.read_alias}")
+        pruned = partitions.indices_for_range(now - timedelta(days=30), None)
+
+        mono = misura(client, MONO_INDEX, body, args.runs)
+        alias = misura(client, partitions.read_alias, body, args.runs)
+        pruning = misura(client, pruned, body, args.runs)
+
+        print(f"{loaded:5d} | {loaded * args.docs_per_month:10,d} | "
+              f"{mono['p50']:7.1f} / {mono['p95']:7.1f} ms | {alias['p50']:5.1f} / {alias['p95']:5.1f} ms | "
+              f"{pruning['p50']:6.1f} / {pruning['p95']:6.1f} ms | {len(pruned.split(','))}")
+
+    if not args.keep:
+        client.indices.delete(index=','.join([MONO_INDEX] + list(partitions.list_partitions())))
+        client.indices.delete_index_template(name=partitions.template_name)
+
+
+if __name__ == '__main__':
+    main()
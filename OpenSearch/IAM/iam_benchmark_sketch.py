@@ -0,0 +1,205 @@
+"""
+================================================================================
+FILE: iam_benchmark_sketch.py
+================================================================================
+Verifica accuratezza degli sketch KPI (iam_sketch.py) rispetto ai valori esatti
+
+Modalità sintetica (default, senza OpenSearch): genera durate per operazione ×
+giorno con distribuzioni diverse (esponenziale, log-normale, bimodale), costruisce
+uno sketch per giorno, li serializza/deserializza come nell'indice, li unisce e
+confronta p50/p95/p99 con i percentili esatti sulle durate ordinate; i contatori
+SLA (solo richieste EVASA, come i KPI) devono coincidere con il conteggio diretto.
+
+Modalità --live: per le operazioni degli ultimi N giorni confronta
+IAMKpiSketches.percentili() con i percentili esatti letti dal raw (scan della
+durata_ore) e con l'aggregazione percentiles di OpenSearch, riportando anche
+il tempo delle due interrogazioni; la SLA degli sketch, sommata per famiglia,
+deve coincidere con totale e richieste entro durata di KPIEngine.calcola_kpi_batch.
+
+UTILIZZO:
+    python iam_benchmark_sketch.py
+    python iam_benchmark_sketch.py --days 60 --rows 5000 --compression 200
+    python iam_benchmark_sketch.py --live --days 30
+================================================================================
+"""
+
+import argparse
+import math
+import random
+import time
+from typing import Dict, List
+
+from opensearchpy import helpers
+
+from iam_kpi_engine import KPIEngine
+from iam_rollup import DEFAULT_EDGES, edge_key
+from iam_sketch import DEFAULT_COMPRESSION, DEFAULT_PERCENTS, IAMKpiSketches, SketchAccumulator, TDigest
+
+DISTRIBUZIONI = {
+    'esponenziale': lambda rng: rng.expovariate(1 / 18),
+    'lognormale': lambda rng: rng.lognormvariate(2, 1.2),
+    'bimodale': lambda rng: rng.uniform(0, 2) if rng.random() < 0.7 else rng.uniform(100, 400)
+}
+
+# Stati sintetici: la SLA conta solo le EVASA (status dei KPI)
+STATI = ['EVASA'] * 7 + ['ANNULLATA', 'NON EVASA', 'IN LAVORAZIONE']
+
+
+def esatto(valori: List[float], q: float) -> float:
+    """Percentile con interpolazione lineare tra le statistiche d'ordine (valori ordinati)"""
+    pos = q * (len(valori) - 1)
+    basso = math.floor(pos)
+    alto = min(basso + 1, len(valori) - 1)
+    return valori[basso] + (valori[alto] - valori[basso]) * (pos - basso)
+
+
+def errore_relativo(stima: float, reale: float) -> float:
+    return abs(stima - reale) / reale * 100 if reale else 0.0
+
+
+def sintetico(args) -> bool:
+    """Sketch giornalieri uniti vs percentili esatti; True se tutti entro la tolleranza"""
+    rng = random.Random(args.seed)
+    # Stati da un generatore separato: le durate restano quelle del seed
+    rng_stati = random.Random(args.seed + 1)
+    ok = True
+    print(f"{'Distribuzione':14s} | {'righe':>9s} | {'centroidi':>9s} | "
+          + ' | '.join(f"{'p' + format(p, 'g'):>5s} esatto / sketch (err%)" for p in DEFAULT_PERCENTS))
+    print('-' * 140)
+
+    for nome, genera in DISTRIBUZIONI.items():
+        accumulatore = SketchAccumulator(DEFAULT_EDGES, args.compression, stato_sla=lambda op: 'EVASA')
+        valori, evase = [], []
+        for giorno in range(args.days):
+            for _ in range(rng.randint(args.rows // 10, args.rows)):
+                durata, stato = genera(rng), rng_stati.choice(STATI)
+                valori.append(durata)
+                if stato == 'EVASA':
+                    evase.append(durata)
+                accumulatore.aggiungi({'fk_nome_operazione': nome, 'data_creazione': f"day-{giorno:04d}",
+                                       'stato': stato, 'durata_ore': durata})
+
+        # Come in lettura: sketch giornalieri serializzati, deserializzati e uniti
+        unione = TDigest(args.compression)
+        for gruppo in accumulatore.gruppi.values():
+            unione.merge(TDigest.from_dict(gruppo['digest'].to_dict()))
+
+        valori.sort()
+        colonne = []
+        for p in DEFAULT_PERCENTS:
+            reale, stima = esatto(valori, p / 100), unione.quantile(p / 100)
+            errore = errore_relativo(stima, reale)
+            ok = ok and errore <= args.tolleranza
+            colonne.append(f"{reale:8.2f} / {stima:8.2f} ({errore:4.2f})")
+
+        # I contatori SLA sono esatti: stesso conteggio del confronto diretto sulle sole EVASA
+        ok = ok and sum(g['sla_count'] for g in accumulatore.gruppi.values()) == len(evase)
+        for edge in DEFAULT_EDGES[:3]:
+            atteso = sum(1 for v in evase if v <= edge)
+            contati = sum(accumulatore.sla_cum(g)[edge_key(edge)] for g in accumulatore.gruppi.values())
+            ok = ok and atteso == contati
+
+        print(f"{nome:14s} | {len(valori):9,d} | {len(unione.means):9d} | " + ' | '.join(colonne))
+
+    return ok
+
+
+def live(args) -> bool:
+    """Sketch nell'indice vs percentili esatti dal raw e aggregazione percentiles"""
+    sketches = IAMKpiSketches(host=args.host, port=args.port, compression=args.compression)
+    client = sketches.client
+
+    t0 = time.perf_counter()
+    stime = sketches.percentili(giorni=args.days)
+    sketch_ms = (time.perf_counter() - t0) * 1000
+    if not stime:
+        print(f"⚠ Nessuno sketch in '{sketches.sketch_index}': eseguire prima un sync o "
+              f"'python iam_sketch.py'")
+        return False
+
+    query = {'range': {'data_creazione': {'gte': f"now-{args.days}d/d"}}}
+    t0 = time.perf_counter()
+    response = client.search(index=sketches.source_index, body={
+        'size': 0,
+        'query': query,
+        'aggs': {'by_operazione': {
+            'terms': {'field': 'fk_nome_operazione', 'size': len(stime)},
+            'aggs': {'pct': {'percentiles': {'field': 'durata_ore', 'percents': list(DEFAULT_PERCENTS)}}}
+        }}
+    }, request_cache=False)
+    agg_ms = (time.perf_counter() - t0) * 1000
+    aggregati = {b['key']: b['pct']['values'] for b in response['aggregations']['by_operazione']['buckets']}
+
+    durate: Dict[str, List[float]] = {}
+    for hit in helpers.scan(client, index=sketches.source_index, size=5000,
+                            query={'query': {'bool': {'filter': [query, {'exists': {'field': 'durata_ore'}}]}}},
+                            _source=['fk_nome_operazione', 'durata_ore']):
+        doc = hit['_source']
+        durate.setdefault(doc.get('fk_nome_operazione'), []).append(doc['durata_ore'])
+
+    ok = True
+    print(f"Sketch: {sketch_ms:.0f} ms | percentiles su raw: {agg_ms:.0f} ms\n")
+    for op, stima in sorted(stime.items(), key=lambda item: -item[1]['completed']):
+        valori = sorted(durate.get(op, []))
+        if not valori:
+            continue
+        righe = []
+        for p in DEFAULT_PERCENTS:
+            reale = esatto(valori, p / 100)
+            valore = stima[f"p{p:g}_hours"]
+            errore = errore_relativo(valore, reale)
+            ok = ok and errore <= args.tolleranza
+            opensearch = aggregati.get(op, {}).get(f"{float(p)}")
+            righe.append(f"p{p:g} {reale:7.2f} / {valore:7.2f} ({errore:4.2f}%) / "
+                         f"{opensearch if opensearch is None else round(opensearch, 2)}")
+        print(f"{op} ({len(valori):,} completate, SLA {stima['sla_percentage']}%)")
+        print(f"   esatto / sketch (err) / percentiles: {' | '.join(righe)}")
+
+    return confronta_kpi(stime, args) and ok
+
+
+def confronta_kpi(stime: Dict[str, Dict], args) -> bool:
+    """SLA degli sketch sommata per famiglia vs KPIEngine sulla stessa finestra (stato e durata del KPI)"""
+    engine = KPIEngine(host=args.host, port=args.port)
+    risultati = engine.calcola_kpi_batch(engine.config.get('kpi', {}), giorni=args.days)
+
+    famiglie: Dict[str, List[int]] = {}
+    for stima in stime.values():
+        totali = famiglie.setdefault(stima['operation_family'], [0, 0])
+        totali[0] += stima['sla_total']
+        totali[1] += stima['sla_passed']
+
+    ok = True
+    print(f"\nSLA sketch vs KPIEngine (ultimi {args.days} giorni): entro durata / totale")
+    for nome, kpi in risultati.items():
+        if 'error' in kpi:
+            print(f"✗ {nome}: {kpi['error']}")
+            ok = False
+            continue
+        totale, entro = famiglie.get(nome, [0, 0])
+        uguali = (totale, entro) == (kpi['total_requests'], kpi['sla_ok_24h'])
+        ok = ok and uguali
+        print(f"{'✓' if uguali else '✗'} {nome}: sketch {entro}/{totale} | "
+              f"KPIEngine {kpi['sla_ok_24h']}/{kpi['total_requests']} ({kpi['sla_percentage_24h']}%)")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Accuratezza sketch t-digest vs percentili esatti')
+    parser.add_argument('--live', action='store_true', help='Confronto sugli indici OpenSearch')
+    parser.add_argument('--host', default=None)
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--days', type=int, default=30, help='Giorni (sketch per giorno)')
+    parser.add_argument('--rows', type=int, default=3000, help='Righe massime per giorno (sintetico)')
+    parser.add_argument('--compression', type=float, default=DEFAULT_COMPRESSION)
+    parser.add_argument('--tolleranza', type=float, default=2.0, help='Errore relativo massimo (%%)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    ok = live(args) if args.live else sintetico(args)
+    print(f"\n{'✓' if ok else '✗'} Errore relativo {'entro' if ok else 'oltre'} il {args.tolleranza}%")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
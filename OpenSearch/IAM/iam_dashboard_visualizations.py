@@ -13,6 +13,12 @@ Crea visualizzazioni professionali per il monitoraggio IAM:
 - Top Users
 - Error Analysis
 
+Con use_rollup=True i pannelli di volume (stato, timeline, totale) leggono
+l'indice rollup giornaliero 'iam-richieste-daily' (somma del campo count).
+
+Index pattern, visualizzazioni e dashboard vengono raccolti in un bundle NDJSON
+(dashboard_provisioning.py) e pubblicati con un'unica chiamata _import?overwrite=true.
+
 UTILIZZO:
     python iam_dashboard_visualizations.py
 
@@ -21,16 +27,20 @@ Output: Dashboard su http://localhost:5601/app/dashboards/view/iam-dashboard-mai
 """
 
 import requests
-import json
-from datetime import datetime
+import sys
+from pathlib import Path
 from typing import Dict, List, Optional
-import time
+
+from iam_rollup import ROLLUP_INDEX
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from dashboard_provisioning import SavedObjectsBundle
 
 
 class IAMDashboardCreator:
     """Crea visualizzazioni su OpenSearch Dashboards (NO SECURITY)"""
 
-    def __init__(self, host='localhost', port=5601):
+    def __init__(self, host='localhost', port=5601, use_rollup=False):
         """Inizializza connessione a Dashboards - NO AUTH"""
         self.base_url = f"http://{host}:{port}"
         self.headers = {
@@ -40,6 +50,9 @@ class IAMDashboardCreator:
         self.session = requests.Session()
         # NO auth perché security è disabilitato
         self.index_pattern = 'iam-richieste'
+        self.rollup_index_pattern = ROLLUP_INDEX
+        self.use_rollup = use_rollup
+        self.bundle = SavedObjectsBundle()
 
         try:
             response = self.session.get(
@@ -60,100 +73,22 @@ class IAMDashboardCreator:
         """Crea ID pulito dal titolo"""
         return title.lower().replace(' ', '-').replace('(', '').replace(')', '').replace('%', 'pct')
 
-    def create_index_pattern(self, time_field='data_creazione') -> bool:
-        """Crea index pattern"""
-        try:
-            # Verifica se esiste
-            response = self.session.get(
-                f"{self.base_url}/api/saved_objects/index-pattern/{self.index_pattern}",
-                headers=self.headers,
-                timeout=5
-            )
-
-            if response.status_code == 200:
-                print(f"✓ Index pattern '{self.index_pattern}' già esistente")
-                return True
-
-            data = {
-                'attributes': {
-                    'title': self.index_pattern,
-                    'timeFieldName': time_field,
-                    'fields': '[]'
-                }
-            }
-
-            response = self.session.post(
-                f"{self.base_url}/api/saved_objects/index-pattern/{self.index_pattern}",
-                json=data,
-                headers=self.headers,
-                timeout=10
-            )
-
-            if response.status_code == 200:
-                print(f"✓ Index pattern '{self.index_pattern}' creato")
-                return True
-            else:
-                print(f"⚠ Index pattern response: {response.status_code}")
-                # Procedi comunque
-                return True
-        except Exception as e:
-            print(f"⚠ Index pattern: {e}")
-            return True
+    def create_index_pattern(self, time_field='data_creazione', index_pattern: Optional[str] = None) -> bool:
+        """Aggiunge l'index pattern al bundle (default: indice raw)"""
+        index_pattern = index_pattern or self.index_pattern
+        self.bundle.index_pattern(index_pattern, time_field=time_field)
+        print(f"✓ Index pattern '{index_pattern}' aggiunto al bundle")
+        return True
 
     def create_visualization(self, title: str, vis_type: str,
-                            config: Dict) -> Optional[str]:
-        """Crea una visualizzazione"""
-        try:
-            vis_id = self._clean_id(title)
-
-            # Elimina se esiste
-            try:
-                self.session.delete(
-                    f"{self.base_url}/api/saved_objects/visualization/{vis_id}",
-                    headers=self.headers,
-                    timeout=5
-                )
-            except:
-                pass
-
-            body = {
-                'attributes': {
-                    'title': title,
-                    'visState': json.dumps({
-                        'title': title,
-                        'type': vis_type,
-                        'params': config.get('params', {}),
-                        'aggs': config.get('aggs', [])
-                    }),
-                    'uiStateJSON': '{}',
-                    'kibanaSavedObjectMeta': {
-                        'searchSourceJSON': json.dumps({
-                            'index': self.index_pattern,
-                            'query': {'match_all': {}},
-                            'filter': []
-                        })
-                    }
-                }
-            }
-
-            response = self.session.post(
-                f"{self.base_url}/api/saved_objects/visualization/{vis_id}",
-                json=body,
-                headers=self.headers,
-                timeout=10
-            )
-
-            if response.status_code == 200:
-                print(f"  ✓ {title}")
-                return vis_id
-            else:
-                print(f"  ⚠ {title}: {response.status_code}")
-                if response.text:
-                    print(f"     Response: {response.text[:100]}")
-                return None
-        except Exception as e:
-            print(f"  ⚠ {title}: {str(e)[:80]}")
-            return None
+                            config: Dict, index_pattern: Optional[str] = None) -> Optional[str]:
+        """Aggiunge una visualizzazione al bundle (sull'index pattern indicato, default raw)"""
+        vis_id = self.bundle.visualizzazione(
+            self._clean_id(title), title, vis_type, index_pattern or self.index_pattern,
+            params=config.get('params', {}), aggs=config.get('aggs', [])
+        )
+        print(f"  ✓ {title}")
+        return vis_id
 
     def create_all_visualizations(self) -> List[str]:
         """Crea tutte le visualizzazioni"""
@@ -179,19 +114,27 @@ class IAMDashboardCreator:
         if vid:
             vis_ids.append(vid)
 
+        # Sul rollup ogni documento aggrega più richieste: metrica = somma di count
+        rollup = self.rollup_index_pattern if self.use_rollup else None
+        volume_metric = (
+            {'id': '1', 'enabled': True, 'type': 'sum', 'schema': 'metric', 'params': {'field': 'count'}}
+            if rollup else
+            {'id': '1', 'enabled': True, 'type': 'count', 'schema': 'metric', 'params': {}}
+        )
+
         # 2. Requests by Status (Bar)
         config = {
             'params': {'addTooltip': True, 'addLegend': True},
             'aggs': [
-                {'id': '1', 'enabled': True, 'type': 'count', 'schema': 'metric', 'params': {}},
+                volume_metric,
                 {
                     'id': '2', 'enabled': True, 'type': 'terms',
                     'schema': 'segment',
-                    'params': {'field': 'stato', 'size': 10}
+                    'params': {'field': 'STATO' if rollup else 'stato', 'size': 10}
                 }
             ]
         }
-        vid = self.create_visualization('Requests by Status', 'histogram', config)
+        vid = self.create_visualization('Requests by Status', 'histogram', config, rollup)
         if vid:
             vis_ids.append(vid)
 
@@ -199,15 +142,15 @@ class IAMDashboardCreator:
         config = {
             'params': {'addTooltip': True, 'addLegend': True, 'legendPosition': 'bottom'},
             'aggs': [
-                {'id': '1', 'enabled': True, 'type': 'count', 'schema': 'metric', 'params': {}},
+                volume_metric,
                 {
                     'id': '2', 'enabled': True, 'type': 'date_histogram',
                     'schema': 'segment',
-                    'params': {'field': 'data_creazione', 'interval': '1d'}
+                    'params': {'field': 'day' if rollup else 'data_creazione', 'interval': '1d'}
                 }
             ]
         }
-        vid = self.create_visualization('Requests Timeline (Daily)', 'line', config)
+        vid = self.create_visualization('Requests Timeline (Daily)', 'line', config, rollup)
         if vid:
             vis_ids.append(vid)
 
@@ -234,15 +177,9 @@ class IAMDashboardCreator:
         # 5. Total Requests (Metric)
         config = {
             'params': {'fontSize': '60'},
-            'aggs': [
-                {
-                    'id': '1', 'enabled': True, 'type': 'count',
-                    'schema': 'metric',
-                    'params': {}
-                }
-            ]
+            'aggs': [volume_metric]
         }
-        vid = self.create_visualization('Total Requests', 'metric', config)
+        vid = self.create_visualization('Total Requests', 'metric', config, rollup)
         if vid:
             vis_ids.append(vid)
 
@@ -358,7 +295,7 @@ class IAMDashboardCreator:
         return vis_ids
 
     def create_dashboard(self, vis_ids: List[str]) -> Optional[str]:
-        """Crea dashboard assemblando le visualizzazioni"""
+        """Aggiunge la dashboard al bundle assemblando le visualizzazioni"""
         print("\n" + "="*80)
         print("CREAZIONE DASHBOARD")
         print("="*80 + "\n")
@@ -366,18 +303,6 @@ class IAMDashboardCreator:
         dashboard_id = 'iam-dashboard-main'
         dashboard_title = 'IAM Requests Monitor'
 
-        # Elimina se esiste
-        try:
-            self.session.delete(
-                f"{self.base_url}/api/saved_objects/dashboard/{dashboard_id}",
-                headers=self.headers,
-                timeout=5
-            )
-        except:
-            pass
-
-        # Crea grid delle visualizzazioni con struttura semplificata
-        panels = []
         positions = [
             # Row 1
             {'x': 0, 'y': 0, 'w': 8, 'h': 4},   # Total Requests
@@ -402,174 +327,16 @@ class IAMDashboardCreator:
             {'x': 12, 'y': 19, 'w': 12, 'h': 5}, # By Area
         ]
 
-        # Costruisci panels array in formato semplificato
-        for i, (vis_id, pos) in enumerate(zip(vis_ids, positions)):
-            panel = {
-                'version': '7.10.0',
-                'gridData': {
-                    'x': pos['x'],
-                    'y': pos['y'],
-                    'w': pos['w'],
-                    'h': pos['h'],
-                    'i': str(i)
-                },
-                'type': 'visualization',
-                'id': vis_id,
-                'embeddableConfig': {}
-            }
-            panels.append(panel)
-
-        # Crea dashboard body con struttura minimale
-        dashboard_body = {
-            'attributes': {
-                'title': dashboard_title,
-                'description': 'IAM Requests Monitoring Dashboard',
-                'panels': panels,
-                'timeRestore': False,
-                'refreshInterval': {
-                    'pause': False,
-                    'value': 60000
-                }
-            }
-        }
-
-        try:
-            response = self.session.post(
-                f"{self.base_url}/api/saved_objects/dashboard/{dashboard_id}",
-                json=dashboard_body,
-                headers=self.headers,
-                timeout=15
-            )
-
-            if response.status_code == 200:
-                print(f"✓ Dashboard '{dashboard_title}' creato")
-                dashboard_url = f"{self.base_url}/app/dashboards/view/{dashboard_id}"
-                print(f"  URL: {dashboard_url}")
-                return dashboard_id
-            elif response.status_code == 201:
-                print(f"✓ Dashboard '{dashboard_title}' creato (201)")
-                dashboard_url = f"{self.base_url}/app/dashboards/view/{dashboard_id}"
-                print(f"  URL: {dashboard_url}")
-                return dashboard_id
-            else:
-                print(f"✗ Errore creazione dashboard: {response.status_code}")
-                print(f"   Response: {response.text[:300]}")
-
-                # Prova metodo alternativo: crea dashboard vuota prima
-                print("\n⏳ Tentativo con metodo alternativo...")
-                return self._create_dashboard_minimal(dashboard_id, dashboard_title, vis_ids)
-        except Exception as e:
-            print(f"✗ Errore: {e}")
-            return None
-
-    def _create_dashboard_minimal(self, dashboard_id: str,
-                                  dashboard_title: str,
-                                  vis_ids: List[str]) -> Optional[str]:
-        """Crea dashboard con metodo alternativo e aggiunge visualizzazioni"""
-        try:
-            # Step 1: Crea dashboard base
-            minimal_body = {
-                'attributes': {
-                    'title': dashboard_title,
-                    'description': 'IAM Requests Monitoring Dashboard',
-                    'timeRestore': False,
-                    'refreshInterval': {
-                        'pause': False,
-                        'value': 60000
-                    }
-                }
-            }
-
-            response = self.session.post(
-                f"{self.base_url}/api/saved_objects/dashboard/{dashboard_id}",
-                json=minimal_body,
-                headers=self.headers,
-                timeout=15
-            )
-
-            if response.status_code not in [200, 201]:
-                print(f"✗ Errore creazione dashboard base: {response.status_code}")
-                return None
-
-            print(f"✓ Dashboard base creato")
-
-            # Step 2: Aggiungi visualizzazioni una per una
-            print(f"\n⏳ Aggiunta di {len(vis_ids)} visualizzazioni...")
-
-            positions = [
-                {'x': 0, 'y': 0, 'w': 8, 'h': 4},   # 0: Total Requests
-                {'x': 8, 'y': 0, 'w': 8, 'h': 4},   # 1: SLA Compliance %
-                {'x': 16, 'y': 0, 'w': 8, 'h': 4},  # 2: In Progress
-
-                {'x': 0, 'y': 4, 'w': 12, 'h': 5},  # 3: Timeline
-                {'x': 12, 'y': 4, 'w': 12, 'h': 5}, # 4: By Status
-
-                {'x': 0, 'y': 9, 'w': 8, 'h': 5},   # 5: Priority
-                {'x': 8, 'y': 9, 'w': 8, 'h': 5},   # 6: By Operation
-                {'x': 16, 'y': 9, 'w': 8, 'h': 5},  # 7: SLA Warnings
-
-                {'x': 0, 'y': 14, 'w': 12, 'h': 5},  # 8: Avg Duration
-                {'x': 12, 'y': 14, 'w': 12, 'h': 5}, # 9: Duration Distribution
-
-                {'x': 0, 'y': 19, 'w': 12, 'h': 5},  # 10: Top Users
-                {'x': 12, 'y': 19, 'w': 12, 'h': 5}, # 11: By Area
-            ]
-
-            # Costruisci panels
-            panels = []
-            for i, (vis_id, pos) in enumerate(zip(vis_ids, positions)):
-                panel = {
-                    'version': '7.10.0',
-                    'gridData': {
-                        'x': pos['x'],
-                        'y': pos['y'],
-                        'w': pos['w'],
-                        'h': pos['h'],
-                        'i': str(i)
-                    },
-                    'type': 'visualization',
-                    'id': vis_id,
-                    'embeddableConfig': {}
-                }
-                panels.append(panel)
-                print(f"  ✓ {i+1}. {vis_id}")
-
-            # Step 3: Aggiorna dashboard con panels
-            update_body = {
-                'attributes': {
-                    'title': dashboard_title,
-                    'description': 'IAM Requests Monitoring Dashboard',
-                    'panels': panels,
-                    'timeRestore': False,
-                    'refreshInterval': {
-                        'pause': False,
-                        'value': 60000
-                    }
-                }
-            }
-
-            response = self.session.put(
-                f"{self.base_url}/api/saved_objects/dashboard/{dashboard_id}",
-                json=update_body,
-                headers=self.headers,
-                timeout=15
-            )
-
-            if response.status_code == 200:
-                print(f"\n✓ Dashboard assemblata con tutte le visualizzazioni!")
-                dashboard_url = f"{self.base_url}/app/dashboards/view/{dashboard_id}"
-                print(f"  URL: {dashboard_url}")
-                return dashboard_id
-            else:
-                print(f"\n⚠ Dashboard creata ma aggiornamento panels: {response.status_code}")
-                print(f"   Prova a ricaricare la pagina")
-                dashboard_url = f"{self.base_url}/app/dashboards/view/{dashboard_id}"
-                print(f"   URL: {dashboard_url}")
-                return dashboard_id
+        self.bundle.dashboard(
+            dashboard_id, dashboard_title, list(zip(vis_ids, positions)),
+            description='IAM Requests Monitoring Dashboard', refresh_ms=60000
+        )
+        print(f"✓ Dashboard '{dashboard_title}' aggiunta al bundle ({min(len(vis_ids), len(positions))} pannelli)")
+        return dashboard_id
 
-        except Exception as e:
-            print(f"✗ Errore metodo alternativo: {e}")
-            return None
+    def publish(self, force: bool = False) -> bool:
+        """Pubblica il bundle (vedi SavedObjectsBundle.pubblica)"""
+        return self.bundle.pubblica(self.session, self.base_url, self.headers, force)
 
     def print_instructions(self, dashboard_id: Optional[str]):
         """Stampa istruzioni di accesso"""
@@ -617,11 +384,13 @@ def main():
     try:
         creator = IAMDashboardCreator(
             host='localhost',
-            port=5601
+            port=5601,
+            use_rollup=True
         )
 
         print("\n1. Creazione Index Pattern...")
         creator.create_index_pattern()
+        creator.create_index_pattern(time_field='day', index_pattern=creator.rollup_index_pattern)
 
         print("\n2. Creazione Visualizzazioni...")
         vis_ids = creator.create_all_visualizations()
@@ -633,6 +402,10 @@ def main():
         print(f"\n3. Assembly Dashboard ({len(vis_ids)} visualizzazioni)...")
         dashboard_id = creator.create_dashboard(vis_ids)
 
+        print("\n4. Import Saved Objects...")
+        if not creator.publish():
+            dashboard_id = None
+
         creator.print_instructions(dashboard_id)
 
     except Exception as e:
@@ -27,15 +27,33 @@ UTILIZZO:
     engine = KPIEngine()
     kpis = engine.calcola_tutti_kpi()
     print(engine.genera_report_kpi(kpis))
+
+    # Da indice rollup giornaliero (iam-richieste-daily), senza scansionare il raw
+    kpis = engine.calcola_tutti_kpi(use_rollup=True)
+
+    # Solo le richieste create negli ultimi 30 giorni (solo le partizioni mensili coinvolte)
+    kpis = engine.calcola_tutti_kpi(giorni=30)
+
+    # Tempo per KPI nell'export JSON (search profiler: solo diagnostica)
+    kpis = engine.calcola_tutti_kpi(profile=True)
 ================================================================================
 """
 
 from opensearchpy import OpenSearch
-from datetime import datetime, timedelta
-from typing import Dict, List, Any
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Any, Optional
 import json
+import sys
 from pathlib import Path
 
+from iam_operation_rules import OperationClassifier, FAMILY_FIELD, PREFIX_FIELD
+from iam_partitions import IAMPartitionManager
+from iam_rollup import ROLLUP_DIMENSIONS, ROLLUP_INDEX, edge_key
+from iam_tracing import span, registra
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from opensearch_pool import get_client
+
 
 class Colors:
     """ANSI color codes"""
@@ -52,29 +70,21 @@ class Colors:
 class KPIEngine:
     """Motore per calcolo KPI configurabili"""
 
-    def __init__(self, host='localhost', port=9200,
-                 use_ssl=False, config_file='iam_kpi_config.json'):
-        """Inizializza il motore KPI (NO SECURITY)"""
+    def __init__(self, host=None, port=None,
+                 use_ssl=None, config_file='iam_kpi_config.json',
+                 client: Optional[OpenSearch] = None):
+        """Inizializza il motore KPI (NO SECURITY) sul client condiviso di opensearch_pool"""
         # OpenSearch senza security - niente auth
-        self.client = OpenSearch(
-            hosts=[{'host': host, 'port': port}],
-            use_ssl=use_ssl,
-            verify_certs=False,
-            ssl_show_warn=False,
-            timeout=30,
-            max_retries=3
-        )
+        self.client = client or get_client(host=host, port=port, use_ssl=use_ssl)
         self.index_name = 'iam-richieste'
+        self.rollup_index = ROLLUP_INDEX
+        self.partitions = IAMPartitionManager(self.client, self.index_name)
 
         # Carica configurazione
         self.config = self._load_config(config_file)
-
-        try:
-            info = self.client.info()
-            print(f"✓ KPI Engine pronto - OpenSearch {info['version']['number']} (NO SECURITY)\n")
-        except Exception as e:
-            print(f"✗ Errore connessione: {e}")
-            raise
+        self.operation_classifier = OperationClassifier.from_config(self.config)
+        # None = da verificare: tutti i documenti hanno i campi operazione calcolati a ingest-time?
+        self._prefix_ready: Optional[bool] = None
 
     def _load_config(self, config_file: str) -> Dict:
         """Carica configurazione KPI da file JSON"""
@@ -170,117 +180,288 @@ class KPIEngine:
 
         return query
 
-    def calcola_kpi_singolo(self, kpi_name: str, kpi_config: Dict) -> Dict:
-        """Calcola un singolo KPI"""
+    def _prefix_indicizzato(self) -> bool:
+        """
+        True se nessun documento dell'indice è privo di operation_family: i documenti
+        indicizzati prima dei campi calcolati non corrisponderebbero al 'term' su
+        operation_prefix (backfill: IAMRequestsLoader.backfill_operation_fields)
+        """
+        if self._prefix_ready is None:
+            try:
+                response = self.client.count(index=self.index_name, body={
+                    'query': {'bool': {'must_not': {'exists': {'field': FAMILY_FIELD}}}}
+                })
+            except Exception as e:
+                print(f"⚠ Verifica {FAMILY_FIELD} non riuscita, KPI con 'wildcard': {e}")
+                return False
+            self._prefix_ready = response['count'] == 0
+            if not self._prefix_ready:
+                print(f"⚠ {response['count']} documenti senza {FAMILY_FIELD}: KPI con 'wildcard' "
+                      f"fino al backfill")
+        return self._prefix_ready
+
+    def _operation_clause(self, kpi_config: Dict) -> Dict:
+        """Clausola sull'operazione: 'term' su operation_prefix se il prefisso è calcolato
+        a ingest-time su tutti i documenti, altrimenti 'wildcard' (RESET_PASSWORD% -> RESET_PASSWORD*)"""
+        if self.operation_classifier.covers(kpi_config['operation_type']) and self._prefix_indicizzato():
+            return {'term': {PREFIX_FIELD: kpi_config['operation_type'].rstrip('%').upper()}}
 
-        try:
-            # Query per totale operazioni di questo tipo
-            query_total = {
+        return {
+            'wildcard': {
+                kpi_config['column_operation']: f"{kpi_config['operation_type'].rstrip('%')}*"
+            }
+        }
+
+    def _build_kpi_aggs(self, kpi_config: Dict) -> Dict:
+        """Aggregazione di un KPI: filtro operazione+stato con sotto-filtri per le soglie SLA"""
+        thresholds = {'sla': {'range': {'durata_ore': {'lte': kpi_config['duration']}}}}
+        if 'duration_2' in kpi_config and 'sla_percentage_2' in kpi_config:
+            thresholds['sla_2'] = {'range': {'durata_ore': {'lte': kpi_config['duration_2']}}}
+
+        return {
+            'filter': {
                 'bool': {
-                    'must': [
-                        {
-                            'wildcard': {
-                                kpi_config['column_operation']: f"{kpi_config['operation_type'].rstrip('%')}*"
-                            }
-                        },
+                    'filter': [
+                        self._operation_clause(kpi_config),
                         {'term': {kpi_config['column_status']: kpi_config['status']}}
                     ]
                 }
+            },
+            'aggs': {
+                'soglie': {'filters': {'filters': thresholds}}
             }
+        }
 
-            # Query per SLA rispettato
-            query_sla = {
+    @staticmethod
+    def _rollup_field(column: str) -> str:
+        """Dimensione del rollup per una colonna della configurazione KPI (nomi canonici minuscoli)"""
+        if column.lower() not in ROLLUP_DIMENSIONS:
+            raise ValueError(f"colonna '{column}' non presente nel rollup ({', '.join(ROLLUP_DIMENSIONS)})")
+        return column.lower()
+
+    def _build_rollup_kpi_aggs(self, kpi_config: Dict) -> Dict:
+        """
+        Aggregazione di un KPI sul rollup: somma dei count e dei conteggi cumulativi ore_cum.
+        Per ogni soglia conta anche i documenti rollup che la contengono (_rollup_bucket
+        rifiuta le soglie assenti, es. duration aggiunta dopo la costruzione del rollup).
+        """
+        operation = kpi_config['operation_type']
+        if self.operation_classifier.covers(operation):
+            # operation_prefix è calcolato per ogni documento rollup
+            operation_clause = {'term': {PREFIX_FIELD: operation.rstrip('%').upper()}}
+        else:
+            operation_clause = {'wildcard': {self._rollup_field(kpi_config['column_operation']):
+                                             f"{operation.rstrip('%')}*"}}
+
+        aggs = {'totale': {'sum': {'field': 'count'}}}
+        soglie = [('sla', 'duration')]
+        if 'duration_2' in kpi_config and 'sla_percentage_2' in kpi_config:
+            soglie.append(('sla_2', 'duration_2'))
+        for name, key in soglie:
+            field = f"ore_cum.{edge_key(kpi_config[key])}"
+            aggs[name] = {'sum': {'field': field}}
+            aggs[f"{name}_docs"] = {'value_count': {'field': field}}
+
+        return {
+            'filter': {
                 'bool': {
-                    'must': [
-                        {
-                            'wildcard': {
-                                kpi_config['column_operation']: f"{kpi_config['operation_type'].rstrip('%')}*"
-                            }
-                        },
-                        {'term': {kpi_config['column_status']: kpi_config['status']}},
-                        {'range': {'durata_ore': {'lte': kpi_config['duration']}}}
+                    'filter': [
+                        operation_clause,
+                        {'term': {self._rollup_field(kpi_config['column_status']): kpi_config['status']}}
                     ]
                 }
-            }
+            },
+            'aggs': aggs
+        }
 
-            # Query per SLA 2 (se presente)
-            query_sla_2 = None
-            if 'duration_2' in kpi_config and 'sla_percentage_2' in kpi_config:
-                query_sla_2 = {
-                    'bool': {
-                        'must': [
-                            {
-                                'wildcard': {
-                                    kpi_config['column_operation']: f"{kpi_config['operation_type'].rstrip('%')}*"
-                                }
-                            },
-                            {'term': {kpi_config['column_status']: kpi_config['status']}},
-                            {'range': {'durata_ore': {'lte': kpi_config['duration_2']}}}
-                        ]
-                    }
-                }
+    @staticmethod
+    def _rollup_bucket(bucket: Dict) -> Dict:
+        """Converte il bucket rollup nella forma del bucket raw letta da _kpi_result"""
+        soglie = {}
+        for name in ('sla', 'sla_2'):
+            if name not in bucket:
+                continue
+            if bucket[f"{name}_docs"]['value'] < bucket['doc_count']:
+                raise ValueError(f"soglia {name} assente in {bucket['doc_count'] - bucket[f'{name}_docs']['value']} "
+                                 f"documenti rollup (ricostruire con 'python iam_rollup.py')")
+            soglie[name] = {'doc_count': int(bucket[name]['value'])}
+        return {'doc_count': int(bucket['totale']['value']), 'soglie': {'buckets': soglie}}
+
+    def _kpi_result(self, kpi_name: str, kpi_config: Dict, bucket: Dict) -> Dict:
+        """Costruisce il risultato del KPI dal bucket dell'aggregazione"""
+        has_sla_2 = 'duration_2' in kpi_config and 'sla_percentage_2' in kpi_config
+        soglie = bucket['soglie']['buckets']
+
+        total = bucket['doc_count']
+        sla_ok = soglie['sla']['doc_count']
+        sla_ok_2 = soglie['sla_2']['doc_count'] if has_sla_2 else 0
+
+        # Calcola percentuali
+        sla_pct = (sla_ok / total * 100) if total > 0 else 0
+        sla_pct_2 = (sla_ok_2 / total * 100) if total > 0 else 0
+
+        # Determina status
+        threshold = kpi_config['sla_percentage']
+        status_kpi = 'OK' if sla_pct >= threshold else 'ALERT'
+
+        if 'sla_percentage_2' in kpi_config:
+            threshold_2 = kpi_config['sla_percentage_2']
+            status_kpi_2 = 'OK' if sla_pct_2 >= threshold_2 else 'ALERT'
+        else:
+            status_kpi_2 = None
 
-            # Esegui query
-            total = self.client.count(index=self.index_name, body={'query': query_total})['count']
-            sla_ok = self.client.count(index=self.index_name, body={'query': query_sla})['count']
-
-            sla_ok_2 = 0
-            if query_sla_2:
-                sla_ok_2 = self.client.count(index=self.index_name, body={'query': query_sla_2})['count']
-
-            # Calcola percentuali
-            sla_pct = (sla_ok / total * 100) if total > 0 else 0
-            sla_pct_2 = (sla_ok_2 / total * 100) if total > 0 else 0
-
-            # Determina status
-            threshold = kpi_config['sla_percentage']
-            status_kpi = 'OK' if sla_pct >= threshold else 'ALERT'
-
-            if 'sla_percentage_2' in kpi_config:
-                threshold_2 = kpi_config['sla_percentage_2']
-                status_kpi_2 = 'OK' if sla_pct_2 >= threshold_2 else 'ALERT'
-            else:
-                status_kpi_2 = None
-
-            return {
-                'name': kpi_name,
-                'operation_type': kpi_config['operation_type'],
-                'total_requests': total,
-                'sla_ok_24h': sla_ok,
-                'sla_percentage_24h': round(sla_pct, 2),
-                'sla_threshold_24h': kpi_config['sla_percentage'],
-                'status_24h': status_kpi,
-                'sla_ok_48h': sla_ok_2 if query_sla_2 else None,
-                'sla_percentage_48h': round(sla_pct_2, 2) if query_sla_2 else None,
-                'sla_threshold_48h': kpi_config.get('sla_percentage_2', None),
-                'status_48h': status_kpi_2,
-                'duration_hours': kpi_config['duration'],
-                'duration_2_hours': kpi_config.get('duration_2', None),
-                'calculated_at': datetime.now().isoformat()
-            }
+        return {
+            'name': kpi_name,
+            'operation_type': kpi_config['operation_type'],
+            'total_requests': total,
+            'sla_ok_24h': sla_ok,
+            'sla_percentage_24h': round(sla_pct, 2),
+            'sla_threshold_24h': kpi_config['sla_percentage'],
+            'status_24h': status_kpi,
+            'sla_ok_48h': sla_ok_2 if has_sla_2 else None,
+            'sla_percentage_48h': round(sla_pct_2, 2) if has_sla_2 else None,
+            'sla_threshold_48h': kpi_config.get('sla_percentage_2', None),
+            'status_48h': status_kpi_2,
+            'duration_hours': kpi_config['duration'],
+            'duration_2_hours': kpi_config.get('duration_2', None),
+            'calculated_at': datetime.now().isoformat()
+        }
+
+    @staticmethod
+    def _profile_agg_times(response: Dict) -> Dict[str, float]:
+        """Tempo (ms) speso da ogni aggregazione, sommato su tutti gli shard (richiede profile)"""
+        times = {}
+        for shard in response.get('profile', {}).get('shards', []):
+            for agg in shard.get('aggregations', []):
+                name = agg.get('description')
+                times[name] = times.get(name, 0.0) + agg.get('time_in_nanos', 0) / 1e6
+        return times
+
+    def _kpi_index(self, use_rollup: bool, giorni: Optional[int]) -> str:
+        """Indice da interrogare: rollup, partizioni mensili della finestra o alias di lettura"""
+        if use_rollup:
+            return self.rollup_index
+        if giorni:
+            return self.partitions.indices_for_range(date.today() - timedelta(days=giorni))
+        return self.index_name
+
+    def calcola_kpi_batch(self, kpi_configs: Dict[str, Dict], profile: bool = False,
+                          use_rollup: bool = False, giorni: Optional[int] = None) -> Dict[str, Dict]:
+        """
+        Calcola più KPI con una sola richiesta _search: un'aggregazione 'filter' per KPI,
+        con sotto-aggregazione 'filters' per le soglie di durata.
+        Con profile=True (diagnostica: search profiler, risposta molto più grande) ogni KPI
+        riporta il tempo speso dalla sua aggregazione; altrimenti solo il 'took' della richiesta.
+        Con use_rollup=True interroga l'indice rollup giornaliero (le soglie KPI sono
+        tra i conteggi cumulativi ore_cum, vedi iam_rollup.py); i KPI con colonne non
+        presenti nel rollup o soglie non ancora calcolate sono ricalcolati dal raw.
+        Con giorni solo le richieste create negli ultimi N giorni, interrogando le sole
+        partizioni mensili coinvolte.
+        """
+        if not self._prefix_ready:
+            # Riverifica a ogni calcolo finché l'indice non è completo (es. dopo il backfill)
+            self._prefix_ready = None
+
+        # KPI che il rollup non può calcolare (colonna o soglia assente): ricalcolati dal raw
+        dal_raw: Dict[str, str] = {}
+        aggs = {}
+        for kpi_name, kpi_config in kpi_configs.items():
+            if not use_rollup:
+                aggs[kpi_name] = self._build_kpi_aggs(kpi_config)
+                continue
+            try:
+                aggs[kpi_name] = self._build_rollup_kpi_aggs(kpi_config)
+            except ValueError as e:
+                dal_raw[kpi_name] = str(e)
+
+        body = {
+            'size': 0,
+            'track_total_hits': False,
+            'profile': profile,
+            'aggs': aggs
+        }
 
+        if giorni:
+            # Rollup: un documento per giorno ('day'); raw: data di creazione
+            body['query'] = {'range': {'day' if use_rollup else 'data_creazione': {'gte': f"now-{giorni}d/d"}}}
+
+        results = {}
+        if aggs:
+            results = self._esegui_kpi_batch({name: kpi_configs[name] for name in aggs}, body, profile,
+                                             use_rollup, giorni, dal_raw)
+        if dal_raw:
+            for kpi_name, motivo in dal_raw.items():
+                print(f"⚠ KPI '{kpi_name}' non calcolabile dal rollup ({motivo}): calcolato dal raw")
+            results.update(self.calcola_kpi_batch({name: kpi_configs[name] for name in dal_raw},
+                                                  profile=profile, giorni=giorni))
+        return {kpi_name: results[kpi_name] for kpi_name in kpi_configs}
+
+    def _esegui_kpi_batch(self, kpi_configs: Dict[str, Dict], body: Dict, profile: bool, use_rollup: bool,
+                          giorni: Optional[int], dal_raw: Dict[str, str]) -> Dict[str, Dict]:
+        """Esegue la _search dei KPI; i bucket rollup senza le soglie richieste finiscono in dal_raw"""
+        try:
+            index = self._kpi_index(use_rollup, giorni)
+            with span('kpi.search', kpis=len(kpi_configs), source='rollup' if use_rollup else 'raw'):
+                response = self.client.search(index=index, body=body)
         except Exception as e:
-            print(f"✗ Errore calcolo KPI '{kpi_name}': {e}")
-            return {
-                'name': kpi_name,
-                'error': str(e)
-            }
+            print(f"✗ Errore calcolo KPI: {e}")
+            return {kpi_name: {'name': kpi_name, 'error': str(e)} for kpi_name in kpi_configs}
+
+        agg_times = self._profile_agg_times(response) if profile else {}
+        results = {}
+
+        for kpi_name, kpi_config in kpi_configs.items():
+            try:
+                bucket = response['aggregations'][kpi_name]
+                if use_rollup:
+                    try:
+                        bucket = self._rollup_bucket(bucket)
+                    except ValueError as e:
+                        dal_raw[kpi_name] = str(e)
+                        continue
+                result = self._kpi_result(kpi_name, kpi_config, bucket)
+                result['source'] = 'rollup' if use_rollup else 'raw'
+                result['timing'] = {
+                    'request_took_ms': response['took'],
+                    'aggregation_ms': round(agg_times[kpi_name], 3) if kpi_name in agg_times else None
+                }
+                results[kpi_name] = result
+                # Tempo dell'aggregazione del KPI (profile); senza profile il took dell'intera richiesta
+                registra(f"kpi.{kpi_name}", agg_times.get(kpi_name, response['took']),
+                         rows=result.get('total_requests'), source=result['source'])
+            except Exception as e:
+                print(f"✗ Errore calcolo KPI '{kpi_name}': {e}")
+                results[kpi_name] = {'name': kpi_name, 'error': str(e)}
+                registra(f"kpi.{kpi_name}", 0.0, status='error')
 
-    def calcola_tutti_kpi(self) -> Dict[str, Dict]:
-        """Calcola tutti i KPI configurati"""
-        print(f"{Colors.BOLD}{Colors.CYAN}Calcolo KPI in corso...{Colors.RESET}\n")
+        return results
+
+    def calcola_kpi_singolo(self, kpi_name: str, kpi_config: Dict) -> Dict:
+        """Calcola un singolo KPI"""
+        return self.calcola_kpi_batch({kpi_name: kpi_config})[kpi_name]
 
-        kpis_result = {}
+    def calcola_tutti_kpi(self, use_rollup: bool = False, profile: bool = False,
+                          giorni: Optional[int] = None) -> Dict[str, Dict]:
+        """Calcola tutti i KPI configurati in un'unica richiesta (dal raw o dal rollup giornaliero),
+        opzionalmente sugli ultimi N giorni; profile=True aggiunge il tempo per KPI (search profiler,
+        solo per diagnostica)"""
+        print(f"{Colors.BOLD}{Colors.CYAN}Calcolo KPI in corso...{Colors.RESET}\n")
 
         if 'kpi' not in self.config:
             print(f"{Colors.RED}✗ Nessun KPI configurato{Colors.RESET}")
             return {}
 
-        for kpi_name, kpi_config in self.config['kpi'].items():
-            print(f"  ▶ {kpi_name}...", end='', flush=True)
-            result = self.calcola_kpi_singolo(kpi_name, kpi_config)
-            kpis_result[kpi_name] = result
-            print(f" {Colors.GREEN}✓{Colors.RESET}")
+        kpis_result = self.calcola_kpi_batch(self.config['kpi'], profile=profile, use_rollup=use_rollup,
+                                             giorni=giorni)
+
+        took = None
+        for kpi_name, result in kpis_result.items():
+            symbol = f"{Colors.RED}✗{Colors.RESET}" if 'error' in result else f"{Colors.GREEN}✓{Colors.RESET}"
+            timing = result.get('timing', {}).get('aggregation_ms')
+            took = result.get('timing', {}).get('request_took_ms', took)
+            print(f"  ▶ {kpi_name}... {symbol}" + (f" ({timing:.2f} ms)" if timing is not None else ""))
+        if took is not None:
+            print(f"  Richiesta unica: {took} ms (took)")
 
         return kpis_result
 
@@ -339,8 +520,8 @@ if __name__ == '__main__':
 
     engine = KPIEngine()
 
-    # Calcola KPI
-    kpis = engine.calcola_tutti_kpi()
+    # Calcola KPI (con tempi per KPI nell'export)
+    kpis = engine.calcola_tutti_kpi(profile=True)
 
     # Stampa report
     print(engine.genera_report_kpi(kpis))
@@ -20,37 +20,106 @@ UTILIZZO:
     loader.create_iam_index()
     richieste = loader.fetch_from_oracle(days=30)
     loader.bulk_insert(richieste)
+
+    # Oppure in streaming (fetchmany -> transform -> parallel_bulk)
+    loader.stream_load(days=30)
+
+    # Oppure sync incrementale (solo righe modificate dall'ultimo watermark)
+    loader.sync(days=30)
+
+Estrazione parallela a fette di giorni configurabile in iam_config.json:
+    {"estrazione": {"parallelismo": 4, "giorni_per_fetta": 1, "arraysize": 5000}}
+
+Campi di testo libero (NOTA, COMUNICAZIONE_UF) configurabili in iam_config.json:
+    {"campi_testo": {"modalita": "split"}}
+    - inline: nel documento principale (default, comportamento storico)
+    - split:  nell'indice separato iam-richieste-text (_id = ID_RICHIESTA)
+    - skip:   non estratti da Oracle; caricabili su richiesta con loader.get_texts(ids)
+    Al cambio di modalità sync() esegue un caricamento completo della finestra invece
+    del delta, così i documenti ricaricati non mescolano le due forme.
 ================================================================================
 """
 
 from opensearchpy import OpenSearch, helpers
 from datetime import datetime, timedelta
 import oracledb
-from typing import List, Dict, Any
+import json
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Dict, Any, Iterator, Optional
+
+from iam_operation_rules import OperationClassifier, FAMILY_FIELD, PREFIX_FIELD
+from iam_rollup import IAMDailyRollup
+from iam_partitions import IAMPartitionManager
+from iam_sketch import IAMKpiSketches, SketchAccumulator
+from iam_schema import (ORACLE_COLUMNS, RICHIESTE_FIELDS, SCHEMA_VERSION, richieste_mappings, richieste_settings,
+                        rename_script)
+from iam_tracing import span, registra
+from iam_tree import RequestForest
+from iam_sla_tracker import SLADeadlineTracker
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from opensearch_pool import get_client
 
 # Usa thin mode (no Oracle Client needed)
 oracledb.init_oracle_client(lib_dir=None)
+# CLOB letti come stringhe nello stesso fetch (niente round-trip per ogni LOB locator)
+oracledb.defaults.fetch_lobs = False
+
+# Estrazione Oracle: parallelismo 1 = query unica sull'intera finestra
+EXTRACTION_DEFAULT = {'parallelismo': 1, 'giorni_per_fetta': 1, 'arraysize': 5000}
+
+# Campi di testo libero: pesanti e mai aggregati, separabili dal documento principale
+TEXT_COLUMNS = ('NOTA', 'COMUNICAZIONE_UF')
+TEXT_FIELDS = tuple(col.lower() for col in TEXT_COLUMNS)
+TEXT_MODES = ('inline', 'split', 'skip')
+TEXT_DEFAULT = {'modalita': 'inline'}
+
+# Colonne che indicano una modifica della richiesta (usate per il watermark del sync incrementale)
+CHANGE_COLUMNS = ('DATA_STORICIZZAZIONE', 'DATA_CHIUSURA', 'DATA_CREAZIONE')
+CHANGE_FIELDS = tuple(col.lower() for col in CHANGE_COLUMNS)
+
+# Query rappresentativa del carico dashboard/KPI usata per misurare la latenza prima/dopo il load
+LATENCY_PROBE_QUERY = {
+    'size': 0,
+    'aggs': {
+        'by_operazione': {
+            'terms': {'field': 'fk_nome_operazione', 'size': 50},
+            'aggs': {'avg_ore': {'avg': {'field': 'durata_ore'}}}
+        },
+        'timeline': {
+            'date_histogram': {'field': 'data_creazione', 'fixed_interval': '1d'}
+        }
+    }
+}
 
 
 class IAMRequestsLoader:
     """Gestisce il caricamento delle richieste IAM da Oracle a OpenSearch"""
 
-    def __init__(self, host='localhost', port=9200,
+    def __init__(self, host=None, port=None,
                  oracle_host='localhost', oracle_port=1521,
                  oracle_service_name='ORCL', oracle_user='admin',
-                 oracle_password='password', use_ssl=False):
-        """Inizializza connessioni a OpenSearch e Oracle"""
-
-        # Connessione OpenSearch (NO SECURITY)
-        self.os_client = OpenSearch(
-            hosts=[{'host': host, 'port': port}],
-            use_ssl=use_ssl,
-            verify_certs=False,
-            ssl_show_warn=False,
-            timeout=30,
-            max_retries=3,
-            retry_on_timeout=True
-        )
+                 oracle_password='password', use_ssl=None,
+                 kpi_config_file='iam_kpi_config.json', partitioned=True,
+                 config_file='iam_config.json', text_mode: Optional[str] = None,
+                 client: Optional[OpenSearch] = None):
+        """Inizializza connessioni a OpenSearch e Oracle
+
+        Con partitioned=True index_name è l'alias di lettura di partizioni mensili
+        (index_name-YYYY.MM, vedi iam_partitions.py). text_mode ('inline', 'split', 'skip')
+        decide dove finiscono NOTA/COMUNICAZIONE_UF; default da iam_config.json.
+        Il client OpenSearch è quello condiviso di opensearch_pool (host/port/use_ssl
+        None = sezione 'opensearch' di iam_config.json), verificato al primo utilizzo.
+        """
+
+        # Connessione OpenSearch (NO SECURITY): pool condiviso con analyzer/KPI/rollup
+        self.os_client = client or get_client(host=host, port=port, use_ssl=use_ssl)
 
         # Connessione Oracle
         self.oracle_host = oracle_host
@@ -60,12 +129,36 @@ class IAMRequestsLoader:
         self.oracle_password = oracle_password
         self.db_connection = None
 
+        # Regole a prefisso per operation_family/operation_prefix (calcolati a ingest-time)
+        self.kpi_config_file = kpi_config_file
+        self.operation_classifier = OperationClassifier.from_config_file(kpi_config_file)
+
+        self.partitioned = partitioned
+        self._partition_managers: Dict[str, IAMPartitionManager] = {}
+
+        config = self._load_config(config_file)
+        self.extraction = {**EXTRACTION_DEFAULT, **config.get('estrazione', {})}
+        self.text_mode = text_mode or {**TEXT_DEFAULT, **config.get('campi_testo', {})}['modalita']
+        if self.text_mode not in TEXT_MODES:
+            raise ValueError(f"Modalità campi testo non valida: {self.text_mode} (ammesse: {', '.join(TEXT_MODES)})")
+
+    @staticmethod
+    def _load_config(config_file: str) -> Dict:
+        """Legge iam_config.json (vuoto se manca: valgono i default delle singole sezioni)"""
         try:
-            info = self.os_client.info()
-            print(f"✓ Connesso a OpenSearch {info['version']['number']} (NO SECURITY)")
+            if Path(config_file).exists():
+                with open(config_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
         except Exception as e:
-            print(f"✗ Errore connessione OpenSearch: {e}")
-            raise
+            print(f"⚠ Configurazione non letta ({config_file}): {e}")
+        return {}
+
+    def _create_oracle_pool(self, size: int):
+        """Pool di connessioni Oracle per l'estrazione parallela"""
+        dsn = oracledb.makedsn(self.oracle_host, self.oracle_port, service_name=self.oracle_service_name)
+        with span('oracle.connect', pool_size=size):
+            return oracledb.create_pool(user=self.oracle_user, password=self.oracle_password, dsn=dsn,
+                                        min=1, max=size, increment=1)
 
     def _connect_oracle(self):
         """Connette a Oracle"""
@@ -75,11 +168,12 @@ class IAMRequestsLoader:
                 self.oracle_port,
                 service_name=self.oracle_service_name
             )
-            connection = oracledb.connect(
-                user=self.oracle_user,
-                password=self.oracle_password,
-                dsn=dsn
-            )
+            with span('oracle.connect'):
+                connection = oracledb.connect(
+                    user=self.oracle_user,
+                    password=self.oracle_password,
+                    dsn=dsn
+                )
             print(f"✓ Connesso a Oracle: {self.oracle_user}@{self.oracle_service_name}")
             return connection
         except Exception as e:
@@ -92,52 +186,35 @@ class IAMRequestsLoader:
             print("   5. oracledb installato? pip install oracledb")
             raise
 
+    def partitions(self, index_name='iam-richieste') -> IAMPartitionManager:
+        """Gestore delle partizioni mensili di un indice"""
+        if index_name not in self._partition_managers:
+            self._partition_managers[index_name] = IAMPartitionManager(self.os_client, index_name)
+        return self._partition_managers[index_name]
+
     def create_iam_index(self, index_name='iam-richieste'):
-        """Crea l'indice IAM con mappings ottimizzati"""
-        mappings = {
-            'properties': {
-                'ID_RICHIESTA': {'type': 'keyword'},
-                'FK_ID_OGGETTO': {'type': 'keyword'},
-                'NOME_UTENZA': {'type': 'keyword'},
-                'FK_TIPO_RICHIESTA': {'type': 'keyword'},
-                'FK_TIPO_UTENZA': {'type': 'keyword'},
-                'FK_NOME_OPERAZIONE': {'type': 'keyword'},
-                'ID_RICHIESTA_PARENT': {'type': 'keyword'},
-                'DATA_CREAZIONE': {'type': 'date'},
-                'DATA_CHIUSURA': {'type': 'date'},
-                'FK_UTENTE': {'type': 'keyword'},
-                'FK_UTENTE_RICHIEDENTE': {'type': 'keyword'},
-                'STATO': {'type': 'keyword'},
-                'NOTA': {'type': 'text'},
-                'FLAG_TRANSAZIONE': {'type': 'keyword'},
-                'DATA_STORICIZZAZIONE': {'type': 'date'},
-                'FK_ID_LAV_DETTAGLIO': {'type': 'keyword'},
-                'MODALITA_LAV_MASS': {'type': 'keyword'},
-                'INOLTRO_GGU': {'type': 'keyword'},
-                'FLAG_INTERSEZIONE_PARAMETRI': {'type': 'keyword'},
-                'TOOL_GENERAZIONE': {'type': 'keyword'},
-                'FLAG_HAS_CHILDREN': {'type': 'keyword'},
-                'FLAG_OP_SEC_SELEZIONATA': {'type': 'keyword'},
-                'PRIORITA_SECONDARIA': {'type': 'integer'},
-                'TIPO_OP_SECONDARIA': {'type': 'integer'},
-                'COMUNICAZIONE_UF': {'type': 'text'},
-                'giorni_elaborazione': {'type': 'integer'},
-                'ore_elaborazione': {'type': 'float'},
-                'is_completed': {'type': 'boolean'},
-                'is_failed': {'type': 'boolean'},
-                'is_pending': {'type': 'boolean'}
-            }
-        }
+        """Crea l'indice IAM con lo schema versionato di iam_schema.py
+        (template + partizioni mensili se partitioned)"""
+        mappings = richieste_mappings()
+        # Una partizione contiene un solo mese: basta uno shard. Indici read-mostly:
+        # best_compression fin dalla creazione (codec statico, vedi optimize_index)
+        settings = richieste_settings(shards=1 if self.partitioned else 2, codec='best_compression')
 
-        settings = {
-            'number_of_shards': 2,
-            'number_of_replicas': 0,
-            'index': {'refresh_interval': '5s'}
-        }
+        if self.text_mode == 'split' and not self.create_text_index(index_name):
+            return False
+
+        if self.partitioned:
+            ready = self.partitions(index_name).ensure_layout(mappings, settings, version=SCHEMA_VERSION,
+                                                              migrate_script=rename_script(),
+                                                              source_time_field='DATA_CREAZIONE')
+            if ready:
+                self.backfill_operation_fields(index_name)
+            return ready
 
         try:
             if self.os_client.indices.exists(index=index_name):
                 print(f"⚠ Indice '{index_name}' già esistente")
+                self.backfill_operation_fields(index_name)
                 return True
 
             self.os_client.indices.create(
@@ -150,92 +227,305 @@ class IAMRequestsLoader:
             print(f"✗ Errore creazione indice: {e}")
             return False
 
-    def fetch_from_oracle(self, days=30) -> List[Dict]:
+    def backfill_operation_fields(self, index_name='iam-richieste') -> int:
         """
-        Legge le richieste da IAM.STORICO_RICHIESTE degli ultimi N giorni
+        Calcola operation_family/operation_prefix sui documenti indicizzati prima dei campi
+        (una _update_by_query con le regole del classificatore, solo sui documenti senza
+        operation_family). Finché ne restano KPIEngine usa 'wildcard' invece di 'term'.
+        """
+        query = {'bool': {'must_not': {'exists': {'field': FAMILY_FIELD}}}}
+        try:
+            missing = self.os_client.count(index=index_name, body={'query': query})['count']
+            if not missing:
+                return 0
 
-        Args:
-            days: numero di giorni indietro da leggere (default 30)
+            print(f"⏳ Backfill {FAMILY_FIELD}/{PREFIX_FIELD} su {missing:,} documenti...")
+            self.os_client.indices.put_mapping(index=index_name, body={
+                'properties': {field: RICHIESTE_FIELDS[field] for field in (FAMILY_FIELD, PREFIX_FIELD)}
+            })
+            response = self.os_client.update_by_query(
+                index=index_name, body={'query': query, 'script': self.operation_classifier.backfill_script()},
+                conflicts='proceed', wait_for_completion=True, refresh=True, request_timeout=3600
+            )
+            print(f"✓ Backfill completato: {response.get('updated', 0):,} documenti aggiornati")
+            return response.get('updated', 0)
+        except Exception as e:
+            print(f"⚠ Backfill {FAMILY_FIELD}/{PREFIX_FIELD} non riuscito: {e}")
+            return 0
 
-        Returns:
-            Lista di richieste come dict
-        """
+    @staticmethod
+    def text_index(index_name='iam-richieste') -> str:
+        """Indice dei campi di testo libero associato all'indice principale"""
+        return f"{index_name}-text"
+
+    def create_text_index(self, index_name='iam-richieste') -> bool:
+        """Crea l'indice dei testi (un documento per richiesta con almeno un testo valorizzato)"""
+        text_index = self.text_index(index_name)
         try:
-            self.db_connection = self._connect_oracle()
-            cursor = self.db_connection.cursor()
+            if self.os_client.indices.exists(index=text_index):
+                return True
+
+            self.os_client.indices.create(index=text_index, body={
+                'settings': {'number_of_shards': 1, 'number_of_replicas': 0,
+                             'index': {'refresh_interval': '5s'}},
+                'mappings': {
+                    'dynamic': 'strict',
+                    'properties': {
+                        'id_richiesta': {'type': 'keyword'},
+                        'data_creazione': {'type': 'date'},
+                        'nota': {'type': 'text', 'norms': False},
+                        'comunicazione_uf': {'type': 'text', 'norms': False}
+                    }
+                }
+            })
+            print(f"✓ Indice testi '{text_index}' creato")
+            return True
+        except Exception as e:
+            print(f"✗ Errore creazione indice testi: {e}")
+            return False
+
+    def _build_query(self, days: int, since: Optional[datetime] = None,
+                     sliced: bool = False, open_end: bool = False) -> str:
+        """Query di estrazione da IAM.STORICO_RICHIESTE per gli ultimi N giorni
+        (con `since` solo le righe modificate dopo il bind :since, con `sliced` la fetta
+        [:slice_start, :slice_end) di DATA_CREAZIONE). Nessun ORDER BY: l'ordine non serve
+        all'indicizzazione e il sort costerebbe a Oracle l'intera finestra."""
+        if since is not None:
+            where = " OR ".join(f"{col} > :since" for col in CHANGE_COLUMNS)
+        elif sliced:
+            where = "DATA_CREAZIONE >= :slice_start"
+            if not open_end:
+                where += " AND DATA_CREAZIONE < :slice_end"
+        else:
+            where = f"DATA_CREAZIONE >= TRUNC(SYSDATE) - {days}"
+
+        # In modalità skip i LOB non vengono nemmeno letti da Oracle
+        columns = [col for col in ORACLE_COLUMNS if self.text_mode != 'skip' or col not in TEXT_COLUMNS]
+        select = ',\n                    '.join(columns)
 
-            query = f"""
+        return f"""
                 SELECT
-                    ID_RICHIESTA,
-                    FK_ID_OGGETTO,
-                    NOME_UTENZA,
-                    FK_TIPO_RICHIESTA,
-                    FK_TIPO_UTENZA,
-                    FK_NOME_OPERAZIONE,
-                    ID_RICHIESTA_PARENT,
-                    DATA_CREAZIONE,
-                    DATA_CHIUSURA,
-                    FK_UTENTE,
-                    FK_UTENTE_RICHIEDENTE,
-                    STATO,
-                    NOTA,
-                    FLAG_TRANSAZIONE,
-                    DATA_STORICIZZAZIONE,
-                    FK_ID_LAV_DETTAGLIO,
-                    MODALITA_LAV_MASS,
-                    INOLTRO_GGU,
-                    FLAG_INTERSEZIONE_PARAMETRI,
-                    TOOL_GENERAZIONE,
-                    FLAG_HAS_CHILDREN,
-                    FLAG_OP_SEC_SELEZIONATA,
-                    PRIORITA_SECONDARIA,
-                    TIPO_OP_SECONDARIA,
-                    COMUNICAZIONE_UF
+                    {select}
                 FROM IAM.STORICO_RICHIESTE
-                WHERE DATA_CREAZIONE >= TRUNC(SYSDATE) - {days}
-                ORDER BY DATA_CREAZIONE DESC
+                WHERE {where}
             """
 
-            print(f"⏳ Lettura da Oracle (ultimi {days} giorni)...")
-            start_time = datetime.now()
-            cursor.execute(query)
+    def _transform_row(self, columns: List[str], row: tuple) -> Dict:
+        """Converte una riga Oracle nel documento OpenSearch (metriche calcolate sui datetime nativi).
+        `columns` sono i nomi canonici dello schema (colonne Oracle in minuscolo)."""
+        row_dict = dict(zip(columns, row))
 
-            # Ottieni nomi colonne
-            columns = [desc[0] for desc in cursor.description]
+        # Calcola metriche direttamente sui datetime Oracle (nessun round-trip ISO)
+        data_c = row_dict.get('data_creazione')
+        data_ch = row_dict.get('data_chiusura')
+        if isinstance(data_c, datetime) and isinstance(data_ch, datetime):
+            delta = data_ch - data_c
+            row_dict['giorni_elaborazione'] = delta.days
+            row_dict['durata_ore'] = delta.total_seconds() / 3600
+        else:
+            row_dict['giorni_elaborazione'] = None
+            row_dict['durata_ore'] = None
 
-            # Costruisci lista di dict
-            rows = []
-            for row in cursor.fetchall():
-                row_dict = dict(zip(columns, row))
+        # Converti timestamp Oracle a ISO string
+        for key, value in row_dict.items():
+            if isinstance(value, datetime):
+                row_dict[key] = value.isoformat()
 
-                # Converti timestamp Oracle a ISO string
-                for key, value in row_dict.items():
-                    if isinstance(value, datetime):
-                        row_dict[key] = value.isoformat()
+        # Determina status (Griffon uses: EVASA, NON EVASA, ANNULLATA)
+        stato = (row_dict.get('stato') or '').upper()
+        row_dict['is_completed'] = 'EVASA' in stato
+        row_dict['is_failed'] = 'ANNULLATA' in stato
+        row_dict['is_pending'] = 'NON EVASA' in stato
 
-                # Calcola metriche
-                if row_dict.get('DATA_CREAZIONE') and row_dict.get('DATA_CHIUSURA'):
-                    try:
-                        data_c = datetime.fromisoformat(row_dict['DATA_CREAZIONE'])
-                        data_ch = datetime.fromisoformat(row_dict['DATA_CHIUSURA'])
-                        row_dict['giorni_elaborazione'] = (data_ch - data_c).days
-                        row_dict['ore_elaborazione'] = (data_ch - data_c).total_seconds() / 3600
-                    except:
-                        row_dict['giorni_elaborazione'] = None
-                        row_dict['ore_elaborazione'] = None
-                else:
-                    row_dict['giorni_elaborazione'] = None
-                    row_dict['ore_elaborazione'] = None
+        # Famiglia e prefissi operazione normalizzati (query 'term' invece di 'wildcard')
+        self.operation_classifier.annotate(row_dict)
 
-                # Determina status (Griffon uses: EVASA, NON EVASA, ANNULLATA)
-                stato = row_dict.get('STATO', '').upper()
-                row_dict['is_completed'] = 'EVASA' in stato
-                row_dict['is_failed'] = 'ANNULLATA' in stato
-                row_dict['is_pending'] = 'NON EVASA' in stato
+        return row_dict
 
-                rows.append(row_dict)
+    def iter_batches_from_oracle(self, days=30, arraysize=5000,
+                                 since: Optional[datetime] = None) -> Iterator[List[Dict]]:
+        """
+        Legge le richieste da Oracle a blocchi con fetchmany(arraysize)
+
+        Args:
+            days: numero di giorni indietro da leggere (default 30)
+            arraysize: righe per round-trip verso Oracle
+            since: se valorizzato legge solo le righe modificate dopo questo istante
+
+        Yields:
+            Liste di al massimo `arraysize` richieste già trasformate
+        """
+        connection = self._connect_oracle()
+        try:
+            cursor = connection.cursor()
+            cursor.arraysize = arraysize
+            cursor.prefetchrows = arraysize + 1
+            params = {'since': since} if since is not None else {}
+            with span('oracle.execute', delta=since is not None):
+                cursor.execute(self._build_query(days, since), params)
+
+            columns = [desc[0].lower() for desc in cursor.description]
+
+            # Tempi accumulati sui round-trip (gli yield non sono conteggiati)
+            fetch = {'ms': 0.0, 'transform_ms': 0.0, 'rows': 0, 'round_trips': 0}
+            try:
+                while True:
+                    t0 = time.perf_counter()
+                    rows = cursor.fetchmany(arraysize)
+                    t1 = time.perf_counter()
+                    fetch['ms'] += (t1 - t0) * 1000
+                    fetch['round_trips'] += 1
+                    if not rows:
+                        break
+                    batch = [self._transform_row(columns, row) for row in rows]
+                    fetch['transform_ms'] += (time.perf_counter() - t1) * 1000
+                    fetch['rows'] += len(batch)
+                    yield batch
+            finally:
+                registra('oracle.fetch', fetch['ms'], rows=fetch['rows'],
+                         round_trips=fetch['round_trips'], arraysize=arraysize)
+                registra('oracle.transform', fetch['transform_ms'], rows=fetch['rows'])
 
             cursor.close()
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _time_slices(days: int, slice_days: int) -> List[tuple]:
+        """Fette [inizio, fine) della finestra; l'ultima è aperta (fine None)"""
+        today = datetime.combine(datetime.now().date(), datetime.min.time())
+        start = today - timedelta(days=days)
+        slices = []
+        while start <= today:
+            end = start + timedelta(days=slice_days)
+            slices.append((start, end if end <= today else None))
+            start = end
+        return slices
+
+    def _fetch_slice(self, pool, slice_start: datetime, slice_end: Optional[datetime], arraysize: int,
+                     batch_queue: queue.Queue, stop: threading.Event) -> int:
+        """Legge una fetta di giorni su una connessione del pool e accoda i blocchi trasformati"""
+        rows_read = 0
+        with pool.acquire() as connection:
+            cursor = connection.cursor()
+            cursor.arraysize = arraysize
+            cursor.prefetchrows = arraysize + 1
+
+            params = {'slice_start': slice_start}
+            if slice_end is not None:
+                params['slice_end'] = slice_end
+            fetta = slice_start.strftime('%Y-%m-%d')
+            with span('oracle.execute', slice=fetta):
+                cursor.execute(self._build_query(0, sliced=True, open_end=slice_end is None), params)
+            columns = [desc[0].lower() for desc in cursor.description]
+
+            fetch_ms = transform_ms = 0.0
+            round_trips = 0
+            while not stop.is_set():
+                t0 = time.perf_counter()
+                rows = cursor.fetchmany(arraysize)
+                t1 = time.perf_counter()
+                fetch_ms += (t1 - t0) * 1000
+                round_trips += 1
+                if not rows:
+                    break
+                batch = [self._transform_row(columns, row) for row in rows]
+                transform_ms += (time.perf_counter() - t1) * 1000
+                rows_read += len(batch)
+                # put con timeout: se il consumatore si ferma i worker terminano
+                while not stop.is_set():
+                    try:
+                        batch_queue.put(batch, timeout=1)
+                        break
+                    except queue.Full:
+                        continue
+            cursor.close()
+        registra('oracle.fetch', fetch_ms, rows=rows_read, round_trips=round_trips, arraysize=arraysize, slice=fetta)
+        registra('oracle.transform', transform_ms, rows=rows_read, slice=fetta)
+        return rows_read
+
+    def iter_batches_parallel(self, days=30, arraysize=5000, slice_days=1,
+                              parallelism=4) -> Iterator[List[Dict]]:
+        """
+        Estrazione parallela: la finestra è divisa in fette di `slice_days` giorni lette
+        in concorrenza da `parallelism` connessioni di un pool. I blocchi arrivano
+        nell'ordine in cui sono pronti (nessun ordinamento tra fette).
+        """
+        slices = self._time_slices(days, slice_days)
+        batch_queue = queue.Queue(maxsize=parallelism * 2)
+        stop = threading.Event()
+        errors = []
+
+        def run():
+            pool = None
+            try:
+                pool = self._create_oracle_pool(parallelism)
+                with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix='oracle-slice') as executor:
+                    futures = [executor.submit(self._fetch_slice, pool, start, end, arraysize, batch_queue, stop)
+                               for start, end in slices]
+                    for future in futures:
+                        future.result()
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                if pool is not None:
+                    pool.close(force=True)
+                batch_queue.put(None)
+
+        print(f"⏳ Estrazione parallela: {len(slices)} fette da {slice_days} giorni, {parallelism} connessioni")
+        coordinator = threading.Thread(target=run, name='oracle-slices', daemon=True)
+        coordinator.start()
+        try:
+            while True:
+                batch = batch_queue.get()
+                if batch is None:
+                    break
+                yield batch
+        finally:
+            stop.set()
+            # Svuota la coda per sbloccare il coordinatore se il consumatore si è fermato prima
+            while coordinator.is_alive():
+                try:
+                    batch_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            coordinator.join()
+
+        if errors:
+            raise errors[0]
+
+    def _extraction_batches(self, days: int, arraysize: Optional[int],
+                            since: Optional[datetime]) -> Iterator[List[Dict]]:
+        """Sorgente dei blocchi: parallela a fette per la finestra completa se configurata,
+        query unica per il delta o con parallelismo 1"""
+        arraysize = arraysize or self.extraction['arraysize']
+        if since is None and self.extraction['parallelismo'] > 1:
+            return self.iter_batches_parallel(days, arraysize, self.extraction['giorni_per_fetta'],
+                                              self.extraction['parallelismo'])
+        return self.iter_batches_from_oracle(days, arraysize, since)
+
+    def iter_from_oracle(self, days=30, arraysize=None) -> Iterator[Dict]:
+        """Generatore riga per riga sopra l'estrazione (parallela se configurata)"""
+        for batch in self._extraction_batches(days, arraysize, None):
+            yield from batch
+
+    def fetch_from_oracle(self, days=30) -> List[Dict]:
+        """
+        Legge le richieste da IAM.STORICO_RICHIESTE degli ultimi N giorni
+
+        Args:
+            days: numero di giorni indietro da leggere (default 30)
+
+        Returns:
+            Lista di richieste come dict
+        """
+        try:
+            print(f"⏳ Lettura da Oracle (ultimi {days} giorni)...")
+            start_time = datetime.now()
+
+            rows = list(self.iter_from_oracle(days))
+
             elapsed = (datetime.now() - start_time).total_seconds()
             print(f"✓ Caricate {len(rows)} richieste da Oracle ({elapsed:.2f}s)")
             return rows
@@ -243,28 +533,493 @@ class IAMRequestsLoader:
         except Exception as e:
             print(f"✗ Errore lettura Oracle: {e}")
             return []
+
+    @staticmethod
+    def _put_until_stopped(batch_queue: queue.Queue, item, stop: threading.Event) -> bool:
+        """put con timeout: False se lo stop arriva prima che la coda abbia spazio"""
+        while not stop.is_set():
+            try:
+                batch_queue.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    @classmethod
+    def _produce_batches(cls, batches: Iterator[List[Dict]], batch_queue: queue.Queue,
+                         errors: List[Exception], stop: threading.Event):
+        """
+        Thread producer: riempie la coda limitata con i blocchi letti da Oracle.
+        Con lo stop (consumatore fermo) chiude il generatore, che rilascia cursore e connessione.
+        """
+        try:
+            for batch in batches:
+                if not cls._put_until_stopped(batch_queue, batch, stop):
+                    break
+        except Exception as e:
+            errors.append(e)
         finally:
-            if self.db_connection:
-                self.db_connection.close()
+            batches.close()
+            cls._put_until_stopped(batch_queue, None, stop)
+
+    def _bulk_action(self, richiesta: Dict, index_name: str) -> Dict:
+        """Azione bulk con _id deterministico: ricaricare una richiesta la sovrascrive (upsert).
+        Con le partizioni il documento va sempre nel mese di DATA_CREAZIONE."""
+        if self.partitioned:
+            index_name = self.partitions(index_name).partition_for(richiesta)
+        action = {'_index': index_name, '_source': richiesta}
+        if richiesta.get('id_richiesta') is not None:
+            action['_id'] = str(richiesta['id_richiesta'])
+        return action
+
+    @staticmethod
+    def _text_document(richiesta: Dict) -> Optional[Dict]:
+        """Documento dell'indice testi; None se la richiesta non ha testi valorizzati"""
+        if richiesta.get('id_richiesta') is None or not any(richiesta.get(field) for field in TEXT_FIELDS):
+            return None
+        doc = {'id_richiesta': str(richiesta['id_richiesta']), 'data_creazione': richiesta.get('data_creazione')}
+        doc.update({field: richiesta.get(field) for field in TEXT_FIELDS})
+        return doc
+
+    def _bulk_actions(self, richiesta: Dict, index_name: str) -> Iterator[Dict]:
+        """Azioni bulk di una richiesta: con text_mode 'split' i testi sono tolti dal
+        documento principale (pop sul dict) e scritti nell'indice testi"""
+        if self.text_mode == 'split':
+            text_doc = self._text_document(richiesta)
+            for field in TEXT_FIELDS:
+                richiesta.pop(field, None)
+            if text_doc is not None:
+                yield {'_index': self.text_index(index_name), '_id': text_doc['id_richiesta'], '_source': text_doc}
+        yield self._bulk_action(richiesta, index_name)
+
+    def stream_load(self, days=30, index_name='iam-richieste', arraysize=None,
+                    chunk_size=5000, max_chunk_bytes=10 * 1024 * 1024, thread_count=4,
+                    queue_size=4, progress_every=10000, since: Optional[datetime] = None,
+                    refresh=True, sketches: Optional[SketchAccumulator] = None,
+                    forest: Optional[RequestForest] = None,
+                    sla_tracker: Optional[SLADeadlineTracker] = None) -> Dict:
+        """
+        Pipeline streaming Oracle -> OpenSearch senza materializzare l'intero risultato
+
+        Stadi: fetchmany(arraysize) -> transform (thread producer) -> coda limitata
+        -> helpers.parallel_bulk (o streaming_bulk con thread_count=1).
+
+        Args:
+            days: numero di giorni indietro da leggere
+            index_name: indice di destinazione
+            arraysize: righe per fetchmany Oracle (default da iam_config.json)
+            chunk_size: documenti massimi per richiesta _bulk
+            max_chunk_bytes: dimensione massima in byte di una richiesta _bulk (limite principale)
+            thread_count: worker bulk paralleli (1 = streaming_bulk)
+            queue_size: blocchi Oracle massimi in attesa di indicizzazione
+            progress_every: ogni quanti documenti stampare l'avanzamento
+            since: se valorizzato carica solo le righe modificate dopo questo istante
+            refresh: esegue un refresh esplicito a fine caricamento
+            sketches: accumulatore t-digest/SLA per operazione × giorno alimentato dalle righe lette
+            forest: foresta padre/figli alimentata dalle righe con ID_RICHIESTA_PARENT o FLAG_HAS_CHILDREN
+            sla_tracker: tracker delle scadenze SLA delle richieste pendenti (aggiornato riga per riga)
+
+        Returns:
+            Dict con success, failed, total, elapsed, docs_per_second, watermark
+            (massimo DATA_STORICIZZAZIONE/DATA_CHIUSURA/DATA_CREAZIONE visto) e
+            affected_days (giorni di DATA_CREAZIONE toccati, per il rollup giornaliero)
+        """
+        arraysize = arraysize or self.extraction['arraysize']
+        window = f"modificate dopo {since.isoformat()}" if since else f"ultimi {days} giorni"
+        print(f"⏳ Streaming Oracle → OpenSearch ({window}, "
+              f"arraysize={arraysize}, chunk={max_chunk_bytes // 1024}KB, workers={thread_count})...")
+
+        batch_queue = queue.Queue(maxsize=queue_size)
+        errors = []
+        stop = threading.Event()
+        producer = threading.Thread(
+            target=self._produce_batches,
+            args=(self._extraction_batches(days, arraysize, since), batch_queue, errors, stop),
+            name='oracle-producer',
+            daemon=True
+        )
+
+        watermark = {'value': None}
+        affected_days = set()
+
+        def actions():
+            while not stop.is_set():
+                try:
+                    batch = batch_queue.get(timeout=1)
+                except queue.Empty:
+                    continue
+                if batch is None:
+                    return
+                for richiesta in batch:
+                    # Stringhe ISO: il confronto lessicografico segue l'ordine temporale
+                    for field in CHANGE_FIELDS:
+                        value = richiesta.get(field)
+                        if value and (watermark['value'] is None or value > watermark['value']):
+                            watermark['value'] = value
+                    if richiesta.get('data_creazione'):
+                        affected_days.add(richiesta['data_creazione'][:10])
+                    if sketches is not None:
+                        sketches.aggiungi(richiesta)
+                    if forest is not None:
+                        # Finestra completa: i figli (creati dopo il padre) passano tutti da qui
+                        forest.aggiungi(richiesta, figli_completi=since is None)
+                    if sla_tracker is not None:
+                        sla_tracker.aggiorna(richiesta)
+                    yield from self._bulk_actions(richiesta, index_name)
+
+        if thread_count > 1:
+            results = helpers.parallel_bulk(
+                self.os_client, actions(), thread_count=thread_count, chunk_size=chunk_size,
+                max_chunk_bytes=max_chunk_bytes, queue_size=queue_size, raise_on_error=False
+            )
+        else:
+            results = helpers.streaming_bulk(
+                self.os_client, actions(), chunk_size=chunk_size,
+                max_chunk_bytes=max_chunk_bytes, raise_on_error=False
+            )
+
+        text_index = self.text_index(index_name)
+        success = failed = text_success = text_failed = 0
+        start = time.time()
+        start_perf = time.perf_counter()
+        producer.start()
+
+        try:
+            for ok, item in results:
+                # I documenti dell'indice testi sono contati a parte
+                if next(iter(item.values()), {}).get('_index') == text_index:
+                    if ok:
+                        text_success += 1
+                    else:
+                        text_failed += 1
+                    continue
+                if ok:
+                    success += 1
+                else:
+                    failed += 1
+
+                processed = success + failed
+                if progress_every and processed % progress_every == 0:
+                    rate = processed / max(time.time() - start, 1e-6)
+                    print(f"   … {processed:,} documenti ({rate:,.0f} docs/s)")
+        finally:
+            # Errore bulk (trasporto, connessione chiusa): il producer non resta bloccato
+            # sulla coda piena e rilascia le risorse Oracle prima di propagare l'errore
+            stop.set()
+            producer.join()
+        if refresh:
+            self.os_client.indices.refresh(index=index_name)
+            if self.text_mode == 'split':
+                self.os_client.indices.refresh(index=text_index)
+
+        elapsed = time.time() - start
+        total = success + failed
+        docs_per_second = total / elapsed if elapsed > 0 else 0
+
+        if errors:
+            print(f"✗ Errore lettura Oracle: {errors[0]}")
+
+        registra('load.stream', (time.perf_counter() - start_perf) * 1000, rows=total,
+                 status='error' if errors or failed else 'ok', failed=failed, text_docs=text_success,
+                 delta=since is not None, thread_count=thread_count)
+
+        print(f"✓ Inserite {success} richieste ({failed} fallimenti) in {elapsed:.2f}s "
+              f"({docs_per_second:,.0f} docs/s)")
+        if self.text_mode == 'split':
+            print(f"   Testi in '{text_index}': {text_success} ({text_failed} fallimenti)")
+
+        return {
+            'success': success,
+            'failed': failed,
+            'text_success': text_success,
+            'text_failed': text_failed,
+            'total': total,
+            'elapsed': round(elapsed, 2),
+            'docs_per_second': round(docs_per_second, 1),
+            'watermark': watermark['value'],
+            'affected_days': sorted(affected_days),
+            'error': str(errors[0]) if errors else None
+        }
+
+    def measure_query_latency(self, index_name='iam-richieste', runs=5) -> Optional[float]:
+        """Latenza mediana (ms, 'took' lato server) della query aggregata di riferimento"""
+        try:
+            timings = sorted(
+                self.os_client.search(index=index_name, body=LATENCY_PROBE_QUERY,
+                                      request_cache=False)['took']
+                for _ in range(runs)
+            )
+            return float(timings[len(timings) // 2])
+        except Exception as e:
+            print(f"⚠ Misura latenza non disponibile: {e}")
+            return None
+
+    @contextmanager
+    def bulk_load_phase(self, index_name='iam-richieste'):
+        """
+        Fase di caricamento massivo: refresh disabilitato e repliche a 0 durante il load,
+        impostazioni originali di ciascun indice ripristinate (e refresh esplicito) all'uscita
+        anche in caso di errore. index_name: indice o elenco di indici separati da virgola
+        (con le partizioni mensili solo quelle della finestra, mai l'alias di lettura).
+        """
+        response = self.os_client.indices.get_settings(index=index_name)
+        original = {
+            name: {
+                'refresh_interval': value['settings']['index'].get('refresh_interval', '1s'),
+                'number_of_replicas': value['settings']['index'].get('number_of_replicas', '1')
+            }
+            for name, value in response.items()
+        }
+
+        self.os_client.indices.put_settings(
+            index=','.join(original),
+            body={'index': {'refresh_interval': '-1', 'number_of_replicas': 0}}
+        )
+        print(f"⚙ Fase bulk su {len(original)} indici: refresh disabilitato, repliche a 0 (originali: {original})")
+
+        try:
+            yield original
+        finally:
+            for name, settings in original.items():
+                self.os_client.indices.put_settings(index=name, body={'index': settings})
+            self.os_client.indices.refresh(index=','.join(original))
+            print(f"⚙ Impostazioni ripristinate e refresh eseguito su {', '.join(original)}")
+
+    def optimize_index(self, index_name='iam-richieste', max_num_segments=1):
+        """
+        Ottimizzazione per indici read-mostly: force-merge, che riscrive i segmenti con il
+        codec dell'indice. Il codec best_compression è statico e viene impostato solo alla
+        creazione (richieste_settings): gli indici in uso non vengono mai chiusi.
+        """
+        settings = self.os_client.indices.get_settings(index=index_name, name='index.codec')
+        without_codec = sorted(name for name, value in settings.items()
+                               if value.get('settings', {}).get('index', {}).get('codec') != 'best_compression')
+        if without_codec:
+            print(f"⚠ Codec di default su {', '.join(without_codec)}: best_compression solo "
+                  f"per gli indici creati da ora in poi")
+
+        start = time.time()
+        self.os_client.indices.forcemerge(
+            index=index_name, max_num_segments=max_num_segments, request_timeout=3600
+        )
+        print(f"✓ Force-merge '{index_name}' a {max_num_segments} segmenti ({time.time() - start:.1f}s)")
+
+    def tuned_load(self, days=30, index_name='iam-richieste', optimize=False,
+                   since: Optional[datetime] = None, **stream_options) -> Dict:
+        """
+        Caricamento all'interno della fase bulk, con force-merge opzionale e report
+        di throughput di ingest e latenza query prima/dopo
+        """
+        latency_before = self.measure_query_latency(index_name)
+
+        phase_target = index_name
+        if self.partitioned:
+            # Fase bulk solo sulle partizioni della finestra (create qui se mancano): lo storico
+            # letto dall'alias mantiene repliche e refresh
+            today = datetime.now().date()
+            start = since.date() if since is not None else today - timedelta(days=days)
+            phase_target = ','.join(sorted({
+                self.partitions(index_name).ensure_partition(month)
+                for month in {(today - timedelta(days=d)).replace(day=1)
+                              for d in range((today - start).days + 1)}
+            }))
+
+        with self.bulk_load_phase(phase_target):
+            result = self.stream_load(days=days, index_name=index_name, since=since,
+                                      refresh=False, **stream_options)
+
+        if optimize and not result['error']:
+            target = index_name
+            if self.partitioned:
+                # Solo i mesi chiusi toccati dal load: la partizione di scrittura (mese corrente)
+                # riceve ancora gli upsert del delta e i mesi precedenti sono già ottimizzati
+                partitions = self.partitions(index_name)
+                write_partition = partitions.partition_name(None)
+                target = ','.join(sorted({partitions.partition_name(day)
+                                          for day in result['affected_days']} - {write_partition}))
+            if target:
+                self.optimize_index(target)
+            else:
+                print("✓ Force-merge non necessario: il load ha toccato solo la partizione di scrittura")
+
+        latency_after = self.measure_query_latency(index_name)
+        result['query_latency_before_ms'] = latency_before
+        result['query_latency_after_ms'] = latency_after
+
+        print(f"📊 Ingest: {result['docs_per_second']:,.0f} docs/s | "
+              f"latenza query: {latency_before if latency_before is not None else '-'} ms → "
+              f"{latency_after if latency_after is not None else '-'} ms")
+
+        return result
+
+    @staticmethod
+    def _load_sync_state(state_file: str) -> Dict:
+        """Legge lo stato del sync incrementale (watermark per indice)"""
+        try:
+            if Path(state_file).exists():
+                with open(state_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception as e:
+            print(f"⚠ Stato sync non leggibile ({state_file}): {e}, eseguo caricamento completo")
+        return {}
+
+    @staticmethod
+    def _save_sync_state(state_file: str, state: Dict):
+        """Salva lo stato del sync incrementale in modo atomico"""
+        tmp_file = Path(f"{state_file}.tmp")
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2, ensure_ascii=False)
+        tmp_file.replace(state_file)
+
+    def sync(self, days=30, index_name='iam-richieste', state_file='iam_sync_state.json',
+             overlap_minutes=5, full=False, optimize=False, update_rollup=True,
+             update_sketches=True, update_trees=True, retention_months: Optional[int] = None,
+             sla_tracker: Optional[SLADeadlineTracker] = None, **stream_options) -> Dict:
+        """
+        Sync incrementale Oracle -> OpenSearch
+
+        Al primo avvio (o con full=True) carica gli ultimi N giorni; in seguito legge solo le
+        righe con DATA_STORICIZZAZIONE/DATA_CHIUSURA/DATA_CREAZIONE successive al watermark
+        salvato (meno overlap_minutes per le transazioni committate in ritardo). Grazie a
+        _id = ID_RICHIESTA le righe già presenti vengono sovrascritte, mai duplicate.
+
+        Args:
+            days: finestra del caricamento completo iniziale
+            index_name: indice di destinazione
+            state_file: file JSON dove persistere il watermark
+            overlap_minutes: margine di rilettura prima del watermark
+            full: forza il caricamento completo ignorando il watermark
+            optimize: dopo un caricamento completo esegue il force-merge (codec impostato alla creazione)
+            update_rollup: ricalcola l'indice rollup giornaliero per i giorni toccati
+            update_sketches: aggiorna gli sketch KPI (iam-kpi-sketches) dei giorni toccati
+            update_trees: ricalcola gli aggregati padre/figli ('albero') degli alberi toccati
+            retention_months: con le partizioni elimina i mesi più vecchi di N (None = nessuna)
+            sla_tracker: tracker SLA da tenere tra un sync e l'altro; riceve le righe lette ed
+                emette gli alert maturati in iam-sla-alerts
+            **stream_options: opzioni passate a stream_load (arraysize, chunk_size, ...)
+
+        Returns:
+            Risultato di stream_load con 'mode' ('full' o 'delta') e 'since'
+        """
+        state = self._load_sync_state(state_file)
+        index_state = state.get(index_name, {})
+
+        # Cambio di modalità campi testo: il delta lascerebbe documenti delle due forme
+        # (stati senza text_mode: caricati con la modalità storica 'inline')
+        previous_text_mode = index_state.get('text_mode', TEXT_DEFAULT['modalita'])
+        if not full and index_state.get('watermark') and previous_text_mode != self.text_mode:
+            print(f"⚠ Modalità campi testo cambiata ({previous_text_mode} → {self.text_mode}): "
+                  f"caricamento completo degli ultimi {days} giorni; i documenti più vecchi "
+                  f"restano nella forma precedente fino alla ricostruzione dell'indice")
+            full = True
+
+        since = None
+        if not full and index_state.get('watermark'):
+            since = datetime.fromisoformat(index_state['watermark']) - timedelta(minutes=overlap_minutes)
+
+        sketches = accumulatore = None
+        if update_sketches:
+            sketches = IAMKpiSketches(client=self.os_client, source_index=index_name,
+                                      config_file=self.kpi_config_file)
+            # Finestra completa (giorni interi): gli sketch si costruiscono durante lo streaming
+            accumulatore = sketches.accumulatore() if since is None else None
+
+        forest = RequestForest() if update_trees else None
+
+        if since is None:
+            # Caricamento completo: fase bulk con refresh/repliche disattivati
+            result = self.tuned_load(days=days, index_name=index_name, optimize=optimize,
+                                     sketches=accumulatore, forest=forest, sla_tracker=sla_tracker,
+                                     **stream_options)
+        else:
+            result = self.stream_load(days=days, index_name=index_name, since=since,
+                                      forest=forest, sla_tracker=sla_tracker, **stream_options)
+        result['mode'] = 'delta' if since else 'full'
+        result['since'] = since.isoformat() if since else None
+
+        if self.partitioned:
+            partitions = self.partitions(index_name)
+            partitions.roll_write_alias()
+            if retention_months:
+                result['expired_partitions'] = partitions.apply_retention(retention_months)
+
+        # Aggregati padre/figli sui documenti padre (update parziali nella partizione del padre)
+        if forest is not None and len(forest):
+            try:
+                with span('load.tree', nodes=len(forest)) as info:
+                    result['alberi'] = forest.aggiorna(
+                        self.os_client, index_name,
+                        index_for=lambda nodo: self._bulk_action(nodo, index_name)['_index'])
+                    info['rows'] = result['alberi']['parents']
+            except Exception as e:
+                print(f"⚠ Aggregati alberi richieste non aggiornati: {e}")
+
+        # Scadenze SLA: eventi maturati da questo sync (e dal tempo trascorso) in iam-sla-alerts
+        if sla_tracker is not None:
+            try:
+                result['sla_alerts'] = sla_tracker.controlla()
+            except Exception as e:
+                print(f"⚠ Alert SLA non emessi: {e}")
+
+        # Il rollup riflette il contenuto dell'indice: va aggiornato anche con fallimenti parziali
+        if update_rollup and result['affected_days']:
+            try:
+                rollup = IAMDailyRollup(client=self.os_client, source_index=index_name,
+                                        config_file=self.kpi_config_file)
+                result['rollup'] = rollup.aggiorna(result['affected_days'])
+            except Exception as e:
+                print(f"⚠ Rollup giornaliero non aggiornato: {e}")
+
+        # Sketch KPI: scritti dall'accumulatore (completo) o ricostruiti dal raw (delta: le
+        # richieste sovrascritte non si possono sottrarre da un t-digest)
+        if sketches is not None:
+            try:
+                if accumulatore is not None and not result['error'] and not result['failed']:
+                    result['sketches'] = sketches.scrivi(accumulatore)
+                    print(f"✓ Sketch KPI: {result['sketches']['docs']} operazioni × giorno "
+                          f"da {result['total']} righe")
+                elif not self.os_client.indices.exists(index=sketches.sketch_index):
+                    # Primo sync delta senza indice sketch: ricostruisce l'intera finestra dal raw
+                    today = datetime.now().date()
+                    result['sketches'] = sketches.aggiorna(
+                        [(today - timedelta(days=d)).isoformat() for d in range(days + 1)])
+                elif result['affected_days']:
+                    result['sketches'] = sketches.aggiorna(result['affected_days'])
+            except Exception as e:
+                print(f"⚠ Sketch KPI non aggiornati: {e}")
+
+        # Avanza il watermark solo se il caricamento è andato a buon fine
+        if result['error'] or result['failed'] or result['text_failed']:
+            print(f"⚠ Watermark non aggiornato ({result['failed'] + result['text_failed']} fallimenti)")
+            return result
+
+        state[index_name] = {
+            'watermark': result['watermark'] or index_state.get('watermark'),
+            'last_sync': datetime.now().isoformat(),
+            'last_mode': result['mode'],
+            'last_rows': result['total'],
+            'text_mode': self.text_mode
+        }
+        self._save_sync_state(state_file, state)
+        print(f"✓ Sync {result['mode']}: {result['total']} righe, watermark {state[index_name]['watermark']}")
+
+        return result
 
     def bulk_insert(self, richieste: List[Dict], index_name='iam-richieste') -> Dict:
         """Inserisce le richieste in bulk"""
         try:
-            actions = [
-                {
-                    '_index': index_name,
-                    '_source': richiesta
-                }
-                for richiesta in richieste
-            ]
+            actions = (action for richiesta in richieste for action in self._bulk_actions(richiesta, index_name))
 
             success, failed = helpers.bulk(
                 self.os_client,
                 actions,
                 raise_on_error=False,
-                refresh=True,
-                chunk_size=500
+                chunk_size=5000,
+                max_chunk_bytes=10 * 1024 * 1024
             )
+            self.os_client.indices.refresh(index=index_name)
+            if self.text_mode == 'split':
+                self.os_client.indices.refresh(index=self.text_index(index_name))
 
             print(f"✓ Inserite {success} richieste ({len(failed)} fallimenti)")
             return {
@@ -276,6 +1031,64 @@ class IAMRequestsLoader:
             print(f"✗ Errore inserimento: {e}")
             return {'success': 0, 'failed': len(richieste), 'total': len(richieste)}
 
+    def load_texts(self, ids: List[Any], index_name='iam-richieste', batch_size=1000) -> Dict[str, Dict]:
+        """
+        Legge NOTA/COMUNICAZIONE_UF da Oracle per le richieste indicate e li indicizza
+        nell'indice testi (caricamento su richiesta, utile con text_mode 'skip')
+
+        Returns:
+            Dict ID_RICHIESTA -> documento testi (solo richieste con testi valorizzati)
+        """
+        if not ids or not self.create_text_index(index_name):
+            return {}
+
+        texts = {}
+        connection = self._connect_oracle()
+        try:
+            cursor = connection.cursor()
+            for offset in range(0, len(ids), batch_size):
+                chunk = list(ids[offset:offset + batch_size])
+                binds = ', '.join(f":id{i}" for i in range(len(chunk)))
+                cursor.execute(f"""
+                    SELECT ID_RICHIESTA, DATA_CREAZIONE, {', '.join(TEXT_COLUMNS)}
+                    FROM IAM.STORICO_RICHIESTE
+                    WHERE ID_RICHIESTA IN ({binds})
+                """, {f"id{i}": value for i, value in enumerate(chunk)})
+                columns = [desc[0].lower() for desc in cursor.description]
+                for row in cursor:
+                    richiesta = dict(zip(columns, row))
+                    if isinstance(richiesta['data_creazione'], datetime):
+                        richiesta['data_creazione'] = richiesta['data_creazione'].isoformat()
+                    doc = self._text_document(richiesta)
+                    if doc is not None:
+                        texts[doc['id_richiesta']] = doc
+            cursor.close()
+        finally:
+            connection.close()
+
+        text_index = self.text_index(index_name)
+        helpers.bulk(self.os_client, ({'_index': text_index, '_id': doc_id, '_source': doc}
+                                      for doc_id, doc in texts.items()), refresh=True)
+        print(f"✓ Testi caricati da Oracle: {len(texts)} richieste su {len(ids)}")
+        return texts
+
+    def get_texts(self, ids: List[Any], index_name='iam-richieste', from_oracle=True) -> Dict[str, Dict]:
+        """
+        Testi di un insieme di richieste: mget sull'indice testi, le mancanti lette da
+        Oracle (from_oracle=True) e indicizzate per le richieste successive
+        """
+        ids = [str(value) for value in ids]
+        texts = {}
+        text_index = self.text_index(index_name)
+        if ids and self.os_client.indices.exists(index=text_index):
+            response = self.os_client.mget(index=text_index, body={'ids': ids})
+            texts = {doc['_id']: doc['_source'] for doc in response['docs'] if doc.get('found')}
+
+        missing = [value for value in ids if value not in texts]
+        if missing and from_oracle:
+            texts.update(self.load_texts(missing, index_name))
+        return texts
+
     def count_documents(self, index_name='iam-richieste') -> int:
         """Conta i documenti nell'indice"""
         try:
@@ -307,16 +1120,13 @@ if __name__ == '__main__':
         print("\n1. Creazione indice...\n")
         loader.create_iam_index()
 
-        print("\n2. Lettura ultimi 30 giorni da Oracle...\n")
-        richieste = loader.fetch_from_oracle(days=30)
+        print("\n2-3. Sync incrementale da Oracle a OpenSearch...\n")
+        result = loader.sync(days=30)
 
-        if not richieste:
+        if result['mode'] == 'full' and not result['total']:
             print("⚠ Nessun dato letto!")
             exit(1)
 
-        print("\n3. Inserimento in OpenSearch...\n")
-        loader.bulk_insert(richieste)
-
         print("\n4. Verifica...\n")
         loader.count_documents()
 
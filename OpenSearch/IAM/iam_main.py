@@ -39,6 +39,9 @@ from datetime import datetime
 from pathlib import Path
 import subprocess
 
+# opensearch_pool.py (client condiviso) è nella cartella superiore
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
 
 class Colors:
     """ANSI color codes"""
@@ -102,6 +105,35 @@ class IAMOrchestrator:
     def __init__(self):
         """Inizializza orchestratore"""
         self.timers = {}
+        self.tracer = None
+        # Scadenze SLA delle pendenti: in memoria tra un ciclo di aggiornamento e l'altro
+        self.sla_tracker = None
+
+    def _avvia_tracing(self, pipeline: str):
+        """Tracer dell'esecuzione: span in iam-pipeline-metrics e iam_pipeline_metrics.json"""
+        from iam_tracing import PipelineTracer, attiva
+        from opensearch_pool import get_client
+        self.tracer = attiva(PipelineTracer(client=get_client(), pipeline=pipeline))
+        return self.tracer
+
+    def _chiudi_tracing(self):
+        """Pubblica gli span raccolti e segnala le fasi in regressione"""
+        from iam_tracing import disattiva
+        tracer = disattiva()
+        self.tracer = None
+        if tracer is not None:
+            regressioni = tracer.chiudi()
+            if regressioni:
+                print_error(f"{len(regressioni)} fasi più lente della mediana storica (vedi sopra)")
+
+    def _esegui_fase(self, name: str, fase) -> bool:
+        """Esegue una fase dentro uno span di primo livello"""
+        from iam_tracing import span
+        with span(name) as info:
+            ok = fase()
+            if not ok:
+                info['status'] = 'error'
+        return ok
 
     def check_dependencies(self):
         """Verifica dipendenze Python"""
@@ -165,6 +197,17 @@ class IAMOrchestrator:
 
         return True
 
+    def check_opensearch(self) -> bool:
+        """Handshake con il client condiviso: una info() per esecuzione (opensearch_pool.verifica)"""
+        from opensearch_pool import get_client, verifica
+        try:
+            info = verifica(get_client())
+            print_success(f"Connesso a OpenSearch {info['version']['number']} (NO SECURITY)")
+            return True
+        except Exception as e:
+            print_error(f"OpenSearch non raggiungibile: {str(e)[:80]}")
+            return False
+
     def load_data(self):
         """Carica dati in OpenSearch"""
         print_section("3. CARICAMENTO DATI DA ORACLE")
@@ -188,22 +231,28 @@ class IAMOrchestrator:
             # Crea indice
             loader.create_iam_index()
 
-            # Leggi ultimi 30 giorni
-            print_info("Lettura ultimi 30 giorni da Oracle...")
-            richieste = loader.fetch_from_oracle(days=30)
+            # Sync incrementale: primo avvio ultimi 30 giorni, poi solo righe modificate
+            print_info("Sync Oracle → OpenSearch (delta dal watermark, upsert per ID_RICHIESTA)...")
+            if self.sla_tracker is None:
+                from iam_sla_tracker import SLADeadlineTracker
+                self.sla_tracker = SLADeadlineTracker(client=loader.os_client)
+            result = loader.sync(days=30, sla_tracker=self.sla_tracker)
 
-            if not richieste:
+            if result['mode'] == 'full' and not result['total']:
                 print_error("Nessun dato letto da Oracle")
                 return False
 
-            # Inserisci in bulk
-            print_info(f"Inserimento {len(richieste)} richieste in OpenSearch...")
-            result = loader.bulk_insert(richieste)
-
             elapsed = time.time() - start
             self.timers['load_data'] = elapsed
 
-            print_success(f"Caricamento completato ({result['success']} documenti)")
+            print_success(f"Caricamento {result['mode']} completato ({result['success']} documenti, "
+                          f"{result['docs_per_second']:,.0f} docs/s)")
+            if result.get('rollup'):
+                print_info(f"Rollup giornaliero: {result['rollup']['days']} giorni ricalcolati, "
+                           f"{result['rollup']['docs']} documenti")
+            if result.get('sla_alerts'):
+                print_info(f"SLA pendenti: {result['sla_alerts']['about_to_breach']} in scadenza, "
+                           f"{result['sla_alerts']['breached']} scadute (iam-sla-alerts)")
             print_timer("Tempo impiegato", elapsed)
 
             return True
@@ -211,6 +260,17 @@ class IAMOrchestrator:
             print_error(f"Caricamento fallito: {e}")
             return False
 
+    @staticmethod
+    def _config_analisi(config_file: str = 'iam_config.json') -> dict:
+        """Sezione 'analisi' di iam_config.json (vuota se il file manca o non è leggibile)"""
+        try:
+            if Path(config_file).exists():
+                with open(config_file, 'r', encoding='utf-8') as f:
+                    return json.load(f).get('analisi', {})
+        except Exception as e:
+            print_error(f"Configurazione analisi non letta: {e}")
+        return {}
+
     def analyze_data(self):
         """Esegue analisi"""
         print_section("4. ANALISI DATI")
@@ -220,8 +280,12 @@ class IAMOrchestrator:
 
             start = time.time()
 
-            analyzer = IAMAnalyzer()
-            analyzer.esegui_tutte_analisi()
+            # SLA e p95/p99 dagli sketch KPI aggiornati dal sync se abilitati in iam_config.json
+            # (l'analizzatore torna ai documenti raw se l'indice sketch non esiste ancora)
+            # 'giorni': solo le richieste create negli ultimi N giorni (partizioni della finestra)
+            config = self._config_analisi()
+            analyzer = IAMAnalyzer(use_sketch=config.get('use_sketch', False))
+            analyzer.esegui_tutte_analisi(giorni=config.get('giorni'))
 
             elapsed = time.time() - start
             self.timers['analyze'] = elapsed
@@ -242,7 +306,7 @@ class IAMOrchestrator:
             start = time.time()
 
             engine = KPIEngine()
-            kpis = engine.calcola_tutti_kpi()
+            kpis = engine.calcola_tutti_kpi(giorni=self._config_analisi().get('giorni'))
 
             print(engine.genera_report_kpi(kpis))
 
@@ -275,6 +339,10 @@ class IAMOrchestrator:
             print_info("Assembly dashboard...")
             dashboard_id = creator.create_dashboard(vis_ids)
 
+            print_info("Import saved objects (solo nuovi/modificati)...")
+            if not creator.publish():
+                dashboard_id = None
+
             creator.print_instructions(dashboard_id)
 
             elapsed = time.time() - start
@@ -300,6 +368,11 @@ class IAMOrchestrator:
 
         print(f"\n{Colors.BOLD}Totale:{Colors.RESET} {total_time:.2f}s\n")
 
+        # Loader, analyzer e KPI condividono lo stesso client (vedi opensearch_pool.py)
+        from opensearch_pool import stampa_metriche
+        stampa_metriche()
+        print()
+
         print(f"{Colors.BOLD}{Colors.GREEN}📊 ACCEDI ALLA DASHBOARD:{Colors.RESET}")
         print(f"   http://localhost:5601/app/dashboards/view/iam-dashboard-main\n")
 
@@ -319,18 +392,18 @@ class IAMOrchestrator:
             print(f"   docker-compose up -d opensearch opensearch-dashboards")
             return False
 
-        # Esecuzione
-        if not self.load_data():
-            return False
-
-        if not self.analyze_data():
+        if not self.check_opensearch():
             return False
 
-        if not self.calculate_kpi():
-            return False
-
-        if not self.create_dashboard():
-            return False
+        # Esecuzione (ogni fase è uno span, vedi iam_tracing.py)
+        self._avvia_tracing('iam-full')
+        try:
+            for name, fase in (('load_data', self.load_data), ('analyze', self.analyze_data),
+                               ('kpi', self.calculate_kpi), ('dashboard', self.create_dashboard)):
+                if not self._esegui_fase(name, fase):
+                    return False
+        finally:
+            self._chiudi_tracing()
 
         self.print_summary()
         return True
@@ -339,19 +412,19 @@ class IAMOrchestrator:
         """Solo caricamento"""
         print_banner()
         print_section("CARICAMENTO DATI")
-        return self.load_data()
+        return self.check_opensearch() and self.load_data()
 
     def run_analyze_only(self):
         """Solo analisi"""
         print_banner()
         print_section("ANALISI DATI")
-        return self.analyze_data()
+        return self.check_opensearch() and self.analyze_data()
 
     def run_kpi_only(self):
         """Solo KPI"""
         print_banner()
         print_section("CALCOLO KPI")
-        return self.calculate_kpi()
+        return self.check_opensearch() and self.calculate_kpi()
 
     def run_dashboard_only(self):
         """Solo dashboard"""
@@ -364,18 +437,30 @@ class IAMOrchestrator:
         print_banner()
         print_section(f"AGGIORNAMENTO PERIODICO (ogni {interval_minutes} min)")
 
+        # Una verifica per esecuzione: i cicli riusano lo stesso client condiviso
+        if not self.check_opensearch():
+            return False
+
         counter = 1
         while True:
             print(f"\n{Colors.BOLD}Esecuzione #{counter} - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}{Colors.RESET}\n")
 
-            # Ricarica dati
-            self.load_data()
+            self._avvia_tracing('iam-update')
+            try:
+                # Ricarica dati
+                self._esegui_fase('load_data', self.load_data)
+
+                # Analisi
+                self._esegui_fase('analyze', self.analyze_data)
 
-            # Analisi
-            self.analyze_data()
+                # KPI
+                self._esegui_fase('kpi', self.calculate_kpi)
+            finally:
+                self._chiudi_tracing()
 
-            # KPI
-            self.calculate_kpi()
+            # Stesso pool di connessioni per tutti i cicli: metriche cumulative
+            from opensearch_pool import stampa_metriche
+            stampa_metriche()
 
             counter += 1
 
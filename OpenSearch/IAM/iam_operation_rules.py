@@ -0,0 +1,151 @@
+"""
+================================================================================
+FILE: iam_operation_rules.py
+================================================================================
+IAM Operation Rules - Famiglie di operazioni calcolate a ingest-time
+
+Classifica FK_NOME_OPERAZIONE tramite regole a prefisso configurabili e
+produce i campi keyword normalizzati:
+- operation_prefix: tutti i prefissi configurati che corrispondono (multi-valore)
+- operation_family: famiglia del prefisso più lungo che corrisponde
+
+In questo modo i KPI possono usare query 'term' su operation_prefix invece
+di 'wildcard' su fk_nome_operazione. I documenti indicizzati prima dei campi
+calcolati vengono completati con backfill_script() (_update_by_query del loader);
+finché ne restano, KPIEngine continua a usare il 'wildcard'.
+
+CONFIGURAZIONE (iam_kpi_config.json):
+{
+    "operation_families": {
+        "RESET_PASSWORD": "reset_password",
+        "BLOCCO": "blocco_inattivita"
+    }
+}
+Se la sezione manca, le regole sono derivate dagli operation_type dei KPI.
+
+UTILIZZO:
+    from iam_operation_rules import OperationClassifier
+
+    classifier = OperationClassifier.from_config_file('iam_kpi_config.json')
+    family, prefixes = classifier.classify('RESET_PASSWORD_AD')
+================================================================================
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+FAMILY_FIELD = 'operation_family'
+PREFIX_FIELD = 'operation_prefix'
+FAMILY_OTHER = 'ALTRO'
+
+# Colonna operazione: nome canonico (schema v2+) e nome storico maiuscolo
+OPERATION_COLUMNS = ('fk_nome_operazione', 'FK_NOME_OPERAZIONE')
+
+# Backfill dei documenti indicizzati senza i campi calcolati (_update_by_query)
+BACKFILL_SCRIPT_SOURCE = """
+String op = null;
+for (def column : params.columns) {
+  if (op == null && ctx._source[column] != null) { op = ctx._source[column].toString(); }
+}
+String family = params.other;
+List prefixes = new ArrayList();
+if (op != null) {
+  String name = op.toUpperCase();
+  for (def rule : params.rules) {
+    if (name.startsWith(rule[0])) {
+      if (prefixes.isEmpty()) { family = rule[1]; }
+      prefixes.add(rule[0]);
+    }
+  }
+}
+ctx._source[params.family_field] = family;
+ctx._source[params.prefix_field] = prefixes;
+"""
+
+
+class OperationClassifier:
+    """Classificatore FK_NOME_OPERAZIONE -> (operation_family, operation_prefix)"""
+
+    def __init__(self, rules: Dict[str, str]):
+        """
+        Args:
+            rules: mappa prefisso -> famiglia (confronto case-insensitive)
+        """
+        # Prefissi ordinati dal più lungo: il primo match determina la famiglia
+        self.rules = sorted(
+            ((prefix.upper(), family) for prefix, family in rules.items()),
+            key=lambda rule: len(rule[0]),
+            reverse=True
+        )
+        self.prefixes = {prefix for prefix, _ in self.rules}
+        self._cache: Dict[str, Tuple[str, List[str]]] = {}
+
+    @classmethod
+    def from_config(cls, config: Dict) -> 'OperationClassifier':
+        """Crea il classificatore dalla configurazione KPI"""
+        if config.get('operation_families'):
+            return cls(config['operation_families'])
+
+        rules = {}
+        for kpi_name, kpi_config in config.get('kpi', {}).items():
+            prefix = kpi_config.get('operation_type', '').rstrip('%')
+            if prefix:
+                rules.setdefault(prefix, kpi_name)
+        return cls(rules)
+
+    @classmethod
+    def from_config_file(cls, config_file: str = 'iam_kpi_config.json') -> 'OperationClassifier':
+        """Crea il classificatore dal file JSON (nessuna regola se il file non esiste)"""
+        try:
+            if Path(config_file).exists():
+                with open(config_file, 'r', encoding='utf-8') as f:
+                    return cls.from_config(json.load(f))
+        except Exception as e:
+            print(f"⚠ Regole operazioni non caricate ({config_file}): {e}")
+        return cls({})
+
+    def classify(self, operazione: Optional[str]) -> Tuple[str, List[str]]:
+        """Restituisce (famiglia, prefissi corrispondenti) per un nome operazione"""
+        if not operazione:
+            return FAMILY_OTHER, []
+
+        # Le operazioni distinte sono poche: il risultato viene memorizzato per nome
+        cached = self._cache.get(operazione)
+        if cached is not None:
+            return cached
+
+        name = operazione.upper()
+        matches = [(prefix, family) for prefix, family in self.rules if name.startswith(prefix)]
+        result = (matches[0][1] if matches else FAMILY_OTHER, [prefix for prefix, _ in matches])
+
+        self._cache[operazione] = result
+        return result
+
+    def annotate(self, richiesta: Dict, column: Optional[str] = None) -> Dict:
+        """Aggiunge operation_family e operation_prefix al documento
+        (default: colonna operazione canonica o, se assente, quella storica maiuscola)"""
+        if column is None:
+            column = next((name for name in OPERATION_COLUMNS if name in richiesta), OPERATION_COLUMNS[0])
+        family, prefixes = self.classify(richiesta.get(column))
+        richiesta[FAMILY_FIELD] = family
+        richiesta[PREFIX_FIELD] = prefixes
+        return richiesta
+
+    def covers(self, operation_type: str) -> bool:
+        """True se il prefisso di un operation_type KPI ('RESET%') è materializzato a ingest-time"""
+        return operation_type.rstrip('%').upper() in self.prefixes
+
+    def backfill_script(self) -> Dict:
+        """Script painless con le stesse regole di classify() per i documenti senza operation_family"""
+        return {
+            'lang': 'painless',
+            'source': BACKFILL_SCRIPT_SOURCE,
+            'params': {
+                'rules': [[prefix, family] for prefix, family in self.rules],
+                'columns': list(OPERATION_COLUMNS),
+                'other': FAMILY_OTHER,
+                'family_field': FAMILY_FIELD,
+                'prefix_field': PREFIX_FIELD
+            }
+        }
@@ -0,0 +1,314 @@
+"""
+================================================================================
+FILE: iam_partitions.py
+================================================================================
+IAM Partitions - Indici mensili per le richieste IAM
+
+Layout:
+- partizioni mensili  iam-richieste-YYYY.MM  (mese di data_creazione)
+- alias di lettura    iam-richieste           (tutte le partizioni)
+- alias di scrittura  iam-richieste-write     (partizione del mese corrente)
+- index template      iam-richieste-partitions (mappings/settings/alias di lettura)
+
+Il loader indirizza ogni richiesta alla partizione del suo mese di creazione,
+così l'upsert per id_richiesta resta idempotente; la retention elimina indici
+interi e le query con intervallo temporale leggono solo le partizioni utili.
+Il template è versionato: le partizioni create con una versione precedente
+vengono aggiornate (mapping + rinomina campi nel _source) da ensure_layout.
+
+UTILIZZO:
+    from iam_partitions import IAMPartitionManager
+
+    partitions = IAMPartitionManager(client)
+    partitions.ensure_layout(mappings, settings, version=2)
+    partitions.apply_retention(keep_months=13)
+    index = partitions.indices_for_range('2024-05-01', '2024-06-01')
+
+    python iam_partitions.py --retention 13
+================================================================================
+"""
+
+import argparse
+import re
+from datetime import date, datetime
+from typing import Dict, List, Optional, Union
+
+from opensearchpy import OpenSearch
+
+READ_ALIAS = 'iam-richieste'
+
+
+def month_start(value: Union[str, date, datetime]) -> date:
+    """Primo giorno del mese di una data (stringa ISO, date o datetime)"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value[:10])
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    """Sposta un primo-del-mese di N mesi (anche negativi)"""
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class IAMPartitionManager:
+    """Gestione partizioni mensili, alias e retention di un indice IAM"""
+
+    def __init__(self, client: OpenSearch, base_name: str = READ_ALIAS, time_field: str = 'data_creazione'):
+        self.client = client
+        self.base_name = base_name
+        self.time_field = time_field
+        self.read_alias = base_name
+        self.write_alias = f"{base_name}-write"
+        self.template_name = f"{base_name}-partitions"
+        # '-2*' (anni 2xxx) per non applicare il template a iam-richieste-daily e simili
+        self.index_pattern = f"{base_name}-2*"
+        self._partition_re = re.compile(rf"^{re.escape(base_name)}-(\d{{4}})\.(\d{{2}})$")
+        self._template = ({}, {})
+        self.version: Optional[int] = None
+
+    def partition_name(self, value: Union[str, date, datetime, None]) -> str:
+        """Partizione del mese indicato (default mese corrente)"""
+        month = month_start(value) if value else month_start(date.today())
+        return f"{self.base_name}-{month.year:04d}.{month.month:02d}"
+
+    def partition_for(self, richiesta: Dict, column: Optional[str] = None) -> str:
+        """Partizione di destinazione di un documento; senza data usa l'alias di scrittura"""
+        value = richiesta.get(column or self.time_field)
+        return self.partition_name(value) if value else self.write_alias
+
+    def list_partitions(self) -> Dict[str, date]:
+        """Partizioni esistenti -> mese, ordinate per mese"""
+        try:
+            names = self.client.indices.get_alias(index=self.index_pattern).keys()
+        except Exception:
+            return {}
+
+        partitions = {}
+        for name in names:
+            match = self._partition_re.match(name)
+            if match:
+                partitions[name] = date(int(match.group(1)), int(match.group(2)), 1)
+        return dict(sorted(partitions.items(), key=lambda item: item[1]))
+
+    def _is_concrete_index(self, name: str) -> bool:
+        """True se 'name' è un indice reale (non un alias)"""
+        return self.client.indices.exists(index=name) and not self.client.indices.exists_alias(name=name)
+
+    def put_template(self, mappings: Dict, settings: Dict, with_read_alias: bool = True,
+                     version: Optional[int] = None):
+        """Index template delle partizioni (le nuove partizioni entrano nell'alias di lettura)"""
+        self._template = (mappings, settings)
+        self.version = version if version is not None else self.version
+        template = {'mappings': mappings, 'settings': settings}
+        if with_read_alias:
+            template['aliases'] = {self.read_alias: {}}
+
+        body = {
+            'index_patterns': [self.index_pattern],
+            'priority': 100,
+            'template': template
+        }
+        if self.version is not None:
+            body['version'] = self.version
+        self.client.indices.put_index_template(name=self.template_name, body=body)
+
+    def upgrade_partitions(self, script: Dict) -> List[str]:
+        """
+        Porta le partizioni create con una versione precedente del template (_meta.schema_version)
+        alla versione corrente: aggiunge i campi mancanti del mapping e riscrive i documenti con
+        `script` (_update_by_query). I settings statici (index sort) restano quelli originali.
+        """
+        mappings, _ = self._template
+        partitions = list(self.list_partitions())
+        if self.version is None or not partitions:
+            return []
+
+        current = self.client.indices.get_mapping(index=','.join(partitions))
+        upgraded = []
+        for name in partitions:
+            mapping = current.get(name, {}).get('mappings', {})
+            if mapping.get('_meta', {}).get('schema_version') == self.version:
+                continue
+
+            # I nomi già presenti come campi concreti non possono diventare alias
+            existing = mapping.get('properties', {})
+            properties = {field: spec for field, spec in mappings.get('properties', {}).items()
+                          if field not in existing}
+            self.client.indices.put_mapping(index=name, body={
+                '_meta': mappings.get('_meta', {}), 'properties': properties
+            })
+            self.client.update_by_query(index=name, body={'script': script}, conflicts='proceed',
+                                        wait_for_completion=True, refresh=True, request_timeout=3600)
+            upgraded.append(name)
+            print(f"✓ Partizione '{name}' aggiornata allo schema v{self.version}")
+        return upgraded
+
+    def ensure_partition(self, value: Union[str, date, datetime, None] = None) -> str:
+        """Crea (se manca) la partizione del mese indicato tramite il template"""
+        name = self.partition_name(value)
+        if not self.client.indices.exists(index=name):
+            self.client.indices.create(index=name)
+            print(f"✓ Partizione '{name}' creata")
+        return name
+
+    def roll_write_alias(self) -> str:
+        """Sposta l'alias di scrittura sulla partizione del mese corrente"""
+        current = self.ensure_partition()
+        actions = [
+            {'remove': {'index': name, 'alias': self.write_alias}}
+            for name in self.list_partitions()
+            if name != current and self.client.indices.exists_alias(index=name, name=self.write_alias)
+        ]
+        actions.append({'add': {'index': current, 'alias': self.write_alias, 'is_write_index': True}})
+        self.client.indices.update_aliases(body={'actions': actions})
+        return current
+
+    def ensure_layout(self, mappings: Dict, settings: Dict, version: Optional[int] = None,
+                      migrate_script: Optional[Dict] = None, source_time_field: Optional[str] = None) -> bool:
+        """
+        Prepara template, alias e partizione corrente.
+        Se esiste ancora l'indice monolitico con il nome dell'alias di lettura lo migra;
+        con `version` e `migrate_script` aggiorna le partizioni di versioni precedenti.
+        """
+        try:
+            monolithic = self._is_concrete_index(self.read_alias)
+            # L'alias non può coesistere con l'indice omonimo: aggiunto dopo la migrazione
+            self.put_template(mappings, settings, with_read_alias=not monolithic, version=version)
+
+            if monolithic and not self.migrate_monolithic(migrate_script, source_time_field):
+                return False
+            if migrate_script is not None:
+                self.upgrade_partitions(migrate_script)
+
+            self.roll_write_alias()
+            print(f"✓ Layout partizionato pronto: {len(self.list_partitions())} partizioni, "
+                  f"alias '{self.read_alias}' / '{self.write_alias}'")
+            return True
+        except Exception as e:
+            print(f"✗ Errore layout partizionato: {e}")
+            return False
+
+    def migrate_monolithic(self, script: Optional[Dict] = None, source_time_field: Optional[str] = None) -> bool:
+        """
+        Copia l'indice monolitico nelle partizioni mensili (_reindex per mese, con `script`
+        applicato a ogni documento), verifica i conteggi, elimina l'indice e aggancia
+        l'alias di lettura a tutte le partizioni. `source_time_field` è il campo data
+        dell'indice monolitico se diverso da quello delle partizioni.
+        """
+        source = self.read_alias
+        time_field = source_time_field or self.time_field
+        print(f"⏳ Migrazione indice monolitico '{source}' in partizioni mensili...")
+
+        bounds = self.client.search(index=source, body={
+            'size': 0,
+            'aggs': {
+                'min': {'min': {'field': time_field}},
+                'max': {'max': {'field': time_field}}
+            }
+        })['aggregations']
+
+        if bounds['min']['value'] is not None:
+            month = month_start(bounds['min']['value_as_string'])
+            last = month_start(bounds['max']['value_as_string'])
+            while month <= last:
+                next_month = add_months(month, 1)
+                body = {
+                    'source': {'index': source, 'query': {'range': {time_field: {
+                        'gte': month.isoformat(), 'lt': next_month.isoformat()
+                    }}}},
+                    'dest': {'index': self.partition_name(month)}
+                }
+                if script:
+                    body['script'] = script
+                self.client.reindex(body=body, wait_for_completion=True, refresh=True, request_timeout=3600)
+                month = next_month
+
+        # Richieste senza data di creazione: partizione corrente
+        body = {
+            'source': {'index': source, 'query': {'bool': {'must_not': {'exists': {'field': time_field}}}}},
+            'dest': {'index': self.ensure_partition()}
+        }
+        if script:
+            body['script'] = script
+        self.client.reindex(body=body, wait_for_completion=True, refresh=True, request_timeout=3600)
+
+        partitions = list(self.list_partitions())
+        expected = self.client.count(index=source)['count']
+        copied = self.client.count(index=','.join(partitions))['count'] if partitions else 0
+        if copied != expected:
+            print(f"✗ Migrazione interrotta: {copied} documenti copiati su {expected}, "
+                  f"indice '{source}' mantenuto")
+            return False
+
+        self.client.indices.delete(index=source)
+        self.client.indices.update_aliases(body={'actions': [
+            {'add': {'index': name, 'alias': self.read_alias}} for name in partitions
+        ]})
+        self.put_template(*self._template, with_read_alias=True)
+        print(f"✓ Migrati {copied} documenti in {len(partitions)} partizioni")
+        return True
+
+    def apply_retention(self, keep_months: int) -> List[str]:
+        """Elimina le partizioni più vecchie degli ultimi N mesi (mese corrente incluso)"""
+        cutoff = add_months(month_start(date.today()), -(keep_months - 1))
+        expired = [name for name, month in self.list_partitions().items() if month < cutoff]
+
+        if expired:
+            self.client.indices.delete(index=','.join(expired))
+            print(f"🗑 Retention {keep_months} mesi: eliminate {len(expired)} partizioni ({', '.join(expired)})")
+        else:
+            print(f"✓ Retention {keep_months} mesi: nessuna partizione da eliminare")
+        return expired
+
+    def indices_for_range(self, start: Union[str, date, datetime, None] = None,
+                          end: Union[str, date, datetime, None] = None) -> str:
+        """
+        Indici da interrogare per data di creazione in [start, end): solo le partizioni dei
+        mesi coinvolti. Senza partizioni corrispondenti ritorna l'alias di lettura.
+        """
+        first = month_start(start) if start else None
+        last = month_start(end) if end else None
+        # 'end' è esclusivo: il primo giorno di un mese non include quel mese
+        if last is not None and str(end)[:10] == last.isoformat():
+            last = add_months(last, -1)
+
+        selected = [
+            name for name, month in self.list_partitions().items()
+            if (first is None or month >= first) and (last is None or month <= last)
+        ]
+        return ','.join(selected) if selected else self.read_alias
+
+    def get_partition_stats(self) -> List[Dict]:
+        """Documenti e dimensione per partizione"""
+        partitions = self.list_partitions()
+        if not partitions:
+            return []
+
+        stats = self.client.indices.stats(index=','.join(partitions), metric='docs,store')['indices']
+        return [
+            {
+                'index': name,
+                'month': month.strftime('%Y-%m'),
+                'docs': stats.get(name, {}).get('primaries', {}).get('docs', {}).get('count', 0),
+                'size_mb': round(stats.get(name, {}).get('primaries', {}).get('store', {})
+                                 .get('size_in_bytes', 0) / 1024 / 1024, 1)
+            }
+            for name, month in partitions.items()
+        ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Partizioni mensili iam-richieste')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9200)
+    parser.add_argument('--retention', type=int, help='Mesi da mantenere (elimina le partizioni più vecchie)')
+    args = parser.parse_args()
+
+    manager = IAMPartitionManager(OpenSearch(hosts=[{'host': args.host, 'port': args.port}], use_ssl=False,
+                                             verify_certs=False, ssl_show_warn=False, timeout=60))
+    if args.retention:
+        manager.apply_retention(args.retention)
+
+    for partition in manager.get_partition_stats():
+        print(f"  {partition['index']:28s} {partition['docs']:>10,} docs  {partition['size_mb']:>8.1f} MB")
@@ -0,0 +1,319 @@
+"""
+================================================================================
+FILE: iam_rollup.py
+================================================================================
+IAM Daily Rollup - Indice aggregato giornaliero delle richieste IAM
+
+Mantiene l'indice 'iam-richieste-daily' con un documento per
+giorno × operazione × tipo_utenza × stato contenente:
+- count, somma/min/max delle ore di elaborazione
+- conteggi cumulativi per soglia di durata (ore_cum.le_<N>): SLA e percentili
+- sla_ok rispetto alla durata KPI della famiglia di operazione
+
+Dopo ogni caricamento vengono ricalcolati solo i giorni toccati dal sync;
+KPI, trend e dashboard possono interrogare il rollup invece dei documenti raw.
+
+UTILIZZO:
+    from iam_rollup import IAMDailyRollup
+
+    rollup = IAMDailyRollup(client=loader.os_client)
+    rollup.create_rollup_index()
+    rollup.aggiorna(result['affected_days'])
+================================================================================
+"""
+
+from opensearchpy import OpenSearch, helpers
+from datetime import datetime, timedelta
+from typing import Dict, List, Iterable, Optional
+import hashlib
+import json
+import sys
+from pathlib import Path
+
+from iam_operation_rules import OperationClassifier
+from iam_partitions import IAMPartitionManager
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from opensearch_pool import get_client
+
+ROLLUP_INDEX = 'iam-richieste-daily'
+
+# Dimensioni del rollup con i nomi canonici del raw (iam_schema); i nomi storici
+# maiuscoli delle configurazioni KPI restano interrogabili come alias
+ROLLUP_DIMENSIONS = ('fk_nome_operazione', 'fk_tipo_utenza', 'stato')
+
+# Soglie (ore) dei conteggi cumulativi; le durate KPI configurate vengono aggiunte
+DEFAULT_EDGES = [1, 2, 4, 8, 12, 24, 48, 72, 96, 120, 168, 336, 720]
+
+
+def edge_key(edge: float) -> str:
+    """Nome del campo cumulativo per una soglia (8 -> le_8, 0.5 -> le_0_5)"""
+    return f"le_{edge:g}".replace('.', '_')
+
+
+class IAMDailyRollup:
+    """Gestisce l'indice rollup giornaliero delle richieste IAM"""
+
+    def __init__(self, host=None, port=None, use_ssl=None,
+                 client: Optional[OpenSearch] = None, source_index='iam-richieste',
+                 rollup_index=ROLLUP_INDEX, config_file='iam_kpi_config.json'):
+        """Usa il client passato (es. quello del loader) o quello condiviso di opensearch_pool (NO SECURITY)"""
+        self.client = client or get_client(host=host, port=port, use_ssl=use_ssl)
+        self.source_index = source_index
+        self.rollup_index = rollup_index
+        self.partitions = IAMPartitionManager(self.client, source_index)
+
+        config = {}
+        try:
+            if Path(config_file).exists():
+                with open(config_file, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+        except Exception as e:
+            print(f"⚠ Config KPI non caricata per il rollup: {e}")
+
+        self.classifier = OperationClassifier.from_config(config)
+        kpi = config.get('kpi', {})
+
+        # Durata SLA primaria per famiglia (le famiglie coincidono con i nomi KPI)
+        self.family_duration = {name: cfg['duration'] for name, cfg in kpi.items() if 'duration' in cfg}
+        # Stato che il KPI della famiglia conta nella SLA (column_status == status, es. EVASA)
+        self.family_status = {name: cfg['status'] for name, cfg in kpi.items() if 'status' in cfg}
+
+        durations = {cfg[key] for cfg in kpi.values() for key in ('duration', 'duration_2') if key in cfg}
+        self.edges = sorted(set(DEFAULT_EDGES) | durations)
+
+    def create_rollup_index(self) -> bool:
+        """Crea l'indice rollup se non esiste"""
+        mappings = {
+            'dynamic': 'strict',
+            'properties': {
+                'day': {'type': 'date'},
+                **{name: {'type': 'keyword'} for name in ROLLUP_DIMENSIONS},
+                **{name.upper(): {'type': 'alias', 'path': name} for name in ROLLUP_DIMENSIONS},
+                'operation_family': {'type': 'keyword'},
+                'operation_prefix': {'type': 'keyword'},
+                'count': {'type': 'long'},
+                'durata_count': {'type': 'long'},
+                'durata_sum': {'type': 'double'},
+                'durata_min': {'type': 'double'},
+                'durata_max': {'type': 'double'},
+                'ore_cum': {
+                    'properties': {edge_key(edge): {'type': 'long'} for edge in self.edges}
+                },
+                'sla_ok': {'type': 'long'},
+                'rollup_run': {'type': 'keyword'},
+                'updated_at': {'type': 'date'}
+            }
+        }
+
+        try:
+            if self.client.indices.exists(index=self.rollup_index):
+                current = self.client.indices.get_mapping(index=self.rollup_index)
+                properties = next(iter(current.values()), {}).get('mappings', {}).get('properties', {})
+                if properties.get(ROLLUP_DIMENSIONS[0], {}).get('type') != 'keyword':
+                    # Layout precedente (dimensioni maiuscole): indice derivato, ricreato
+                    self.client.indices.delete(index=self.rollup_index)
+                    print(f"⚠ Rollup '{self.rollup_index}' con dimensioni maiuscole eliminato: i giorni non "
+                          f"ricalcolati mancano fino a 'python iam_rollup.py' (ricostruisci)")
+                    return self.create_rollup_index()
+
+                # Nuove soglie KPI: aggiunge i campi cumulativi mancanti
+                self.client.indices.put_mapping(index=self.rollup_index, body={
+                    'properties': {'ore_cum': mappings['properties']['ore_cum']}
+                })
+                return True
+
+            self.client.indices.create(index=self.rollup_index, body={
+                'mappings': mappings,
+                'settings': {'number_of_shards': 1, 'number_of_replicas': 0}
+            })
+            print(f"✓ Indice rollup '{self.rollup_index}' creato")
+            return True
+        except Exception as e:
+            print(f"✗ Errore creazione indice rollup: {e}")
+            return False
+
+    def _composite_body(self, start: str, end: str, after: Optional[Dict] = None) -> Dict:
+        """Aggregazione composite sul raw per i giorni [start, end)"""
+        composite = {
+            'size': 1000,
+            'sources': [
+                {'day': {'date_histogram': {'field': 'data_creazione', 'calendar_interval': '1d',
+                                            'format': 'yyyy-MM-dd'}}},
+                {'operazione': {'terms': {'field': 'fk_nome_operazione', 'missing_bucket': True}}},
+                {'tipo_utenza': {'terms': {'field': 'fk_tipo_utenza', 'missing_bucket': True}}},
+                {'stato': {'terms': {'field': 'stato', 'missing_bucket': True}}}
+            ]
+        }
+        if after:
+            composite['after'] = after
+
+        return {
+            'size': 0,
+            'query': {'range': {'data_creazione': {'gte': start, 'lt': end}}},
+            'aggs': {
+                'righe': {
+                    'composite': composite,
+                    'aggs': {
+                        'durata': {'stats': {'field': 'durata_ore'}},
+                        'cumulative': {'filters': {'filters': {
+                            edge_key(edge): {'range': {'durata_ore': {'lte': edge}}}
+                            for edge in self.edges
+                        }}}
+                    }
+                }
+            }
+        }
+
+    def _rollup_doc(self, bucket: Dict, run_id: str) -> Dict:
+        """Documento rollup da un bucket composite"""
+        key = bucket['key']
+        family, prefixes = self.classifier.classify(key['operazione'])
+        ore_cum = {name: b['doc_count'] for name, b in bucket['cumulative']['buckets'].items()}
+
+        duration = self.family_duration.get(family)
+        sla_ok = ore_cum.get(edge_key(duration), 0) if duration is not None else 0
+
+        stats = bucket['durata']
+        return {
+            'day': key['day'],
+            'fk_nome_operazione': key['operazione'],
+            'operation_family': family,
+            'operation_prefix': prefixes,
+            'fk_tipo_utenza': key['tipo_utenza'],
+            'stato': key['stato'],
+            'count': bucket['doc_count'],
+            'durata_count': stats['count'],
+            'durata_sum': stats['sum'] or 0.0,
+            'durata_min': stats['min'],
+            'durata_max': stats['max'],
+            'ore_cum': ore_cum,
+            'sla_ok': sla_ok,
+            'rollup_run': run_id,
+            'updated_at': datetime.now().isoformat()
+        }
+
+    def _iter_rollup_actions(self, start: str, end: str, run_id: str):
+        """Scorre tutte le pagine della composite generando le azioni bulk"""
+        # Solo le partizioni mensili dei giorni da ricalcolare (l'alias se l'indice è monolitico)
+        source = self.partitions.indices_for_range(start, end)
+        after = None
+        while True:
+            response = self.client.search(index=source, body=self._composite_body(start, end, after))
+            righe = response['aggregations']['righe']
+
+            for bucket in righe['buckets']:
+                doc = self._rollup_doc(bucket, run_id)
+                doc_key = '|'.join(str(doc[k]) for k in ('day', *ROLLUP_DIMENSIONS))
+                yield {
+                    '_index': self.rollup_index,
+                    '_id': hashlib.sha1(doc_key.encode('utf-8')).hexdigest(),
+                    '_source': doc
+                }
+
+            after = righe.get('after_key')
+            if not after or not righe['buckets']:
+                return
+
+    def aggiorna(self, days: Iterable[str]) -> Dict:
+        """
+        Ricalcola il rollup per i giorni indicati (stringhe 'YYYY-MM-DD').
+
+        I documenti sono scritti con _id deterministico e quelli non più presenti
+        (es. richieste passate da NON EVASA a EVASA) vengono rimossi al termine,
+        così i lettori non vedono mai giorni vuoti durante l'aggiornamento.
+        Se qualche scrittura fallisce la pulizia viene saltata: le righe precedenti
+        restano finché non sono sostituite ('failed' nel risultato).
+        """
+        days = sorted({day[:10] for day in days if day})
+        if not days:
+            print("✓ Rollup: nessun giorno da aggiornare")
+            return {'days': 0, 'docs': 0, 'deleted': 0, 'failed': 0}
+
+        self.create_rollup_index()
+
+        start = days[0]
+        end = (datetime.fromisoformat(days[-1]) + timedelta(days=1)).strftime('%Y-%m-%d')
+        run_id = datetime.now().strftime('%Y%m%d%H%M%S%f')
+
+        t0 = datetime.now()
+        success, errors = helpers.bulk(self.client, self._iter_rollup_actions(start, end, run_id),
+                                       chunk_size=2000, raise_on_error=False)
+        failed = len(errors) if isinstance(errors, list) else 0
+
+        deleted = 0
+        if failed:
+            # Senza tutte le righe nuove la pulizia toglierebbe righe non sostituite
+            self.client.indices.refresh(index=self.rollup_index)
+            print(f"⚠ Rollup: {failed} documenti non scritti, righe precedenti mantenute")
+        else:
+            # Rimuove le combinazioni non più presenti nei giorni ricalcolati
+            deleted = self.client.delete_by_query(index=self.rollup_index, body={
+                'query': {'bool': {
+                    'filter': [{'range': {'day': {'gte': start, 'lt': end}}}],
+                    'must_not': [{'term': {'rollup_run': run_id}}]
+                }}
+            }, refresh=True, conflicts='proceed')['deleted']
+
+        elapsed = (datetime.now() - t0).total_seconds()
+        print(f"{'⚠' if failed else '✓'} Rollup aggiornato: {start} → {days[-1]} ({success} documenti, "
+              f"{deleted} rimossi, {failed} fallimenti, {elapsed:.2f}s)")
+
+        return {'days': len(days), 'docs': success, 'deleted': deleted, 'failed': failed,
+                'elapsed': round(elapsed, 2)}
+
+    def ricostruisci(self, giorni: int = 30) -> Dict:
+        """Ricostruisce il rollup per gli ultimi N giorni"""
+        today = datetime.now().date()
+        return self.aggiorna([(today - timedelta(days=i)).isoformat() for i in range(giorni + 1)])
+
+    def stima_percentili(self, query: Optional[Dict] = None,
+                         percents: List[float] = (50, 95, 99)) -> Dict[str, Optional[float]]:
+        """
+        Stima i percentili della durata interpolando i conteggi cumulativi del rollup
+        (precisione limitata dalle soglie in self.edges)
+        """
+        aggs = {'totale': {'sum': {'field': 'durata_count'}}}
+        aggs.update({edge_key(edge): {'sum': {'field': f"ore_cum.{edge_key(edge)}"}} for edge in self.edges})
+
+        response = self.client.search(index=self.rollup_index, body={
+            'size': 0,
+            'query': query or {'match_all': {}},
+            'aggs': aggs
+        })
+        aggregations = response['aggregations']
+        total = aggregations['totale']['value']
+
+        results = {}
+        for pct in percents:
+            if not total:
+                results[str(pct)] = None
+                continue
+
+            target = total * pct / 100
+            prev_edge, prev_count = 0.0, 0.0
+            value = None
+            for edge in self.edges:
+                count = aggregations[edge_key(edge)]['value']
+                if count >= target:
+                    span = count - prev_count
+                    ratio = (target - prev_count) / span if span else 0
+                    value = prev_edge + ratio * (edge - prev_edge)
+                    break
+                prev_edge, prev_count = edge, count
+
+            # Oltre l'ultima soglia: il percentile è almeno self.edges[-1]
+            results[str(pct)] = round(value if value is not None else self.edges[-1], 2)
+
+        return results
+
+
+if __name__ == '__main__':
+    print("=" * 80)
+    print("IAM ROLLUP - Ricostruzione indice giornaliero")
+    print("=" * 80)
+
+    rollup = IAMDailyRollup()
+    rollup.create_rollup_index()
+    rollup.ricostruisci(giorni=90)
+    print(f"Percentili durata (stima): {rollup.stima_percentili()}")
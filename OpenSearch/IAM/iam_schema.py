@@ -0,0 +1,150 @@
+"""
+================================================================================
+FILE: iam_schema.py
+================================================================================
+IAM Schema - Profilo di mapping versionato per iam-richieste
+
+Schema unico (nomi minuscoli, come le query di IAMAnalyzer e delle dashboard)
+ottimizzato per il carico di aggregazioni:
+- index sort su data_creazione (desc): range temporali e "ultime N" leggono
+  blocchi contigui e possono terminare in anticipo
+- eager_global_ordinals sui campi 'terms' più usati (fk_nome_operazione, stato,
+  operation_family): ordinali costruiti al refresh invece che alla prima query
+- doc_values disattivati sui keyword mai aggregati/ordinati, norms disattivate
+  sui testi liberi (nessuno scoring per rilevanza)
+- alias per i nomi storici (ID_RICHIESTA, ore_elaborazione, tempo_evasione_ore, ...)
+  così query e visualizzazioni esistenti continuano a funzionare
+
+La versione è registrata nel template (campo 'version') e nel _meta del mapping;
+le partizioni create con versioni precedenti vengono aggiornate da
+IAMPartitionManager.upgrade_partitions con LEGACY_RENAMES.
+
+UTILIZZO:
+    from iam_schema import richieste_mappings, richieste_settings, SCHEMA_VERSION
+
+    client.indices.create(index='iam-test', body={
+        'mappings': richieste_mappings(),
+        'settings': richieste_settings(shards=1)
+    })
+================================================================================
+"""
+
+from typing import Dict, Optional
+
+SCHEMA_VERSION = 3
+
+TIME_FIELD = 'data_creazione'
+
+# Campi concreti dello schema (nome canonico -> mapping)
+RICHIESTE_FIELDS = {
+    'id_richiesta': {'type': 'keyword'},
+    'fk_id_oggetto': {'type': 'keyword', 'doc_values': False},
+    'nome_utenza': {'type': 'keyword'},
+    'fk_tipo_richiesta': {'type': 'keyword'},
+    'fk_tipo_utenza': {'type': 'keyword'},
+    'fk_nome_operazione': {'type': 'keyword', 'eager_global_ordinals': True},
+    'id_richiesta_parent': {'type': 'keyword'},
+    'data_creazione': {'type': 'date'},
+    'data_chiusura': {'type': 'date'},
+    'fk_utente': {'type': 'keyword'},
+    'fk_utente_richiedente': {'type': 'keyword'},
+    'stato': {'type': 'keyword', 'eager_global_ordinals': True},
+    'nota': {'type': 'text', 'norms': False},
+    'flag_transazione': {'type': 'keyword', 'doc_values': False},
+    'data_storicizzazione': {'type': 'date'},
+    'fk_id_lav_dettaglio': {'type': 'keyword', 'doc_values': False},
+    'modalita_lav_mass': {'type': 'keyword', 'doc_values': False},
+    'inoltro_ggu': {'type': 'keyword', 'doc_values': False},
+    'flag_intersezione_parametri': {'type': 'keyword', 'doc_values': False},
+    'tool_generazione': {'type': 'keyword', 'doc_values': False},
+    'flag_has_children': {'type': 'keyword', 'doc_values': False},
+    'flag_op_sec_selezionata': {'type': 'keyword', 'doc_values': False},
+    'priorita_secondaria': {'type': 'integer'},
+    'tipo_op_secondaria': {'type': 'integer'},
+    'comunicazione_uf': {'type': 'text', 'norms': False},
+    'giorni_elaborazione': {'type': 'integer'},
+    'durata_ore': {'type': 'float'},
+    'is_completed': {'type': 'boolean'},
+    'is_failed': {'type': 'boolean'},
+    'is_pending': {'type': 'boolean'},
+    'operation_family': {'type': 'keyword', 'eager_global_ordinals': True},
+    'operation_prefix': {'type': 'keyword'},
+    'data_inserimento_es': {'type': 'date'},
+    # Aggregati padre/figli scritti sui documenti con figli (iam_tree.py)
+    'albero': {'properties': {
+        'figli': {'type': 'integer'},
+        'discendenti': {'type': 'integer'},
+        'aperti': {'type': 'integer'},
+        'profondita': {'type': 'integer'},
+        'livello': {'type': 'integer'},
+        'max_chiusura_figli': {'type': 'date'},
+        'durata_ore': {'type': 'float'},
+        'completo': {'type': 'boolean'},
+        'stato_peggiore': {'type': 'keyword'},
+        'radice': {'type': 'keyword'},
+        'aggiornato': {'type': 'date'}
+    }}
+}
+
+# Colonne di IAM.STORICO_RICHIESTE: il nome canonico è il nome Oracle in minuscolo
+ORACLE_COLUMNS = (
+    'ID_RICHIESTA', 'FK_ID_OGGETTO', 'NOME_UTENZA', 'FK_TIPO_RICHIESTA', 'FK_TIPO_UTENZA',
+    'FK_NOME_OPERAZIONE', 'ID_RICHIESTA_PARENT', 'DATA_CREAZIONE', 'DATA_CHIUSURA', 'FK_UTENTE',
+    'FK_UTENTE_RICHIEDENTE', 'STATO', 'NOTA', 'FLAG_TRANSAZIONE', 'DATA_STORICIZZAZIONE',
+    'FK_ID_LAV_DETTAGLIO', 'MODALITA_LAV_MASS', 'INOLTRO_GGU', 'FLAG_INTERSEZIONE_PARAMETRI',
+    'TOOL_GENERAZIONE', 'FLAG_HAS_CHILDREN', 'FLAG_OP_SEC_SELEZIONATA', 'PRIORITA_SECONDARIA',
+    'TIPO_OP_SECONDARIA', 'COMUNICAZIONE_UF'
+)
+
+# Nomi storici -> nome canonico (colonne maiuscole del loader IAM, durate IAM/IAM2)
+LEGACY_RENAMES = {
+    **{column: column.lower() for column in ORACLE_COLUMNS},
+    'ore_elaborazione': 'durata_ore',
+    'tempo_evasione_ore': 'durata_ore'
+}
+
+# Script painless che rinomina i campi storici nel _source (reindex/update_by_query)
+RENAME_SCRIPT_SOURCE = """
+for (def entry : params.names.entrySet()) {
+  if (ctx._source.containsKey(entry.getKey())) {
+    ctx._source[entry.getValue()] = ctx._source.remove(entry.getKey());
+  }
+}
+"""
+
+
+def rename_script(renames: Dict[str, str] = None) -> Dict:
+    """Script di rinomina dei campi storici per _reindex / _update_by_query"""
+    return {'lang': 'painless', 'source': RENAME_SCRIPT_SOURCE, 'params': {'names': renames or LEGACY_RENAMES}}
+
+
+def richieste_mappings(legacy_aliases: bool = True) -> Dict:
+    """Mapping versionato delle richieste; campi sconosciuti salvati nel _source ma non indicizzati"""
+    properties = {name: dict(spec) for name, spec in RICHIESTE_FIELDS.items()}
+    if legacy_aliases:
+        properties.update({old: {'type': 'alias', 'path': new} for old, new in LEGACY_RENAMES.items()})
+    return {
+        'dynamic': False,
+        '_meta': {'schema_version': SCHEMA_VERSION},
+        'properties': properties
+    }
+
+
+def richieste_settings(shards: int = 1, replicas: int = 0, refresh_interval: str = '5s',
+                       codec: Optional[str] = None) -> Dict:
+    """
+    Settings dello schema: index sort e codec sono statici, valgono solo per gli indici
+    creati da qui in poi (il codec si imposta alla creazione, mai chiudendo un indice in uso)
+    """
+    index = {
+        'refresh_interval': refresh_interval,
+        'sort.field': TIME_FIELD,
+        'sort.order': 'desc'
+    }
+    if codec:
+        index['codec'] = codec
+    return {
+        'number_of_shards': shards,
+        'number_of_replicas': replicas,
+        'index': index
+    }
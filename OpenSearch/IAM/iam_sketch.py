@@ -0,0 +1,479 @@
+"""
+================================================================================
+FILE: iam_sketch.py
+================================================================================
+IAM KPI Sketches - t-digest e contatori SLA per operazione × giorno
+
+Mentre le righe passano nello stream_load del loader, SketchAccumulator tiene
+per ogni (fk_nome_operazione, giorno di data_creazione):
+- un t-digest (merging digest, funzione di scala k1) della durata_ore:
+  percentili p50/p95/p99 con errore relativo basso soprattutto sulle code
+- conteggi cumulativi per soglia (sla_cum.le_<N>, stesse soglie del rollup)
+  e sla_ok rispetto alla durata KPI della famiglia di operazione: esatti e,
+  come in KPIEngine, solo sulle richieste nello stato del KPI (sla_status,
+  es. EVASA) con denominatore sla_count (anche senza durata)
+- count, durata_count, somma/min/max della durata (tutti gli stati)
+
+IAMKpiSketches li salva nell'indice compatto 'iam-kpi-sketches' (un documento
+per operazione × giorno, centroidi non indicizzati). Le analisi SLA uniscono
+qualche decina di sketch invece di aggregare percentiles sui documenti raw.
+
+I t-digest sono unibili ma non sottraibili: un sync delta che sovrascrive
+richieste già caricate non può essere sommato allo sketch esistente, quindi i
+giorni toccati vengono ricostruiti dal raw (come il rollup); il caricamento
+completo scrive direttamente gli sketch accumulati durante lo streaming.
+
+UTILIZZO:
+    from iam_sketch import IAMKpiSketches, SketchAccumulator
+
+    sketches = IAMKpiSketches(client=loader.os_client)
+    sketches.aggiorna(result['affected_days'])
+    sketches.percentili(giorni=30)          # {operazione: {p50, p95, p99, sla, ...}}
+================================================================================
+"""
+
+import hashlib
+import math
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from opensearchpy import OpenSearch, helpers
+
+from iam_rollup import IAMDailyRollup, edge_key
+
+SKETCH_INDEX = 'iam-kpi-sketches'
+
+# Compressione del t-digest: ~compression centroidi per sketch, errore ~1/compression sulle code
+DEFAULT_COMPRESSION = 100
+
+# Valori tenuti nel buffer prima di una compressione (multipli della compressione)
+BUFFER_FACTOR = 5
+
+DEFAULT_PERCENTS = (50, 95, 99)
+
+
+class TDigest:
+    """Merging t-digest (Dunning) con funzione di scala k1; unibile con merge()"""
+
+    def __init__(self, compression: float = DEFAULT_COMPRESSION):
+        self.compression = compression
+        self.means: List[float] = []
+        self.weights: List[float] = []
+        self.count = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._buffer: List[Tuple[float, float]] = []
+
+    def __len__(self) -> int:
+        return int(self.count)
+
+    def add(self, value: float, weight: float = 1.0):
+        self._buffer.append((value, weight))
+        self.count += weight
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if len(self._buffer) >= BUFFER_FACTOR * self.compression:
+            self._comprimi()
+
+    def merge(self, other: 'TDigest') -> 'TDigest':
+        """Aggiunge i centroidi di un altro digest (in place)"""
+        other._comprimi()
+        if not other.count:
+            return self
+        self._buffer.extend(zip(other.means, other.weights))
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._comprimi()
+        return self
+
+    def _q_limit(self, q: float) -> float:
+        """Quantile massimo raggiungibile da un centroide che inizia a q (k1: k(q) = δ/2π·asin(2q-1))"""
+        k = self.compression / (2 * math.pi) * math.asin(2 * q - 1) + 1
+        if k >= self.compression / 4:
+            return 1.0
+        return (math.sin(2 * math.pi * k / self.compression) + 1) / 2
+
+    def _comprimi(self):
+        """Unisce buffer e centroidi esistenti in un passaggio ordinato"""
+        if not self._buffer:
+            return
+        punti = sorted(list(zip(self.means, self.weights)) + self._buffer)
+        self._buffer = []
+
+        total = sum(w for _, w in punti)
+        means, weights = [], []
+        cumulato = 0.0
+        limite = total * self._q_limit(0.0)
+        mean, weight = punti[0]
+        for m, w in punti[1:]:
+            if cumulato + weight + w <= limite:
+                weight += w
+                mean += (m - mean) * w / weight
+                continue
+            means.append(mean)
+            weights.append(weight)
+            cumulato += weight
+            limite = total * self._q_limit(min(cumulato / total, 1.0))
+            mean, weight = m, w
+        means.append(mean)
+        weights.append(weight)
+        self.means, self.weights = means, weights
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Stima del quantile q (0..1) interpolando tra i centri dei centroidi"""
+        self._comprimi()
+        if not self.means:
+            return None
+        if len(self.means) == 1:
+            return self.means[0]
+
+        target = q * self.count
+        primo, ultimo = self.weights[0], self.weights[-1]
+        if target <= primo / 2:
+            # Tra il minimo e il centro del primo centroide
+            return self.min + (self.means[0] - self.min) * target / (primo / 2)
+        if target >= self.count - ultimo / 2:
+            # Tra il centro dell'ultimo centroide e il massimo
+            coda = (target - (self.count - ultimo / 2)) / (ultimo / 2)
+            return self.means[-1] + (self.max - self.means[-1]) * coda
+
+        cumulato = 0.0
+        for i in range(len(self.means) - 1):
+            centro = cumulato + self.weights[i] / 2
+            successivo = cumulato + self.weights[i] + self.weights[i + 1] / 2
+            if target <= successivo:
+                ratio = (target - centro) / (successivo - centro)
+                value = self.means[i] + ratio * (self.means[i + 1] - self.means[i])
+                return min(max(value, self.min), self.max)
+            cumulato += self.weights[i]
+        return self.max
+
+    def to_dict(self) -> Dict:
+        """Forma compatta per l'indice (centroidi arrotondati, pesi interi)"""
+        self._comprimi()
+        return {
+            'compression': self.compression,
+            'count': self.count,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+            'means': [round(m, 6) for m in self.means],
+            'weights': [int(w) if float(w).is_integer() else w for w in self.weights]
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'TDigest':
+        digest = cls(data.get('compression', DEFAULT_COMPRESSION))
+        digest.means = list(data.get('means', []))
+        digest.weights = list(data.get('weights', []))
+        digest.count = float(data.get('count') or sum(digest.weights))
+        if digest.count:
+            digest.min = data['min'] if data.get('min') is not None else digest.means[0]
+            digest.max = data['max'] if data.get('max') is not None else digest.means[-1]
+        return digest
+
+
+class SketchAccumulator:
+    """Sketch e contatori per (fk_nome_operazione, giorno) alimentati riga per riga"""
+
+    def __init__(self, edges: List[float], compression: float = DEFAULT_COMPRESSION,
+                 stato_sla: Optional[Callable[[Optional[str]], Optional[str]]] = None):
+        """
+        stato_sla(operazione): stato che il KPI conta nella SLA (None = operazione senza KPI,
+        nessuna richiesta in SLA). Senza stato_sla i contatori SLA includono tutte le richieste.
+        """
+        self.edges = list(edges)
+        self.compression = compression
+        self.stato_sla = stato_sla
+        self.gruppi: Dict[Tuple[Optional[str], str], Dict] = {}
+
+    def __len__(self) -> int:
+        return len(self.gruppi)
+
+    def _gruppo(self, operazione: Optional[str], day: str) -> Dict:
+        gruppo = self.gruppi.get((operazione, day))
+        if gruppo is None:
+            gruppo = {
+                'count': 0,
+                'durata_sum': 0.0,
+                'digest': TDigest(self.compression),
+                # Solo richieste nello stato SLA: totale (denominatore KPI) e conteggi per intervallo
+                # (edges[i-1], edges[i]]; l'ultimo intervallo è oltre la soglia massima
+                'sla_status': self.stato_sla(operazione) if self.stato_sla else None,
+                'sla_count': 0,
+                'bins': [0] * (len(self.edges) + 1)
+            }
+            self.gruppi[(operazione, day)] = gruppo
+        return gruppo
+
+    def aggiungi(self, richiesta: Dict):
+        """Registra una richiesta trasformata (nomi canonici, data_creazione ISO)"""
+        day = (richiesta.get('data_creazione') or '')[:10]
+        if not day:
+            return
+        gruppo = self._gruppo(richiesta.get('fk_nome_operazione'), day)
+        gruppo['count'] += 1
+        in_sla = self.stato_sla is None or (gruppo['sla_status'] is not None
+                                            and richiesta.get('stato') == gruppo['sla_status'])
+        if in_sla:
+            gruppo['sla_count'] += 1
+
+        durata = richiesta.get('durata_ore')
+        if durata is None:
+            return
+        gruppo['digest'].add(durata)
+        gruppo['durata_sum'] += durata
+        if in_sla:
+            gruppo['bins'][bisect_left(self.edges, durata)] += 1
+
+    def sla_cum(self, gruppo: Dict) -> Dict[str, int]:
+        """Conteggi cumulativi durata <= soglia delle richieste nello stato SLA (campi ore_cum del rollup)"""
+        cumulati, totale = {}, 0
+        for edge, count in zip(self.edges, gruppo['bins']):
+            totale += count
+            cumulati[edge_key(edge)] = totale
+        return cumulati
+
+
+class IAMKpiSketches:
+    """Gestisce l'indice degli sketch KPI per operazione × giorno"""
+
+    def __init__(self, host=None, port=None, use_ssl=None,
+                 client: Optional[OpenSearch] = None, source_index='iam-richieste',
+                 sketch_index=SKETCH_INDEX, config_file='iam_kpi_config.json',
+                 compression: float = DEFAULT_COMPRESSION):
+        """Soglie, famiglie e durate SLA sono quelle del rollup giornaliero (iam_kpi_config.json)"""
+        self.rollup = IAMDailyRollup(host=host, port=port, use_ssl=use_ssl, client=client,
+                                     source_index=source_index, config_file=config_file)
+        self.client = self.rollup.client
+        self.source_index = source_index
+        self.sketch_index = sketch_index
+        self.compression = compression
+        self.edges = self.rollup.edges
+
+    def stato_sla(self, operazione: Optional[str]) -> Optional[str]:
+        """Stato contato nella SLA dal KPI della famiglia dell'operazione (None senza KPI)"""
+        family, _ = self.rollup.classifier.classify(operazione)
+        return self.rollup.family_status.get(family)
+
+    def accumulatore(self) -> SketchAccumulator:
+        """Accumulatore vuoto con le soglie e gli stati SLA configurati (per lo stream_load)"""
+        return SketchAccumulator(self.edges, self.compression, stato_sla=self.stato_sla)
+
+    def create_index(self) -> bool:
+        """Crea l'indice sketch se non esiste (aggiunge le soglie KPI nuove se esiste)"""
+        sla_cum = {'properties': {edge_key(edge): {'type': 'long'} for edge in self.edges}}
+        mappings = {
+            'dynamic': 'strict',
+            'properties': {
+                'day': {'type': 'date'},
+                'fk_nome_operazione': {'type': 'keyword'},
+                'operation_family': {'type': 'keyword'},
+                'count': {'type': 'long'},
+                'durata_count': {'type': 'long'},
+                'durata_sum': {'type': 'double'},
+                'durata_min': {'type': 'double'},
+                'durata_max': {'type': 'double'},
+                'sla_cum': sla_cum,
+                'sla_duration': {'type': 'float'},
+                'sla_status': {'type': 'keyword'},
+                'sla_count': {'type': 'long'},
+                'sla_ok': {'type': 'long'},
+                # Centroidi del t-digest: letti solo da _source
+                'digest': {'type': 'object', 'enabled': False},
+                'sketch_run': {'type': 'keyword'},
+                'updated_at': {'type': 'date'}
+            }
+        }
+
+        try:
+            if self.client.indices.exists(index=self.sketch_index):
+                self.client.indices.put_mapping(index=self.sketch_index, body={
+                    'properties': {'sla_cum': sla_cum, 'sla_status': {'type': 'keyword'},
+                                   'sla_count': {'type': 'long'}}
+                })
+                return True
+
+            self.client.indices.create(index=self.sketch_index, body={
+                'mappings': mappings,
+                'settings': {'number_of_shards': 1, 'number_of_replicas': 0}
+            })
+            print(f"✓ Indice sketch '{self.sketch_index}' creato")
+            return True
+        except Exception as e:
+            print(f"✗ Errore creazione indice sketch: {e}")
+            return False
+
+    def _documento(self, accumulatore: SketchAccumulator, operazione: Optional[str], day: str,
+                   gruppo: Dict, run_id: str) -> Dict:
+        family, _ = self.rollup.classifier.classify(operazione)
+        sla_cum = accumulatore.sla_cum(gruppo)
+        duration = self.rollup.family_duration.get(family)
+        digest = gruppo['digest']
+
+        return {
+            'day': day,
+            'fk_nome_operazione': operazione,
+            'operation_family': family,
+            'count': gruppo['count'],
+            'durata_count': int(digest.count),
+            'durata_sum': gruppo['durata_sum'],
+            'durata_min': digest.min if digest.count else None,
+            'durata_max': digest.max if digest.count else None,
+            'sla_cum': sla_cum,
+            'sla_duration': duration,
+            'sla_status': gruppo['sla_status'],
+            'sla_count': gruppo['sla_count'],
+            'sla_ok': sla_cum.get(edge_key(duration), 0) if duration is not None else 0,
+            'digest': digest.to_dict(),
+            'sketch_run': run_id,
+            'updated_at': datetime.now().isoformat()
+        }
+
+    def _azioni(self, accumulatore: SketchAccumulator, run_id: str):
+        for (operazione, day), gruppo in accumulatore.gruppi.items():
+            doc_key = f"{day}|{operazione}"
+            yield {
+                '_index': self.sketch_index,
+                '_id': hashlib.sha1(doc_key.encode('utf-8')).hexdigest(),
+                '_source': self._documento(accumulatore, operazione, day, gruppo, run_id)
+            }
+
+    def scrivi(self, accumulatore: SketchAccumulator) -> Dict:
+        """
+        Salva gli sketch accumulati (un documento per operazione × giorno) e rimuove,
+        nei giorni scritti, le operazioni non più presenti. Con scritture fallite la
+        rimozione viene saltata (sketch precedenti mantenuti, 'failed' nel risultato).
+        """
+        days = sorted({day for _, day in accumulatore.gruppi})
+        if not days:
+            return {'days': 0, 'docs': 0, 'deleted': 0, 'failed': 0}
+
+        self.create_index()
+        run_id = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        success, errors = helpers.bulk(self.client, self._azioni(accumulatore, run_id),
+                                       chunk_size=1000, raise_on_error=False)
+        failed = len(errors) if isinstance(errors, list) else 0
+
+        deleted = 0
+        if failed:
+            self.client.indices.refresh(index=self.sketch_index)
+            print(f"⚠ Sketch KPI: {failed} documenti non scritti, sketch precedenti mantenuti")
+        else:
+            deleted = self.client.delete_by_query(index=self.sketch_index, body={
+                'query': {'bool': {
+                    'filter': [{'terms': {'day': days}}],
+                    'must_not': [{'term': {'sketch_run': run_id}}]
+                }}
+            }, refresh=True, conflicts='proceed')['deleted']
+
+        return {'days': len(days), 'docs': success, 'deleted': deleted, 'failed': failed}
+
+    def aggiorna(self, days: Iterable[str]) -> Dict:
+        """
+        Ricostruisce dal raw gli sketch dei giorni indicati ('YYYY-MM-DD').
+
+        Usato dopo i sync delta: le richieste sovrascritte non possono essere
+        sottratte da un t-digest, quindi si rilegge la durata dei soli giorni toccati.
+        """
+        days = sorted({day[:10] for day in days if day})
+        if not days:
+            print("✓ Sketch KPI: nessun giorno da aggiornare")
+            return {'days': 0, 'docs': 0, 'deleted': 0, 'failed': 0}
+
+        t0 = datetime.now()
+        accumulatore = self.accumulatore()
+        start = days[0]
+        end = (datetime.fromisoformat(days[-1]) + timedelta(days=1)).strftime('%Y-%m-%d')
+        query = {'bool': {
+            'should': [{'range': {'data_creazione': {'gte': day, 'lt': f"{day}||+1d"}}} for day in days],
+            'minimum_should_match': 1
+        }}
+        for hit in helpers.scan(self.client, index=self.rollup.partitions.indices_for_range(start, end),
+                                query={'query': query}, size=5000,
+                                _source=['fk_nome_operazione', 'data_creazione', 'stato', 'durata_ore']):
+            accumulatore.aggiungi(hit['_source'])
+
+        result = self.scrivi(accumulatore)
+        result['elapsed'] = round((datetime.now() - t0).total_seconds(), 2)
+        print(f"{'⚠' if result['failed'] else '✓'} Sketch KPI aggiornati: {start} → {days[-1]} "
+              f"({result['docs']} documenti, {result['deleted']} rimossi, {result['failed']} fallimenti, "
+              f"{result['elapsed']:.2f}s)")
+        return result
+
+    def leggi(self, giorni: int = 30, operazioni: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """Unisce per operazione gli sketch degli ultimi N giorni"""
+        filtri = [{'range': {'day': {'gte': f"now-{giorni}d/d"}}}]
+        if operazioni:
+            filtri.append({'terms': {'fk_nome_operazione': operazioni}})
+
+        unione: Dict[str, Dict] = {}
+        precedenti = 0
+        for hit in helpers.scan(self.client, index=self.sketch_index,
+                                query={'query': {'bool': {'filter': filtri}}}, size=1000):
+            doc = hit['_source']
+            op = doc['fk_nome_operazione']
+            totale = unione.get(op)
+            if totale is None:
+                totale = unione[op] = {
+                    'operation_family': doc.get('operation_family'),
+                    'sla_duration': doc.get('sla_duration'),
+                    'sla_status': doc.get('sla_status'),
+                    'count': 0, 'durata_count': 0, 'durata_sum': 0.0, 'sla_count': 0, 'sla_ok': 0,
+                    'sla_cum': {}, 'days': 0, 'digest': TDigest(self.compression)
+                }
+            totale['days'] += 1
+            for campo in ('count', 'durata_count', 'durata_sum', 'sla_ok'):
+                totale[campo] += doc.get(campo) or 0
+            if 'sla_count' not in doc:
+                # Sketch scritto prima del filtro per stato: SLA su tutte le richieste completate
+                precedenti += 1
+            totale['sla_count'] += doc.get('sla_count', doc.get('durata_count') or 0)
+            for name, value in (doc.get('sla_cum') or {}).items():
+                totale['sla_cum'][name] = totale['sla_cum'].get(name, 0) + value
+            totale['digest'].merge(TDigest.from_dict(doc['digest']))
+        if precedenti:
+            print(f"⚠ {precedenti} sketch senza sla_count (formato precedente): SLA non filtrata per stato "
+                  f"fino alla ricostruzione (python iam_sketch.py)")
+        return unione
+
+    def percentili(self, giorni: int = 30, percents: Iterable[float] = DEFAULT_PERCENTS,
+                   operazioni: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """Percentili della durata e SLA per operazione dagli sketch uniti"""
+        results = {}
+        for op, totale in self.leggi(giorni, operazioni).items():
+            digest, completate, in_sla = totale['digest'], totale['durata_count'], totale['sla_count']
+            con_sla = totale['sla_duration'] is not None
+            results[op] = {
+                'operation_family': totale['operation_family'],
+                'total': totale['count'],
+                'completed': completate,
+                'sla_duration': totale['sla_duration'],
+                'sla_status': totale['sla_status'],
+                # Come KPIEngine: richieste nello stato del KPI, entro la durata / totale nello stato
+                'sla_total': in_sla if con_sla else 0,
+                'sla_passed': totale['sla_ok'],
+                'sla_failed': in_sla - totale['sla_ok'] if con_sla else 0,
+                'sla_percentage': round(totale['sla_ok'] / in_sla * 100, 2) if in_sla and con_sla else None,
+                'avg_hours': round(totale['durata_sum'] / completate, 2) if completate else None,
+                'max_hours': round(digest.max, 2) if completate else None,
+                'days': totale['days'],
+                **{f"p{p:g}_hours": (round(digest.quantile(p / 100), 2) if completate else None)
+                   for p in percents}
+            }
+        return results
+
+
+if __name__ == '__main__':
+    print("=" * 80)
+    print("IAM KPI SKETCHES - Ricostruzione indice sketch")
+    print("=" * 80)
+
+    sketches = IAMKpiSketches()
+    oggi = datetime.now().date()
+    sketches.aggiorna([(oggi - timedelta(days=i)).isoformat() for i in range(91)])
+    for op, valori in sorted(sketches.percentili(giorni=30).items()):
+        print(f"{op}: p95 {valori['p95_hours']}h | p99 {valori['p99_hours']}h | SLA {valori['sla_percentage']}%")
@@ -0,0 +1,277 @@
+"""
+================================================================================
+FILE: iam_sla_simulator.py
+================================================================================
+IAM SLA Simulator - What-if su duration / sla_percentage dei KPI
+
+Invece di modificare iam_kpi_config.json e rieseguire KPIEngine sul cluster a
+ogni tentativo, il simulatore legge una sola volta le durate delle richieste di
+ogni KPI (stessi filtri operazione + stato di KPIEngine, un'unica scan) e le
+tiene ordinate in NumPy. Da lì, senza altre query:
+- curva(): compliance % per migliaia di soglie con np.searchsorted
+- soglie_per_target(): ore necessarie per raggiungere le percentuali obiettivo
+- griglia(): esito OK/ALERT per ogni combinazione duration × sla_percentage
+- proposta(): configurazione KPI con le duration minime che rispettano i target
+
+Le richieste senza durata_ore contano nel totale ma mai entro SLA (come in
+KPIEngine); dopo la lettura i totali per KPI sono confrontati con il doc_count
+di KPIEngine.calcola_kpi_batch. Le durate possono essere salvate in un file .npz
+e riusate.
+
+UTILIZZO:
+    from iam_sla_simulator import SLASimulator
+
+    sim = SLASimulator.da_cluster()                 # una scan, poi tutto in locale
+    sim.salva('iam_sla_durate.npz')
+    sim = SLASimulator.da_file('iam_sla_durate.npz')
+    sim.curva('reset_password', np.arange(0, 72.5, 0.5))
+    sim.soglie_per_target('reset_password', [80, 90, 95, 99])
+
+    python iam_sla_simulator.py --targets 85 90 95 --max-hours 168
+================================================================================
+"""
+
+import argparse
+import json
+import math
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from opensearchpy import helpers
+
+from iam_kpi_engine import KPIEngine
+
+DURATE_FILE = 'iam_sla_durate.npz'
+
+
+def _corrisponde(kpi_config: Dict, operazione: Optional[str], stato: Optional[str]) -> bool:
+    """
+    Stessa selezione di KPIEngine._operation_clause + filtro stato, su un documento:
+    operation_type è sempre un prefisso ('term' su operation_prefix o 'wildcard' PREFISSO*),
+    con o senza '%', confrontato senza distinzione maiuscole/minuscole come in OperationClassifier
+    """
+    if not operazione or stato != kpi_config['status']:
+        return False
+    return operazione.upper().startswith(kpi_config['operation_type'].rstrip('%').upper())
+
+
+class SLASimulator:
+    """Durate ordinate per KPI e valutazione vettoriale delle soglie SLA"""
+
+    def __init__(self, durate: Dict[str, np.ndarray], kpi_configs: Dict[str, Dict],
+                 letto_il: Optional[str] = None):
+        # Ordinate una volta: le richieste senza durata diventano +inf (mai entro SLA)
+        self.durate = {name: np.sort(np.asarray(valori, dtype=np.float64)) for name, valori in durate.items()}
+        self.kpi_configs = kpi_configs
+        self.letto_il = letto_il or datetime.now().isoformat()
+
+    @classmethod
+    def da_cluster(cls, engine: Optional[KPIEngine] = None, giorni: Optional[int] = None,
+                   batch_size: int = 10000) -> 'SLASimulator':
+        """
+        Legge con una sola scan le durate delle richieste di tutti i KPI configurati
+        (filtri di KPIEngine in OR, assegnazione ai KPI lato Python).
+        """
+        engine = engine or KPIEngine()
+        kpi_configs = engine.config.get('kpi', {})
+        filtri = [engine._build_kpi_aggs(cfg)['filter'] for cfg in kpi_configs.values()]
+        query = {'bool': {'should': filtri, 'minimum_should_match': 1}}
+        if giorni:
+            query['bool']['filter'] = [{'range': {'data_creazione': {'gte': f"now-{giorni}d/d"}}}]
+
+        colonne = {name: (cfg['column_operation'].lower(), cfg['column_status'].lower())
+                   for name, cfg in kpi_configs.items()}
+        campi = sorted({c for coppia in colonne.values() for c in coppia} | {'durata_ore'})
+
+        valori: Dict[str, List[float]] = {name: [] for name in kpi_configs}
+        t0 = time.perf_counter()
+        righe = 0
+        for hit in helpers.scan(engine.client, index=engine._kpi_index(False, giorni), size=batch_size,
+                                query={'query': query, '_source': campi}):
+            doc = hit['_source']
+            righe += 1
+            durata = doc.get('durata_ore')
+            durata = math.inf if durata is None else durata
+            for name, cfg in kpi_configs.items():
+                col_op, col_stato = colonne[name]
+                if _corrisponde(cfg, doc.get(col_op), doc.get(col_stato)):
+                    valori[name].append(durata)
+
+        print(f"✓ Durate lette: {righe:,} richieste per {len(kpi_configs)} KPI "
+              f"in {time.perf_counter() - t0:.2f}s")
+        sim = cls({name: np.array(v, dtype=np.float64) for name, v in valori.items()}, kpi_configs)
+        sim.verifica_totali(engine, giorni)
+        return sim
+
+    @classmethod
+    def da_file(cls, path: str = DURATE_FILE) -> 'SLASimulator':
+        """Simulatore dalle durate salvate con salva() (nessuna query al cluster)"""
+        with np.load(path, allow_pickle=False) as dati:
+            meta = json.loads(str(dati['__meta__']))
+            durate = {name: dati[name] for name in meta['kpi']}
+        return cls(durate, meta['kpi'], meta.get('letto_il'))
+
+    def salva(self, path: str = DURATE_FILE):
+        """Durate ordinate (una colonna per KPI) + configurazione KPI in un .npz compresso"""
+        meta = json.dumps({'kpi': self.kpi_configs, 'letto_il': self.letto_il}, ensure_ascii=False)
+        np.savez_compressed(path, __meta__=np.array(meta), **self.durate)
+
+    def totale(self, kpi: str) -> int:
+        return int(self.durate[kpi].size)
+
+    def verifica_totali(self, engine: KPIEngine, giorni: Optional[int] = None) -> Dict[str, tuple]:
+        """
+        Confronta le richieste lette per KPI con il doc_count di KPIEngine.calcola_kpi_batch
+        sulla stessa configurazione e finestra. Ritorna {kpi: (simulatore, KPIEngine)} dei KPI discordanti.
+        """
+        risultati = engine.calcola_kpi_batch(self.kpi_configs, giorni=giorni)
+        discordanti = {}
+        for name, result in risultati.items():
+            if 'error' in result:
+                print(f"⚠ Verifica totali {name} non eseguita: {result['error']}")
+                continue
+            if result['total_requests'] != self.totale(name):
+                discordanti[name] = (self.totale(name), result['total_requests'])
+
+        if discordanti:
+            print("⚠ Totali diversi da KPIEngine: " + ', '.join(
+                f"{name} {sim:,} vs {kpi:,}" for name, (sim, kpi) in discordanti.items()))
+        else:
+            print(f"✓ Totali per KPI uguali a KPIEngine ({len(risultati)} KPI)")
+        return discordanti
+
+    def curva(self, kpi: str, soglie: Iterable[float]) -> np.ndarray:
+        """Compliance % (durata <= soglia) per ogni soglia: un searchsorted sull'array ordinato"""
+        durate = self.durate[kpi]
+        soglie = np.asarray(soglie, dtype=np.float64)
+        if not durate.size:
+            return np.zeros_like(soglie)
+        return np.searchsorted(durate, soglie, side='right') * 100.0 / durate.size
+
+    def soglie_per_target(self, kpi: str, targets: Iterable[float]) -> np.ndarray:
+        """
+        Ore minime per cui la compliance raggiunge ciascun target %: la durata
+        in posizione ceil(target × n) - 1. NaN se il target non è raggiungibile
+        (richieste senza durata) o se il KPI non ha richieste.
+        """
+        durate = self.durate[kpi]
+        targets = np.asarray(targets, dtype=np.float64)
+        if not durate.size:
+            return np.full_like(targets, np.nan)
+        # Tolleranza: 95% di 20 richieste = 19, non 20 per l'arrotondamento binario
+        posizioni = np.ceil(targets * durate.size / 100.0 - 1e-9).astype(np.int64) - 1
+        soglie = durate[np.clip(posizioni, 0, durate.size - 1)]
+        soglie = np.where(posizioni < 0, 0.0, soglie)
+        return np.where(np.isfinite(soglie), soglie, np.nan)
+
+    def griglia(self, kpi: str, durations: Iterable[float], percentuali: Iterable[float]) -> Dict:
+        """
+        Esito di ogni combinazione duration × sla_percentage: matrice booleana
+        [len(durations), len(percentuali)] (True = OK) e compliance per duration.
+        """
+        compliance = self.curva(kpi, durations)
+        percentuali = np.asarray(percentuali, dtype=np.float64)
+        return {
+            'durations': np.asarray(durations, dtype=np.float64),
+            'percentuali': percentuali,
+            'compliance': compliance,
+            'ok': compliance[:, None] >= percentuali[None, :]
+        }
+
+    def valuta_config(self, kpi_configs: Optional[Dict[str, Dict]] = None) -> Dict[str, Dict]:
+        """Stessi numeri di KPIEngine per una configurazione (anche modificata), senza query"""
+        results = {}
+        for name, cfg in (kpi_configs or self.kpi_configs).items():
+            if name not in self.durate:
+                continue
+            coppie = [('duration', 'sla_percentage')]
+            if 'duration_2' in cfg and 'sla_percentage_2' in cfg:
+                coppie.append(('duration_2', 'sla_percentage_2'))
+            compliance = self.curva(name, [cfg[d] for d, _ in coppie])
+            results[name] = {
+                'total_requests': self.totale(name),
+                **{f"{d}_hours": cfg[d] for d, _ in coppie},
+                **{f"{p}_target": cfg[p] for _, p in coppie},
+                **{f"compliance_{d}": round(float(c), 2) for (d, _), c in zip(coppie, compliance)},
+                'status': 'OK' if all(c >= cfg[p] for (_, p), c in zip(coppie, compliance)) else 'ALERT'
+            }
+        return results
+
+    def proposta(self, arrotonda_ore: float = 1.0) -> Dict[str, Dict]:
+        """
+        Configurazione KPI con duration/duration_2 minime (arrotondate per eccesso)
+        che rispettano gli sla_percentage attuali sui dati storici.
+        """
+        proposta = {}
+        for name, cfg in self.kpi_configs.items():
+            nuova = dict(cfg)
+            for d, p in (('duration', 'sla_percentage'), ('duration_2', 'sla_percentage_2')):
+                if d not in cfg or p not in cfg:
+                    continue
+                ore = self.soglie_per_target(name, [cfg[p]])[0]
+                if not np.isnan(ore):
+                    nuova[d] = float(math.ceil(ore / arrotonda_ore) * arrotonda_ore)
+            proposta[name] = nuova
+        return proposta
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulatore what-if delle soglie SLA dei KPI IAM')
+    parser.add_argument('--file', default=DURATE_FILE, help='File .npz con le durate per KPI')
+    parser.add_argument('--refresh', action='store_true', help='Rilegge le durate dal cluster')
+    parser.add_argument('--giorni', type=int, default=None, help='Solo le richieste degli ultimi N giorni')
+    parser.add_argument('--config', default='iam_kpi_config.json')
+    parser.add_argument('--kpi', nargs='*', help='KPI da simulare (default: tutti)')
+    parser.add_argument('--targets', type=float, nargs='+', default=[80, 85, 90, 95, 99])
+    parser.add_argument('--max-hours', type=float, default=168)
+    parser.add_argument('--step', type=float, default=0.25, help='Passo (ore) della curva di compliance')
+    parser.add_argument('--proposta', help='Scrive qui la configurazione KPI proposta (JSON)')
+    args = parser.parse_args()
+
+    if args.refresh or not Path(args.file).exists():
+        sim = SLASimulator.da_cluster(KPIEngine(config_file=args.config), giorni=args.giorni)
+        sim.salva(args.file)
+        print(f"✓ Durate salvate in {args.file}")
+    else:
+        sim = SLASimulator.da_file(args.file)
+        print(f"✓ Durate da {args.file} (lette il {sim.letto_il})")
+
+    kpis = args.kpi or list(sim.durate)
+    # Soglie correnti dal file di configurazione (possono differire da quelle della lettura)
+    kpi_configs = sim.kpi_configs
+    if Path(args.config).exists():
+        with open(args.config, 'r', encoding='utf-8') as f:
+            kpi_configs = json.load(f).get('kpi', kpi_configs)
+    soglie = np.arange(0, args.max_hours + args.step, args.step)
+    percentuali = np.arange(50, 100.01, 0.5)
+
+    t0 = time.perf_counter()
+    necessarie = {kpi: sim.soglie_per_target(kpi, args.targets) for kpi in kpis}
+    griglie = {kpi: sim.griglia(kpi, soglie, percentuali) for kpi in kpis}
+    attuale = sim.valuta_config(kpi_configs)
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    combinazioni = sum(g['ok'].size for g in griglie.values())
+
+    punti = [h for h in (1, 2, 4, 8, 12, 24, 48, 72, 96, 120, 168) if h <= args.max_hours]
+    for kpi in kpis:
+        cfg = kpi_configs.get(kpi, {})
+        stato = attuale.get(kpi, {})
+        print(f"\n▶ {kpi} ({sim.totale(kpi):,} richieste) - attuale: {cfg.get('sla_percentage')}% in "
+              f"{cfg.get('duration')}h → {stato.get('compliance_duration', '-')}% [{stato.get('status', '-')}]")
+        print("   Compliance: " + ' | '.join(f"{h}h {c:5.1f}%" for h, c in zip(punti, sim.curva(kpi, punti))))
+        print("   Ore per target: " + ' | '.join(
+            f"{t:g}% → {'n/r' if np.isnan(o) else f'{o:.1f}h'}" for t, o in zip(args.targets, necessarie[kpi])))
+
+    print(f"\n✓ {combinazioni:,} combinazioni duration × sla_percentage valutate in {elapsed_ms:.1f} ms")
+
+    if args.proposta:
+        with open(args.proposta, 'w', encoding='utf-8') as f:
+            json.dump({'kpi': sim.proposta()}, f, indent=2, ensure_ascii=False)
+        print(f"✓ Configurazione proposta salvata in {args.proposta}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+"""
+================================================================================
+FILE: iam_sla_tracker.py
+================================================================================
+IAM SLA Deadline Tracker - Scadenze SLA delle richieste NON EVASA in tempo reale
+
+Le richieste pendenti (is_pending / NON EVASA) finora emergevano solo alla
+successiva analisi completa. SLADeadlineTracker resta in memoria tra un sync e
+l'altro (IAMOrchestrator lo riusa a ogni ciclo) ed è alimentato dalle righe
+del sync delta:
+- scadenza = DATA_CREAZIONE + duration KPI della famiglia di operazione
+  (famiglie senza duration: non tracciate)
+- min-heap ordinato per prossimo evento: preavviso (scadenza - preavviso) e
+  poi scadenza; ogni riga del sync costa O(log n), le righe chiuse o con
+  scadenza cambiata invalidano la voce precedente (cancellazione pigra)
+- controlla() estrae dall'heap solo gli eventi maturati e li scrive
+  nell'indice 'iam-sla-alerts' come 'about_to_breach' / 'breached'
+
+Nessuna rilettura dell'indice a ogni sync: le pendenti vengono lette una sola
+volta all'avvio del processo. Gli alert hanno _id deterministico (richiesta,
+evento, scadenza) e sono scritti con op 'create': un riavvio non li duplica.
+
+Preavviso configurabile in iam_config.json:
+    {"sla_alerts": {"preavviso_frazione": 0.2, "preavviso_min_ore": 1}}
+
+UTILIZZO:
+    from iam_sla_tracker import SLADeadlineTracker
+
+    tracker = SLADeadlineTracker(client=loader.os_client)
+    loader.sync(days=30, sla_tracker=tracker)     # alimenta e controlla a ogni sync
+    tracker.controlla()                            # eventi maturati nel frattempo
+================================================================================
+"""
+
+import heapq
+import json
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from opensearchpy import OpenSearch, helpers
+
+from iam_operation_rules import OperationClassifier
+
+ALERTS_INDEX = 'iam-sla-alerts'
+
+ABOUT_TO_BREACH = 'about_to_breach'
+BREACHED = 'breached'
+
+# Preavviso: frazione della durata SLA, con un minimo in ore
+ALERTS_DEFAULT = {'preavviso_frazione': 0.2, 'preavviso_min_ore': 1}
+
+# Campi letti dall'indice all'avvio (richieste pendenti)
+PENDING_FIELDS = ['id_richiesta', 'fk_nome_operazione', 'operation_family', 'data_creazione', 'stato',
+                  'is_pending']
+
+ALERTS_MAPPINGS = {
+    'dynamic': 'strict',
+    'properties': {
+        '@timestamp': {'type': 'date'},
+        'evento': {'type': 'keyword'},
+        'id_richiesta': {'type': 'keyword'},
+        'fk_nome_operazione': {'type': 'keyword'},
+        'operation_family': {'type': 'keyword'},
+        'stato': {'type': 'keyword'},
+        'data_creazione': {'type': 'date'},
+        'deadline': {'type': 'date'},
+        'sla_ore': {'type': 'float'},
+        'ore_alla_scadenza': {'type': 'float'}
+    }
+}
+
+
+class SLADeadlineTracker:
+    """Min-heap delle scadenze SLA delle richieste pendenti"""
+
+    def __init__(self, client: OpenSearch, source_index: str = 'iam-richieste',
+                 alerts_index: str = ALERTS_INDEX, kpi_config_file: str = 'iam_kpi_config.json',
+                 config_file: str = 'iam_config.json'):
+        self.client = client
+        self.source_index = source_index
+        self.alerts_index = alerts_index
+
+        kpi_config = self._load_json(kpi_config_file)
+        self.classifier = OperationClassifier.from_config(kpi_config)
+        self.family_duration = {name: cfg['duration'] for name, cfg in kpi_config.get('kpi', {}).items()
+                                if 'duration' in cfg}
+        self.alerts = {**ALERTS_DEFAULT, **self._load_json(config_file).get('sla_alerts', {})}
+
+        # id -> voce corrente; l'heap contiene (istante evento, seq, id, evento)
+        self.pendenti: Dict[str, Dict] = {}
+        self.heap: List[tuple] = []
+        self._seq = 0
+        self.inizializzato = False
+
+    @staticmethod
+    def _load_json(path: str) -> Dict:
+        try:
+            if Path(path).exists():
+                with open(path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception as e:
+            print(f"⚠ Configurazione non letta per il tracker SLA ({path}): {e}")
+        return {}
+
+    def __len__(self) -> int:
+        return len(self.pendenti)
+
+    def preavviso(self, sla_ore: float) -> timedelta:
+        ore = max(sla_ore * self.alerts['preavviso_frazione'], self.alerts['preavviso_min_ore'])
+        return timedelta(hours=min(ore, sla_ore))
+
+    def _push(self, quando: datetime, voce: Dict, evento: str):
+        heapq.heappush(self.heap, (quando, voce['seq'], voce['id_richiesta'], evento))
+
+    def aggiorna(self, richiesta: Dict):
+        """
+        Registra una riga del sync (O(log n)): pendente -> (ri)programma la scadenza,
+        altrimenti rimuove la voce (le sue entry nell'heap diventano obsolete).
+        """
+        if richiesta.get('id_richiesta') is None:
+            return
+        node_id = str(richiesta['id_richiesta'])
+        pending = richiesta.get('is_pending')
+        if pending is None:
+            pending = 'NON EVASA' in (richiesta.get('stato') or '').upper()
+
+        family = richiesta.get('operation_family')
+        if family is None:
+            family, _ = self.classifier.classify(richiesta.get('fk_nome_operazione'))
+        sla_ore = self.family_duration.get(family)
+        if not pending or sla_ore is None or not richiesta.get('data_creazione'):
+            self.pendenti.pop(node_id, None)
+            return
+
+        deadline = datetime.fromisoformat(richiesta['data_creazione']) + timedelta(hours=sla_ore)
+        voce = self.pendenti.get(node_id)
+        if voce is not None and voce['deadline'] == deadline:
+            voce['stato'] = richiesta.get('stato')
+            return
+
+        self._seq += 1
+        voce = {
+            'seq': self._seq,
+            'id_richiesta': node_id,
+            'fk_nome_operazione': richiesta.get('fk_nome_operazione'),
+            'operation_family': family,
+            'stato': richiesta.get('stato'),
+            'data_creazione': richiesta['data_creazione'],
+            'deadline': deadline,
+            'sla_ore': sla_ore
+        }
+        self.pendenti[node_id] = voce
+        self._push(deadline - self.preavviso(sla_ore), voce, ABOUT_TO_BREACH)
+
+    def carica_pendenti(self) -> int:
+        """Unica lettura dell'indice: le richieste pendenti all'avvio del processo"""
+        t0 = time.perf_counter()
+        righe = 0
+        query = {'query': {'term': {'is_pending': True}}, '_source': PENDING_FIELDS}
+        for hit in helpers.scan(self.client, index=self.source_index, query=query, size=5000):
+            self.aggiorna(hit['_source'])
+            righe += 1
+        self.inizializzato = True
+        print(f"✓ Tracker SLA: {righe} richieste pendenti lette, {len(self)} con scadenza "
+              f"({time.perf_counter() - t0:.2f}s)")
+        return righe
+
+    def _evento(self, voce: Dict, evento: str, adesso: datetime) -> Dict:
+        residue = (voce['deadline'] - adesso).total_seconds() / 3600
+        return {
+            '@timestamp': adesso.isoformat(),
+            'evento': evento,
+            'id_richiesta': voce['id_richiesta'],
+            'fk_nome_operazione': voce['fk_nome_operazione'],
+            'operation_family': voce['operation_family'],
+            'stato': voce['stato'],
+            'data_creazione': voce['data_creazione'],
+            'deadline': voce['deadline'].isoformat(),
+            'sla_ore': voce['sla_ore'],
+            'ore_alla_scadenza': round(residue, 2)
+        }
+
+    def eventi_maturati(self, adesso: Optional[datetime] = None) -> List[Dict]:
+        """Estrae dall'heap gli eventi con istante <= adesso (O(k log n) per k eventi)"""
+        adesso = adesso or datetime.now()
+        eventi = []
+        while self.heap and self.heap[0][0] <= adesso:
+            _, seq, node_id, evento = heapq.heappop(self.heap)
+            voce = self.pendenti.get(node_id)
+            if voce is None or voce['seq'] != seq:
+                continue  # richiesta chiusa o scadenza cambiata
+
+            if evento == ABOUT_TO_BREACH and voce['deadline'] > adesso:
+                eventi.append(self._evento(voce, ABOUT_TO_BREACH, adesso))
+                self._push(voce['deadline'], voce, BREACHED)
+                continue
+
+            # Scadenza superata (anche se il preavviso non è mai stato emesso)
+            eventi.append(self._evento(voce, BREACHED, adesso))
+        return eventi
+
+    def _compatta(self):
+        """Ricostruisce l'heap senza le entry obsolete (richieste chiuse o riprogrammate)"""
+        self.heap = [item for item in self.heap
+                     if item[2] in self.pendenti and self.pendenti[item[2]]['seq'] == item[1]]
+        heapq.heapify(self.heap)
+
+    def _create_index(self):
+        if not self.client.indices.exists(index=self.alerts_index):
+            self.client.indices.create(index=self.alerts_index, body={
+                'mappings': ALERTS_MAPPINGS,
+                'settings': {'number_of_shards': 1, 'number_of_replicas': 0}
+            })
+            print(f"✓ Indice alert '{self.alerts_index}' creato")
+
+    def controlla(self, adesso: Optional[datetime] = None) -> Dict:
+        """Emette in iam-sla-alerts gli eventi maturati; al primo controllo legge le pendenti"""
+        if not self.inizializzato:
+            self.carica_pendenti()
+
+        eventi = self.eventi_maturati(adesso)
+        if len(self.heap) > 2 * len(self.pendenti) + 1000:
+            self._compatta()
+        conteggi = {ABOUT_TO_BREACH: 0, BREACHED: 0}
+        for evento in eventi:
+            conteggi[evento['evento']] += 1
+
+        scritti = 0
+        if eventi:
+            self._create_index()
+            azioni = ({
+                '_op_type': 'create',
+                '_index': self.alerts_index,
+                '_id': f"{e['id_richiesta']}-{e['evento']}-{e['deadline']}",
+                '_source': e
+            } for e in eventi)
+            scritti, errori = helpers.bulk(self.client, azioni, raise_on_error=False)
+            # 409: alert già emesso (es. dopo un riavvio)
+            errori = [e for e in errori if next(iter(e.values()), {}).get('status') != 409]
+            if errori:
+                print(f"⚠ {len(errori)} alert SLA non scritti in '{self.alerts_index}'")
+
+        print(f"{'⚠' if conteggi[BREACHED] else '✓'} Tracker SLA: {len(self)} pendenti con scadenza, "
+              f"{conteggi[ABOUT_TO_BREACH]} in scadenza, {conteggi[BREACHED]} scadute ({scritti} alert nuovi)")
+        return {'pending': len(self), ABOUT_TO_BREACH: conteggi[ABOUT_TO_BREACH],
+                BREACHED: conteggi[BREACHED], 'indexed': scritti}
@@ -0,0 +1,297 @@
+"""
+================================================================================
+FILE: iam_tracing.py
+================================================================================
+IAM Tracing - Span per fase della pipeline e indice 'iam-pipeline-metrics'
+
+Ogni esecuzione di IAMOrchestrator registra span con durata, righe e byte:
+- fasi (load_data, analyze, kpi, dashboard)
+- Oracle: connect, execute, fetch (round-trip fetchmany), transform
+- OpenSearch: ogni chunk _bulk (byte del body, documenti) tramite i listener
+  di opensearch_pool
+- ogni analisi di IAMAnalyzer e ogni KPI di KPIEngine
+
+Gli span vanno nell'indice 'iam-pipeline-metrics' (grafici di throughput e
+latenza sulla stessa Dashboards) e nel file locale iam_pipeline_metrics.json
+(ultime esecuzioni), usato anche per segnalare le fasi in regressione rispetto
+alla mediana delle esecuzioni precedenti.
+
+Senza tracer attivo span()/registra() non fanno nulla: i moduli strumentati
+funzionano identici anche fuori dall'orchestratore.
+
+UTILIZZO:
+    from iam_tracing import PipelineTracer, attiva, span
+
+    tracer = attiva(PipelineTracer(client))
+    with span('load_data') as s:
+        ...
+        s['rows'] = 1000
+    tracer.chiudi()
+================================================================================
+"""
+
+import json
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from statistics import median
+from typing import Dict, Iterator, List, Optional
+
+from opensearchpy import OpenSearch, helpers
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from opensearch_pool import aggiungi_listener, rimuovi_listener
+
+METRICS_INDEX = 'iam-pipeline-metrics'
+METRICS_FILE = 'iam_pipeline_metrics.json'
+
+# Esecuzioni conservate nel file locale (storico per il confronto)
+MAX_RUNS = 50
+
+# Fase in regressione se la durata supera di questo fattore la mediana storica
+REGRESSION_FACTOR = 1.5
+REGRESSION_MIN_MS = 500
+
+METRICS_MAPPINGS = {
+    'dynamic': False,
+    'properties': {
+        '@timestamp': {'type': 'date'},
+        'run_id': {'type': 'keyword'},
+        'pipeline': {'type': 'keyword'},
+        'name': {'type': 'keyword'},
+        'phase': {'type': 'keyword'},
+        'parent': {'type': 'keyword'},
+        'thread': {'type': 'keyword'},
+        'status': {'type': 'keyword'},
+        'duration_ms': {'type': 'float'},
+        'rows': {'type': 'long'},
+        'bytes': {'type': 'long'},
+        'rows_per_second': {'type': 'float'},
+        'attrs': {'type': 'object', 'enabled': False}
+    }
+}
+
+
+class PipelineTracer:
+    """Raccoglie gli span di un'esecuzione e li pubblica su indice e file"""
+
+    def __init__(self, client: Optional[OpenSearch] = None, pipeline: str = 'iam-main',
+                 index_name: str = METRICS_INDEX, json_file: Optional[str] = METRICS_FILE):
+        self.client = client
+        self.pipeline = pipeline
+        self.index_name = index_name
+        self.json_file = json_file
+        self.run_id = f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.spans: List[Dict] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Fase corrente del thread principale: assegnata agli span dei thread worker
+        self._fase: Optional[str] = None
+
+    def _stack(self) -> List[str]:
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def registra(self, name: str, duration_ms: float, rows: Optional[int] = None,
+                 size: Optional[int] = None, status: str = 'ok', start: Optional[float] = None, **attrs):
+        """Span già misurato (es. tempi accumulati su più fetchmany); size = byte"""
+        stack = self._stack()
+        doc = {
+            '@timestamp': datetime.fromtimestamp(start if start is not None else time.time()).isoformat(),
+            'run_id': self.run_id,
+            'pipeline': self.pipeline,
+            'name': name,
+            'phase': stack[0] if stack else (self._fase or name),
+            'parent': stack[-1] if stack else None,
+            'thread': threading.current_thread().name,
+            'status': status,
+            'duration_ms': round(duration_ms, 3),
+            'rows': rows,
+            'bytes': size,
+            'rows_per_second': round(rows / (duration_ms / 1000), 1) if rows and duration_ms > 0 else None,
+            'attrs': attrs
+        }
+        with self._lock:
+            self.spans.append(doc)
+        return doc
+
+    @contextmanager
+    def span(self, name: str, **attrs) -> Iterator[Dict]:
+        """Span misurato sul blocco; il dict restituito accetta rows, bytes, status e attributi extra"""
+        info = dict(attrs)
+        stack = self._stack()
+        root = not stack and threading.current_thread() is threading.main_thread()
+        if root:
+            self._fase = name
+        stack.append(name)
+        start_wall, start = time.time(), time.perf_counter()
+        status = 'ok'
+        try:
+            yield info
+        except Exception as e:
+            status = 'error'
+            info.setdefault('error', str(e)[:300])
+            raise
+        finally:
+            stack.pop()
+            status = info.pop('status', status)
+            rows, nbytes = info.pop('rows', None), info.pop('bytes', None)
+            self.registra(name, (time.perf_counter() - start) * 1000, rows=rows, size=nbytes,
+                          status=status, start=start_wall, **info)
+            if root:
+                self._fase = None
+
+    def _on_request(self, method: str, url: str, elapsed_ms: float, ok: bool, body):
+        """Listener opensearch_pool: uno span per ogni chunk _bulk (escluso l'indice metriche)"""
+        path = url.split('?')[0]
+        if not path.endswith('/_bulk') or self.index_name in path:
+            return
+        size = len(body) if body is not None else None
+        newline = b'\n' if isinstance(body, bytes) else '\n'
+        # Azioni index/create: due righe per documento
+        docs = body.count(newline) // 2 if body is not None else None
+        self.registra('opensearch.bulk_chunk', elapsed_ms, rows=docs, size=size,
+                      status='ok' if ok else 'error', start=time.time() - elapsed_ms / 1000)
+
+    def avvia(self):
+        aggiungi_listener(self._on_request)
+
+    def ferma(self):
+        rimuovi_listener(self._on_request)
+
+    def riepilogo(self) -> Dict[str, Dict]:
+        """Totali per nome span: conteggio, durata, righe, byte"""
+        totali: Dict[str, Dict] = {}
+        for s in self.spans:
+            t = totali.setdefault(s['name'], {'count': 0, 'duration_ms': 0.0, 'rows': 0, 'bytes': 0})
+            t['count'] += 1
+            t['duration_ms'] += s['duration_ms']
+            t['rows'] += s['rows'] or 0
+            t['bytes'] += s['bytes'] or 0
+        return totali
+
+    def _storico(self) -> List[Dict]:
+        if not self.json_file or not Path(self.json_file).exists():
+            return []
+        try:
+            with open(self.json_file, 'r', encoding='utf-8') as f:
+                return json.load(f).get('runs', [])
+        except Exception as e:
+            print(f"⚠ Storico metriche non leggibile ({self.json_file}): {e}")
+            return []
+
+    def regressioni(self, storico: Optional[List[Dict]] = None,
+                    factor: float = REGRESSION_FACTOR, min_ms: float = REGRESSION_MIN_MS) -> List[Dict]:
+        """Span la cui durata totale supera factor × mediana delle esecuzioni precedenti"""
+        storico = self._storico() if storico is None else storico
+        precedenti: Dict[str, List[float]] = {}
+        for run in storico:
+            if run.get('pipeline') != self.pipeline:
+                continue
+            for name, t in run.get('summary', {}).items():
+                precedenti.setdefault(name, []).append(t['duration_ms'])
+
+        regressioni = []
+        for name, t in self.riepilogo().items():
+            durate = precedenti.get(name)
+            if not durate or len(durate) < 3:
+                continue
+            riferimento = median(durate)
+            if t['duration_ms'] >= min_ms and t['duration_ms'] > riferimento * factor:
+                regressioni.append({'name': name, 'duration_ms': round(t['duration_ms'], 1),
+                                    'median_ms': round(riferimento, 1),
+                                    'ratio': round(t['duration_ms'] / riferimento, 2) if riferimento else None})
+        return regressioni
+
+    def salva(self, storico: Optional[List[Dict]] = None):
+        """Aggiunge l'esecuzione al file locale (riepilogo + span), tenendo le ultime MAX_RUNS"""
+        if not self.json_file:
+            return
+        runs = (self._storico() if storico is None else storico) + [{
+            'run_id': self.run_id,
+            'pipeline': self.pipeline,
+            'timestamp': datetime.now().isoformat(),
+            'summary': self.riepilogo(),
+            'spans': self.spans
+        }]
+        with open(self.json_file, 'w', encoding='utf-8') as f:
+            json.dump({'runs': runs[-MAX_RUNS:]}, f, ensure_ascii=False, indent=1)
+
+    def pubblica(self) -> int:
+        """Scrive gli span nell'indice metriche (creato al primo utilizzo)"""
+        if self.client is None or not self.spans:
+            return 0
+        if not self.client.indices.exists(index=self.index_name):
+            self.client.indices.create(index=self.index_name, body={
+                'mappings': METRICS_MAPPINGS,
+                'settings': {'number_of_shards': 1, 'number_of_replicas': 0}
+            })
+        success, _ = helpers.bulk(self.client, (
+            {'_index': self.index_name, '_source': doc} for doc in self.spans
+        ), raise_on_error=False)
+        return success
+
+    def chiudi(self) -> List[Dict]:
+        """Ferma la raccolta, pubblica su indice e file e ritorna le regressioni rilevate"""
+        self.ferma()
+        storico = self._storico()
+        regressioni = self.regressioni(storico)
+        try:
+            indicizzati = self.pubblica()
+            if indicizzati:
+                print(f"✓ {indicizzati} span in '{self.index_name}' (run {self.run_id})")
+        except Exception as e:
+            print(f"⚠ Span non indicizzati in '{self.index_name}': {e}")
+        try:
+            self.salva(storico)
+        except Exception as e:
+            print(f"⚠ Span non salvati in {self.json_file}: {e}")
+
+        for r in regressioni:
+            print(f"⚠ Regressione '{r['name']}': {r['duration_ms']:.0f} ms "
+                  f"(mediana {r['median_ms']:.0f} ms, ×{r['ratio']})")
+        return regressioni
+
+
+_attivo: Optional[PipelineTracer] = None
+
+
+def attiva(tracer: PipelineTracer) -> PipelineTracer:
+    """Rende il tracer quello usato da span()/registra() dei moduli strumentati"""
+    global _attivo
+    if _attivo is not None:
+        _attivo.ferma()
+    _attivo = tracer
+    tracer.avvia()
+    return tracer
+
+
+def disattiva() -> Optional[PipelineTracer]:
+    global _attivo
+    tracer, _attivo = _attivo, None
+    if tracer is not None:
+        tracer.ferma()
+    return tracer
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Dict]:
+    """Span sul tracer attivo; senza tracer restituisce un dict ignorato"""
+    tracer = _attivo
+    if tracer is None:
+        yield dict(attrs)
+        return
+    with tracer.span(name, **attrs) as info:
+        yield info
+
+
+def registra(name: str, duration_ms: float, **kwargs):
+    """Span già misurato sul tracer attivo (no-op senza tracer)"""
+    tracer = _attivo
+    if tracer is not None:
+        tracer.registra(name, duration_ms, **kwargs)
@@ -0,0 +1,253 @@
+"""
+================================================================================
+FILE: iam_tree.py
+================================================================================
+IAM Request Trees - Aggregati padre/figli (ID_RICHIESTA_PARENT) sul documento padre
+
+Le richieste composite (FLAG_HAS_CHILDREN / ID_RICHIESTA_PARENT) sono documenti
+piatti: la latenza end-to-end non si calcola senza join lato client. Durante
+ogni sync il loader passa a RequestForest le righe che partecipano a un albero;
+la foresta:
+- tiene i nodi in una mappa id -> nodo (solo i campi necessari) e costruisce
+  la mappa di adiacenza padre -> figli in O(n)
+- completa gli alberi toccati leggendo dall'indice gli antenati mancanti e,
+  per i nodi non caricati per intero (sync delta, antenati fuori finestra),
+  i discendenti (una query terms per livello e per blocco di id)
+- calcola con una visita post-order iterativa (O(n), senza ricorsione) gli
+  aggregati di ogni nodo con figli e li scrive sul documento con un update
+  parziale del campo 'albero':
+    figli, discendenti, aperti, profondita, livello (0 = radice),
+    max_chiusura_figli, durata_ore (creazione -> ultima chiusura dell'albero,
+    solo se completo), completo, stato_peggiore, radice, aggiornato
+
+Le analisi SLA delle richieste composite diventano una sola query sulle radici
+(albero.livello = 0), vedi IAMAnalyzer.analisi_sla_composite.
+
+UTILIZZO:
+    from iam_tree import RequestForest
+
+    forest = RequestForest()
+    for richiesta in richieste:
+        forest.aggiungi(richiesta)
+    forest.aggiorna(client, 'iam-richieste', index_for=lambda nodo: 'iam-richieste')
+================================================================================
+"""
+
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+from opensearchpy import OpenSearch, helpers
+
+# Campi letti dall'indice per completare gli alberi
+NODE_FIELDS = ['id_richiesta', 'id_richiesta_parent', 'data_creazione', 'data_chiusura', 'stato',
+               'flag_has_children']
+
+# Gravità dello stato per stato_peggiore (stati non elencati: in corso)
+STATE_SEVERITY = {'EVASA': 0, 'NON EVASA': 2, 'ANNULLATA': 3}
+STATE_SEVERITY_DEFAULT = 1
+
+# Valori di FLAG_HAS_CHILDREN che indicano una richiesta senza figli
+NO_CHILDREN_FLAGS = {None, '', '0', 'N', 'NO', 'F', 'FALSE'}
+
+# Id per query terms e massimo livelli letti (protezione da cicli nei dati)
+TERMS_BATCH = 1000
+MAX_LEVELS = 50
+
+
+def _severity(stato: Optional[str]) -> int:
+    return STATE_SEVERITY.get((stato or '').upper(), STATE_SEVERITY_DEFAULT)
+
+
+def _peggiore(a: Optional[str], b: Optional[str]) -> Optional[str]:
+    return b if _severity(b) > _severity(a) else a
+
+
+def _ore(inizio: Optional[str], fine: Optional[str]) -> Optional[float]:
+    if not inizio or not fine:
+        return None
+    return (datetime.fromisoformat(fine) - datetime.fromisoformat(inizio)).total_seconds() / 3600
+
+
+def partecipa(richiesta: Dict) -> bool:
+    """True se la richiesta ha un padre o dichiara figli (le altre non entrano nella foresta)"""
+    if richiesta.get('id_richiesta') is None:
+        return False
+    flag = richiesta.get('flag_has_children')
+    flag = flag.strip().upper() if isinstance(flag, str) else flag
+    return richiesta.get('id_richiesta_parent') is not None or flag not in NO_CHILDREN_FLAGS
+
+
+class RequestForest:
+    """Foresta padre -> figli delle richieste toccate da un sync"""
+
+    def __init__(self):
+        self.nodi: Dict[str, Dict] = {}
+        # Nodi di cui si conoscono già tutti i figli (righe di un caricamento completo)
+        self.completi: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self.nodi)
+
+    @staticmethod
+    def _nodo(richiesta: Dict) -> Dict:
+        parent = richiesta.get('id_richiesta_parent')
+        return {
+            'parent': str(parent) if parent is not None else None,
+            'data_creazione': richiesta.get('data_creazione'),
+            'data_chiusura': richiesta.get('data_chiusura'),
+            'stato': richiesta.get('stato')
+        }
+
+    def aggiungi(self, richiesta: Dict, figli_completi: bool = False):
+        """
+        Registra una richiesta trasformata (solo se partecipa a un albero).
+        figli_completi=True quando tutti i suoi figli passano dallo stesso caricamento
+        (finestra completa: i figli sono creati dopo il padre).
+        """
+        if not partecipa(richiesta):
+            return
+        node_id = str(richiesta['id_richiesta'])
+        self.nodi[node_id] = self._nodo(richiesta)
+        if figli_completi:
+            self.completi.add(node_id)
+
+    def _leggi(self, client: OpenSearch, index_name: str, field: str, ids: Iterable[str]) -> List[Dict]:
+        """Documenti con field in ids (query terms a blocchi di TERMS_BATCH)"""
+        ids = list(ids)
+        trovati = []
+        for i in range(0, len(ids), TERMS_BATCH):
+            query = {'query': {'terms': {field: ids[i:i + TERMS_BATCH]}}, '_source': NODE_FIELDS}
+            trovati.extend(hit['_source'] for hit in helpers.scan(client, index=index_name, query=query, size=5000))
+        return trovati
+
+    def completa(self, client: OpenSearch, index_name: str) -> int:
+        """
+        Legge dall'indice antenati e discendenti mancanti degli alberi toccati.
+        Ritorna il numero di nodi aggiunti.
+        """
+        iniziali = len(self.nodi)
+
+        # Antenati: risale finché i padri referenziati sono tutti noti (o inesistenti)
+        assenti: Set[str] = set()
+        for _ in range(MAX_LEVELS):
+            mancanti = {n['parent'] for n in self.nodi.values()
+                        if n['parent'] and n['parent'] not in self.nodi} - assenti
+            if not mancanti:
+                break
+            for doc in self._leggi(client, index_name, 'id_richiesta', mancanti):
+                self.nodi.setdefault(str(doc['id_richiesta']), self._nodo(doc))
+            assenti |= mancanti - set(self.nodi)
+
+        # Discendenti: figli dei nodi non caricati per intero, livello per livello
+        espansi = set(self.completi)
+        for _ in range(MAX_LEVELS):
+            da_espandere = set(self.nodi) - espansi
+            if not da_espandere:
+                break
+            espansi |= da_espandere
+            for doc in self._leggi(client, index_name, 'id_richiesta_parent', da_espandere):
+                self.nodi.setdefault(str(doc['id_richiesta']), self._nodo(doc))
+
+        return len(self.nodi) - iniziali
+
+    def adiacenze(self) -> Dict[str, List[str]]:
+        """Mappa padre -> figli (solo padri presenti nella foresta)"""
+        figli: Dict[str, List[str]] = {}
+        for node_id, nodo in self.nodi.items():
+            if nodo['parent'] in self.nodi and nodo['parent'] != node_id:
+                figli.setdefault(nodo['parent'], []).append(node_id)
+        return figli
+
+    def calcola(self) -> Dict[str, Dict]:
+        """Aggregati 'albero' di ogni nodo con figli (visita post-order iterativa per radice)"""
+        figli = self.adiacenze()
+        radici = [node_id for node_id, nodo in self.nodi.items() if nodo['parent'] not in self.nodi]
+        adesso = datetime.now().isoformat()
+
+        # Per nodo (sottoalbero incluso il nodo): nodi, aperti, profondità, ultima chiusura, stato peggiore
+        sintesi: Dict[str, tuple] = {}
+        aggregati: Dict[str, Dict] = {}
+        visitati: Set[str] = set()
+
+        for radice in radici:
+            stack = [(radice, 0, False)]
+            while stack:
+                node_id, livello, chiuso = stack.pop()
+                if not chiuso:
+                    if node_id in visitati:
+                        continue  # ciclo nei dati: il nodo è già in un altro ramo
+                    visitati.add(node_id)
+                    stack.append((node_id, livello, True))
+                    stack.extend((child, livello + 1, False) for child in figli.get(node_id, ()))
+                    continue
+
+                nodo = self.nodi[node_id]
+                nodi, aperti, profondita = 0, 0, 0
+                max_chiusura, peggiore = None, None
+                for child in figli.get(node_id, ()):
+                    if child not in sintesi:
+                        continue
+                    c_nodi, c_aperti, c_prof, c_chiusura, c_peggiore = sintesi[child]
+                    nodi += c_nodi
+                    aperti += c_aperti
+                    profondita = max(profondita, c_prof + 1)
+                    if c_chiusura and (max_chiusura is None or c_chiusura > max_chiusura):
+                        max_chiusura = c_chiusura
+                    peggiore = _peggiore(peggiore, c_peggiore)
+
+                chiusura = nodo['data_chiusura']
+                ultima = max(filter(None, (chiusura, max_chiusura)), default=None)
+                stato = _peggiore(nodo['stato'], peggiore) if peggiore is not None else nodo['stato']
+                sintesi[node_id] = (nodi + 1, aperti + (0 if chiusura else 1), profondita, ultima, stato)
+
+                if nodi:
+                    completo = aperti == 0 and chiusura is not None
+                    aggregati[node_id] = {
+                        'figli': len(figli[node_id]),
+                        'discendenti': nodi,
+                        'aperti': aperti,
+                        'profondita': profondita,
+                        'livello': livello,
+                        'max_chiusura_figli': max_chiusura,
+                        'durata_ore': round(_ore(nodo['data_creazione'], ultima), 4) if completo else None,
+                        'completo': completo,
+                        'stato_peggiore': stato,
+                        'radice': radice,
+                        'aggiornato': adesso
+                    }
+
+        return aggregati
+
+    def azioni(self, aggregati: Dict[str, Dict], index_for: Callable[[Dict], str]) -> Iterator[Dict]:
+        """Update parziali del campo 'albero' sui documenti padre"""
+        for node_id, albero in aggregati.items():
+            nodo = self.nodi[node_id]
+            yield {
+                '_op_type': 'update',
+                '_index': index_for({'id_richiesta': node_id, **nodo}),
+                '_id': node_id,
+                'doc': {'albero': albero},
+                'retry_on_conflict': 3
+            }
+
+    def aggiorna(self, client: OpenSearch, index_name: str,
+                 index_for: Optional[Callable[[Dict], str]] = None) -> Dict:
+        """
+        Completa gli alberi, calcola gli aggregati e li scrive sui padri.
+        index_for(nodo) restituisce l'indice concreto del documento (partizione mensile).
+        """
+        t0 = datetime.now()
+        if not self.nodi:
+            return {'nodes': 0, 'fetched': 0, 'parents': 0, 'updated': 0, 'failed': 0}
+
+        letti = self.completa(client, index_name)
+        aggregati = self.calcola()
+        success, errors = helpers.bulk(client, self.azioni(aggregati, index_for or (lambda nodo: index_name)),
+                                       chunk_size=2000, raise_on_error=False)
+        failed = len(errors) if isinstance(errors, list) else 0
+
+        elapsed = (datetime.now() - t0).total_seconds()
+        print(f"✓ Alberi richieste: {len(aggregati)} padri aggiornati su {len(self.nodi)} nodi "
+              f"({letti} letti dall'indice, {failed} fallimenti, {elapsed:.2f}s)")
+        return {'nodes': len(self.nodi), 'fetched': letti, 'parents': len(aggregati),
+                'updated': success, 'failed': failed, 'elapsed': round(elapsed, 2)}
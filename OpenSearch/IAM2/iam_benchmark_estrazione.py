@@ -0,0 +1,45 @@
+"""
+IAM RICHIESTE - Benchmark estrazione Oracle a fette
+===================================================
+
+Misura il tempo di carica_richieste sulla stessa finestra al variare del
+parallelismo (1 = query unica) usando le credenziali di iam_config.json.
+
+Utilizzo:
+    python iam_benchmark_estrazione.py
+    python iam_benchmark_estrazione.py --giorni 90 --parallelismo 1 2 4 8 --giorni-per-fetta 7
+"""
+
+import argparse
+import time
+
+from iam_opensearch_dashboard import IAMOracleLoader
+from iam_scheduler import IAMConfig
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark estrazione Oracle parallela')
+    parser.add_argument('--giorni', type=int, default=90)
+    parser.add_argument('--parallelismo', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--giorni-per-fetta', type=int, default=1)
+    parser.add_argument('--arraysize', type=int, default=5000)
+    args = parser.parse_args()
+
+    loader = IAMOracleLoader(IAMConfig.carica_config()['oracle'])
+    base = None
+    try:
+        print(f"\n{'Parallelismo':>12s} | {'Righe':>10s} | {'Tempo':>8s} | Speedup")
+        print('-' * 50)
+        for parallelismo in args.parallelismo:
+            start = time.perf_counter()
+            richieste = loader.carica_richieste(args.giorni, arraysize=args.arraysize, parallelismo=parallelismo,
+                                                giorni_per_fetta=args.giorni_per_fetta)
+            elapsed = time.perf_counter() - start
+            base = base or elapsed
+            print(f"{parallelismo:12d} | {len(richieste):10,d} | {elapsed:7.1f}s | {base / elapsed:.1f}x")
+    finally:
+        loader.chiudi()
+
+
+if __name__ == '__main__':
+    main()
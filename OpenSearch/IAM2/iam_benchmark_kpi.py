@@ -0,0 +1,142 @@
+"""
+IAM RICHIESTE - Benchmark calcolo KPI
+=====================================
+
+Confronta su richieste sintetiche (default 1M):
+- calcolo per riga: sette scansioni della lista con dict e statistics.mean
+- IAMKPIAnalyzer.calcola_tutti_kpi su RichiestaBatch (input del caricamento da
+  Oracle: colonne già codificate) e, per confronto, su List[RichiestaIAM]
+  (conversione in colonne inclusa nel tempo)
+
+e verifica che i due calcoli producano gli stessi KPI.
+
+Utilizzo:
+    python iam_benchmark_kpi.py
+    python iam_benchmark_kpi.py --richieste 2000000
+"""
+
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from iam_opensearch_dashboard import COLONNE_RICHIESTA, IAMKPIAnalyzer, RichiestaBatch, RichiestaIAM
+
+OPERAZIONI = [f"{base}_{sistema}" for base in ('RESET_PASSWORD', 'CREAZIONE_ACCOUNT', 'BLOCCO', 'PROROGA',
+                                               'MODIFICA_PARAMETRI', 'RIATTIVAZIONE', 'CANCELLAZIONE')
+              for sistema in ('AD', 'LDAP', 'SAP', 'RACF', 'ORACLE', 'UNIX')]
+STATI = ['EVASA'] * 6 + ['NON EVASA', 'ANNULLATA', 'IN LAVORAZIONE']
+TIPI_UTENZA = ['INTERNA', 'ESTERNA', 'TECNICA', 'AMMINISTRATIVA']
+
+
+def genera_richieste(n: int) -> List[RichiestaIAM]:
+    """Richieste sintetiche degli ultimi 90 giorni (circa 15% non chiuse)"""
+    now = datetime.now()
+    richieste = []
+    for i in range(n):
+        creazione = now - timedelta(seconds=random.randint(0, 90 * 86400))
+        chiusura = creazione + timedelta(hours=random.expovariate(1 / 18)) if random.random() < 0.85 else None
+        richieste.append(RichiestaIAM(
+            id_richiesta=i, fk_id_oggetto=i % 5000, nome_utenza=f"U{i % 50000:06d}",
+            fk_tipo_richiesta='STD', fk_tipo_utenza=random.choice(TIPI_UTENZA),
+            fk_nome_operazione=random.choice(OPERAZIONI), id_richiesta_parent=None,
+            data_creazione=creazione, data_chiusura=chiusura,
+            fk_utente=f"OP{i % 300:03d}", fk_utente_richiedente=f"R{i % 8000:05d}",
+            stato=random.choice(STATI), nota=None, flag_transazione='N',
+            data_storicizzazione=None, priorita_secondaria=0, tipo_op_secondaria=0, comunicazione_uf=None
+        ))
+    return richieste
+
+
+def batch_da_richieste(richieste: List[RichiestaIAM]) -> RichiestaBatch:
+    """Le stesse richieste in formato colonnare, come le produce il caricamento da Oracle"""
+    campi = [nome for nome, _ in COLONNE_RICHIESTA]
+    return RichiestaBatch.from_rows([tuple(getattr(r, campo) for campo in campi) for r in richieste])
+
+
+def kpi_per_riga(richieste: List[RichiestaIAM]) -> Dict[str, float]:
+    """Calcolo di riferimento per riga (sette passate, come la versione precedente)"""
+    risultati = {}
+
+    operazioni = {}
+    for r in richieste:
+        operazioni.setdefault(r.fk_nome_operazione, [])
+        if r.tempo_evasione_ore is not None:
+            operazioni[r.fk_nome_operazione].append(r.tempo_evasione_ore)
+    for op, tempi in operazioni.items():
+        if tempi:
+            risultati[f'Tempo medio evasione - {op}'] = round(statistics.mean(tempi), 2)
+
+    evase = len([r for r in richieste if r.stato == 'EVASA'])
+    risultati['Tasso di evasione'] = round(evase / len(richieste) * 100, 2)
+
+    stati = {}
+    for r in richieste:
+        stati[r.stato] = stati.get(r.stato, 0) + 1
+    for stato, count in stati.items():
+        risultati[f'Richieste {stato}'] = count
+
+    frequenze = {}
+    for r in richieste:
+        frequenze[r.fk_nome_operazione] = frequenze.get(r.fk_nome_operazione, 0) + 1
+    for op, count in sorted(frequenze.items(), key=lambda x: x[1], reverse=True)[:5]:
+        risultati[f'Frequenza - {op}'] = count
+
+    richieste_evase = [r for r in richieste if r.stato == 'EVASA']
+    entro_24h = len([r for r in richieste_evase
+                     if r.tempo_evasione_ore is not None and r.tempo_evasione_ore <= 24])
+    risultati['SLA 24h'] = round(entro_24h / len(richieste_evase) * 100, 2) if richieste_evase else 0
+
+    risultati['Backlog'] = len([r for r in richieste if r.stato != 'EVASA'])
+
+    tipi = {}
+    for r in richieste:
+        tipi.setdefault(r.fk_tipo_utenza, [])
+        if r.tempo_evasione_ore is not None:
+            tipi[r.fk_tipo_utenza].append(r.tempo_evasione_ore)
+    for tipo, tempi in tipi.items():
+        if tempi:
+            risultati[f'Tempo medio - {tipo}'] = round(statistics.mean(tempi), 2)
+
+    return risultati
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark KPI per riga vs colonnare')
+    parser.add_argument('--richieste', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    print(f"⏳ Generazione {args.richieste:,} richieste sintetiche...")
+    richieste = genera_richieste(args.richieste)
+
+    start = time.perf_counter()
+    riferimento = kpi_per_riga(richieste)
+    t_riga = time.perf_counter() - start
+
+    batch = batch_da_richieste(richieste)
+    analyzer = IAMKPIAnalyzer(client=None)
+
+    start = time.perf_counter()
+    kpi_batch = analyzer.calcola_tutti_kpi(batch)
+    t_batch = time.perf_counter() - start
+
+    start = time.perf_counter()
+    kpi_lista = analyzer.calcola_tutti_kpi(richieste)
+    t_lista = time.perf_counter() - start
+
+    print(f"\nPer riga:              {t_riga:7.2f}s")
+    for etichetta, kpi_list, tempo in (('Colonnare (batch)', kpi_batch, t_batch),
+                                       ('Colonnare (lista)', kpi_lista, t_lista)):
+        colonnare = {kpi['nome_kpi']: kpi['valore'] for kpi in kpi_list}
+        differenze = {nome for nome in riferimento.keys() | colonnare.keys()
+                      if abs((riferimento.get(nome) or 0) - (colonnare.get(nome) or 0)) > 0.01}
+        print(f"{etichetta + ':':<22} {tempo:7.2f}s  ({t_riga / tempo:.1f}x) - {len(colonnare)} KPI, "
+              + ("✓ identici al calcolo per riga" if not differenze else f"✗ differenze: {sorted(differenze)}"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+IAM RICHIESTE - Benchmark memoria RichiestaIAM vs RichiestaBatch
+================================================================
+
+Misura con tracemalloc, su righe sintetiche lette a blocchi come da fetchmany:
+- lista di RichiestaIAM + to_dict() per il bulk (percorso precedente)
+- RichiestaBatch colonnare + serializzazione NDJSON a blocchi
+
+Utilizzo:
+    python iam_benchmark_memoria.py
+    python iam_benchmark_memoria.py --righe 1000000
+"""
+
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from iam_opensearch_dashboard import RichiestaBatch, RichiestaIAM, COLONNE_RICHIESTA
+
+OPERAZIONI = [f"{base}_{sistema}" for base in ('RESET_PASSWORD', 'CREAZIONE_ACCOUNT', 'BLOCCO', 'PROROGA')
+              for sistema in ('AD', 'LDAP', 'SAP', 'RACF')]
+
+
+def blocchi_righe(n: int, dimensione: int = 5000, seed: int = 42):
+    """Righe Oracle sintetiche (tuple nell'ordine di COLONNE_RICHIESTA) a blocchi"""
+    rng = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    for inizio in range(0, n, dimensione):
+        blocco = []
+        for i in range(inizio, min(inizio + dimensione, n)):
+            creazione = now - timedelta(seconds=rng.randint(0, 90 * 86400))
+            chiusura = creazione + timedelta(seconds=rng.randint(60, 72 * 3600)) if rng.random() < 0.85 else None
+            blocco.append((
+                i, i % 5000, f"U{i % 50000:06d}", 'STD', rng.choice(['INTERNA', 'ESTERNA', 'TECNICA']),
+                rng.choice(OPERAZIONI), None, creazione, chiusura, f"OP{i % 300:03d}", f"R{i % 8000:05d}",
+                rng.choice(['EVASA', 'EVASA', 'EVASA', 'NON EVASA', 'ANNULLATA']),
+                'Richiesta gestita' if rng.random() < 0.1 else None, 'N', None, 0, 0, None
+            ))
+        yield blocco
+
+
+def misura(descrizione: str, funzione):
+    """Esegue la funzione riportando memoria trattenuta, picco e tempo"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    risultato = funzione()
+    elapsed = time.perf_counter() - start
+    corrente, picco = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{descrizione:45s} | trattenuta {corrente / 2**20:8.1f} MB | picco {picco / 2**20:8.1f} MB | {elapsed:6.2f}s")
+    return risultato
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark memoria richieste IAM')
+    parser.add_argument('--righe', type=int, default=500_000)
+    args = parser.parse_args()
+
+    nomi = [nome for nome, _ in COLONNE_RICHIESTA]
+
+    def lista_dataclass():
+        richieste = [RichiestaIAM(**dict(zip(nomi, row))) for blocco in blocchi_righe(args.righe) for row in blocco]
+        documenti = [r.to_dict() for r in richieste]
+        return richieste, documenti
+
+    def batch_colonnare():
+        batch = RichiestaBatch()
+        for blocco in blocchi_righe(args.righe):
+            batch.aggiungi_righe(blocco)
+        byte_ndjson = sum(len(corpo) for corpo, _ in batch.iter_ndjson('iam-richieste'))
+        return batch, byte_ndjson
+
+    print(f"Righe: {args.righe:,}\n")
+    risultato = misura('RichiestaIAM + to_dict() (precedente)', lista_dataclass)
+    del risultato
+    batch, byte_ndjson = misura('RichiestaBatch + NDJSON a blocchi', batch_colonnare)
+
+    print(f"\nColonne RichiestaBatch: {batch.memoria_bytes() / 2**20:.1f} MB "
+          f"({batch.memoria_bytes() / max(len(batch), 1):.0f} byte/riga), NDJSON {byte_ndjson / 2**20:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -16,10 +16,22 @@ import oracledb
 from opensearchpy import OpenSearch, helpers
 from datetime import datetime, timedelta
 import json
-import statistics
-from typing import List, Dict, Any, Tuple
+import sys
+from pathlib import Path
+from typing import List, Dict, Any, Tuple, Union
 from dataclasses import dataclass
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from opensearch_pool import get_client, verifica
+
+# Schema unico delle richieste (OpenSearch/IAM/iam_schema.py), in coda per non coprire i moduli IAM2
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'IAM'))
+from iam_schema import SCHEMA_VERSION, richieste_mappings, richieste_settings
 
 
 # ============================================================================
@@ -40,13 +52,24 @@ OPENSEARCH_CONFIG = {
     'host': 'localhost',
     'port': 9200,
     'auth': ('admin', 'admin'),
-    'use_ssl': False
+    'use_ssl': False,
+    'pool_maxsize': 16
+}
+
+# Estrazione Oracle: parallelismo > 1 legge la finestra a fette di giorni in concorrenza
+ESTRAZIONE_CONFIG = {
+    'parallelismo': 4,
+    'giorni_per_fetta': 1,
+    'arraysize': 5000
 }
 
 # Nomi indici
 INDEX_RICHIESTE = 'iam-richieste'
 INDEX_KPI = 'iam-kpi'
 
+# Indici versionati delle richieste: mapping e settings di iam_schema (versione SCHEMA_VERSION)
+TEMPLATE_RICHIESTE = f"{INDEX_RICHIESTE}-versioni"
+
 
 # ============================================================================
 # DATA CLASSES
@@ -95,10 +118,15 @@ class RichiestaIAM:
             'priorita_secondaria': self.priorita_secondaria,
             'tipo_op_secondaria': self.tipo_op_secondaria,
             'comunicazione_uf': self.comunicazione_uf,
-            'tempo_evasione_ore': self._calcola_tempo_evasione(),
+            'durata_ore': self._calcola_tempo_evasione(),
             'data_inserimento_es': datetime.now().isoformat()
         }
 
+    @property
+    def tempo_evasione_ore(self) -> float:
+        """Ore tra creazione e chiusura (None se la richiesta non è chiusa)"""
+        return self._calcola_tempo_evasione()
+
     def _calcola_tempo_evasione(self) -> float:
         """Calcola ore tra creazione e chiusura"""
         if self.data_creazione and self.data_chiusura:
@@ -107,6 +135,261 @@ class RichiestaIAM:
         return None
 
 
+# Colonne di IAM_RICHIESTE nell'ordine della SELECT, con il tipo di colonna del batch:
+# 'int' int64 (NULL = sentinella), 'str' stringa codificata a dizionario,
+# 'date' datetime64[s] (NULL = NaT), 'text' testo libero (lista Python)
+COLONNE_RICHIESTA = [
+    ('id_richiesta', 'int'),
+    ('fk_id_oggetto', 'int'),
+    ('nome_utenza', 'str'),
+    ('fk_tipo_richiesta', 'str'),
+    ('fk_tipo_utenza', 'str'),
+    ('fk_nome_operazione', 'str'),
+    ('id_richiesta_parent', 'int'),
+    ('data_creazione', 'date'),
+    ('data_chiusura', 'date'),
+    ('fk_utente', 'str'),
+    ('fk_utente_richiedente', 'str'),
+    ('stato', 'str'),
+    ('nota', 'text'),
+    ('flag_transazione', 'str'),
+    ('data_storicizzazione', 'date'),
+    ('priorita_secondaria', 'int'),
+    ('tipo_op_secondaria', 'int'),
+    ('comunicazione_uf', 'text')
+]
+
+INT_NULL = np.iinfo(np.int64).min
+
+
+def _intero(valore) -> int:
+    """
+    Valore di una colonna 'int' (None -> INT_NULL). ValueError/TypeError se non è un
+    intero esatto (es. NUMBER con decimali o stringa non numerica da Oracle)
+    """
+    if valore is None:
+        return INT_NULL
+    if isinstance(valore, (int, np.integer)):
+        return int(valore)
+    intero = int(valore.strip()) if isinstance(valore, str) else int(valore)
+    if not isinstance(valore, str) and intero != valore:
+        raise ValueError(f"valore non intero: {valore!r}")
+    return intero
+
+
+class RichiestaView:
+    """Vista lazy su una riga di RichiestaBatch (stessi attributi di RichiestaIAM)"""
+
+    __slots__ = ('_batch', '_indice')
+
+    def __init__(self, batch: 'RichiestaBatch', indice: int):
+        self._batch = batch
+        self._indice = indice
+
+    def __getattr__(self, nome: str):
+        return self._batch.valore(nome, self._indice)
+
+    @property
+    def tempo_evasione_ore(self) -> float:
+        """Ore tra creazione e chiusura (None se la richiesta non è chiusa)"""
+        durata = self._batch.durata_ore()[self._indice]
+        return None if np.isnan(durata) else float(durata)
+
+    def to_dict(self) -> Dict:
+        """Converte a dict per OpenSearch"""
+        return self._batch.to_dict(self._indice)
+
+
+class RichiestaBatch:
+    """
+    Richieste IAM in formato colonnare: stringhe codificate a dizionario (codici int32),
+    date datetime64[s], interi int64. Le righe sono viste lazy (RichiestaView) e il batch
+    si serializza direttamente in NDJSON per _bulk senza creare un dict per riga.
+    """
+
+    def __init__(self):
+        self._dizionari = {nome: {} for nome, tipo in COLONNE_RICHIESTA if tipo == 'str'}
+        self._etichette = {nome: [] for nome in self._dizionari}
+        self._blocchi = {nome: [] for nome, _ in COLONNE_RICHIESTA}
+        # Colonne 'int' con valori non interi: tenute come lista Python (come 'text')
+        self._interi_testo = set()
+        self._colonne: Dict[str, Any] = {}
+        self._durata = None
+        self._n = 0
+
+    @classmethod
+    def from_rows(cls, rows: List[Tuple]) -> 'RichiestaBatch':
+        """Batch da righe Oracle nell'ordine di COLONNE_RICHIESTA"""
+        batch = cls()
+        batch.aggiungi_righe(rows)
+        return batch
+
+    def _codifica(self, nome: str, valori: List) -> np.ndarray:
+        """Codici del dizionario della colonna, aggiungendo i valori nuovi in ordine di comparsa"""
+        dizionario = self._dizionari[nome]
+        etichette = self._etichette[nome]
+        codici = np.empty(len(valori), dtype=np.int32)
+        for i, valore in enumerate(valori):
+            codice = dizionario.get(valore)
+            if codice is None:
+                codice = dizionario[valore] = len(etichette)
+                etichette.append(valore)
+            codici[i] = codice
+        return codici
+
+    def aggiungi_righe(self, rows: List[Tuple]):
+        """Aggiunge un blocco di righe (es. un fetchmany) convertendolo subito in colonne"""
+        if not rows:
+            return
+
+        for pos, (nome, tipo) in enumerate(COLONNE_RICHIESTA):
+            valori = [row[pos] for row in rows]
+            if tipo == 'str':
+                blocco = self._codifica(nome, valori)
+            elif tipo == 'date':
+                blocco = np.array(valori, dtype='datetime64[s]')
+            elif tipo == 'int' and nome not in self._interi_testo:
+                try:
+                    blocco = np.array([_intero(v) for v in valori], dtype=np.int64)
+                except (TypeError, ValueError, OverflowError) as e:
+                    self._demote_intero(nome, e)
+                    blocco = valori
+            else:
+                blocco = valori
+            self._blocchi[nome].append(blocco)
+
+        self._n += len(rows)
+        self._colonne = {}
+        self._durata = None
+
+    def _demote_intero(self, nome: str, errore: Exception):
+        """Passa una colonna 'int' a lista Python, convertendo i blocchi già caricati"""
+        print(f"⚠ Colonna '{nome}' con valori non interi ({errore}): valori originali senza conversione")
+        self._interi_testo.add(nome)
+        self._blocchi[nome] = [[None if v == INT_NULL else v for v in blocco.tolist()]
+                               if isinstance(blocco, np.ndarray) else blocco
+                               for blocco in self._blocchi[nome]]
+
+    def _tipo(self, nome: str) -> str:
+        """Tipo effettivo della colonna nel batch ('text' per le colonne 'int' declassate)"""
+        return 'text' if nome in self._interi_testo else dict(COLONNE_RICHIESTA)[nome]
+
+    def colonna(self, nome: str):
+        """Colonna consolidata (codici per le stringhe, lista per i testi)"""
+        if nome not in self._colonne:
+            blocchi = self._blocchi[nome]
+            tipo = self._tipo(nome)
+            if tipo == 'text':
+                colonna = [valore for blocco in blocchi for valore in blocco]
+            elif len(blocchi) == 1:
+                colonna = blocchi[0]
+            elif blocchi:
+                colonna = np.concatenate(blocchi)
+            else:
+                colonna = np.empty(0, dtype={'str': np.int32, 'int': np.int64}.get(tipo, 'datetime64[s]'))
+            # Dopo la consolidazione si tiene un solo blocco
+            self._blocchi[nome] = [colonna]
+            self._colonne[nome] = colonna
+        return self._colonne[nome]
+
+    def codici(self, nome: str) -> Tuple[np.ndarray, List]:
+        """(codici, etichette) di una colonna stringa, etichette in ordine di comparsa"""
+        return self.colonna(nome), self._etichette[nome]
+
+    def durata_ore(self) -> np.ndarray:
+        """Ore tra creazione e chiusura (NaN se manca una delle due date)"""
+        if self._durata is None:
+            self._durata = (self.colonna('data_chiusura') - self.colonna('data_creazione')) / np.timedelta64(1, 'h')
+        return self._durata
+
+    def conteggio_valori(self, nome: str) -> Dict[Any, int]:
+        """Conteggio per valore di una colonna stringa"""
+        codici, etichette = self.codici(nome)
+        return dict(zip(etichette, np.bincount(codici, minlength=len(etichette)).tolist()))
+
+    def valore(self, nome: str, indice: int):
+        """Valore Python di una cella"""
+        if nome not in dict(COLONNE_RICHIESTA):
+            raise AttributeError(nome)
+        tipo = self._tipo(nome)
+
+        valore = self.colonna(nome)[indice]
+        if tipo == 'str':
+            return self._etichette[nome][valore]
+        if tipo == 'int':
+            return None if valore == INT_NULL else int(valore)
+        if tipo == 'date':
+            return None if np.isnat(valore) else valore.item()
+        return valore
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __getitem__(self, indice: int) -> RichiestaView:
+        if not -self._n <= indice < self._n:
+            raise IndexError(indice)
+        return RichiestaView(self, indice % self._n)
+
+    def __iter__(self):
+        return (RichiestaView(self, i) for i in range(self._n))
+
+    def _sorgenti(self, inizio: int, fine: int, data_inserimento: str):
+        """Documenti _source delle righe [inizio, fine), con conversioni vettoriali per colonna"""
+        valori = {}
+        for nome, _ in COLONNE_RICHIESTA:
+            tipo = self._tipo(nome)
+            colonna = self.colonna(nome)[inizio:fine]
+            if tipo == 'str':
+                etichette = self._etichette[nome]
+                valori[nome] = [etichette[c] for c in colonna.tolist()]
+            elif tipo == 'int':
+                valori[nome] = [None if v == INT_NULL else v for v in colonna.tolist()]
+            elif tipo == 'date':
+                iso = np.datetime_as_string(colonna, unit='s').tolist()
+                valori[nome] = [None if v == 'NaT' else v for v in iso]
+            else:
+                valori[nome] = colonna
+
+        durata = self.durata_ore()[inizio:fine]
+        valori['durata_ore'] = [None if np.isnan(d) else d for d in durata.tolist()]
+
+        nomi = list(valori)
+        for riga in zip(*valori.values()):
+            documento = dict(zip(nomi, riga))
+            documento['data_inserimento_es'] = data_inserimento
+            yield documento
+
+    def to_dict(self, indice: int) -> Dict:
+        """Documento OpenSearch di una riga (stessa forma di RichiestaIAM.to_dict)"""
+        return next(self._sorgenti(indice, indice + 1, datetime.now().isoformat()))
+
+    def iter_ndjson(self, index_name: str, righe_per_blocco: int = 5000):
+        """Corpi _bulk NDJSON (azione index con _id = id_richiesta) a blocchi di righe"""
+        data_inserimento = datetime.now().isoformat()
+        for inizio in range(0, self._n, righe_per_blocco):
+            fine = min(inizio + righe_per_blocco, self._n)
+            linee = []
+            for documento in self._sorgenti(inizio, fine, data_inserimento):
+                linee.append(json.dumps({'index': {'_index': index_name, '_id': str(documento['id_richiesta'])}}))
+                # default=str: Decimal/valori Oracle delle colonne 'int' declassate
+                linee.append(json.dumps(documento, ensure_ascii=False, default=str))
+            yield '\n'.join(linee) + '\n', fine - inizio
+
+    def memoria_bytes(self) -> int:
+        """Memoria occupata dalle colonne (array + dizionari delle stringhe + testi)"""
+        totale = 0
+        for nome, _ in COLONNE_RICHIESTA:
+            colonna = self.colonna(nome)
+            if self._tipo(nome) == 'text':
+                totale += sys.getsizeof(colonna) + sum(sys.getsizeof(v) for v in colonna if v is not None)
+            else:
+                totale += colonna.nbytes
+        for nome, etichette in self._etichette.items():
+            totale += sys.getsizeof(etichette) + sys.getsizeof(self._dizionari[nome])
+            totale += sum(sys.getsizeof(v) for v in etichette)
+        return totale
+
+
 # ============================================================================
 # LOADER ORACLE
 # ============================================================================
@@ -138,20 +421,8 @@ class IAMOracleLoader:
             print(f"✗ Errore connessione Oracle: {e}")
             raise
 
-    def carica_richieste(self, giorni_indietro: int = 90) -> List[RichiestaIAM]:
-        """
-        Carica richieste degli ultimi N giorni
-
-        Args:
-            giorni_indietro: numero di giorni da caricare
-        """
-        try:
-            cursor = self.connection.cursor()
-
-            data_limite = (datetime.now() - timedelta(days=giorni_indietro)).date()
-
-            query = f"""
-            SELECT 
+    QUERY_RICHIESTE = """
+            SELECT
                 ID_RICHIESTA,
                 FK_ID_OGGETTO,
                 NOME_UTENZA,
@@ -171,44 +442,93 @@ class IAMOracleLoader:
                 TIPO_OP_SECONDARIA,
                 COMUNICAZIONE_UF
             FROM IAM_RICHIESTE
-            WHERE DATA_CREAZIONE >= TO_DATE('{data_limite}', 'YYYY-MM-DD')
-            ORDER BY DATA_CREAZIONE DESC
+            WHERE DATA_CREAZIONE >= :inizio
             """
 
-            cursor.execute(query)
-            rows = cursor.fetchall()
-
-            richieste = []
-            for row in rows:
-                richiesta = RichiestaIAM(
-                    id_richiesta=row[0],
-                    fk_id_oggetto=row[1],
-                    nome_utenza=row[2],
-                    fk_tipo_richiesta=row[3],
-                    fk_tipo_utenza=row[4],
-                    fk_nome_operazione=row[5],
-                    id_richiesta_parent=row[6],
-                    data_creazione=row[7],
-                    data_chiusura=row[8],
-                    fk_utente=row[9],
-                    fk_utente_richiedente=row[10],
-                    stato=row[11],
-                    nota=row[12],
-                    flag_transazione=row[13],
-                    data_storicizzazione=row[14],
-                    priorita_secondaria=row[15],
-                    tipo_op_secondaria=row[16],
-                    comunicazione_uf=row[17]
+    def _fette(self, data_limite: datetime, giorni_per_fetta: int) -> List[Tuple]:
+        """Fette [inizio, fine) di DATA_CREAZIONE da data_limite a oggi; l'ultima è aperta"""
+        oggi = datetime.combine(datetime.now().date(), datetime.min.time())
+        fette, inizio = [], data_limite
+        while inizio <= oggi:
+            fine = inizio + timedelta(days=giorni_per_fetta)
+            fette.append((inizio, fine if fine <= oggi else None))
+            inizio = fine
+        return fette
+
+    def _leggi_fetta(self, connection, inizio: datetime, fine, arraysize: int,
+                     richieste: RichiestaBatch, lock: threading.Lock) -> int:
+        """Legge una fetta (senza ORDER BY) e aggiunge i blocchi al batch condiviso"""
+        query = self.QUERY_RICHIESTE
+        params = {'inizio': inizio}
+        if fine is not None:
+            query += "  AND DATA_CREAZIONE < :fine\n"
+            params['fine'] = fine
+
+        cursor = connection.cursor()
+        cursor.arraysize = arraysize
+        cursor.prefetchrows = arraysize + 1
+        cursor.execute(query, params)
+
+        lette = 0
+        while True:
+            rows = cursor.fetchmany(arraysize)
+            if not rows:
+                break
+            with lock:
+                richieste.aggiungi_righe(rows)
+            lette += len(rows)
+
+        cursor.close()
+        return lette
+
+    def carica_richieste(self, giorni_indietro: int = 90, arraysize: int = 5000,
+                         parallelismo: int = 1, giorni_per_fetta: int = 1) -> RichiestaBatch:
+        """
+        Carica richieste degli ultimi N giorni in un RichiestaBatch colonnare
+
+        Args:
+            giorni_indietro: numero di giorni da caricare
+            arraysize: righe per fetchmany (ogni blocco è convertito subito in colonne)
+            parallelismo: connessioni concorrenti; > 1 divide la finestra in fette di giorni
+            giorni_per_fetta: ampiezza delle fette (1 = giornaliere, 7 = settimanali)
+        """
+        data_limite = datetime.combine((datetime.now() - timedelta(days=giorni_indietro)).date(),
+                                       datetime.min.time())
+        richieste = RichiestaBatch()
+        lock = threading.Lock()
+        start = time.time()
+
+        try:
+            if parallelismo <= 1:
+                self._leggi_fetta(self.connection, data_limite, None, arraysize, richieste, lock)
+            else:
+                fette = self._fette(data_limite, giorni_per_fetta)
+                pool = oracledb.create_pool(
+                    user=self.config['user'],
+                    password=self.config['password'],
+                    dsn=oracledb.makedsn(self.config['host'], self.config['port'],
+                                         service_name=self.config['service_name']),
+                    min=1, max=parallelismo, increment=1
                 )
-                richieste.append(richiesta)
 
-            print(f"✓ Caricate {len(richieste)} richieste da Oracle")
-            cursor.close()
+                def leggi(fetta):
+                    with pool.acquire() as connection:
+                        return self._leggi_fetta(connection, fetta[0], fetta[1], arraysize, richieste, lock)
+
+                try:
+                    with ThreadPoolExecutor(max_workers=parallelismo) as executor:
+                        list(executor.map(leggi, fette))
+                finally:
+                    pool.close(force=True)
+
+                print(f"  {len(fette)} fette da {giorni_per_fetta} giorni, {parallelismo} connessioni")
+
+            print(f"✓ Caricate {len(richieste)} richieste da Oracle ({time.time() - start:.1f}s)")
             return richieste
 
         except Exception as e:
             print(f"✗ Errore caricamento dati: {e}")
-            return []
+            return RichiestaBatch()
 
     def chiudi(self):
         """Chiude connessione"""
@@ -224,73 +544,156 @@ class IAMOpenSearchManager:
     """Gestisce indici e visualizzazioni su OpenSearch"""
 
     def __init__(self, config: Dict):
-        """Inizializza client OpenSearch"""
-        self.client = OpenSearch(
-            hosts=[{'host': config['host'], 'port': config['port']}],
-            http_auth=config['auth'],
-            use_ssl=config['use_ssl'],
-            verify_certs=False,
-            ssl_show_warn=False,
-            timeout=30,
-            max_retries=3
+        """
+        Client condiviso di opensearch_pool: stesso pool urllib3 per tutti i manager
+        dello stesso endpoint (es. un ciclo dello scheduler dopo l'altro), nessun
+        handshake nel costruttore
+        """
+        self.client = get_client(
+            host=config['host'],
+            port=config['port'],
+            auth=config.get('auth'),
+            use_ssl=config.get('use_ssl'),
+            pool_maxsize=config.get('pool_maxsize')
         )
-        self._verifica_connessione()
 
     def _verifica_connessione(self):
-        """Verifica connessione a OpenSearch"""
+        """Verifica connessione a OpenSearch (info() solo alla prima verifica del client)"""
         try:
-            info = self.client.info()
+            info = verifica(self.client)
             print(f"✓ Connesso a OpenSearch {info['version']['number']}")
         except Exception as e:
             print(f"✗ Errore OpenSearch: {e}")
             raise
 
-    def crea_indice_richieste(self):
-        """Crea indice per richieste IAM"""
-        mappings = {
-            'properties': {
-                'id_richiesta': {'type': 'keyword'},
-                'fk_id_oggetto': {'type': 'integer'},
-                'nome_utenza': {'type': 'text', 'fields': {'keyword': {'type': 'keyword'}}},
-                'fk_tipo_richiesta': {'type': 'keyword'},
-                'fk_tipo_utenza': {'type': 'keyword'},
-                'fk_nome_operazione': {'type': 'keyword'},
-                'id_richiesta_parent': {'type': 'integer'},
-                'data_creazione': {'type': 'date'},
-                'data_chiusura': {'type': 'date'},
-                'fk_utente': {'type': 'keyword'},
-                'fk_utente_richiedente': {'type': 'keyword'},
-                'stato': {'type': 'keyword'},
-                'nota': {'type': 'text'},
-                'flag_transazione': {'type': 'keyword'},
-                'data_storicizzazione': {'type': 'date'},
-                'priorita_secondaria': {'type': 'integer'},
-                'tipo_op_secondaria': {'type': 'integer'},
-                'comunicazione_uf': {'type': 'text'},
-                'tempo_evasione_ore': {'type': 'float'},
-                'data_inserimento_es': {'type': 'date'}
+    def installa_template_richieste(self):
+        """
+        Index template versionato degli indici iam-richieste-v*: stesso schema di OpenSearch/IAM
+        (iam_schema.richieste_mappings/richieste_settings, index sort statico su data_creazione:
+        vale per gli indici creati dopo l'installazione)
+        """
+        self.client.indices.put_index_template(name=TEMPLATE_RICHIESTE, body={
+            'index_patterns': [f"{INDEX_RICHIESTE}-v*"],
+            'priority': 100,
+            'version': SCHEMA_VERSION,
+            'template': {
+                'settings': richieste_settings(shards=2),
+                'mappings': richieste_mappings()
             }
-        }
+        })
 
-        settings = {
-            'number_of_shards': 2,
-            'number_of_replicas': 0,
-            'index': {'refresh_interval': '5s'}
-        }
+    def crea_indice_richieste(self) -> str:
+        """
+        Crea un nuovo indice versionato per le richieste IAM (iam-richieste-vAAAAMMGGhhmmss).
+        L'alias INDEX_RICHIESTE non viene toccato: i lettori continuano sull'indice attivo
+        finché attiva_indice_richieste() non sposta l'alias.
+        """
+        self.installa_template_richieste()
+
+        # Fase di caricamento: niente refresh né repliche, ripristinati prima dello swap
+        settings = {'index': {'refresh_interval': '-1'}}
+
+        nuovo_indice = f"{INDEX_RICHIESTE}-v{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        self.client.indices.create(
+            index=nuovo_indice,
+            body={'settings': settings}
+        )
+        print(f"✓ Creazione indice versionato '{nuovo_indice}' (schema v{SCHEMA_VERSION})")
+        return nuovo_indice
 
+    def _indici_alias(self, alias: str = INDEX_RICHIESTE) -> List[str]:
+        """Indici attualmente dietro l'alias"""
         try:
-            if self.client.indices.exists(index=INDEX_RICHIESTE):
-                self.client.indices.delete(index=INDEX_RICHIESTE)
-                print(f"⚠ Indice '{INDEX_RICHIESTE}' ricreato")
-            else:
-                print(f"✓ Creazione indice '{INDEX_RICHIESTE}'")
+            if not self.client.indices.exists_alias(name=alias):
+                return []
+            return list(self.client.indices.get_alias(name=alias).keys())
+        except Exception:
+            return []
 
-            self.client.indices.create(
-                index=INDEX_RICHIESTE,
-                body={'mappings': mappings, 'settings': settings}
-            )
+    def _versioni_richieste(self) -> List[str]:
+        """Indici versionati delle richieste, dal più vecchio al più recente"""
+        try:
+            return sorted(self.client.indices.get(index=f"{INDEX_RICHIESTE}-v*").keys())
+        except Exception:
+            return []
+
+    def attiva_indice_richieste(self, nuovo_indice: str, versioni_mantenute: int = 1):
+        """
+        Sposta atomicamente l'alias INDEX_RICHIESTE sul nuovo indice con una sola chiamata
+        _aliases, poi elimina le versioni oltre le ultime `versioni_mantenute` precedenti
+        (tenute per il rollback)
+        """
+        actions = [{'remove': {'index': indice, 'alias': INDEX_RICHIESTE}}
+                   for indice in self._indici_alias() if indice != nuovo_indice]
+
+        # Primo passaggio dal vecchio indice concreto: rimosso nella stessa chiamata atomica
+        if self.client.indices.exists(index=INDEX_RICHIESTE) and not self._indici_alias():
+            actions.append({'remove_index': {'index': INDEX_RICHIESTE}})
+            print(f"⚠ Indice non versionato '{INDEX_RICHIESTE}' sostituito dall'alias (nessun rollback)")
+
+        actions.append({'add': {'index': nuovo_indice, 'alias': INDEX_RICHIESTE}})
+        self.client.indices.update_aliases(body={'actions': actions})
+        print(f"✓ Alias '{INDEX_RICHIESTE}' → '{nuovo_indice}'")
+
+        self._gc_versioni(versioni_mantenute)
+
+    def _gc_versioni(self, versioni_mantenute: int):
+        """Elimina le versioni non attive più vecchie delle ultime `versioni_mantenute`"""
+        attivi = set(self._indici_alias())
+        precedenti = [indice for indice in self._versioni_richieste() if indice not in attivi]
+        da_eliminare = precedenti[:max(0, len(precedenti) - versioni_mantenute)]
+
+        for indice in da_eliminare:
+            self.client.indices.delete(index=indice)
+            print(f"🗑 Eliminata versione '{indice}'")
+
+    def rollback_indice_richieste(self) -> bool:
+        """Riporta l'alias sulla versione precedente a quella attiva"""
+        attivi = self._indici_alias()
+        precedenti = [indice for indice in self._versioni_richieste()
+                      if attivi and indice < min(attivi)]
+        if not precedenti:
+            print("✗ Nessuna versione precedente disponibile per il rollback")
+            return False
+
+        actions = [{'remove': {'index': indice, 'alias': INDEX_RICHIESTE}} for indice in attivi]
+        actions.append({'add': {'index': precedenti[-1], 'alias': INDEX_RICHIESTE}})
+        self.client.indices.update_aliases(body={'actions': actions})
+        print(f"↩ Rollback: alias '{INDEX_RICHIESTE}' → '{precedenti[-1]}'")
+        return True
+
+    def ricostruisci_indice_richieste(self, richieste: Union[RichiestaBatch, List[RichiestaIAM]],
+                                      versioni_mantenute: int = 1) -> int:
+        """
+        Ricostruzione blue/green: carica tutto in un nuovo indice versionato e sposta l'alias
+        solo a caricamento completo e verificato (nessun errore bulk, documenti presenti =
+        righe da caricare). In caso di errore l'alias resta sull'indice precedente e il
+        nuovo indice viene eliminato.
+        """
+        nuovo_indice = None
+        try:
+            nuovo_indice = self.crea_indice_richieste()
+            attese = len(richieste)
+            inserite, fallite = self._inserisci(richieste, index_name=nuovo_indice, refresh=False)
+            if fallite:
+                raise RuntimeError(f"{fallite} richieste non inserite su {attese}")
+
+            self.client.indices.put_settings(index=nuovo_indice, body={'index': {'refresh_interval': '5s'}})
+            self.client.indices.refresh(index=nuovo_indice)
+
+            # Confronto con le righe caricate da Oracle, non con le inserite: un bulk
+            # parziale non deve mai arrivare ai lettori
+            presenti = self.client.count(index=nuovo_indice)['count']
+            if not attese or presenti != attese:
+                raise RuntimeError(f"indice incompleto ({presenti} documenti, {attese} attesi)")
+
+            self.attiva_indice_richieste(nuovo_indice, versioni_mantenute)
+            return inserite
         except Exception as e:
-            print(f"✗ Errore creazione indice: {e}")
+            print(f"✗ Ricostruzione indice fallita, alias invariato: {e}")
+            if nuovo_indice and self.client.indices.exists(index=nuovo_indice):
+                self.client.indices.delete(index=nuovo_indice)
+            return 0
 
     def crea_indice_kpi(self):
         """Crea indice per KPI"""
@@ -323,12 +726,24 @@ class IAMOpenSearchManager:
         except Exception as e:
             print(f"✗ Errore creazione indice KPI: {e}")
 
-    def inserisci_richieste(self, richieste: List[RichiestaIAM]) -> int:
-        """Inserisce richieste in bulk"""
+    def inserisci_richieste(self, richieste: Union[RichiestaBatch, List[RichiestaIAM]],
+                            index_name: str = INDEX_RICHIESTE, refresh: bool = True) -> int:
+        """Inserisce richieste in bulk (default tramite l'alias dell'indice attivo)"""
+        return self._inserisci(richieste, index_name, refresh)[0]
+
+    def _inserisci(self, richieste: Union[RichiestaBatch, List[RichiestaIAM]],
+                   index_name: str, refresh: bool) -> Tuple[int, int]:
+        """
+        Inserimento bulk che ritorna (inserite, fallite): un errore a metà caricamento
+        conta come fallite tutte le righe non confermate da _bulk
+        """
+        if isinstance(richieste, RichiestaBatch):
+            return self._inserisci_batch(richieste, index_name, refresh)
+
         try:
             actions = [
                 {
-                    '_index': INDEX_RICHIESTE,
+                    '_index': index_name,
                     '_id': str(r.id_richiesta),
                     '_source': r.to_dict()
                 }
@@ -339,15 +754,36 @@ class IAMOpenSearchManager:
                 self.client,
                 actions,
                 raise_on_error=False,
-                refresh=True
+                refresh=refresh
             )
 
             print(f"✓ Inserite {success} richieste ({len(failed)} errori)")
-            return success
+            return success, len(failed)
 
         except Exception as e:
             print(f"✗ Errore inserimento: {e}")
-            return 0
+            return 0, len(richieste)
+
+    def _inserisci_batch(self, batch: RichiestaBatch, index_name: str, refresh: bool) -> Tuple[int, int]:
+        """Invia il batch come corpi NDJSON già serializzati, un blocco di righe per _bulk"""
+        success = errori = 0
+        try:
+            for corpo, righe in batch.iter_ndjson(index_name):
+                response = self.client.bulk(body=corpo)
+                falliti = sum(1 for item in response['items'] if item['index'].get('error')) \
+                    if response.get('errors') else 0
+                success += righe - falliti
+                errori += falliti
+
+            if refresh:
+                self.client.indices.refresh(index=index_name)
+
+            print(f"{'✓' if not errori else '⚠'} Inserite {success} richieste ({errori} errori)")
+            return success, errori
+
+        except Exception as e:
+            print(f"✗ Errore inserimento dopo {success} richieste: {e}")
+            return success, len(batch) - success
 
     def inserisci_kpi(self, kpi_list: List[Dict]):
         """Inserisce KPI"""
@@ -382,198 +818,148 @@ class IAMKPIAnalyzer:
     def __init__(self, client: OpenSearch):
         self.client = client
 
-    def calcola_tutti_kpi(self, richieste: List[RichiestaIAM]) -> List[Dict]:
-        """Calcola tutti i KPI"""
-        kpi_list = []
-
-        # KPI 1: Tempo medio evasione per operazione
-        kpi_list.extend(self._kpi_tempo_medio_operazione(richieste))
-
-        # KPI 2: Tasso di evasione
-        kpi_list.append(self._kpi_tasso_evasione(richieste))
-
-        # KPI 3: Richieste per stato
-        kpi_list.extend(self._kpi_richieste_per_stato(richieste))
-
-        # KPI 4: Operazioni più frequenti
-        kpi_list.extend(self._kpi_operazioni_frequenti(richieste))
-
-        # KPI 5: SLA (90% evaso entro 24h)
-        kpi_list.append(self._kpi_sla_24h(richieste))
-
-        # KPI 6: Richieste in backlog
-        kpi_list.append(self._kpi_backlog(richieste))
-
-        # KPI 7: Tempo medio per tipo utenza
-        kpi_list.extend(self._kpi_tempo_per_tipo_utenza(richieste))
-
-        return kpi_list
-
-    def _kpi_tempo_medio_operazione(self, richieste: List[RichiestaIAM]) -> List[Dict]:
-        """Tempo medio evasione per operazione"""
-        operazioni = {}
-
-        for r in richieste:
-            if r.fk_nome_operazione not in operazioni:
-                operazioni[r.fk_nome_operazione] = []
-            if r.tempo_evasione_ore is not None:
-                operazioni[r.fk_nome_operazione].append(r.tempo_evasione_ore)
-
-        kpi_list = []
-        for op, tempi in operazioni.items():
-            if tempi:
-                kpi = {
-                    'timestamp': datetime.now().isoformat(),
-                    'nome_kpi': f'Tempo medio evasione - {op}',
-                    'valore': round(statistics.mean(tempi), 2),
-                    'unita_misura': 'ore',
-                    'periodo': 'ultimo_caricamento',
-                    'descrizione': f'Tempo medio evasione per operazione {op}',
-                    'soglia_warning': 24,
-                    'soglia_critical': 48,
-                    'stato_kpi': self._stato_kpi(round(statistics.mean(tempi), 2), 24, 48)
-                }
-                kpi_list.append(kpi)
-
-        return kpi_list
-
-    def _kpi_tasso_evasione(self, richieste: List[RichiestaIAM]) -> Dict:
-        """Percentuale richieste evase"""
-        if not richieste:
-            return {}
-
-        evase = len([r for r in richieste if r.stato == 'EVASA'])
-        tasso = (evase / len(richieste)) * 100
+    @classmethod
+    def _colonne(cls, richieste: Union[RichiestaBatch, List[RichiestaIAM]]) -> Dict[str, Any]:
+        """Colonne NumPy per il calcolo KPI (lette dal batch o da una sola scansione della lista)"""
+        if isinstance(richieste, RichiestaBatch):
+            # Il dizionario del batch è già in ordine di comparsa
+            colonne = {'durata_ore': richieste.durata_ore()}
+            for chiave, chiave_etichette, colonna in (('operazione', 'operazioni', 'fk_nome_operazione'),
+                                                      ('tipo_utenza', 'tipi_utenza', 'fk_tipo_utenza'),
+                                                      ('stato', 'stati', 'stato')):
+                codici, etichette = richieste.codici(colonna)
+                colonne[chiave] = codici
+                colonne[chiave_etichette] = ['None' if e is None else str(e) for e in etichette]
+            return colonne
+
+        # Codifica a dizionario nella stessa passata (come RichiestaBatch._codifica):
+        # codici in ordine di prima comparsa, senza array di stringhe né ordinamenti
+        n = len(richieste)
+        op_diz, tipo_diz, stato_diz = {}, {}, {}
+        op_cod = np.empty(n, dtype=np.int32)
+        tipo_cod = np.empty(n, dtype=np.int32)
+        stato_cod = np.empty(n, dtype=np.int32)
+        # Durata calcolata nella stessa passata: la conversione di datetime Python in
+        # datetime64 costerebbe più dell'intero calcolo; NaN se manca creazione o chiusura
+        durata = np.full(n, np.nan)
+        for i, r in enumerate(richieste):
+            op_cod[i] = op_diz.setdefault(r.fk_nome_operazione, len(op_diz))
+            tipo_cod[i] = tipo_diz.setdefault(r.fk_tipo_utenza, len(tipo_diz))
+            stato_cod[i] = stato_diz.setdefault(r.stato, len(stato_diz))
+            if r.data_creazione and r.data_chiusura:
+                durata[i] = (r.data_chiusura - r.data_creazione).total_seconds()
+
+        op_etichette, tipo_etichette, stato_etichette = (
+            ['None' if v is None else str(v) for v in dizionario] for dizionario in (op_diz, tipo_diz, stato_diz)
+        )
+        return {
+            'operazione': op_cod, 'operazioni': op_etichette,
+            'tipo_utenza': tipo_cod, 'tipi_utenza': tipo_etichette,
+            'stato': stato_cod, 'stati': stato_etichette,
+            'durata_ore': durata / 3600
+        }
 
+    @staticmethod
+    def _media_per_gruppo(codici: np.ndarray, durata: np.ndarray, n_gruppi: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Conteggio e media della durata per gruppo (solo durate valorizzate)"""
+        valide = ~np.isnan(durata)
+        conteggi = np.bincount(codici[valide], minlength=n_gruppi)
+        somme = np.bincount(codici[valide], weights=durata[valide], minlength=n_gruppi)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return conteggi, somme / conteggi
+
+    def _kpi(self, timestamp: str, nome: str, valore, unita: str, descrizione: str,
+             soglia_warning=None, soglia_critical=None, stato_kpi: str = 'OK') -> Dict:
+        """Documento KPI per l'indice iam-kpi"""
         return {
-            'timestamp': datetime.now().isoformat(),
-            'nome_kpi': 'Tasso di evasione',
-            'valore': round(tasso, 2),
-            'unita_misura': '%',
+            'timestamp': timestamp,
+            'nome_kpi': nome,
+            'valore': valore,
+            'unita_misura': unita,
             'periodo': 'ultimo_caricamento',
-            'descrizione': f'{evase} richieste evase su {len(richieste)}',
-            'soglia_warning': 80,
-            'soglia_critical': 70,
-            'stato_kpi': self._stato_kpi(tasso, 80, 70, reverse=True)
+            'descrizione': descrizione,
+            'soglia_warning': soglia_warning,
+            'soglia_critical': soglia_critical,
+            'stato_kpi': stato_kpi
         }
 
-    def _kpi_richieste_per_stato(self, richieste: List[RichiestaIAM]) -> List[Dict]:
-        """Conteggio richieste per stato"""
-        stati = {}
-
-        for r in richieste:
-            if r.stato not in stati:
-                stati[r.stato] = 0
-            stati[r.stato] += 1
-
-        kpi_list = []
-        for stato, count in stati.items():
-            kpi = {
-                'timestamp': datetime.now().isoformat(),
-                'nome_kpi': f'Richieste {stato}',
-                'valore': count,
-                'unita_misura': 'numero',
-                'periodo': 'ultimo_caricamento',
-                'descrizione': f'Conteggio richieste nello stato {stato}',
-                'soglia_warning': None,
-                'soglia_critical': None,
-                'stato_kpi': 'OK'
-            }
-            kpi_list.append(kpi)
-
-        return kpi_list
-
-    def _kpi_operazioni_frequenti(self, richieste: List[RichiestaIAM]) -> List[Dict]:
-        """Top 5 operazioni"""
-        operazioni = {}
+    def calcola_tutti_kpi(self, richieste: Union[RichiestaBatch, List[RichiestaIAM]]) -> List[Dict]:
+        """
+        Calcola tutti i KPI in un'unica passata vettoriale: le richieste sono convertite
+        una volta in colonne (codici operazione/stato/tipo utenza, durata in ore) e i
+        group-by sono bincount sui codici
+        """
+        if not len(richieste):
+            return []
 
-        for r in richieste:
-            if r.fk_nome_operazione not in operazioni:
-                operazioni[r.fk_nome_operazione] = 0
-            operazioni[r.fk_nome_operazione] += 1
+        col = self._colonne(richieste)
+        timestamp = datetime.now().isoformat()
+        durata = col['durata_ore']
+        totale = len(durata)
 
-        sorted_ops = sorted(operazioni.items(), key=lambda x: x[1], reverse=True)[:5]
+        evasa = col['stati'].index('EVASA') if 'EVASA' in col['stati'] else -1
+        mask_evase = col['stato'] == evasa
+        n_evase = int(mask_evase.sum())
 
         kpi_list = []
-        for op, count in sorted_ops:
-            kpi = {
-                'timestamp': datetime.now().isoformat(),
-                'nome_kpi': f'Frequenza - {op}',
-                'valore': count,
-                'unita_misura': 'numero',
-                'periodo': 'ultimo_caricamento',
-                'descrizione': f'Numero richieste per operazione {op}',
-                'soglia_warning': None,
-                'soglia_critical': None,
-                'stato_kpi': 'OK'
-            }
-            kpi_list.append(kpi)
 
-        return kpi_list
-
-    def _kpi_sla_24h(self, richieste: List[RichiestaIAM]) -> Dict:
-        """SLA: % evase entro 24h"""
-        richieste_evase = [r for r in richieste if r.stato == 'EVASA']
-
-        if not richieste_evase:
-            sla = 0
-        else:
-            entro_24h = len([r for r in richieste_evase if r.tempo_evasione_ore and r.tempo_evasione_ore <= 24])
-            sla = (entro_24h / len(richieste_evase)) * 100
-
-        return {
-            'timestamp': datetime.now().isoformat(),
-            'nome_kpi': 'SLA 24h',
-            'valore': round(sla, 2),
-            'unita_misura': '%',
-            'periodo': 'ultimo_caricamento',
-            'descrizione': 'Percentuale richieste evase entro 24 ore',
-            'soglia_warning': 85,
-            'soglia_critical': 75,
-            'stato_kpi': self._stato_kpi(sla, 85, 75, reverse=True)
-        }
-
-    def _kpi_backlog(self, richieste: List[RichiestaIAM]) -> Dict:
-        """Richieste in backlog (non evase)"""
-        backlog = len([r for r in richieste if r.stato != 'EVASA'])
-
-        return {
-            'timestamp': datetime.now().isoformat(),
-            'nome_kpi': 'Backlog',
-            'valore': backlog,
-            'unita_misura': 'numero',
-            'periodo': 'ultimo_caricamento',
-            'descrizione': 'Numero richieste non ancora evase',
-            'soglia_warning': 50,
-            'soglia_critical': 100,
-            'stato_kpi': self._stato_kpi(backlog, 50, 100)
-        }
+        # KPI 1: Tempo medio evasione per operazione
+        conteggi, medie = self._media_per_gruppo(col['operazione'], durata, len(col['operazioni']))
+        for op, n, media in zip(col['operazioni'], conteggi, medie):
+            if n:
+                valore = round(float(media), 2)
+                kpi_list.append(self._kpi(
+                    timestamp, f'Tempo medio evasione - {op}', valore, 'ore',
+                    f'Tempo medio evasione per operazione {op}', 24, 48, self._stato_kpi(valore, 24, 48)
+                ))
 
-    def _kpi_tempo_per_tipo_utenza(self, richieste: List[RichiestaIAM]) -> List[Dict]:
-        """Tempo medio per tipo utenza"""
-        tipi_utenza = {}
+        # KPI 2: Tasso di evasione
+        tasso = n_evase / totale * 100
+        kpi_list.append(self._kpi(
+            timestamp, 'Tasso di evasione', round(tasso, 2), '%',
+            f'{n_evase} richieste evase su {totale}', 80, 70, self._stato_kpi(tasso, 80, 70, reverse=True)
+        ))
 
-        for r in richieste:
-            if r.fk_tipo_utenza not in tipi_utenza:
-                tipi_utenza[r.fk_tipo_utenza] = []
-            if r.tempo_evasione_ore is not None:
-                tipi_utenza[r.fk_tipo_utenza].append(r.tempo_evasione_ore)
+        # KPI 3: Richieste per stato
+        for stato, count in zip(col['stati'], np.bincount(col['stato'], minlength=len(col['stati']))):
+            kpi_list.append(self._kpi(
+                timestamp, f'Richieste {stato}', int(count), 'numero',
+                f'Conteggio richieste nello stato {stato}'
+            ))
+
+        # KPI 4: Operazioni più frequenti (top 5, a parità di conteggio ordine di comparsa)
+        frequenze = np.bincount(col['operazione'], minlength=len(col['operazioni']))
+        for idx in np.argsort(-frequenze, kind='stable')[:5]:
+            op = col['operazioni'][idx]
+            kpi_list.append(self._kpi(
+                timestamp, f'Frequenza - {op}', int(frequenze[idx]), 'numero',
+                f'Numero richieste per operazione {op}'
+            ))
+
+        # KPI 5: SLA (% evase entro 24h)
+        entro_24h = int(np.count_nonzero(mask_evase & (durata <= 24)))
+        sla = entro_24h / n_evase * 100 if n_evase else 0
+        kpi_list.append(self._kpi(
+            timestamp, 'SLA 24h', round(sla, 2), '%',
+            'Percentuale richieste evase entro 24 ore', 85, 75, self._stato_kpi(sla, 85, 75, reverse=True)
+        ))
+
+        # KPI 6: Richieste in backlog (non evase)
+        backlog = totale - n_evase
+        kpi_list.append(self._kpi(
+            timestamp, 'Backlog', backlog, 'numero',
+            'Numero richieste non ancora evase', 50, 100, self._stato_kpi(backlog, 50, 100)
+        ))
 
-        kpi_list = []
-        for tipo, tempi in tipi_utenza.items():
-            if tempi:
-                kpi = {
-                    'timestamp': datetime.now().isoformat(),
-                    'nome_kpi': f'Tempo medio - {tipo}',
-                    'valore': round(statistics.mean(tempi), 2),
-                    'unita_misura': 'ore',
-                    'periodo': 'ultimo_caricamento',
-                    'descrizione': f'Tempo medio evasione per tipo utenza {tipo}',
-                    'soglia_warning': 24,
-                    'soglia_critical': 48,
-                    'stato_kpi': self._stato_kpi(round(statistics.mean(tempi), 2), 24, 48)
-                }
-                kpi_list.append(kpi)
+        # KPI 7: Tempo medio per tipo utenza
+        conteggi, medie = self._media_per_gruppo(col['tipo_utenza'], durata, len(col['tipi_utenza']))
+        for tipo, n, media in zip(col['tipi_utenza'], conteggi, medie):
+            if n:
+                valore = round(float(media), 2)
+                kpi_list.append(self._kpi(
+                    timestamp, f'Tempo medio - {tipo}', valore, 'ore',
+                    f'Tempo medio evasione per tipo utenza {tipo}', 24, 48, self._stato_kpi(valore, 24, 48)
+                ))
 
         return kpi_list
 
@@ -622,23 +1008,23 @@ class IAMDashboardOrchestrator:
             # 2. Connessione OpenSearch
             print("\n[2] Connessione a OpenSearch...")
             self.opensearch_manager = IAMOpenSearchManager(OPENSEARCH_CONFIG)
+            self.opensearch_manager._verifica_connessione()
 
-            # 3. Creazione indici
+            # 3. Creazione indici (le richieste vanno in un indice versionato, vedi punto 5)
             print("\n[3] Creazione indici...")
-            self.opensearch_manager.crea_indice_richieste()
             self.opensearch_manager.crea_indice_kpi()
 
             # 4. Caricamento dati
             print(f"\n[4] Caricamento richieste (ultimi {giorni_indietro} giorni)...")
-            richieste = self.oracle_loader.carica_richieste(giorni_indietro)
+            richieste = self.oracle_loader.carica_richieste(giorni_indietro, **ESTRAZIONE_CONFIG)
 
             if not richieste:
                 print("✗ Nessuna richiesta caricata")
                 return
 
-            # 5. Inserimento in OpenSearch
+            # 5. Inserimento in OpenSearch: nuovo indice versionato + swap atomico dell'alias
             print("\n[5] Inserimento in OpenSearch...")
-            self.opensearch_manager.inserisci_richieste(richieste)
+            self.opensearch_manager.ricostruisci_indice_richieste(richieste)
 
             # 6. Calcolo KPI
             print("\n[6] Calcolo KPI...")
@@ -658,7 +1044,7 @@ class IAMDashboardOrchestrator:
             if self.oracle_loader:
                 self.oracle_loader.chiudi()
 
-    def _stampa_riepilogo(self, richieste: List[RichiestaIAM], kpi_list: List[Dict]):
+    def _stampa_riepilogo(self, richieste: RichiestaBatch, kpi_list: List[Dict]):
         """Stampa riepilogo"""
         print("\n" + "=" * 80)
         print("📊 RIEPILOGO")
@@ -669,9 +1055,10 @@ class IAMDashboardOrchestrator:
         print(f"   KPI calcolati: {len(kpi_list)}")
 
         # Statistiche richieste
-        evase = len([r for r in richieste if r.stato == 'EVASA'])
-        non_evase = len([r for r in richieste if r.stato == 'NON EVASA'])
-        annullate = len([r for r in richieste if r.stato == 'ANNULLATA'])
+        per_stato = richieste.conteggio_valori('stato')
+        evase = per_stato.get('EVASA', 0)
+        non_evase = per_stato.get('NON EVASA', 0)
+        annullate = per_stato.get('ANNULLATA', 0)
 
         print(f"\n📋 STATI:")
         print(f"   ✓ Evase: {evase}")
@@ -696,7 +1083,7 @@ class IAMDashboardOrchestrator:
         print("\n2️⃣  CREA INDEX PATTERN:")
         print(f"   a) Management (⚙️) → Index Patterns")
         print(f"   b) Create Index Pattern")
-        print(f"   c) Scrivi: {INDEX_RICHIESTE}*")
+        print(f"   c) Scrivi: {INDEX_RICHIESTE} (alias, senza * per non includere le versioni)")
         print(f"   d) Time field: data_creazione")
 
         print("\n3️⃣  VISUALIZZAZIONI CONSIGLIATE:")
@@ -707,7 +1094,7 @@ class IAMDashboardOrchestrator:
         print("   • Data Table: KPI stato")
 
         print("\n4️⃣  QUERY UTILI DA PROVARE:")
-        print("   • Stato = EVASA AND tempo_evasione_ore > 24")
+        print("   • Stato = EVASA AND durata_ore > 24")
         print("   • fk_nome_operazione = RESET_PASSWORD_ACCOUNT")
 
         print("\n" + "=" * 80)
@@ -4,12 +4,18 @@ IAM RICHIESTE - OpenSearch Visualizations
 
 Crea visualizzazioni automatiche su OpenSearch Dashboard
 Script complementare a iam_opensearch_dashboard.py
+
+Gli oggetti vengono raccolti in un bundle NDJSON (dashboard_provisioning.py)
+e pubblicati con un'unica chiamata _import?overwrite=true.
 """
 
 import requests
-import json
+import sys
+from pathlib import Path
 from typing import Dict, List, Optional
-from datetime import datetime
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from dashboard_provisioning import SavedObjectsBundle
 
 
 class IAMVisualizationsCreator:
@@ -25,6 +31,7 @@ class IAMVisualizationsCreator:
         }
         self.session = requests.Session()
         self.session.auth = self.auth
+        self.bundle = SavedObjectsBundle()
         self._verifica_connessione()
 
     def _verifica_connessione(self):
@@ -45,45 +52,12 @@ class IAMVisualizationsCreator:
             raise
 
     def crea_index_pattern(self, index_pattern='iam-richieste', time_field='data_creazione') -> bool:
-        """Crea index pattern"""
-        try:
-            # Verifica se esiste
-            response = self.session.get(
-                f"{self.base_url}/api/saved_objects/index-pattern/{index_pattern}",
-                headers=self.headers
-            )
-
-            if response.status_code == 200:
-                print(f"⚠ Index pattern '{index_pattern}' già presente")
-                return True
-
-            # Crea nuovo
-            data = {
-                'attributes': {
-                    'title': index_pattern,
-                    'timeFieldName': time_field,
-                    'fields': '[]'
-                }
-            }
-
-            response = self.session.post(
-                f"{self.base_url}/api/saved_objects/index-pattern/{index_pattern}",
-                json=data,
-                headers=self.headers
-            )
-
-            if response.status_code == 200:
-                print(f"✓ Index pattern '{index_pattern}' creato")
-                return True
-            else:
-                print(f"✗ Errore: {response.text[:100]}")
-                return False
-
-        except Exception as e:
-            print(f"✗ Errore: {e}")
-            return False
+        """Aggiunge l'index pattern al bundle"""
+        self.bundle.index_pattern(index_pattern, time_field=time_field)
+        print(f"✓ Index pattern '{index_pattern}' aggiunto al bundle")
+        return True
 
-    def crea_tutte_visualizzazioni(self, index_pattern='iam-richieste*') -> List[str]:
+    def crea_tutte_visualizzazioni(self, index_pattern='iam-richieste') -> List[str]:
         """Crea tutte le visualizzazioni IAM"""
         visualizzazioni = []
 
@@ -112,7 +86,7 @@ class IAMVisualizationsCreator:
             'aggs': [
                 {'id': '1', 'enabled': True, 'type': 'count', 'schema': 'metric', 'params': {}},
                 {'id': '2', 'enabled': True, 'type': 'terms', 'schema': 'segment',
-                 'params': {'field': 'fk_nome_operazione.keyword', 'size': 10, 'order': 'desc', 'orderBy': '1'}}
+                 'params': {'field': 'fk_nome_operazione', 'size': 10, 'order': 'desc', 'orderBy': '1'}}
             ]
         }
         vis_id = self._crea_visualizzazione('IAM - Top 10 Operazioni', 'histogram', index_pattern, config)
@@ -139,7 +113,7 @@ class IAMVisualizationsCreator:
             'params': {'fontSize': '60'},
             'aggs': [
                 {'id': '1', 'enabled': True, 'type': 'avg', 'schema': 'metric',
-                 'params': {'field': 'tempo_evasione_ore'}}
+                 'params': {'field': 'durata_ore'}}
             ]
         }
         vis_id = self._crea_visualizzazione('IAM - Tempo Medio Evasione (ore)', 'metric', index_pattern, config)
@@ -167,9 +141,9 @@ class IAMVisualizationsCreator:
             'aggs': [
                 {'id': '1', 'enabled': True, 'type': 'count', 'schema': 'metric', 'params': {}},
                 {'id': '2', 'enabled': True, 'type': 'terms', 'schema': 'bucket',
-                 'params': {'field': 'nome_utenza.keyword', 'size': 20}},
+                 'params': {'field': 'nome_utenza', 'size': 20}},
                 {'id': '3', 'enabled': True, 'type': 'terms', 'schema': 'bucket',
-                 'params': {'field': 'fk_nome_operazione.keyword', 'size': 10}}
+                 'params': {'field': 'fk_nome_operazione', 'size': 10}}
             ]
         }
         vis_id = self._crea_visualizzazione('IAM - Richieste Non Evase', 'table', index_pattern, config)
@@ -183,7 +157,7 @@ class IAMVisualizationsCreator:
             'aggs': [
                 {'id': '1', 'enabled': True, 'type': 'count', 'schema': 'metric', 'params': {}},
                 {'id': '2', 'enabled': True, 'type': 'terms', 'schema': 'segment',
-                 'params': {'field': 'fk_nome_operazione.keyword', 'size': 15}},
+                 'params': {'field': 'fk_nome_operazione', 'size': 15}},
                 {'id': '3', 'enabled': True, 'type': 'terms', 'schema': 'segment',
                  'params': {'field': 'stato', 'size': 5}}
             ]
@@ -199,7 +173,7 @@ class IAMVisualizationsCreator:
             'aggs': [
                 {'id': '1', 'enabled': True, 'type': 'count', 'schema': 'metric', 'params': {}},
                 {'id': '2', 'enabled': True, 'type': 'terms', 'schema': 'segment',
-                 'params': {'field': 'nome_utenza.keyword', 'size': 20, 'order': 'desc', 'orderBy': '1'}}
+                 'params': {'field': 'nome_utenza', 'size': 20, 'order': 'desc', 'orderBy': '1'}}
             ]
         }
         vis_id = self._crea_visualizzazione('IAM - Top 20 Utenti', 'histogram', index_pattern, config)
@@ -212,9 +186,9 @@ class IAMVisualizationsCreator:
             'params': {'addTooltip': True, 'addLegend': True},
             'aggs': [
                 {'id': '1', 'enabled': True, 'type': 'stats', 'schema': 'metric',
-                 'params': {'field': 'tempo_evasione_ore'}},
+                 'params': {'field': 'durata_ore'}},
                 {'id': '2', 'enabled': True, 'type': 'terms', 'schema': 'segment',
-                 'params': {'field': 'fk_nome_operazione.keyword', 'size': 10}}
+                 'params': {'field': 'fk_nome_operazione', 'size': 10}}
             ]
         }
         vis_id = self._crea_visualizzazione('IAM - Tempo Evasione per Operazione', 'histogram', index_pattern, config)
@@ -228,7 +202,7 @@ class IAMVisualizationsCreator:
             'aggs': [
                 {'id': '1', 'enabled': True, 'type': 'count', 'schema': 'metric', 'params': {}},
                 {'id': '2', 'enabled': True, 'type': 'terms', 'schema': 'bucket',
-                 'params': {'field': 'fk_nome_operazione.keyword', 'size': 20}},
+                 'params': {'field': 'fk_nome_operazione', 'size': 20}},
                 {'id': '3', 'enabled': True, 'type': 'terms', 'schema': 'bucket',
                  'params': {'field': 'stato', 'size': 5}}
             ]
@@ -248,133 +222,33 @@ class IAMVisualizationsCreator:
 
     def _crea_visualizzazione(self, title: str, vis_type: str,
                              index_pattern: str, config: Dict) -> Optional[str]:
-        """Crea una singola visualizzazione"""
-        try:
-            vis_id = title.lower().replace(' ', '-').replace('(', '').replace(')', '')
-
-            # Elimina se esiste
-            self._elimina_visualizzazione(vis_id)
-
-            body = {
-                'attributes': {
-                    'title': title,
-                    'visState': json.dumps({
-                        'title': title,
-                        'type': vis_type,
-                        'params': config.get('params', {}),
-                        'aggs': config.get('aggs', [])
-                    }),
-                    'uiStateJSON': '{}',
-                    'kibanaSavedObjectMeta': {
-                        'searchSourceJSON': json.dumps({
-                            'index': index_pattern,
-                            'query': {'match_all': {}},
-                            'filter': []
-                        })
-                    }
-                }
-            }
-
-            response = self.session.post(
-                f"{self.base_url}/api/saved_objects/visualization/{vis_id}",
-                json=body,
-                headers=self.headers,
-                timeout=10
-            )
-
-            if response.status_code == 200:
-                print(f"   ✓ Creata: {title}")
-                return response.json()['id']
-            else:
-                print(f"   ✗ Errore '{title}': {response.text[:50]}")
-                return None
-
-        except Exception as e:
-            print(f"   ✗ Errore: {e}")
-            return None
-
-    def _elimina_visualizzazione(self, vis_id: str) -> bool:
-        """Elimina una visualizzazione se esiste"""
-        try:
-            response = self.session.delete(
-                f"{self.base_url}/api/saved_objects/visualization/{vis_id}",
-                headers=self.headers,
-                timeout=5
-            )
-            return response.status_code in [200, 204]
-        except:
-            return False
+        """Aggiunge una singola visualizzazione al bundle"""
+        vis_id = title.lower().replace(' ', '-').replace('(', '').replace(')', '')
+        self.bundle.visualizzazione(vis_id, title, vis_type, index_pattern,
+                                    params=config.get('params', {}), aggs=config.get('aggs', []))
+        print(f"   ✓ Aggiunta al bundle: {title}")
+        return vis_id
 
     def crea_dashboard(self, vis_ids: List[str], dashboard_name='IAM - Main Dashboard') -> Optional[str]:
-        """Crea dashboard con le visualizzazioni"""
-        try:
-            dashboard_id = dashboard_name.lower().replace(' ', '-').replace('(', '').replace(')', '')
-
-            # Elimina se esiste
-            self._elimina_dashboard(dashboard_id)
-
-            # Struttura dei panel nel dashboard
-            panels = []
-            x, y = 0, 0
-            for i, vis_id in enumerate(vis_ids[:12]):  # Max 12 visualizzazioni
-                panel = {
-                    'version': '8.0.0',
-                    'gridData': {
-                        'x': x,
-                        'y': y,
-                        'w': 24,
-                        'h': 15
-                    },
-                    'type': 'visualization',
-                    'id': f'panel-{i}',
-                    'embeddableConfig': {},
-                    'panelRefName': f'panel_{i}_embeddable'
-                }
-                panels.append(panel)
-                x = (x + 24) % 48
-                if x == 0:
-                    y += 15
-
-            body = {
-                'attributes': {
-                    'title': dashboard_name,
-                    'panels': panels,
-                    'timeRestore': True,
-                    'timeFrom': 'now-30d',
-                    'timeTo': 'now',
-                    'refresh': '1h'
-                }
-            }
-
-            response = self.session.post(
-                f"{self.base_url}/api/saved_objects/dashboard/{dashboard_id}",
-                json=body,
-                headers=self.headers,
-                timeout=10
-            )
-
-            if response.status_code == 200:
-                print(f"✓ Dashboard '{dashboard_name}' creato")
-                return response.json()['id']
-            else:
-                print(f"✗ Errore dashboard: {response.text[:100]}")
-                return None
-
-        except Exception as e:
-            print(f"✗ Errore creazione dashboard: {e}")
-            return None
-
-    def _elimina_dashboard(self, dashboard_id: str) -> bool:
-        """Elimina dashboard se esiste"""
-        try:
-            response = self.session.delete(
-                f"{self.base_url}/api/saved_objects/dashboard/{dashboard_id}",
-                headers=self.headers,
-                timeout=5
-            )
-            return response.status_code in [200, 204]
-        except:
-            return False
+        """Aggiunge al bundle la dashboard con le visualizzazioni (griglia 2 colonne)"""
+        dashboard_id = dashboard_name.lower().replace(' ', '-').replace('(', '').replace(')', '')
+
+        pannelli = []
+        x, y = 0, 0
+        for vis_id in vis_ids[:12]:  # Max 12 visualizzazioni
+            pannelli.append((vis_id, {'x': x, 'y': y, 'w': 24, 'h': 15}))
+            x = (x + 24) % 48
+            if x == 0:
+                y += 15
+
+        self.bundle.dashboard(dashboard_id, dashboard_name, pannelli,
+                              time_from='now-30d', time_to='now', time_restore=True, refresh_ms=3600000)
+        print(f"✓ Dashboard '{dashboard_name}' aggiunta al bundle")
+        return dashboard_id
+
+    def pubblica(self, forza: bool = False) -> bool:
+        """Pubblica il bundle (vedi SavedObjectsBundle.pubblica)"""
+        return self.bundle.pubblica(self.session, self.base_url, self.headers, forza, timeout=30)
 
     def _crea_kpi_dashboard(self, index_pattern: str) -> Dict:
         """Crea configurazione per KPI dashboard"""
@@ -451,10 +325,13 @@ def main():
         creator.crea_index_pattern('iam-richieste', 'data_creazione')
 
         print("\n2. Creazione Visualizzazioni...")
-        visualizzazioni = creator.crea_tutte_visualizzazioni('iam-richieste*')
+        visualizzazioni = creator.crea_tutte_visualizzazioni('iam-richieste')
 
         print("\n3. Creazione Dashboard...")
-        dashboard_id = creator.crea_dashboard(visualizzazioni, 'IAM - Main Dashboard')
+        creator.crea_dashboard(visualizzazioni, 'IAM - Main Dashboard')
+
+        print("\n4. Import Saved Objects...")
+        creator.pubblica()
 
         creator.stampa_istruzioni(visualizzazioni)
 
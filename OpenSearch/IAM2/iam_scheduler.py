@@ -80,7 +80,8 @@ class IAMConfig:
         'host': 'localhost',
         'port': 9200,
         'auth': ['admin', 'admin'],
-        'use_ssl': False
+        'use_ssl': False,
+        'pool_maxsize': 16
     }
 
     DASHBOARDS_DEFAULT = {
@@ -90,6 +91,13 @@ class IAMConfig:
         'password': 'admin'
     }
 
+    # parallelismo > 1: finestra letta a fette di giorni su connessioni concorrenti
+    ESTRAZIONE_DEFAULT = {
+        'parallelismo': 4,
+        'giorni_per_fetta': 1,
+        'arraysize': 5000
+    }
+
     SCHEDULE_DEFAULT = {
         'tipo': 'daily',  # daily, hourly, weekly
         'ora': '02:00',   # Per daily
@@ -113,8 +121,10 @@ class IAMConfig:
                 'opensearch': cls.OPENSEARCH_DEFAULT,
                 'dashboards': cls.DASHBOARDS_DEFAULT,
                 'schedule': cls.SCHEDULE_DEFAULT,
+                'estrazione': cls.ESTRAZIONE_DEFAULT,
                 'giorni_indietro': 90,
                 'ricrea_indici': False,
+                'versioni_mantenute': 1,
                 'ricrea_visualizzazioni': False
             }
             cls.salva_config(config)
@@ -139,8 +149,10 @@ class IAMConfig:
             'opensearch': cls.OPENSEARCH_DEFAULT,
             'dashboards': cls.DASHBOARDS_DEFAULT,
             'schedule': cls.SCHEDULE_DEFAULT,
+            'estrazione': cls.ESTRAZIONE_DEFAULT,
             'giorni_indietro': 90,
             'ricrea_indici': False,
+            'versioni_mantenute': 1,
             'ricrea_visualizzazioni': False
         }
 
@@ -193,7 +205,10 @@ class IAMScheduler:
             # 1. Caricamento dati Oracle
             self.logger.info("[1] Caricamento dati da Oracle...")
             loader = IAMOracleLoader(self.config['oracle'])
-            richieste = loader.carica_richieste(self.config['giorni_indietro'])
+            richieste = loader.carica_richieste(
+                self.config['giorni_indietro'],
+                **{**IAMConfig.ESTRAZIONE_DEFAULT, **self.config.get('estrazione', {})}
+            )
             loader.chiudi()
 
             if not richieste:
@@ -204,11 +219,14 @@ class IAMScheduler:
             self.logger.info("[2] Inserimento in OpenSearch...")
             manager = IAMOpenSearchManager(self.config['opensearch'])
 
-            if self.config.get('ricrea_indici', False):
-                manager.crea_indice_richieste()
+            if self.config.get('ricrea_indici', False) or not manager.client.indices.exists(index=INDEX_RICHIESTE):
+                # Blue/green: nuovo indice versionato, alias spostato solo a caricamento completato
                 manager.crea_indice_kpi()
-
-            inserted = manager.inserisci_richieste(richieste)
+                inserted = manager.ricostruisci_indice_richieste(
+                    richieste, versioni_mantenute=self.config.get('versioni_mantenute', 1)
+                )
+            else:
+                inserted = manager.inserisci_richieste(richieste)
 
             # 3. Calcolo e inserimento KPI
             self.logger.info("[3] Calcolo KPI...")
@@ -226,15 +244,20 @@ class IAMScheduler:
             self.logger.info(f"✓ AGGIORNAMENTO COMPLETATO in {elapsed:.2f} secondi")
             self.logger.info(f"  • Richieste inserite: {inserted}")
             self.logger.info(f"  • KPI calcolati: {len(kpi_list)}")
+            from opensearch_pool import metriche
+            for endpoint, snap in metriche(manager.client).items():
+                self.logger.info(f"  • OpenSearch {endpoint}: {snap['requests']} richieste, "
+                                 f"{snap['errors']} errori, p95 {snap['p95_ms']} ms")
             self.logger.info("=" * 70)
 
         except Exception as e:
             self.logger.error(f"✗ ERRORE durante aggiornamento: {e}", exc_info=True)
 
     def _ricrea_visualizzazioni(self):
-        """Ricrea visualizzazioni su Dashboard"""
+        """Allinea visualizzazioni e dashboard: importa solo gli oggetti con hash cambiato"""
         try:
-            from iam_opensearch_visualizations import IAMVisualizationsCreator
+            from iam_opensearch_visualization import IAMVisualizationsCreator
+            from iam_opensearch_dashboard import INDEX_RICHIESTE
 
             creator = IAMVisualizationsCreator(
                 host=self.config['dashboards']['host'],
@@ -243,11 +266,15 @@ class IAMScheduler:
                 password=self.config['dashboards']['password']
             )
 
-            creator.crea_index_pattern('iam-richieste', 'data_creazione')
-            visualizzazioni = creator.crea_tutte_visualizzazioni('iam-richieste*')
+            # Alias senza '*': il pattern non deve includere le versioni iam-richieste-v*
+            creator.crea_index_pattern(INDEX_RICHIESTE, 'data_creazione')
+            visualizzazioni = creator.crea_tutte_visualizzazioni(INDEX_RICHIESTE)
             dashboard_id = creator.crea_dashboard(visualizzazioni, 'IAM - Main Dashboard')
 
-            self.logger.info(f"✓ Dashboard aggiornato: {dashboard_id}")
+            if creator.pubblica():
+                self.logger.info(f"✓ Dashboard allineato: {dashboard_id}")
+            else:
+                self.logger.warning(f"⚠ Import saved objects incompleto per {dashboard_id}")
 
         except Exception as e:
             self.logger.error(f"✗ Errore ricreazione visualizzazioni: {e}", exc_info=True)
@@ -343,16 +370,10 @@ def genera_report_stato():
     print("=" * 70 + "\n")
 
     try:
-        from opensearchpy import OpenSearch
+        from iam_opensearch_dashboard import IAMOpenSearchManager
 
         config = IAMConfig.carica_config()
-        client = OpenSearch(
-            hosts=[{'host': config['opensearch']['host'], 'port': config['opensearch']['port']}],
-            http_auth=tuple(config['opensearch']['auth']),
-            use_ssl=config['opensearch']['use_ssl'],
-            verify_certs=False,
-            ssl_show_warn=False
-        )
+        client = IAMOpenSearchManager(config['opensearch']).client
 
         # Verifica indici
         print("📊 INDICI:")
@@ -376,7 +397,7 @@ def genera_report_stato():
                         'terms': {'field': 'stato'}
                     },
                     'avg_time': {
-                        'avg': {'field': 'tempo_evasione_ore'}
+                        'avg': {'field': 'durata_ore'}
                     }
                 }
             }
@@ -4,12 +4,18 @@ SOC Dashboard Creator - Auto-generazione Visualizzazioni
 
 Crea automaticamente visualizzazioni e dashboard su OpenSearch Dashboards
 per il SOC case study
+
+Index pattern, visualizzazioni e dashboard sono raccolti in un bundle NDJSON
+(dashboard_provisioning.py) e pubblicati con un'unica chiamata _import?overwrite=true
 """
 
 import requests
-import json
+import sys
+from pathlib import Path
 from typing import List, Dict, Optional
-import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from dashboard_provisioning import SavedObjectsBundle
 
 
 class OpenSearchDashboardCreator:
@@ -26,6 +32,7 @@ class OpenSearchDashboardCreator:
         self.session = requests.Session()
         self.session.auth = self.auth
         self.viz_ids = []
+        self.bundle = SavedObjectsBundle()
 
         try:
             response = self.session.get(
@@ -44,102 +51,24 @@ class OpenSearchDashboardCreator:
 
     def create_index_pattern(self, pattern_name='soc-*',
                             time_field='timestamp') -> bool:
-        """Crea index pattern"""
-        try:
-            # Verifica se esiste
-            response = self.session.get(
-                f"{self.base_url}/api/saved_objects/index-pattern/{pattern_name}",
-                headers=self.headers
-            )
-
-            if response.status_code == 200:
-                print(f"⚠ Index pattern '{pattern_name}' già esistente")
-                return True
-
-            data = {
-                'attributes': {
-                    'title': pattern_name,
-                    'timeFieldName': time_field,
-                    'fields': '[]'
-                }
-            }
-
-            response = self.session.post(
-                f"{self.base_url}/api/saved_objects/index-pattern/{pattern_name}",
-                json=data,
-                headers=self.headers
-            )
-
-            if response.status_code == 200:
-                print(f"✓ Index pattern '{pattern_name}' creato")
-                return True
-            else:
-                print(f"✗ Errore: {response.text[:100]}")
-                return False
-
-        except Exception as e:
-            print(f"✗ Errore: {e}")
-            return False
-
-    def delete_visualization(self, vis_id: str) -> bool:
-        """Elimina una visualizzazione se esiste"""
-        try:
-            self.session.delete(
-                f"{self.base_url}/api/saved_objects/visualization/{vis_id}",
-                headers=self.headers
-            )
-            return True
-        except:
-            return False
+        """Aggiunge l'index pattern al bundle"""
+        self.bundle.index_pattern(pattern_name, time_field=time_field)
+        print(f"✓ Index pattern '{pattern_name}' aggiunto al bundle")
+        return True
 
     def create_visualization(self, title: str, viz_type: str,
                             index_pattern: str, config: Dict) -> Optional[str]:
-        """Crea una visualizzazione"""
-        try:
-            vis_id = title.lower().replace(' ', '-').replace('(', '').replace(')', '')
-
-            # Elimina se esiste
-            self.delete_visualization(vis_id)
-            time.sleep(0.1)
-
-            body = {
-                'attributes': {
-                    'title': title,
-                    'visState': json.dumps({
-                        'title': title,
-                        'type': viz_type,
-                        'params': config.get('params', {}),
-                        'aggs': config.get('aggs', [])
-                    }),
-                    'uiStateJSON': '{}',
-                    'kibanaSavedObjectMeta': {
-                        'searchSourceJSON': json.dumps({
-                            'index': index_pattern,
-                            'query': config.get('query', {'match_all': {}}),
-                            'filter': config.get('filters', [])
-                        })
-                    }
-                }
-            }
-
-            response = self.session.post(
-                f"{self.base_url}/api/saved_objects/visualization/{vis_id}",
-                json=body,
-                headers=self.headers
-            )
-
-            if response.status_code == 200:
-                result = response.json()
-                self.viz_ids.append(result['id'])
-                print(f"✓ Visualizzazione '{title}' creata")
-                return result['id']
-            else:
-                print(f"✗ Errore '{title}': {response.text[:100]}")
-                return None
-
-        except Exception as e:
-            print(f"✗ Errore: {e}")
-            return None
+        """Aggiunge una visualizzazione al bundle"""
+        vis_id = title.lower().replace(' ', '-').replace('(', '').replace(')', '')
+        self.bundle.visualizzazione(
+            vis_id, title, viz_type, index_pattern,
+            params=config.get('params', {}), aggs=config.get('aggs', []),
+            query=config.get('query'), filters=config.get('filters')
+        )
+        if vis_id not in self.viz_ids:
+            self.viz_ids.append(vis_id)
+        print(f"✓ Visualizzazione '{title}' aggiunta al bundle")
+        return vis_id
 
     # ========== VISUALIZZAZIONI CASE STUDY 1: DDoS ==========
 
@@ -593,106 +522,41 @@ class OpenSearchDashboardCreator:
 
     def create_dashboard(self, dashboard_name='SOC Security Monitoring',
                         description='Dashboard di Monitoring SOC Completo'):
-        """Crea dashboard con tutte le visualizzazioni"""
-        try:
-            # Pulisci nome dashboard
-            dash_id = dashboard_name.lower().replace(' ', '-')
-
-            # Elimina se esiste
-            try:
-                self.session.delete(
-                    f"{self.base_url}/api/saved_objects/dashboard/{dash_id}",
-                    headers=self.headers
-                )
-            except:
-                pass
-
-            time.sleep(0.2)
-
-            # Crea structure del dashboard
-            panels = []
-            panel_positions = [
-                {'x': 0, 'y': 0, 'w': 24, 'h': 4},    # Titolo
-                {'x': 0, 'y': 4, 'w': 8, 'h': 3},     # Metrica top
-                {'x': 8, 'y': 4, 'w': 8, 'h': 3},     # Metrica
-                {'x': 16, 'y': 4, 'w': 8, 'h': 3},    # Metrica
-                {'x': 0, 'y': 7, 'w': 12, 'h': 4},    # Timeline
-                {'x': 12, 'y': 7, 'w': 12, 'h': 4},   # Timeline
-                {'x': 0, 'y': 11, 'w': 12, 'h': 3},   # Chart
-                {'x': 12, 'y': 11, 'w': 12, 'h': 3},  # Chart
-                {'x': 0, 'y': 14, 'w': 8, 'h': 3},    # Pie/Donut
-                {'x': 8, 'y': 14, 'w': 8, 'h': 3},    # Pie/Donut
-                {'x': 16, 'y': 14, 'w': 8, 'h': 3},   # Pie/Donut
-                {'x': 0, 'y': 17, 'w': 24, 'h': 3},   # Table
-                {'x': 0, 'y': 20, 'w': 12, 'h': 3},   # Chart
-                {'x': 12, 'y': 20, 'w': 12, 'h': 3},  # Chart
-                {'x': 0, 'y': 23, 'w': 12, 'h': 3},   # Area
-                {'x': 12, 'y': 23, 'w': 12, 'h': 3},  # Area
-                {'x': 0, 'y': 26, 'w': 8, 'h': 3},    # Pie
-                {'x': 8, 'y': 26, 'w': 8, 'h': 3},    # Pie
-                {'x': 16, 'y': 26, 'w': 8, 'h': 3},   # Pie
-                {'x': 0, 'y': 29, 'w': 24, 'h': 4},   # Timeline
-            ]
-
-            for i, viz_id in enumerate(self.viz_ids):
-                if i < len(panel_positions):
-                    pos = panel_positions[i]
-                    panels.append({
-                        'version': '7.13.0',
-                        'gridData': {
-                            'x': pos['x'],
-                            'y': pos['y'],
-                            'w': pos['w'],
-                            'h': pos['h'],
-                            'i': str(i)
-                        },
-                        'panelIndex': str(i),
-                        'embeddableConfig': {},
-                        'panelRefName': f"panel_{i}"
-                    })
-
-            # Crea request per dashboard
-            body = {
-                'attributes': {
-                    'title': dashboard_name,
-                    'description': description,
-                    'panels': panels,
-                    'timeRestore': False,
-                    'timeFrom': 'now-24h',
-                    'timeTo': 'now',
-                    'refreshInterval': {
-                        'pause': False,
-                        'value': 10000
-                    }
-                },
-                'references': [
-                    {
-                        'name': f"panel_{i}",
-                        'type': 'visualization',
-                        'id': self.viz_ids[i]
-                    }
-                    for i in range(len(self.viz_ids))
-                ]
-            }
-
-            response = self.session.post(
-                f"{self.base_url}/api/saved_objects/dashboard/{dash_id}",
-                json=body,
-                headers=self.headers
-            )
-
-            if response.status_code == 200:
-                result = response.json()
-                print(f"✓ Dashboard '{dashboard_name}' creato")
-                print(f"  ID: {result['id']}")
-                return result['id']
-            else:
-                print(f"✗ Errore creazione dashboard: {response.text[:200]}")
-                return None
-
-        except Exception as e:
-            print(f"✗ Errore: {e}")
-            return None
+        """Aggiunge al bundle la dashboard con tutte le visualizzazioni"""
+        dash_id = dashboard_name.lower().replace(' ', '-')
+
+        panel_positions = [
+            {'x': 0, 'y': 0, 'w': 24, 'h': 4},    # Titolo
+            {'x': 0, 'y': 4, 'w': 8, 'h': 3},     # Metrica top
+            {'x': 8, 'y': 4, 'w': 8, 'h': 3},     # Metrica
+            {'x': 16, 'y': 4, 'w': 8, 'h': 3},    # Metrica
+            {'x': 0, 'y': 7, 'w': 12, 'h': 4},    # Timeline
+            {'x': 12, 'y': 7, 'w': 12, 'h': 4},   # Timeline
+            {'x': 0, 'y': 11, 'w': 12, 'h': 3},   # Chart
+            {'x': 12, 'y': 11, 'w': 12, 'h': 3},  # Chart
+            {'x': 0, 'y': 14, 'w': 8, 'h': 3},    # Pie/Donut
+            {'x': 8, 'y': 14, 'w': 8, 'h': 3},    # Pie/Donut
+            {'x': 16, 'y': 14, 'w': 8, 'h': 3},   # Pie/Donut
+            {'x': 0, 'y': 17, 'w': 24, 'h': 3},   # Table
+            {'x': 0, 'y': 20, 'w': 12, 'h': 3},   # Chart
+            {'x': 12, 'y': 20, 'w': 12, 'h': 3},  # Chart
+            {'x': 0, 'y': 23, 'w': 12, 'h': 3},   # Area
+            {'x': 12, 'y': 23, 'w': 12, 'h': 3},  # Area
+            {'x': 0, 'y': 26, 'w': 8, 'h': 3},    # Pie
+            {'x': 8, 'y': 26, 'w': 8, 'h': 3},    # Pie
+            {'x': 16, 'y': 26, 'w': 8, 'h': 3},   # Pie
+            {'x': 0, 'y': 29, 'w': 24, 'h': 4},   # Timeline
+        ]
+
+        pannelli = list(zip(self.viz_ids, panel_positions))
+        self.bundle.dashboard(dash_id, dashboard_name, pannelli,
+                              description=description, refresh_ms=10000)
+        print(f"✓ Dashboard '{dashboard_name}' aggiunta al bundle ({len(pannelli)} pannelli)")
+        return dash_id
+
+    def publish(self, force: bool = False) -> bool:
+        """Pubblica il bundle (vedi SavedObjectsBundle.pubblica)"""
+        return self.bundle.pubblica(self.session, self.base_url, self.headers, force)
 
     def print_final_instructions(self):
         """Stampa istruzioni finali"""
@@ -796,6 +660,8 @@ def main():
             'SOC Security Monitoring',
             'Dashboard di Monitoring SOC Completo - 5 Case Study'
         )
+        if not creator.publish():
+            dashboard_id = None
 
         # 5. Mostra istruzioni finali
         print("\n5️⃣  Setup Dashboard...")
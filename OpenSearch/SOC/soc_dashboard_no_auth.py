@@ -3,13 +3,17 @@ SOC Dashboard Creator - Versione SENZA SICUREZZA (No Auth)
 ===========================================================
 
 Crea automaticamente visualizzazioni su OpenSearch Dashboards
-senza autenticazione
+senza autenticazione, pubblicando tutti gli oggetti con un unico
+_import?overwrite=true (dashboard_provisioning.py)
 """
 
 import requests
-import json
+import sys
+from pathlib import Path
 from typing import List, Dict, Optional
-import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from dashboard_provisioning import SavedObjectsBundle
 
 
 class OpenSearchDashboardCreator:
@@ -24,6 +28,7 @@ class OpenSearchDashboardCreator:
         }
         self.session = requests.Session()
         self.viz_ids = []
+        self.bundle = SavedObjectsBundle()
 
         try:
             response = self.session.get(
@@ -41,100 +46,24 @@ class OpenSearchDashboardCreator:
 
     def create_index_pattern(self, pattern_name='soc-*',
                             time_field='timestamp') -> bool:
-        """Crea index pattern"""
-        try:
-            response = self.session.get(
-                f"{self.base_url}/api/saved_objects/index-pattern/{pattern_name}",
-                headers=self.headers
-            )
-
-            if response.status_code == 200:
-                print(f"⚠ Index pattern '{pattern_name}' già esistente")
-                return True
-
-            data = {
-                'attributes': {
-                    'title': pattern_name,
-                    'timeFieldName': time_field,
-                    'fields': '[]'
-                }
-            }
-
-            response = self.session.post(
-                f"{self.base_url}/api/saved_objects/index-pattern/{pattern_name}",
-                json=data,
-                headers=self.headers
-            )
-
-            if response.status_code == 200:
-                print(f"✓ Index pattern '{pattern_name}' creato")
-                return True
-            else:
-                print(f"✗ Errore: {response.text[:100]}")
-                return False
-
-        except Exception as e:
-            print(f"✗ Errore: {e}")
-            return False
-
-    def delete_visualization(self, vis_id: str) -> bool:
-        """Elimina una visualizzazione se esiste"""
-        try:
-            self.session.delete(
-                f"{self.base_url}/api/saved_objects/visualization/{vis_id}",
-                headers=self.headers
-            )
-            return True
-        except:
-            return False
+        """Aggiunge l'index pattern al bundle"""
+        self.bundle.index_pattern(pattern_name, time_field=time_field)
+        print(f"✓ Index pattern '{pattern_name}' aggiunto al bundle")
+        return True
 
     def create_visualization(self, title: str, viz_type: str,
                             index_pattern: str, config: Dict) -> Optional[str]:
-        """Crea una visualizzazione"""
-        try:
-            vis_id = title.lower().replace(' ', '-').replace('(', '').replace(')', '')
-
-            self.delete_visualization(vis_id)
-            time.sleep(0.1)
-
-            body = {
-                'attributes': {
-                    'title': title,
-                    'visState': json.dumps({
-                        'title': title,
-                        'type': viz_type,
-                        'params': config.get('params', {}),
-                        'aggs': config.get('aggs', [])
-                    }),
-                    'uiStateJSON': '{}',
-                    'kibanaSavedObjectMeta': {
-                        'searchSourceJSON': json.dumps({
-                            'index': index_pattern,
-                            'query': config.get('query', {'match_all': {}}),
-                            'filter': config.get('filters', [])
-                        })
-                    }
-                }
-            }
-
-            response = self.session.post(
-                f"{self.base_url}/api/saved_objects/visualization/{vis_id}",
-                json=body,
-                headers=self.headers
-            )
-
-            if response.status_code == 200:
-                result = response.json()
-                self.viz_ids.append(result['id'])
-                print(f"✓ Visualizzazione '{title}' creata")
-                return result['id']
-            else:
-                print(f"✗ Errore '{title}': {response.text[:100]}")
-                return None
-
-        except Exception as e:
-            print(f"✗ Errore: {e}")
-            return None
+        """Aggiunge una visualizzazione al bundle"""
+        vis_id = title.lower().replace(' ', '-').replace('(', '').replace(')', '')
+        self.bundle.visualizzazione(
+            vis_id, title, viz_type, index_pattern,
+            params=config.get('params', {}), aggs=config.get('aggs', []),
+            query=config.get('query'), filters=config.get('filters')
+        )
+        if vis_id not in self.viz_ids:
+            self.viz_ids.append(vis_id)
+        print(f"✓ Visualizzazione '{title}' aggiunta al bundle")
+        return vis_id
 
     def create_all_visualizations(self):
         """Crea tutte le visualizzazioni"""
@@ -426,101 +355,41 @@ class OpenSearchDashboardCreator:
         print(f"\n✓ Totale visualizzazioni create: {len(self.viz_ids)}")
 
     def create_dashboard(self, dashboard_name='SOC Security Monitoring'):
-        """Crea dashboard con tutte le visualizzazioni"""
-        try:
-            dash_id = dashboard_name.lower().replace(' ', '-')
-
-            try:
-                self.session.delete(
-                    f"{self.base_url}/api/saved_objects/dashboard/{dash_id}",
-                    headers=self.headers
-                )
-            except:
-                pass
-
-            time.sleep(0.2)
-
-            panels = []
-            panel_positions = [
-                {'x': 0, 'y': 0, 'w': 24, 'h': 3},
-                {'x': 0, 'y': 3, 'w': 8, 'h': 3},
-                {'x': 8, 'y': 3, 'w': 8, 'h': 3},
-                {'x': 16, 'y': 3, 'w': 8, 'h': 3},
-                {'x': 0, 'y': 6, 'w': 12, 'h': 3},
-                {'x': 12, 'y': 6, 'w': 12, 'h': 3},
-                {'x': 0, 'y': 9, 'w': 12, 'h': 3},
-                {'x': 12, 'y': 9, 'w': 12, 'h': 3},
-                {'x': 0, 'y': 12, 'w': 8, 'h': 3},
-                {'x': 8, 'y': 12, 'w': 8, 'h': 3},
-                {'x': 16, 'y': 12, 'w': 8, 'h': 3},
-                {'x': 0, 'y': 15, 'w': 24, 'h': 3},
-                {'x': 0, 'y': 18, 'w': 12, 'h': 3},
-                {'x': 12, 'y': 18, 'w': 12, 'h': 3},
-                {'x': 0, 'y': 21, 'w': 12, 'h': 3},
-                {'x': 12, 'y': 21, 'w': 12, 'h': 3},
-                {'x': 0, 'y': 24, 'w': 8, 'h': 3},
-                {'x': 8, 'y': 24, 'w': 8, 'h': 3},
-                {'x': 16, 'y': 24, 'w': 8, 'h': 3},
-                {'x': 0, 'y': 27, 'w': 24, 'h': 3},
-            ]
-
-            for i, viz_id in enumerate(self.viz_ids):
-                if i < len(panel_positions):
-                    pos = panel_positions[i]
-                    panels.append({
-                        'version': '7.13.0',
-                        'gridData': {
-                            'x': pos['x'],
-                            'y': pos['y'],
-                            'w': pos['w'],
-                            'h': pos['h'],
-                            'i': str(i)
-                        },
-                        'panelIndex': str(i),
-                        'embeddableConfig': {},
-                        'panelRefName': f"panel_{i}"
-                    })
-
-            body = {
-                'attributes': {
-                    'title': dashboard_name,
-                    'description': 'Dashboard SOC Completo - 5 Case Study',
-                    'panels': panels,
-                    'timeRestore': False,
-                    'timeFrom': 'now-24h',
-                    'timeTo': 'now',
-                    'refreshInterval': {
-                        'pause': False,
-                        'value': 10000
-                    }
-                },
-                'references': [
-                    {
-                        'name': f"panel_{i}",
-                        'type': 'visualization',
-                        'id': self.viz_ids[i]
-                    }
-                    for i in range(len(self.viz_ids))
-                ]
-            }
-
-            response = self.session.post(
-                f"{self.base_url}/api/saved_objects/dashboard/{dash_id}",
-                json=body,
-                headers=self.headers
-            )
-
-            if response.status_code == 200:
-                result = response.json()
-                print(f"✓ Dashboard '{dashboard_name}' creato")
-                return result['id']
-            else:
-                print(f"✗ Errore: {response.text[:200]}")
-                return None
-
-        except Exception as e:
-            print(f"✗ Errore: {e}")
-            return None
+        """Aggiunge al bundle la dashboard con tutte le visualizzazioni"""
+        dash_id = dashboard_name.lower().replace(' ', '-')
+
+        panel_positions = [
+            {'x': 0, 'y': 0, 'w': 24, 'h': 3},
+            {'x': 0, 'y': 3, 'w': 8, 'h': 3},
+            {'x': 8, 'y': 3, 'w': 8, 'h': 3},
+            {'x': 16, 'y': 3, 'w': 8, 'h': 3},
+            {'x': 0, 'y': 6, 'w': 12, 'h': 3},
+            {'x': 12, 'y': 6, 'w': 12, 'h': 3},
+            {'x': 0, 'y': 9, 'w': 12, 'h': 3},
+            {'x': 12, 'y': 9, 'w': 12, 'h': 3},
+            {'x': 0, 'y': 12, 'w': 8, 'h': 3},
+            {'x': 8, 'y': 12, 'w': 8, 'h': 3},
+            {'x': 16, 'y': 12, 'w': 8, 'h': 3},
+            {'x': 0, 'y': 15, 'w': 24, 'h': 3},
+            {'x': 0, 'y': 18, 'w': 12, 'h': 3},
+            {'x': 12, 'y': 18, 'w': 12, 'h': 3},
+            {'x': 0, 'y': 21, 'w': 12, 'h': 3},
+            {'x': 12, 'y': 21, 'w': 12, 'h': 3},
+            {'x': 0, 'y': 24, 'w': 8, 'h': 3},
+            {'x': 8, 'y': 24, 'w': 8, 'h': 3},
+            {'x': 16, 'y': 24, 'w': 8, 'h': 3},
+            {'x': 0, 'y': 27, 'w': 24, 'h': 3},
+        ]
+
+        pannelli = list(zip(self.viz_ids, panel_positions))
+        self.bundle.dashboard(dash_id, dashboard_name, pannelli,
+                              description='Dashboard SOC Completo - 5 Case Study', refresh_ms=10000)
+        print(f"✓ Dashboard '{dashboard_name}' aggiunta al bundle ({len(pannelli)} pannelli)")
+        return dash_id
+
+    def publish(self, force: bool = False) -> bool:
+        """Pubblica il bundle (vedi SavedObjectsBundle.pubblica)"""
+        return self.bundle.pubblica(self.session, self.base_url, self.headers, force)
 
     def print_summary(self):
         """Stampa riassunto finale"""
@@ -587,6 +456,7 @@ def main():
 
         print("\n4️⃣  Creazione Dashboard...")
         creator.create_dashboard('SOC Security Monitoring')
+        creator.publish()
 
         print("\n5️⃣  Riepilogo...")
         creator.print_summary()
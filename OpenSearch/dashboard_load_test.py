@@ -0,0 +1,415 @@
+"""
+================================================================================
+FILE: dashboard_load_test.py
+================================================================================
+Load test delle aggregazioni delle dashboard IAM e SOC
+
+1. Estrae le definizioni dei pannelli direttamente dai creator esistenti
+   (IAMDashboardCreator, IAMVisualizationsCreator, OpenSearchDashboardCreator
+   SOC) intercettando il salvataggio delle visualizzazioni: nessuna chiamata a
+   OpenSearch Dashboards.
+2. Converte ogni pannello nella _search che Dashboards invierebbe
+   (filtro temporale + query del pannello, bucket annidati, metriche).
+3. Popola un OpenSearch locale single-node con dati sintetici (scala
+   configurabile, es. 10x i volumi attuali) negli indici 'loadtest-*', più
+   il rollup giornaliero IAM calcolato sugli stessi dati.
+4. Riesegue i pannelli con concorrenza configurabile e riporta latenza
+   p50/p95/p99 per pannello, segnalando quelli da spostare su un rollup.
+
+UTILIZZO:
+    python dashboard_load_test.py
+    python dashboard_load_test.py --scala 10 --concorrenza 8 --ripetizioni 50
+    python dashboard_load_test.py --no-carica --json risultati.json
+================================================================================
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from opensearchpy import OpenSearch, helpers
+
+BASE_DIR = Path(__file__).resolve().parent
+for _cartella in ('IAM', 'IAM2', 'SOC'):
+    sys.path.insert(0, str(BASE_DIR / _cartella))
+
+from iam_dashboard_visualizations import IAMDashboardCreator  # noqa: E402
+from iam_opensearch_visualization import IAMVisualizationsCreator  # noqa: E402
+from iam_rollup import IAMDailyRollup, ROLLUP_INDEX  # noqa: E402
+from iam_schema import richieste_mappings, richieste_settings  # noqa: E402
+import soc_dashboard_creator  # noqa: E402
+import soc_dashboard_no_auth  # noqa: E402
+
+PREFISSO = 'loadtest-'
+INDICE_IAM = 'iam-richieste'
+INDICE_SOC = 'soc-logs'
+
+# Campo temporale del filtro "time picker" per index pattern
+CAMPI_TEMPO = {INDICE_IAM: 'data_creazione', ROLLUP_INDEX: 'day', 'soc-*': 'timestamp'}
+
+OPERAZIONI = [f"{base}_{sistema}" for base in ('RESET_PASSWORD', 'CREAZIONE_ACCOUNT', 'BLOCCO', 'PROROGA',
+                                               'MODIFICA_PARAMETRI', 'RIATTIVAZIONE', 'CANCELLAZIONE')
+              for sistema in ('AD', 'LDAP', 'SAP', 'RACF', 'ORACLE', 'UNIX')]
+STATI = ['EVASA'] * 6 + ['NON EVASA', 'ANNULLATA', 'IN LAVORAZIONE']
+
+
+@dataclass
+class Pannello:
+    """Definizione di un pannello estratta da un creator"""
+    sorgente: str
+    titolo: str
+    tipo: str
+    index_pattern: str
+    aggs: List[Dict]
+    query: Dict = field(default_factory=lambda: {'match_all': {}})
+    filtri: List[Dict] = field(default_factory=list)
+
+
+# ============================================================================
+# ESTRAZIONE PANNELLI DAI CREATOR
+# ============================================================================
+
+def _registra(creator, metodo: str, firma: str, sorgente: str, pannelli: List[Pannello]):
+    """Sostituisce sull'istanza il metodo che salva la visualizzazione con un registratore"""
+    def registratore(*args, **kwargs):
+        valori = dict(zip(firma.split(','), args), **kwargs)
+        config = valori['config']
+        pannelli.append(Pannello(
+            sorgente=sorgente,
+            titolo=valori['title'],
+            tipo=valori.get('vis_type') or valori.get('viz_type'),
+            index_pattern=valori.get('index_pattern') or getattr(creator, 'index_pattern', None),
+            aggs=config.get('aggs', []),
+            query=config.get('query', {'match_all': {}}),
+            filtri=config.get('filters', [])
+        ))
+        return valori['title']
+    setattr(creator, metodo, registratore)
+
+
+def estrai_pannelli() -> List[Pannello]:
+    """Pannelli di tutte le dashboard (i creator sono istanziati senza connettersi)"""
+    pannelli: List[Pannello] = []
+
+    # IAM: indice raw e variante con i pannelli di volume sul rollup giornaliero
+    for use_rollup in (False, True):
+        creator = IAMDashboardCreator.__new__(IAMDashboardCreator)
+        creator.index_pattern = INDICE_IAM
+        creator.rollup_index_pattern = ROLLUP_INDEX
+        creator.use_rollup = use_rollup
+        trovati: List[Pannello] = []
+        _registra(creator, 'create_visualization', 'title,vis_type,config,index_pattern', 'IAM', trovati)
+        with contextlib.redirect_stdout(io.StringIO()):
+            creator.create_all_visualizations()
+        if use_rollup:
+            trovati = [p for p in trovati if p.index_pattern == ROLLUP_INDEX]
+            for pannello in trovati:
+                pannello.sorgente = 'IAM rollup'
+        pannelli.extend(trovati)
+
+    creator = IAMVisualizationsCreator.__new__(IAMVisualizationsCreator)
+    _registra(creator, '_crea_visualizzazione', 'title,vis_type,index_pattern,config', 'IAM2', pannelli)
+    with contextlib.redirect_stdout(io.StringIO()):
+        creator.crea_tutte_visualizzazioni(INDICE_IAM)
+
+    for modulo in (soc_dashboard_creator, soc_dashboard_no_auth):
+        creator = modulo.OpenSearchDashboardCreator.__new__(modulo.OpenSearchDashboardCreator)
+        creator.viz_ids = []
+        _registra(creator, 'create_visualization', 'title,viz_type,index_pattern,config',
+                  f"SOC ({modulo.__name__})", pannelli)
+        with contextlib.redirect_stdout(io.StringIO()):
+            creator.create_all_visualizations()
+
+    return pannelli
+
+
+# ============================================================================
+# PANNELLO -> _search
+# ============================================================================
+
+def _intervallo(params: Dict, giorni: int) -> Dict:
+    """Intervallo del date_histogram come lo risolve Dashboards ('auto' ~ 100 bucket)"""
+    interval = params.get('interval', 'auto')
+    if interval == 'custom':
+        interval = params.get('customInterval', '1h')
+    if interval == 'auto':
+        minuti = max(1, giorni * 24 * 60 // 100)
+        return {'fixed_interval': f"{minuti}m"}
+    if interval in ('1d', 'd', '1w', 'w', '1M', 'M', '1y', 'y', '1h', 'h', '1m', 'm'):
+        return {'calendar_interval': interval if interval[0].isdigit() else f"1{interval}"}
+    return {'fixed_interval': interval}
+
+
+def _metrica(agg: Dict) -> Optional[Dict]:
+    """Aggregazione metrica (None per count: basta il doc_count)"""
+    if agg['type'] == 'count':
+        return None
+    if agg['type'] == 'percentiles':
+        return {'percentiles': {'field': agg['params']['field'], 'percents': agg['params'].get('percents', [50])}}
+    return {agg['type']: {'field': agg['params']['field']}}
+
+
+def _bucket(agg: Dict, metriche: Dict[str, Dict], giorni: int) -> Dict:
+    """Aggregazione bucket di un pannello"""
+    params = agg['params']
+    if agg['type'] == 'terms':
+        order_by = params.get('orderBy', '1')
+        ordine = {'_count': params.get('order', 'desc')} if order_by not in metriche else \
+            {order_by: params.get('order', 'desc')}
+        return {'terms': {'field': params['field'], 'size': params.get('size', 5), 'order': ordine}}
+    if agg['type'] == 'date_histogram':
+        return {'date_histogram': {'field': params['field'], **_intervallo(params, giorni), 'min_doc_count': 1}}
+    if agg['type'] == 'histogram':
+        return {'histogram': {'field': params['field'], 'interval': params['interval']}}
+    raise ValueError(f"Aggregazione bucket non supportata: {agg['type']}")
+
+
+def costruisci_query(pannello: Pannello, indice: str, giorni: int) -> Dict:
+    """_search equivalente alla richiesta di Dashboards per il pannello"""
+    abilitate = [agg for agg in pannello.aggs if agg.get('enabled', True)]
+    metriche = {agg['id']: m for agg in abilitate if agg['schema'] == 'metric'
+                for m in [_metrica(agg)] if m is not None}
+    bucket = [agg for agg in abilitate if agg['schema'] != 'metric']
+
+    # Bucket annidati nell'ordine del pannello, metriche sul livello più interno
+    aggs = dict(metriche)
+    for agg in reversed(bucket):
+        livello = _bucket(agg, metriche, giorni)
+        if aggs:
+            livello['aggs'] = aggs
+        aggs = {agg['id']: livello}
+
+    filtri = [{'range': {CAMPI_TEMPO.get(pannello.index_pattern, 'timestamp'): {'gte': f"now-{giorni}d"}}}]
+    filtri.extend(pannello.filtri)
+    if pannello.query and 'match_all' not in pannello.query:
+        filtri.append(pannello.query)
+
+    return {'index': indice, 'body': {
+        'size': 0,
+        'track_total_hits': True,
+        'query': {'bool': {'filter': filtri}},
+        'aggs': aggs
+    }}
+
+
+# ============================================================================
+# DATI SINTETICI
+# ============================================================================
+
+def documenti_iam(n: int, giorni: int, rng: random.Random):
+    """Richieste IAM sintetiche nello schema canonico"""
+    now = datetime.now().replace(microsecond=0)
+    for i in range(n):
+        creazione = now - timedelta(seconds=rng.randint(0, giorni * 86400))
+        chiusura = creazione + timedelta(hours=rng.expovariate(1 / 18)) if rng.random() < 0.85 else None
+        stato = rng.choice(STATI)
+        yield {
+            '_index': PREFISSO + INDICE_IAM, '_id': str(i),
+            '_source': {
+                'id_richiesta': str(i),
+                'nome_utenza': f"U{i % 50000:06d}",
+                'fk_tipo_utenza': rng.choice(['INTERNA', 'ESTERNA', 'TECNICA', 'AMMINISTRATIVA']),
+                'fk_nome_operazione': rng.choice(OPERAZIONI),
+                'data_creazione': creazione.isoformat(),
+                'data_chiusura': chiusura.isoformat() if chiusura else None,
+                'fk_utente_richiedente': f"R{i % 8000:05d}",
+                'stato': stato,
+                'priorita_secondaria': rng.randint(0, 3),
+                'durata_ore': round((chiusura - creazione).total_seconds() / 3600, 2) if chiusura else None,
+                'is_completed': stato == 'EVASA',
+                'is_pending': stato == 'NON EVASA'
+            }
+        }
+
+
+def documenti_soc(n: int, giorni: int, rng: random.Random):
+    """Log SOC sintetici (firewall, proxy, webserver, router) con i campi dei pannelli"""
+    now = datetime.now().replace(microsecond=0)
+    for i in range(n):
+        sorgente = rng.choice(['firewall', 'proxy', 'webserver', 'router'])
+        sospetto = rng.random() < 0.05
+        yield {
+            '_index': PREFISSO + INDICE_SOC,
+            '_source': {
+                'timestamp': (now - timedelta(seconds=rng.randint(0, giorni * 86400))).isoformat(),
+                'source_type': sorgente,
+                'src_ip': f"10.0.{rng.randint(0, 20)}.{rng.randint(1, 254)}",
+                'client_ip': f"10.0.1.{rng.randint(1, 254)}",
+                'dst_port': rng.choice([22, 53, 80, 443, 3389, 8080]),
+                'action': rng.choice(['ALLOW'] * 8 + ['DENY', 'BLOCKED']),
+                'is_suspicious': sospetto,
+                'is_blocked': rng.random() < 0.03,
+                'is_alert': sospetto and rng.random() < 0.5,
+                'category': rng.choice(['business', 'social', 'command-control', 'malware', 'phishing']),
+                'domain': f"site{rng.randint(1, 500)}.example.com",
+                'path': rng.choice(['/', '/login', '/admin', '/api/v1/users', '/wp-admin', '/../../etc/passwd']),
+                'status_code': rng.choice([200] * 8 + [401, 403, 404, 500]),
+                'user_agent': rng.choice(['Mozilla/5.0', 'curl/8.0', 'sqlmap/1.7', 'python-requests/2.31']),
+                'response_time_ms': round(rng.expovariate(1 / 120), 1),
+                'log_type': rng.choice(['interface', 'cpu_high', 'memory_high', 'bgp']),
+                'value': round(rng.uniform(0, 100), 1),
+                'severity': rng.choice(['INFO'] * 6 + ['WARNING', 'ERROR'])
+            }
+        }
+
+
+def carica_dati(client: OpenSearch, args):
+    """Ricrea gli indici loadtest-* e li popola; il rollup IAM è calcolato dai dati raw"""
+    rng = random.Random(args.seed)
+    indice_iam, indice_soc = PREFISSO + INDICE_IAM, PREFISSO + INDICE_SOC
+    indice_rollup = PREFISSO + ROLLUP_INDEX
+    for indice in (indice_iam, indice_soc, indice_rollup):
+        if client.indices.exists(index=indice):
+            client.indices.delete(index=indice)
+
+    client.indices.create(index=indice_iam, body={
+        'mappings': richieste_mappings(), 'settings': richieste_settings(shards=1, refresh_interval='-1')
+    })
+    # SOC: mapping dinamico, come gli indici soc-* reali (stringhe text + .keyword)
+    client.indices.create(index=indice_soc, body={
+        'settings': {'number_of_shards': 1, 'number_of_replicas': 0, 'index': {'refresh_interval': '-1'}}
+    })
+
+    n_iam, n_soc = args.iam_docs * args.scala, args.soc_docs * args.scala
+    for nome, azioni, n in (('IAM', documenti_iam(n_iam, args.giorni, rng), n_iam),
+                            ('SOC', documenti_soc(n_soc, args.giorni, rng), n_soc)):
+        start = time.perf_counter()
+        helpers.bulk(client, azioni, chunk_size=5000, max_chunk_bytes=10 * 1024 * 1024, request_timeout=300)
+        print(f"✓ {nome}: {n:,} documenti in {time.perf_counter() - start:.1f}s")
+
+    for indice in (indice_iam, indice_soc):
+        client.indices.put_settings(index=indice, body={'index': {'refresh_interval': '5s'}})
+    client.indices.refresh(index=f"{indice_iam},{indice_soc}")
+
+    rollup = IAMDailyRollup(client=client, source_index=indice_iam, rollup_index=indice_rollup,
+                            config_file=str(BASE_DIR / 'IAM' / 'iam_kpi_config.json'))
+    rollup.ricostruisci(args.giorni)
+
+
+# ============================================================================
+# REPLAY
+# ============================================================================
+
+def percentile(valori: List[float], p: float) -> float:
+    """Percentile nearest-rank su valori ordinati"""
+    return valori[min(len(valori) - 1, max(0, int(round(p / 100 * len(valori))) - 1))]
+
+
+def esegui(client: OpenSearch, pannelli: List[Pannello], args) -> List[Dict]:
+    """Riesegue tutti i pannelli mescolati (come il caricamento concorrente di una dashboard)"""
+    richieste = []
+    for pannello in pannelli:
+        indice = PREFISSO + pannello.index_pattern
+        try:
+            richieste.append((pannello, costruisci_query(pannello, indice, args.giorni)))
+        except (KeyError, ValueError) as e:
+            print(f"⚠ Pannello '{pannello.titolo}' non convertibile: {e}")
+
+    lavori = [r for r in richieste for _ in range(args.ripetizioni)]
+    random.Random(args.seed).shuffle(lavori)
+
+    def esegui_uno(lavoro):
+        pannello, query = lavoro
+        start = time.perf_counter()
+        try:
+            risposta = client.search(index=query['index'], body=query['body'],
+                                     request_cache=args.con_cache, request_timeout=120)
+            return (pannello.sorgente, pannello.titolo), risposta['took'], (time.perf_counter() - start) * 1000, None
+        except Exception as e:
+            return (pannello.sorgente, pannello.titolo), None, (time.perf_counter() - start) * 1000, str(e)[:120]
+
+    # Chiave (sorgente, titolo): i due creator SOC condividono i titoli
+    misure: Dict[tuple, Dict] = {(p.sorgente, p.titolo): {'pannello': p, 'took': [], 'totale': [], 'errore': None}
+                                 for p, _ in richieste}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concorrenza) as executor:
+        for chiave, took, totale, errore in executor.map(esegui_uno, lavori):
+            if errore:
+                misure[chiave]['errore'] = errore
+                continue
+            misure[chiave]['took'].append(took)
+            misure[chiave]['totale'].append(totale)
+    elapsed = time.perf_counter() - start
+    print(f"✓ {len(lavori):,} richieste in {elapsed:.1f}s ({len(lavori) / elapsed:,.0f} req/s, "
+          f"concorrenza {args.concorrenza})")
+
+    risultati = []
+    for (sorgente, titolo), m in misure.items():
+        totale = sorted(m['totale'])
+        risultati.append({
+            'sorgente': sorgente,
+            'pannello': titolo,
+            'indice': m['pannello'].index_pattern,
+            'richieste': len(totale),
+            'took_p50': statistics.median(m['took']) if m['took'] else None,
+            'p50': round(percentile(totale, 50), 1) if totale else None,
+            'p95': round(percentile(totale, 95), 1) if totale else None,
+            'p99': round(percentile(totale, 99), 1) if totale else None,
+            'errore': m['errore']
+        })
+    return sorted(risultati, key=lambda r: r['p95'] if r['p95'] is not None else float('inf'), reverse=True)
+
+
+def stampa_report(risultati: List[Dict], soglia_ms: float):
+    """Tabella per pannello, dal più lento; segnala i candidati al rollup"""
+    print(f"\n{'Sorgente':24s} | {'Pannello':45s} | {'p50':>8s} | {'p95':>8s} | {'p99':>8s} | Note")
+    print('-' * 120)
+    for r in risultati:
+        if r['errore']:
+            print(f"{r['sorgente'][:24]:24s} | {r['pannello'][:45]:45s} | {'-':>8s} | {'-':>8s} | {'-':>8s} | "
+                  f"✗ {r['errore'][:60]}")
+            continue
+        nota = '→ rollup' if r['p95'] > soglia_ms and r['indice'] != ROLLUP_INDEX else ''
+        print(f"{r['sorgente'][:24]:24s} | {r['pannello'][:45]:45s} | {r['p50']:6.1f}ms | "
+              f"{r['p95']:6.1f}ms | {r['p99']:6.1f}ms | {nota}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test aggregazioni dashboard IAM/SOC')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9200)
+    parser.add_argument('--scala', type=int, default=10, help='Moltiplicatore dei volumi base')
+    parser.add_argument('--iam-docs', type=int, default=100_000, help='Richieste IAM a scala 1')
+    parser.add_argument('--soc-docs', type=int, default=200_000, help='Log SOC a scala 1')
+    parser.add_argument('--giorni', type=int, default=30, help='Storia sintetica e finestra del time picker')
+    parser.add_argument('--concorrenza', type=int, default=8, help='Richieste _search in parallelo')
+    parser.add_argument('--ripetizioni', type=int, default=30, help='Esecuzioni per pannello')
+    parser.add_argument('--soglia-ms', type=float, default=500, help='p95 oltre cui suggerire un rollup')
+    parser.add_argument('--con-cache', action='store_true', help='Abilita la request cache (default disabilitata)')
+    parser.add_argument('--no-carica', dest='carica', action='store_false', help='Riusa gli indici loadtest-*')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='Salva i risultati in un file JSON')
+    args = parser.parse_args()
+
+    client = OpenSearch(hosts=[{'host': args.host, 'port': args.port}], use_ssl=False,
+                        verify_certs=False, ssl_show_warn=False, timeout=300, maxsize=args.concorrenza)
+
+    pannelli = estrai_pannelli()
+    print(f"✓ Estratti {len(pannelli)} pannelli "
+          f"({', '.join(sorted({p.sorgente for p in pannelli}))})")
+
+    if args.carica:
+        carica_dati(client, args)
+
+    risultati = esegui(client, pannelli, args)
+    stampa_report(risultati, args.soglia_ms)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'timestamp': datetime.now().isoformat(), 'parametri': vars(args),
+                       'risultati': risultati}, f, indent=2, ensure_ascii=False)
+        print(f"\n✓ Risultati salvati in {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""
+================================================================================
+FILE: dashboard_provisioning.py
+================================================================================
+Provisioning dashboard - bundle NDJSON di saved objects per OpenSearch Dashboards
+
+Invece di DELETE + sleep + POST per ogni oggetto, i creator (SOC, IAM, IAM2)
+accumulano index pattern, visualizzazioni e dashboard in un SavedObjectsBundle
+che viene pubblicato con una sola chiamata:
+
+    POST /api/saved_objects/_import?overwrite=true   (multipart, file .ndjson)
+
+Gli oggetti usano il formato con 'references' (indexRefName / panelRefName),
+quindi il bundle salvato con salva() è anche un export importabile dalla UI.
+
+Diff per hash di contenuto: ogni visualizzazione/dashboard porta lo sha1 della
+propria definizione renderizzata (chiave 'provisioningHash' in uiStateJSON /
+optionsJSON, gli unici attributi liberi ammessi dal mapping strict di .kibana).
+Prima dell'import una POST /api/saved_objects/_bulk_get confronta gli hash e
+vengono scritti solo gli oggetti nuovi o modificati: un run senza modifiche
+costa una sola richiesta. Gli index pattern si confrontano su title e
+timeFieldName, così il field list già popolato non viene azzerato.
+
+UTILIZZO:
+    from dashboard_provisioning import SavedObjectsBundle
+
+    bundle = SavedObjectsBundle()
+    bundle.index_pattern('soc-*', time_field='timestamp')
+    vis_id = bundle.visualizzazione('top-ip', 'Top IP', 'histogram', 'soc-*', aggs=[...])
+    bundle.dashboard('soc', 'SOC', [(vis_id, {'x': 0, 'y': 0, 'w': 24, 'h': 8})])
+    ok = bundle.pubblica(session, 'http://localhost:5601', headers)
+================================================================================
+"""
+
+import hashlib
+import json
+from typing import Dict, List, Optional, Tuple
+
+INDEX_REF_NAME = 'kibanaSavedObjectMeta.searchSourceJSON.index'
+
+HASH_KEY = 'provisioningHash'
+
+# Attributo JSON (stringa) che trasporta l'hash, per tipo di saved object
+HASH_CARRIER = {'visualization': 'uiStateJSON', 'dashboard': 'optionsJSON'}
+
+# Tipi senza attributo libero: confronto diretto su questi attributi
+COMPARE_FIELDS = {'index-pattern': ('title', 'timeFieldName')}
+
+
+def content_hash(tipo: str, attributes: Dict, references: List[Dict]) -> str:
+    """sha1 della definizione renderizzata (chiavi ordinate, hash escluso)"""
+    canonico = json.dumps({'type': tipo, 'attributes': attributes, 'references': references},
+                          sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(canonico.encode('utf-8')).hexdigest()
+
+
+def _hash_salvato(oggetto: Dict) -> Optional[str]:
+    """Hash letto dall'attributo carrier di un oggetto restituito da _bulk_get"""
+    carrier = HASH_CARRIER.get(oggetto.get('type'))
+    try:
+        return json.loads(oggetto.get('attributes', {}).get(carrier) or '{}').get(HASH_KEY)
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+class SavedObjectsBundle:
+    """Raccolta ordinata di saved objects da importare in un'unica richiesta"""
+
+    def __init__(self):
+        # (tipo, id) -> oggetto: un secondo inserimento con lo stesso id sostituisce il primo
+        self.oggetti: Dict[Tuple[str, str], Dict] = {}
+
+    def __len__(self) -> int:
+        return len(self.oggetti)
+
+    def aggiungi(self, tipo: str, obj_id: str, attributes: Dict,
+                 references: Optional[List[Dict]] = None) -> str:
+        """Aggiunge (o sostituisce) un saved object generico, marcandolo con l'hash del contenuto"""
+        references = references or []
+        carrier = HASH_CARRIER.get(tipo)
+        if carrier:
+            digest = content_hash(tipo, attributes, references)
+            stato = json.loads(attributes.get(carrier) or '{}')
+            stato[HASH_KEY] = digest
+            attributes = {**attributes, carrier: json.dumps(stato)}
+
+        self.oggetti[(tipo, obj_id)] = {
+            'type': tipo,
+            'id': obj_id,
+            'attributes': attributes,
+            'references': references
+        }
+        return obj_id
+
+    def index_pattern(self, pattern: str, time_field: Optional[str] = None,
+                      pattern_id: Optional[str] = None) -> str:
+        """Index pattern (id = pattern, come negli script esistenti)"""
+        attributes = {'title': pattern, 'fields': '[]'}
+        if time_field:
+            attributes['timeFieldName'] = time_field
+        return self.aggiungi('index-pattern', pattern_id or pattern, attributes)
+
+    def visualizzazione(self, vis_id: str, title: str, vis_type: str, index_pattern: str,
+                        params: Optional[Dict] = None, aggs: Optional[List[Dict]] = None,
+                        query: Optional[Dict] = None, filters: Optional[List[Dict]] = None) -> str:
+        """Visualizzazione legata all'index pattern tramite reference"""
+        attributes = {
+            'title': title,
+            'visState': json.dumps({
+                'title': title,
+                'type': vis_type,
+                'params': params or {},
+                'aggs': aggs or []
+            }),
+            'uiStateJSON': '{}',
+            'description': '',
+            'version': 1,
+            'kibanaSavedObjectMeta': {
+                'searchSourceJSON': json.dumps({
+                    'indexRefName': INDEX_REF_NAME,
+                    'query': query or {'match_all': {}},
+                    'filter': filters or []
+                })
+            }
+        }
+        references = [{'name': INDEX_REF_NAME, 'type': 'index-pattern', 'id': index_pattern}]
+        return self.aggiungi('visualization', vis_id, attributes, references)
+
+    def dashboard(self, dash_id: str, title: str, pannelli: List[Tuple[str, Dict]],
+                  description: str = '', time_from: str = 'now-24h', time_to: str = 'now',
+                  time_restore: bool = False, refresh_ms: int = 60000) -> str:
+        """Dashboard da una lista di (vis_id, {'x', 'y', 'w', 'h'})"""
+        panels, references = [], []
+        for i, (vis_id, pos) in enumerate(pannelli):
+            panels.append({
+                'version': '7.10.0',
+                'gridData': {'x': pos['x'], 'y': pos['y'], 'w': pos['w'], 'h': pos['h'], 'i': str(i)},
+                'panelIndex': str(i),
+                'embeddableConfig': {},
+                'panelRefName': f"panel_{i}"
+            })
+            references.append({'name': f"panel_{i}", 'type': 'visualization', 'id': vis_id})
+
+        attributes = {
+            'title': title,
+            'description': description,
+            'panelsJSON': json.dumps(panels),
+            'optionsJSON': json.dumps({'useMargins': True, 'hidePanelTitles': False}),
+            'version': 1,
+            'timeRestore': time_restore,
+            'refreshInterval': {'pause': False, 'value': refresh_ms},
+            'kibanaSavedObjectMeta': {
+                'searchSourceJSON': json.dumps({'query': {'query': '', 'language': 'kuery'}, 'filter': []})
+            }
+        }
+        if time_restore:
+            attributes.update({'timeFrom': time_from, 'timeTo': time_to})
+        return self.aggiungi('dashboard', dash_id, attributes, references)
+
+    def _invariato(self, atteso: Dict, esistente: Dict) -> bool:
+        """True se l'oggetto esistente corrisponde alla definizione del bundle"""
+        if 'error' in esistente:
+            return False
+        if atteso['type'] in HASH_CARRIER:
+            return _hash_salvato(esistente) == _hash_salvato(atteso)
+        campi = COMPARE_FIELDS.get(atteso['type'])
+        if campi is None:
+            return False
+        attributi = esistente.get('attributes', {})
+        return all(attributi.get(c) == atteso['attributes'].get(c) for c in campi)
+
+    def modificati(self, session, base_url: str, headers: Optional[Dict] = None,
+                   timeout: int = 30) -> List[Tuple[str, str]]:
+        """
+        Chiavi (tipo, id) degli oggetti nuovi o modificati, con una sola POST _bulk_get.
+
+        Se la lettura fallisce tutti gli oggetti sono considerati modificati.
+        """
+        chiavi = list(self.oggetti)
+        if not chiavi:
+            return []
+
+        headers = {**(headers or {}), 'Content-Type': 'application/json'}
+        headers.setdefault('osd-xsrf', 'true')
+        try:
+            response = session.post(
+                f"{base_url}/api/saved_objects/_bulk_get",
+                json=[{'type': tipo, 'id': obj_id} for tipo, obj_id in chiavi],
+                headers=headers,
+                timeout=timeout
+            )
+            if response.status_code != 200:
+                return chiavi
+            esistenti = {(o.get('type'), o.get('id')): o for o in response.json().get('saved_objects', [])}
+        except Exception:
+            return chiavi
+
+        return [k for k in chiavi if not self._invariato(self.oggetti[k], esistenti.get(k, {'error': {}}))]
+
+    def to_ndjson(self, chiavi: Optional[List[Tuple[str, str]]] = None) -> str:
+        """Un oggetto per riga (tutti o solo le chiavi indicate); index pattern prima di visualizzazioni e dashboard"""
+        ordine = {'index-pattern': 0, 'visualization': 1, 'dashboard': 2}
+        selezione = self.oggetti.values() if chiavi is None else [self.oggetti[k] for k in chiavi]
+        oggetti = sorted(selezione, key=lambda o: ordine.get(o['type'], 1))
+        return '\n'.join(json.dumps(o, ensure_ascii=False) for o in oggetti) + '\n'
+
+    def salva(self, path: str):
+        """Scrive il bundle su file (importabile anche da Stack Management)"""
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.to_ndjson())
+
+    def importa(self, session, base_url: str, headers: Optional[Dict] = None,
+                overwrite: bool = True, timeout: int = 60, solo_modifiche: bool = True) -> Dict:
+        """
+        Pubblica il bundle con una sola POST /api/saved_objects/_import.
+
+        Con solo_modifiche=True importa solo gli oggetti nuovi o con hash diverso
+        (vedi modificati()). Ritorna {'success', 'count', 'unchanged', 'errors'};
+        con overwrite=True gli oggetti esistenti vengono sostituiti senza DELETE preventive.
+        """
+        chiavi = self.modificati(session, base_url, headers) if solo_modifiche else list(self.oggetti)
+        invariati = len(self.oggetti) - len(chiavi)
+        if not chiavi:
+            return {'success': True, 'count': 0, 'unchanged': invariati, 'errors': []}
+
+        # Multipart: il Content-Type lo imposta requests, resta solo osd-xsrf (e simili)
+        headers = {k: v for k, v in (headers or {}).items() if k.lower() != 'content-type'}
+        headers.setdefault('osd-xsrf', 'true')
+
+        try:
+            response = session.post(
+                f"{base_url}/api/saved_objects/_import",
+                params={'overwrite': str(overwrite).lower()},
+                files={'file': ('bundle.ndjson', self.to_ndjson(chiavi).encode('utf-8'), 'application/ndjson')},
+                headers=headers,
+                timeout=timeout
+            )
+        except Exception as e:
+            return {'success': False, 'count': 0, 'unchanged': invariati,
+                    'errors': [{'error': {'type': 'request', 'message': str(e)}}]}
+
+        if response.status_code != 200:
+            return {'success': False, 'count': 0, 'unchanged': invariati,
+                    'errors': [{'error': {'type': str(response.status_code), 'message': response.text[:300]}}]}
+
+        result = response.json()
+        return {
+            'success': result.get('success', False),
+            'count': result.get('successCount', 0),
+            'unchanged': invariati,
+            'errors': result.get('errors', [])
+        }
+
+    def pubblica(self, session, base_url: str, headers: Optional[Dict] = None,
+                 force: bool = False, timeout: int = 60) -> bool:
+        """Importa gli oggetti nuovi o modificati (force: tutti) e stampa l'esito; True se riuscito"""
+        print(f"\n⏳ Import di {len(self)} saved objects...")
+        esito = self.importa(session, base_url, headers, timeout=timeout, solo_modifiche=not force)
+        self.stampa_esito(esito)
+        return esito['success']
+
+    def stampa_esito(self, esito: Dict):
+        """Riepilogo dell'import in stile creator"""
+        invariati = esito.get('unchanged', 0)
+        if esito['success'] and not esito['count']:
+            print(f"✓ Saved objects invariati ({invariati}/{len(self)}): nessun import")
+            return
+        if esito['success']:
+            print(f"✓ Import saved objects: {esito['count']} nuovi/modificati, {invariati} invariati")
+            return
+        print(f"✗ Import saved objects: {esito['count']}/{len(self) - invariati} oggetti importati")
+        for errore in esito['errors'][:10]:
+            dettaglio = errore.get('error', {})
+            print(f"   ✗ {errore.get('type', '')} {errore.get('id', '')}: "
+                  f"{dettaglio.get('type', '')} {dettaglio.get('message', '')}".rstrip())
@@ -0,0 +1,236 @@
+"""
+================================================================================
+FILE: opensearch_pool.py
+================================================================================
+Client OpenSearch condiviso - un pool urllib3 per processo e per endpoint
+
+IAMRequestsLoader, KPIEngine, IAMAnalyzer, IAMDailyRollup e IAMOpenSearchManager
+ottengono il client da get_client() invece di crearne uno proprio:
+- configurazione letta una volta dalla sezione 'opensearch' di iam_config.json
+  (i parametri espliciti hanno la precedenza, None = valore da configurazione)
+- un solo client per endpoint e impostazioni (host, port, ssl, utente, timeout,
+  retry, pool_maxsize): il pool urllib3 persistente viene riusato da tutti i
+  componenti e tra i cicli di aggiornamento, anche dai worker di parallel_bulk;
+  override diversi (es. pool_maxsize più grande per il bulk) danno un client a parte
+- nessuna info() nei costruttori: verifica() fa l'handshake solo quando serve,
+  una volta per client
+- MeteredConnection conta richieste, errori e latenze per endpoint (metriche())
+  e notifica ogni richiesta ai listener registrati (es. span per chunk _bulk)
+
+UTILIZZO:
+    from opensearch_pool import get_client, verifica, stampa_metriche
+
+    client = get_client()                       # da iam_config.json
+    client = get_client(host='os01', port=9200) # override espliciti
+    print(verifica(client)['version']['number'])
+    stampa_metriche()
+================================================================================
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from opensearchpy import OpenSearch, Urllib3HttpConnection
+
+DEFAULTS = {
+    'host': 'localhost',
+    'port': 9200,
+    'use_ssl': False,
+    'auth': None,
+    'timeout': 30,
+    'max_retries': 3,
+    'retry_on_timeout': True,
+    'pool_maxsize': 16
+}
+
+# Latenze conservate per i percentili (per client)
+LATENCY_WINDOW = 10000
+
+_lock = threading.Lock()
+_config: Optional[Dict] = None
+_clients: Dict[tuple, OpenSearch] = {}
+_metrics: Dict[tuple, 'ClientMetrics'] = {}
+_info: Dict[int, Dict] = {}
+_listeners: List[Callable] = []
+
+
+class ClientMetrics:
+    """Contatori thread-safe delle richieste HTTP di un client"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.endpoints: Dict[str, Dict] = {}
+
+    @staticmethod
+    def endpoint(method: str, url: str) -> str:
+        """Endpoint sintetico: ultimo segmento '_xxx' del path (es. POST _bulk), altrimenti il metodo"""
+        api = next((seg for seg in reversed(url.split('?')[0].split('/')) if seg.startswith('_')), '')
+        return f"{method} {api}".strip()
+
+    def registra(self, method: str, url: str, elapsed_ms: float, ok: bool):
+        with self._lock:
+            self.requests += 1
+            self.total_ms += elapsed_ms
+            self.latencies.append(elapsed_ms)
+            if not ok:
+                self.errors += 1
+            stats = self.endpoints.setdefault(self.endpoint(method, url), {'requests': 0, 'errors': 0, 'total_ms': 0.0})
+            stats['requests'] += 1
+            stats['total_ms'] += elapsed_ms
+            if not ok:
+                stats['errors'] += 1
+
+    def snapshot(self) -> Dict:
+        """Totali, p50/p95/max delle latenze recenti e dettaglio per endpoint"""
+        with self._lock:
+            latenze = sorted(self.latencies)
+            endpoints = {name: dict(stats) for name, stats in self.endpoints.items()}
+            requests, errors, total_ms = self.requests, self.errors, self.total_ms
+
+        def pct(p):
+            return round(latenze[min(len(latenze) - 1, int(len(latenze) * p))], 2) if latenze else None
+
+        return {
+            'requests': requests,
+            'errors': errors,
+            'avg_ms': round(total_ms / requests, 2) if requests else None,
+            'p50_ms': pct(0.50),
+            'p95_ms': pct(0.95),
+            'max_ms': round(latenze[-1], 2) if latenze else None,
+            'endpoints': endpoints
+        }
+
+
+class MeteredConnection(Urllib3HttpConnection):
+    """Connessione urllib3 che registra ogni richiesta in un ClientMetrics"""
+
+    def __init__(self, *args, metrics: Optional[ClientMetrics] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = metrics
+
+    def perform_request(self, method, url, *args, **kwargs):
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = super().perform_request(method, url, *args, **kwargs)
+            ok = True
+            return result
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if self.metrics is not None:
+                self.metrics.registra(method, url, elapsed_ms, ok)
+            if _listeners:
+                # perform_request(method, url, params=None, body=None, ...)
+                body = kwargs.get('body', args[1] if len(args) > 1 else None)
+                for listener in list(_listeners):
+                    try:
+                        listener(method, url, elapsed_ms, ok, body)
+                    except Exception:
+                        pass
+
+
+def aggiungi_listener(listener: Callable):
+    """Registra listener(method, url, elapsed_ms, ok, body) chiamato dopo ogni richiesta HTTP"""
+    with _lock:
+        if listener not in _listeners:
+            _listeners.append(listener)
+
+
+def rimuovi_listener(listener: Callable):
+    with _lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+
+def configura(config_file: str = 'iam_config.json', section: str = 'opensearch') -> Dict:
+    """(Ri)legge la sezione OpenSearch della configurazione; chiamata implicitamente da get_client()"""
+    global _config
+    config = {}
+    try:
+        if Path(config_file).exists():
+            with open(config_file, 'r', encoding='utf-8') as f:
+                config = json.load(f).get(section, {})
+    except Exception as e:
+        print(f"⚠ Configurazione OpenSearch non letta ({config_file}): {e}")
+
+    with _lock:
+        _config = {**DEFAULTS, **config}
+        return dict(_config)
+
+
+def get_client(**overrides) -> OpenSearch:
+    """
+    Client condiviso per l'endpoint richiesto (host, port, use_ssl, auth, timeout,
+    max_retries, retry_on_timeout, pool_maxsize); i valori None usano la configurazione.
+    """
+    if _config is None:
+        configura()
+
+    settings = {**_config, **{k: v for k, v in overrides.items() if v is not None}}
+    auth = tuple(settings['auth']) if settings.get('auth') else None
+    # Tutte le impostazioni del client nella chiave: nessun override ignorato in silenzio
+    # (credenziali complete, come hash per non tenere la password nella chiave)
+    key = (settings['host'], int(settings['port']), bool(settings['use_ssl']), hash(auth),
+           settings['timeout'], settings['max_retries'], bool(settings['retry_on_timeout']),
+           int(settings['pool_maxsize']))
+
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            metrics = ClientMetrics()
+            client = OpenSearch(
+                hosts=[{'host': settings['host'], 'port': int(settings['port'])}],
+                http_auth=auth,
+                use_ssl=settings['use_ssl'],
+                verify_certs=False,
+                ssl_show_warn=False,
+                timeout=settings['timeout'],
+                max_retries=settings['max_retries'],
+                retry_on_timeout=settings['retry_on_timeout'],
+                connection_class=MeteredConnection,
+                maxsize=settings['pool_maxsize'],
+                metrics=metrics
+            )
+            _clients[key] = client
+            _metrics[key] = metrics
+        return client
+
+
+def verifica(client: OpenSearch) -> Dict:
+    """info() del cluster, eseguita solo alla prima verifica di ogni client"""
+    info = _info.get(id(client))
+    if info is None:
+        info = client.info()
+        _info[id(client)] = info
+    return info
+
+
+def metriche(client: Optional[OpenSearch] = None) -> Dict[str, Dict]:
+    """Snapshot delle metriche per endpoint 'host:port' (solo il client indicato, se passato)"""
+    with _lock:
+        coppie = [(key, _metrics[key]) for key, c in _clients.items() if client is None or c is client]
+        endpoint = [(key[0], key[1]) for key in _clients]
+    # Più client sullo stesso endpoint (override diversi): etichetta con pool e timeout
+    return {(f"{key[0]}:{key[1]}" if endpoint.count((key[0], key[1])) == 1
+             else f"{key[0]}:{key[1]} (pool {key[7]}, timeout {key[4]}s)"): metrics.snapshot()
+            for key, metrics in coppie}
+
+
+def stampa_metriche(client: Optional[OpenSearch] = None):
+    """Riepilogo delle richieste HTTP effettuate dai client condivisi"""
+    for endpoint, snap in metriche(client).items():
+        if not snap['requests']:
+            continue
+        print(f"📡 OpenSearch {endpoint}: {snap['requests']} richieste, {snap['errors']} errori, "
+              f"avg {snap['avg_ms']} ms, p50 {snap['p50_ms']} ms, p95 {snap['p95_ms']} ms")
+        top = sorted(snap['endpoints'].items(), key=lambda item: item[1]['total_ms'], reverse=True)[:5]
+        for name, stats in top:
+            print(f"   {name:25s} {stats['requests']:6d} req  {stats['total_ms'] / 1000:8.2f}s")